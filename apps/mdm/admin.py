@@ -1,6 +1,7 @@
 from typing import ClassVar
 
 import structlog
+from django.conf import settings
 from django.contrib import admin, messages
 from django.contrib.admin import helpers
 from django.contrib.admin.decorators import action
@@ -32,6 +33,7 @@ from .models import (
     DeviceSnapshotApp,
     FirmwareSnapshot,
     Fleet,
+    MDMAPIUsage,
     Policy,
     PolicyApplication,
     PolicyVariable,
@@ -557,3 +559,61 @@ class FirmwareSnapshotAdmin(admin.ModelAdmin):
         "synced_at",
         "raw_data",
     )
+
+
+@admin.register(MDMAPIUsage)
+class MDMAPIUsageAdmin(admin.ModelAdmin):
+    """Staff-only dashboard of the MDM API calls made per organization and hour."""
+
+    list_display = (
+        "hour",
+        "organization",
+        "mdm",
+        "method",
+        "endpoint",
+        "calls",
+        "errors",
+        "rate_limited",
+        "backoffs",
+        "average_seconds",
+        "hourly_quota_used",
+    )
+    list_filter = ("mdm", "organization", "method", "hour")
+    list_select_related = ("organization",)
+    search_fields = ("endpoint",)
+    date_hierarchy = "hour"
+    ordering = ("-hour", "organization", "-calls")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        # The calls to all endpoints made for the same organization and MDM in the same
+        # hour, including the rows excluded by the changelist filters and search
+        hour_calls = (
+            MDMAPIUsage.objects.filter(
+                organization=models.OuterRef("organization"),
+                mdm=models.OuterRef("mdm"),
+                hour=models.OuterRef("hour"),
+            )
+            .order_by()
+            .values("organization", "mdm", "hour")
+            .annotate(total=models.Sum("calls"))
+            .values("total")
+        )
+        return super().get_queryset(request).annotate(hour_calls=models.Subquery(hour_calls))
+
+    @admin.display(description="Average seconds")
+    def average_seconds(self, obj):
+        return round(obj.seconds / obj.calls, 3) if obj.calls else None
+
+    @admin.display(description="Hourly quota used")
+    def hourly_quota_used(self, obj):
+        """The share of the organization's hourly quota used by all its calls in that hour."""
+        quota = settings.MDM_API_HOURLY_QUOTAS.get(obj.mdm)
+        if not quota:
+            return None
+        return f"{obj.hour_calls / quota:.0%}"
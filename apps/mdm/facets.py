@@ -0,0 +1,64 @@
+import hashlib
+import uuid
+from collections.abc import Sequence
+
+import structlog
+from django.core.cache import cache
+from django.db.models import Count, QuerySet
+
+logger = structlog.getLogger(__name__)
+
+
+class DeviceFacetCache:
+    """Counts of an organization's devices per distinct value of one or more fields
+    (a "facet", e.g. the fleet), for the choices in the device list filters.
+
+    Counts are cached in the Django cache per organization and per facet query, so
+    a device list filtered by a search term gets its own entry. Each organization
+    has a revision token that is part of the key and is replaced when its devices
+    are created, deleted or moved to another fleet (see the signal receivers in
+    apps.mdm.models and the MDM device syncs), which drops all of its entries.
+    """
+
+    revision_cache_key = "mdm:device-facets-revision:{organization_id}"
+    timeout = 60 * 60
+
+    def revision(self, organization_id: int) -> str:
+        return cache.get_or_set(
+            self.revision_cache_key.format(organization_id=organization_id),
+            uuid.uuid4().hex,
+            timeout=None,
+        )
+
+    def get(self, organization_id: int, queryset: QuerySet, fields: Sequence[str]) -> list[tuple]:
+        """Return a ``(*values, count)`` tuple for each distinct combination of
+        ``fields`` in ``queryset``, ordered by ``fields``.
+
+        Only the fields are selected and grouped on, so any annotations on
+        ``queryset`` that are not used to filter it are left out of the query.
+        """
+        counts = (
+            queryset.order_by().values_list(*fields).annotate(count=Count("pk")).order_by(*fields)
+        )
+        sql, params = counts.query.sql_with_params()
+        digest = hashlib.sha256(repr((sql, params)).encode()).hexdigest()
+        key = f"mdm:device-facets:{organization_id}:{self.revision(organization_id)}:{digest}"
+        rows = cache.get(key)
+        if rows is None:
+            rows = list(counts)
+            cache.set(key, rows, timeout=self.timeout)
+        return rows
+
+    def invalidate(self, *organization_ids: int):
+        """Drop the cached counts for the given organizations."""
+        cache.set_many(
+            {
+                self.revision_cache_key.format(organization_id=organization_id): uuid.uuid4().hex
+                for organization_id in organization_ids
+            },
+            timeout=None,
+        )
+        logger.debug("Invalidated device facet counts", organization_ids=organization_ids)
+
+
+device_facet_cache = DeviceFacetCache()
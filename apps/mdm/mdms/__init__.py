@@ -1,6 +1,13 @@
+import copy
+import os
+import threading
+
 from django.conf import settings
+from django.core.cache import cache
 from django.utils.module_loading import import_string
 
+from apps.mdm.metering import APIUsage
+
 from .android_enterprise import AndroidEnterprise
 from .base import MDM, MDMAPIError
 from .tinymdm import TinyMDM
@@ -41,3 +48,94 @@ def get_active_mdm_instance(organization=None) -> MDM | None:
             # MDM not configured
             pass
     return None
+
+
+class EnterpriseMDMRegistry:
+    """Process-level registry of ready-to-use MDM instances keyed by AMAPI
+    enterprise name (e.g. ``enterprises/LC00lvvue0``).
+
+    Resolving the organization for an enterprise and building its MDM instance
+    (which then loads the service account credentials and the Google API
+    discovery client on first use) is far more expensive than handling a single
+    AMAPI notification, so instances are built once and reused.
+
+    Each call to :meth:`get` returns a shallow copy of the cached instance, so
+    that the per-call state (``api_errors`` and ``api_usage``) is not shared
+    between concurrent notifications, while the credentials and API client
+    built by the cached instance are.
+
+    Entries are dropped by :meth:`invalidate`, which is called whenever an
+    ``AndroidEnterpriseAccount`` or ``Organization`` is saved or deleted. The
+    registry version is kept in the Django cache so that invalidation also
+    reaches the other worker processes.
+    """
+
+    version_cache_key = "mdm:enterprise-registry-version"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._version = None
+
+    def get(self, enterprise_name: str) -> MDM | None:
+        """Return the active MDM instance for the organization enrolled as
+        ``enterprise_name``, or ``None`` if there is no such organization or its
+        MDM is not configured.
+        """
+        version = cache.get(self.version_cache_key, 0)
+        # The service account file is read from the environment when the instance
+        # is built, so it is part of the key.
+        key = (enterprise_name, os.getenv("ANDROID_ENTERPRISE_SERVICE_ACCOUNT_FILE"))
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            cached = key in self._entries
+            mdm = self._entries.get(key)
+        if not cached:
+            mdm = self._build(enterprise_name)
+            with self._lock:
+                if version == self._version:
+                    self._entries[key] = mdm
+        return self._copy(mdm)
+
+    def invalidate(self) -> None:
+        """Drop all the cached instances, in this and every other process."""
+        try:
+            cache.incr(self.version_cache_key)
+        except ValueError:
+            # The key does not exist yet
+            cache.set(self.version_cache_key, 1, timeout=None)
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+
+    @staticmethod
+    def _copy(mdm: MDM | None) -> MDM | None:
+        """Return a copy of a cached instance with its own per-call state."""
+        if mdm is None:
+            return None
+        mdm = copy.copy(mdm)
+        mdm.api_errors = []
+        mdm.api_usage = APIUsage()
+        return mdm
+
+    @staticmethod
+    def _build(enterprise_name: str) -> MDM | None:
+        from apps.publish_mdm.models import AndroidEnterpriseAccount  # noqa: PLC0415
+
+        account = (
+            AndroidEnterpriseAccount.objects.filter(enterprise_name=enterprise_name)
+            .select_related("organization")
+            .first()
+        )
+        if not account:
+            return None
+        mdm = get_active_mdm_instance(organization=account.organization)
+        if isinstance(mdm, AndroidEnterprise):
+            # Build the API client now so that the copies returned by get() share it
+            mdm.api  # noqa: B018
+        return mdm
+
+
+enterprise_mdm_registry = EnterpriseMDMRegistry()
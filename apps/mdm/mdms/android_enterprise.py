@@ -1,6 +1,7 @@
 import datetime as dt
 import json
 import os
+import time
 from functools import cached_property
 
 import structlog
@@ -14,8 +15,10 @@ from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from apps.mdm.facets import device_facet_cache
+from apps.mdm.metering import APIUsage, amapi_endpoint, mdm_api_usage
 from apps.mdm.models import Device, DeviceSnapshot, DeviceSnapshotApp, Fleet, Policy
-from apps.publish_mdm.utils import create_qr_code
+from apps.publish_mdm.qrcodes import qr_code_cache
 
 from .base import MDM, MDMAPIError
 
@@ -48,6 +51,7 @@ class AndroidEnterprise(MDM):
         # Do not pass an organization if you only need to perform operations that are
         # not organization or enterprise-specific (e.g. setting up Pub/Sub, enrolling an enterprise, etc.)
         self.api_errors = []
+        self.api_usage = APIUsage()
         self.organization = organization
         self.service_account_file = os.getenv("ANDROID_ENTERPRISE_SERVICE_ACCOUNT_FILE")
         if (
@@ -147,15 +151,21 @@ class AndroidEnterprise(MDM):
         )
 
     def execute(self, resource_method, raise_exception=True):
-        """Executes an API request. In case of an error response, add a api_error
+        """Executes an API request and records it in the MDM API usage (see
+        apps.mdm.metering). In case of an error response, add a api_error
         attribute (a MDMAPIError object) to the exception raised by the execute()
         call. If raise_exception is passed and it's falsy, this function will not
         raise an exception for an error response, but will instead add an MDMAPIError
         object to the api_errors list.
         """
+        status_code = None
+        start = time.perf_counter()
         try:
-            return resource_method.execute()
+            response = resource_method.execute()
+            status_code = 200
+            return response
         except HttpError as e:
+            status_code = e.status_code
             try:
                 error_data = json.loads(e.content.decode())
             except json.JSONDecodeError:
@@ -166,6 +176,14 @@ class AndroidEnterprise(MDM):
                 e.api_error = api_error
                 raise
             self.api_errors.append(api_error)
+        finally:
+            mdm_api_usage.record(
+                self,
+                *amapi_endpoint(resource_method),
+                time.perf_counter() - start,
+                status_code=status_code,
+                rate_limited=int(status_code == 429),
+            )
 
     def get_devices(self):
         """Gets all the devices enrolled in the enterprise. It's not possible to
@@ -426,6 +444,9 @@ class AndroidEnterprise(MDM):
             mdm_device for mdm_device in mdm_devices if mdm_device.id not in our_device_ids
         ]
         self.create_new_devices(fleet, mdm_devices_to_create)
+        # bulk_create() and bulk_update() don't send the signals that invalidate the
+        # cached device counts
+        device_facet_cache.invalidate(fleet.organization_id)
         # Link snapshots to devices
         # Get all snapshots that don't have a device
         qs = DeviceSnapshot.objects.filter(mdm_device_id=None).select_for_update()
@@ -519,7 +540,9 @@ class AndroidEnterprise(MDM):
         logger.info("Syncing fleet to Android Enterprise devices", fleet=fleet)
         self.pull_devices(fleet)
         if push_config:
-            for device in fleet.devices.select_related("fleet").all():
+            devices = list(fleet.devices.select_related("fleet"))
+            Device.load_odk_collect_qr_code_strings(devices)
+            for device in devices:
                 self.push_device_config(device=device)
 
     def sync_fleets(self, push_config: bool = True):
@@ -548,9 +571,8 @@ class AndroidEnterprise(MDM):
         logger.info(
             "Creating the enrollment QR code", fleet=fleet, enrollment_token=enrollment_token
         )
-        qr_code = create_qr_code(enrollment_token["qrCode"])
         # Update the enroll_qr_code field. Do not call Fleet.save()
-        fleet.enroll_qr_code.save(f"{fleet}.png", qr_code, save=False)
+        fleet.enroll_qr_code = qr_code_cache.get_or_create(enrollment_token["qrCode"])
         # Update other fields
         fleet.enroll_token_expires_at = dt.datetime.fromisoformat(
             enrollment_token["expirationTimestamp"]
@@ -932,6 +954,8 @@ class AndroidEnterprise(MDM):
                 count=count,
                 previous_names=previous_names,
             )
+            if count:
+                device_facet_cache.invalidate(fleet.organization_id)
 
     def _handle_status_report_notification(self, mdm_device: MDMDevice) -> None:
         """Update device metadata and create a snapshot from a STATUS_REPORT notification."""
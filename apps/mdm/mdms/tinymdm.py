@@ -1,16 +1,19 @@
 import datetime as dt
+import time
 from functools import cached_property
 
 import requests
 import structlog
-from django.core.files.base import ContentFile
 from django.db.models import F, OuterRef, Q, Subquery
 from django.utils import timezone
 from requests.adapters import HTTPAdapter
 from requests_ratelimiter import LimiterSession
 from urllib3.util.retry import Retry
 
+from apps.mdm.facets import device_facet_cache
+from apps.mdm.metering import APIUsage, mdm_api_usage, tinymdm_endpoint
 from apps.mdm.models import Device, DeviceSnapshot, DeviceSnapshotApp, Fleet
+from apps.publish_mdm.qrcodes import qr_code_cache
 
 from .base import MDM, MDMAPIError
 
@@ -30,6 +33,7 @@ class TinyMDM(MDM):
 
     def __init__(self, organization=None):
         self.api_errors = []
+        self.api_usage = APIUsage()
         self.organization = organization
 
     @cached_property
@@ -72,14 +76,33 @@ class TinyMDM(MDM):
         return bool(self.session)
 
     def request(self, method: str, url: str, *args, **kwargs):
-        """Makes a TinyMDM API request. In case of an error response, add a api_error
+        """Makes a TinyMDM API request and records it in the MDM API usage (see
+        apps.mdm.metering). In case of an error response, add a api_error
         attribute (a MDMAPIError object) to the exception raised by Response.raise_for_status().
         If a raise_for_status kwarg is passed and it's falsy, this function will not
         raise an exception for an error response, but will instead add an MDMAPIError
         object to the api_errors list.
         """
         raise_for_status = kwargs.pop("raise_for_status", True)
-        response = self.session.request(method, url, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, *args, **kwargs)
+        except requests.exceptions.RequestException:
+            mdm_api_usage.record(self, method, tinymdm_endpoint(url), time.perf_counter() - start)
+            raise
+        # urllib3 keeps the retries made for the request (e.g. after 429 responses)
+        # on the raw response
+        history = getattr(getattr(response.raw, "retries", None), "history", ())
+        mdm_api_usage.record(
+            self,
+            method,
+            tinymdm_endpoint(url),
+            time.perf_counter() - start,
+            status_code=response.status_code,
+            rate_limited=sum(retry.status == 429 for retry in history)
+            + (response.status_code == 429),
+            backoffs=len(history),
+        )
         try:
             response.raise_for_status()
         except requests.exceptions.RequestException as e:
@@ -245,6 +268,9 @@ class TinyMDM(MDM):
             mdm_device for mdm_device in mdm_devices if mdm_device["id"] not in our_device_ids
         ]
         self.create_new_devices(fleet, mdm_devices_to_create)
+        # bulk_create() and bulk_update() don't send the signals that invalidate the
+        # cached device counts
+        device_facet_cache.invalidate(fleet.organization_id)
         # Link snapshots to devices
         # Get all snapshots that don't have a device
         qs = DeviceSnapshot.objects.filter(mdm_device_id=None).select_for_update()
@@ -320,7 +346,9 @@ class TinyMDM(MDM):
         logger.info("Syncing fleet to TinyMDM devices", fleet=fleet)
         self.pull_devices(fleet)
         if push_config:
-            for device in fleet.devices.exclude(app_user_name="").select_related("fleet").all():
+            devices = list(fleet.devices.exclude(app_user_name="").select_related("fleet"))
+            Device.load_odk_collect_qr_code_strings(devices)
+            for device in devices:
                 self.push_device_config(device=device)
 
     def sync_fleets(self, push_config: bool = True):
@@ -376,7 +404,7 @@ class TinyMDM(MDM):
         response = requests.get(qr_code_url, timeout=10)
         response.raise_for_status()
         # Update the enroll_qr_code field. Do not call Fleet.save()
-        fleet.enroll_qr_code.save(f"{fleet}.png", ContentFile(response.content), save=False)
+        fleet.enroll_qr_code = qr_code_cache.store(response.content)
 
     def delete_group(self, fleet: Fleet) -> bool:
         """Delete a TinyMDM group. If the group has devices either in the database or
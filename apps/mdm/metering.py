@@ -0,0 +1,219 @@
+import threading
+import time
+from dataclasses import astuple, dataclass, fields
+from urllib.parse import urlparse
+
+import structlog
+from django.apps import apps
+from django.core.signals import request_finished
+from django.db import DatabaseError, connection, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.patterns.metrics import CallMetrics
+
+from .models import MDMAPIUsage
+
+logger = structlog.getLogger(__name__)
+
+mdm_api_metrics = CallMetrics(
+    name="publish_mdm_mdm_api",
+    description="MDM API",
+    label_names=("mdm", "method", "endpoint"),
+)
+
+# The fixed path segments in TinyMDM API URLs. Any other segment is an ID
+TINYMDM_PATH_SEGMENTS = {
+    "devices",
+    "enrollment_qr_code",
+    "enterprise",
+    "groups",
+    "info",
+    "members",
+    "policies",
+    "users",
+    "wipe",
+}
+
+
+def tinymdm_endpoint(url: str) -> str:
+    """Return the TinyMDM API endpoint for a request URL, with IDs replaced by
+    placeholders, like ``groups/{id}/devices``.
+    """
+    _, _, path = urlparse(url).path.partition("/api/v1/")
+    return "/".join(
+        segment if segment in TINYMDM_PATH_SEGMENTS else "{id}"
+        for segment in path.split("/")
+        if segment
+    )
+
+
+def amapi_endpoint(resource_method) -> tuple[str, str]:
+    """Return the HTTP method and the API method ID (like
+    ``androidmanagement.enterprises.devices.list``) of a Google API request.
+    """
+    method = getattr(resource_method, "method", None)
+    method_id = getattr(resource_method, "methodId", None)
+    return (
+        method if isinstance(method, str) else "",
+        method_id if isinstance(method_id, str) else "",
+    )
+
+
+@dataclass
+class APIUsage:
+    """Counts of MDM API calls and the time spent on them."""
+
+    calls: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+    backoffs: int = 0
+    seconds: float = 0.0
+
+    def observe(self, seconds: float, error: bool, rate_limited: int = 0, backoffs: int = 0):
+        self.calls += 1
+        self.errors += error
+        self.rate_limited += rate_limited
+        self.backoffs += backoffs
+        self.seconds += seconds
+
+    def add(self, other: "APIUsage"):
+        self.calls += other.calls
+        self.errors += other.errors
+        self.rate_limited += other.rate_limited
+        self.backoffs += other.backoffs
+        self.seconds += other.seconds
+
+    def as_metadata(self) -> dict:
+        """The usage as Dagster asset metadata."""
+        return {
+            "api_calls": self.calls,
+            "api_errors": self.errors,
+            "api_rate_limited": self.rate_limited,
+            "api_backoffs": self.backoffs,
+            "api_seconds": round(self.seconds, 3),
+        }
+
+
+class APIUsageBuffer:
+    """Records the MDM API calls made by this process and periodically adds them
+    to the hourly MDMAPIUsage rows of each organization.
+
+    Calls are buffered in memory, so recording one does not query the database.
+    The buffer is flushed when it holds ``flush_size`` calls, when a call is
+    recorded ``flush_interval`` seconds after the last flush, at the end of each
+    request and at the end of the MDM Dagster assets. Each flush also shares the
+    process's mdm_api_metrics (see CallMetrics.share()).
+    """
+
+    flush_size = 100
+    flush_interval = 60
+
+    def __init__(self):
+        self._usage: dict[tuple, APIUsage] = {}
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        mdm,
+        method: str,
+        endpoint: str,
+        seconds: float,
+        status_code: int | None = None,
+        rate_limited: int = 0,
+        backoffs: int = 0,
+    ):
+        """Record a call made by an MDM instance. A missing ``status_code`` means
+        no response was received.
+        """
+        error = status_code is None or status_code >= 400
+        mdm.api_usage.observe(seconds, error, rate_limited, backoffs)
+        mdm_api_metrics.observe((mdm.name, method, endpoint), seconds, error, retries=backoffs)
+        if rate_limited:
+            logger.info(
+                "MDM API rate limit reached",
+                mdm=mdm.name,
+                organization=mdm.organization,
+                endpoint=endpoint,
+                backoffs=backoffs,
+            )
+        organization_id = getattr(mdm.organization, "pk", None)
+        if organization_id is None:
+            return
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+        key = (organization_id, mdm.name, hour, method, endpoint)
+        with self._lock:
+            self._usage.setdefault(key, APIUsage()).observe(seconds, error, rate_limited, backoffs)
+            self._pending += 1
+            due = (
+                self._pending >= self.flush_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Add the buffered calls to the MDMAPIUsage rows."""
+        mdm_api_metrics.share()
+        with self._lock:
+            usage, self._usage = self._usage, {}
+            self._pending = 0
+            self._last_flush = time.monotonic()
+        if not usage:
+            return
+        try:
+            # Use a savepoint so a failed flush doesn't break an outer transaction.
+            # Skip organizations deleted since, as foreign keys are only checked on commit
+            with transaction.atomic():
+                Organization = apps.get_model("publish_mdm", "Organization")
+                organization_ids = set(
+                    Organization.objects.filter(pk__in={key[0] for key in usage}).values_list(
+                        "pk", flat=True
+                    )
+                )
+                rows = [
+                    (*key, *astuple(counts))
+                    for key, counts in sorted(usage.items())
+                    if key[0] in organization_ids
+                ]
+                if rows:
+                    self._upsert(rows)
+        except DatabaseError:
+            logger.warning("Could not save MDM API usage", rows=len(usage), exc_info=True)
+            return
+        logger.debug("Saved MDM API usage", rows=len(usage))
+
+    @staticmethod
+    def _upsert(rows: list[tuple]):
+        """Insert the (organization ID, MDM, hour, method, endpoint, *counts) rows,
+        or add their counts to the existing rows, in a single query. Concurrent
+        flushes from other processes add to the same rows without conflicting.
+        """
+        quote = connection.ops.quote_name
+        table = quote(MDMAPIUsage._meta.db_table)
+        key_columns = ["organization_id", "mdm", "hour", "method", "endpoint"]
+        counter_columns = [counter.name for counter in fields(APIUsage)]
+        columns = ", ".join(quote(column) for column in [*key_columns, *counter_columns])
+        placeholders = ", ".join(["%s"] * (len(key_columns) + len(counter_columns)))
+        updates = ", ".join(
+            f"{quote(column)} = {table}.{quote(column)} + EXCLUDED.{quote(column)}"
+            for column in counter_columns
+        )
+        sql = (
+            f"INSERT INTO {table} ({columns}) VALUES "
+            + ", ".join([f"({placeholders})"] * len(rows))
+            + f" ON CONFLICT ({', '.join(quote(column) for column in key_columns)})"
+            + f" DO UPDATE SET {updates}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [value for row in rows for value in row])
+
+
+mdm_api_usage = APIUsageBuffer()
+
+
+@receiver(request_finished)
+def flush_mdm_api_usage(sender, **kwargs):
+    mdm_api_usage.flush()
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.13 on 2026-10-19 11:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("mdm", "0014_enrollmenttoken"),
+        ("publish_mdm", "0022_publishrun"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MDMAPIUsage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("mdm", models.CharField(max_length=50, verbose_name="MDM")),
+                (
+                    "hour",
+                    models.DateTimeField(help_text="The start of the hour the calls were made in."),
+                ),
+                ("method", models.CharField(max_length=10)),
+                ("endpoint", models.CharField(max_length=255)),
+                ("calls", models.PositiveIntegerField(default=0)),
+                ("errors", models.PositiveIntegerField(default=0)),
+                (
+                    "rate_limited",
+                    models.PositiveIntegerField(
+                        default=0, help_text="The number of 429 Too Many Requests responses."
+                    ),
+                ),
+                (
+                    "backoffs",
+                    models.PositiveIntegerField(
+                        default=0, help_text="The number of requests retried after backing off."
+                    ),
+                ),
+                (
+                    "seconds",
+                    models.FloatField(default=0, help_text="The total time spent on the calls."),
+                ),
+                (
+                    "organization",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="mdm_api_usage",
+                        to="publish_mdm.organization",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "MDM API usage",
+                "verbose_name_plural": "MDM API usage",
+                "indexes": [models.Index(fields=["hour"], name="mdm_mdmapiu_hour_0386c7_idx")],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("organization", "hour", "mdm", "method", "endpoint"),
+                        name="unique_mdm_api_usage",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -1,13 +1,16 @@
 import json
+from collections.abc import Iterable
 from datetime import timedelta
 
 import structlog
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
-from django.db import models
-from django.db.models import F, GeneratedField, Q, Value
+from django.db import models, transaction
+from django.db.models import F, GeneratedField, OuterRef, Q, Subquery, Value
 from django.db.models.fields.json import KeyTextTransform, KeyTransform
 from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils.html import mark_safe
 from django.utils.timezone import now
 from googleapiclient.errors import Error as GoogleAPIClientError
@@ -17,6 +20,8 @@ from apps.infisical.fields import EncryptedCharField
 from apps.infisical.managers import EncryptedManager
 from apps.patterns.soft_delete import SoftDeleteModel
 
+from .facets import device_facet_cache
+from .policy_cache import policy_render_cache
 from .serializers import PolicySerializer
 
 logger = structlog.get_logger()
@@ -337,19 +342,26 @@ class Policy(models.Model):
         return f"{self.name} ({self.policy_id})"
 
     def get_policy_data(self, **kwargs):
-        """Generates policy data using the PolicySerializer."""
-        device = kwargs.get("device")
+        """Generates policy data using the PolicySerializer.
+
+        When rendering for a device, the device-independent document is compiled
+        once per policy revision and reused for every device (see PolicyRenderCache).
+        """
+        if device := kwargs.get("device"):
+            compiled = policy_render_cache.get(self, lambda: self.get_serializer().compile())
+            return compiled.render(device)
+        return self.get_serializer().to_dict()
+
+    def get_serializer(self) -> PolicySerializer:
         applications = list(self.applications.select_related("policy").order_by("order", "pk"))
         variables = list(
             PolicyVariable.decrypted.filter(Q(policy=self) | Q(fleet__in=self.fleets.all()))
         )
-        serializer = PolicySerializer(
+        return PolicySerializer(
             policy=self,
             applications=applications,
             variables=variables,
-            device=device,
         )
-        return serializer.to_dict()
 
 
 class PolicyApplication(models.Model):
@@ -644,15 +656,26 @@ class Device(SoftDeleteModel):
     def __str__(self):
         return f"{self.name} ({self.device_id})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._store_facet_state()
+        return instance
+
+    def _store_facet_state(self):
+        """Remember the fields the device filter facet counts depend on, so saves
+        that don't change them can skip invalidating the counts.
+        """
+        if "fleet_id" in self.__dict__ and "deleted_at" in self.__dict__:
+            self._facet_state = (self.fleet_id, self.is_deleted)
+
     def save(self, *args, **kwargs):
         from .mdms import get_active_mdm_instance  # noqa: PLC0415
 
         push_to_mdm = kwargs.pop("push_to_mdm", False)
 
-        if not self.app_user_name and self.fleet_id and self.fleet.default_app_user_id:
-            self.app_user_name = self.fleet.default_app_user.name
-            if "update_fields" in kwargs:
-                kwargs["update_fields"] = [*kwargs["update_fields"], "app_user_name"]
+        if self.set_default_app_user_name() and "update_fields" in kwargs:
+            kwargs["update_fields"] = [*kwargs["update_fields"], "app_user_name"]
 
         super().save(*args, **kwargs)
         logger.info(
@@ -667,10 +690,59 @@ class Device(SoftDeleteModel):
         ):
             active_mdm.push_device_config(self)
 
+    def set_default_app_user_name(self) -> bool:
+        """Assign the fleet's default app user to the device if it has none.
+        Returns True if the app_user_name was changed.
+        """
+        if not self.app_user_name and self.fleet_id and self.fleet.default_app_user_id:
+            self.app_user_name = self.fleet.default_app_user.name
+            return True
+        return False
+
+    @classmethod
+    def load_odk_collect_qr_code_strings(cls, devices: Iterable["Device"]):
+        """Load the ODK Collect QR code strings for a batch of devices with a single
+        query, so get_odk_collect_qr_code_string() doesn't query for each device.
+        Each app user's QR code data is only serialized once.
+        """
+        from apps.publish_mdm.models import AppUser  # noqa: PLC0415
+
+        devices = [device for device in devices if device.pk and device.app_user_name]
+        if not devices:
+            return
+        # Match app users in the database, since app user names are case-insensitive
+        app_users = AppUser.objects.filter(
+            project_id=OuterRef("fleet__project_id"), name=OuterRef("app_user_name")
+        ).order_by("pk")
+        rows = (
+            cls.all_objects.filter(pk__in=[device.pk for device in devices])
+            .annotate(
+                app_user_id=Subquery(app_users.values("pk")[:1]),
+                app_user_qr_code_data=Subquery(app_users.values("qr_code_data")[:1]),
+            )
+            .values_list("pk", "app_user_name", "app_user_id", "app_user_qr_code_data")
+        )
+        qr_code_strings = {}
+        loaded = {}
+        for pk, app_user_name, app_user_id, qr_code_data in rows:
+            if app_user_id is None:
+                loaded[pk] = (app_user_name, "")
+                continue
+            if app_user_id not in qr_code_strings:
+                qr_code_strings[app_user_id] = json.dumps(qr_code_data, separators=(",", ":"))
+            loaded[pk] = (app_user_name, qr_code_strings[app_user_id])
+        for device in devices:
+            if device.pk in loaded:
+                device._odk_collect_qr_code_string = loaded[device.pk]
+
     def get_odk_collect_qr_code_string(self):
         """Gets a QR code string that can be used to update the managed configuration
         for ODK Collect in the MDM.
         """
+        # Use the value from load_odk_collect_qr_code_strings(), unless the app user changed
+        loaded = getattr(self, "_odk_collect_qr_code_string", None)
+        if loaded and loaded[0] == self.app_user_name:
+            return loaded[1]
         if (
             self.app_user_name
             and self.fleet.project
@@ -872,6 +944,43 @@ class FirmwareSnapshot(models.Model):
         return f"{self.device_identifier} ({self.version}) firmware snapshot"
 
 
+class MDMAPIUsage(models.Model):
+    """The calls made to one MDM API endpoint for an organization in one hour
+    (see apps.mdm.metering).
+    """
+
+    organization = models.ForeignKey(
+        "publish_mdm.Organization", on_delete=models.CASCADE, related_name="mdm_api_usage"
+    )
+    mdm = models.CharField(verbose_name="MDM", max_length=50)
+    hour = models.DateTimeField(help_text="The start of the hour the calls were made in.")
+    method = models.CharField(max_length=10)
+    endpoint = models.CharField(max_length=255)
+    calls = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    rate_limited = models.PositiveIntegerField(
+        default=0, help_text="The number of 429 Too Many Requests responses."
+    )
+    backoffs = models.PositiveIntegerField(
+        default=0, help_text="The number of requests retried after backing off."
+    )
+    seconds = models.FloatField(default=0, help_text="The total time spent on the calls.")
+
+    class Meta:
+        verbose_name = "MDM API usage"
+        verbose_name_plural = "MDM API usage"
+        constraints = (
+            models.UniqueConstraint(
+                fields=["organization", "hour", "mdm", "method", "endpoint"],
+                name="unique_mdm_api_usage",
+            ),
+        )
+        indexes = (models.Index(fields=["hour"]),)
+
+    def __str__(self):
+        return f"{self.mdm} {self.method} {self.endpoint} ({self.organization}, {self.hour})"
+
+
 # ---------------------------------------------------------------------------
 # EnrollmentToken
 # ---------------------------------------------------------------------------
@@ -1021,3 +1130,71 @@ class EnrollmentToken(models.Model):
                 }
             }
         )
+
+
+@receiver([post_save, post_delete], sender=Policy)
+@receiver([post_save, post_delete], sender=PolicyApplication)
+@receiver([post_save, post_delete], sender=PolicyVariable)
+@receiver([post_save, post_delete], sender=Fleet)
+def invalidate_policy_render_cache(sender, instance, **kwargs):
+    """Drop the organization's compiled policy documents when anything they are
+    built from changes. A Fleet can change which fleet-scoped variables apply to
+    a policy.
+    """
+    if sender in (Policy, Fleet):
+        organization_id = instance.organization_id
+    elif instance.policy_id:
+        # The policy may already be deleted if this is a cascading delete, in
+        # which case there is nothing left to invalidate
+        organization_id = (
+            Policy.objects.filter(pk=instance.policy_id)
+            .values_list("organization_id", flat=True)
+            .first()
+        )
+    else:
+        organization_id = (
+            Fleet.objects.filter(pk=instance.fleet_id)
+            .values_list("organization_id", flat=True)
+            .first()
+        )
+    if organization_id is None:
+        return
+    policy_render_cache.invalidate(organization_id)
+    # Invalidate again after the commit, in case another process compiled a policy
+    # from the previous state in the meantime
+    transaction.on_commit(lambda: policy_render_cache.invalidate(organization_id))
+
+
+@receiver([post_save, post_delete], sender=Fleet)
+def invalidate_fleet_facet_counts(sender, instance, **kwargs):
+    """Drop the organization's cached device counts, which are labelled with fleet names."""
+    device_facet_cache.invalidate(instance.organization_id)
+
+
+@receiver([post_save, post_delete], sender=Device)
+def invalidate_device_facet_counts(sender, instance, update_fields=None, **kwargs):
+    """Drop the organization's cached device counts when a device is created, deleted
+    or moved to another fleet. Saves that only update other fields are skipped.
+    """
+    if update_fields is not None and not {"fleet", "deleted_at"} & set(update_fields):
+        return
+    if kwargs["signal"] is post_save:
+        previous_state = getattr(instance, "_facet_state", None)
+        instance._store_facet_state()
+        if not kwargs["created"] and previous_state == (instance.fleet_id, instance.is_deleted):
+            return
+    if Device.fleet.is_cached(instance):
+        organization_id = instance.fleet.organization_id
+    else:
+        # The fleet may already be deleted if the device is being deleted with it,
+        # in which case the fleet's receiver has invalidated the counts
+        organization_id = (
+            Fleet.objects.filter(pk=instance.fleet_id)
+            .values_list("organization_id", flat=True)
+            .first()
+        )
+    if organization_id:
+        device_facet_cache.invalidate(organization_id)
+        # Invalidate again after the commit, in case another process counted the
+        # devices from the previous state in the meantime
+        transaction.on_commit(lambda: device_facet_cache.invalidate(organization_id))
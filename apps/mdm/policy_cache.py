@@ -0,0 +1,61 @@
+import threading
+import uuid
+from collections.abc import Callable
+
+import structlog
+from django.core.cache import cache
+
+from .serializers import CompiledPolicy
+
+logger = structlog.getLogger(__name__)
+
+
+class PolicyRenderCache:
+    """A per-process cache of CompiledPolicy objects, so pushing a policy to many
+    devices only queries and decrypts its applications and variables once.
+
+    Each organization has a revision token in the Django cache, which is replaced
+    whenever one of its Policy, PolicyApplication, PolicyVariable or Fleet rows
+    changes (see the signal receivers in apps.mdm.models). A compiled policy is
+    only reused while its organization's revision is unchanged, so every process
+    recompiles the policies of that organization and no other.
+    Decrypted variable values are only ever kept in this process' memory.
+    """
+
+    revision_cache_key = "mdm:policy-render-revision:{organization_id}"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: dict[int, tuple[str, CompiledPolicy]] = {}
+
+    def revision(self, organization_id: int) -> str:
+        return cache.get_or_set(
+            self.revision_cache_key.format(organization_id=organization_id),
+            uuid.uuid4().hex,
+            timeout=None,
+        )
+
+    def get(self, policy, build: Callable[[], CompiledPolicy]) -> CompiledPolicy:
+        revision = self.revision(policy.organization_id)
+        with self._lock:
+            entry = self._entries.get(policy.pk)
+        if entry and entry[0] == revision:
+            return entry[1]
+        compiled = build()
+        with self._lock:
+            self._entries[policy.pk] = (revision, compiled)
+        return compiled
+
+    def invalidate(self, *organization_ids: int):
+        """Drop the compiled policies of the given organizations, in every process."""
+        cache.set_many(
+            {
+                self.revision_cache_key.format(organization_id=organization_id): uuid.uuid4().hex
+                for organization_id in organization_ids
+            },
+            timeout=None,
+        )
+        logger.debug("Invalidated compiled policies", organization_ids=organization_ids)
+
+
+policy_render_cache = PolicyRenderCache()
@@ -2,11 +2,13 @@
 PolicySerializer: assembles a valid AMAPI enterprises.policies dict
 from normalized Policy, PolicyApplication, and PolicyVariable data.
 
-No ORM calls — receives pre-fetched data as arguments.
+No ORM calls — receives pre-fetched data as arguments. Compiled documents are
+cached by apps.mdm.policy_cache.
 """
 
 from __future__ import annotations
 
+import copy
 from dataclasses import dataclass, field
 from string import Template
 from typing import TYPE_CHECKING
@@ -14,6 +16,9 @@ from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from apps.mdm.models import Device, Policy, PolicyApplication, PolicyVariable
 
+# Built-in variables whose values come from the device a policy is rendered for
+DEVICE_VARIABLES = frozenset({"app_user_name", "device_id", "imei", "serial_number"})
+
 
 @dataclass
 class PolicySerializer:
@@ -25,6 +30,43 @@ class PolicySerializer:
     device: Device | None = None
 
     def to_dict(self) -> dict:
+        result = self._build_document()
+
+        # Resolve variable placeholders in all string values
+        merged_vars = self._merge_variables()
+        self._resolve_variables(result, merged_vars)
+
+        return result
+
+    def compile(self) -> CompiledPolicy:
+        """Build the device-independent policy document once, so it can be rendered
+        for many devices with CompiledPolicy.render().
+
+        Strings that don't use device variables are resolved now. The others are
+        recorded as slots that are filled in for each device.
+        """
+        document = self._build_document()
+        variables = self._merge_variables()
+        slots = []
+
+        def walk(obj, path):
+            items = obj.items() if isinstance(obj, dict) else enumerate(obj)
+            for key, value in items:
+                if isinstance(value, str):
+                    if DEVICE_VARIABLES.intersection(Template(value).get_identifiers()):
+                        slots.append(((*path, key), value))
+                    else:
+                        obj[key] = self._substitute(value, variables)
+                elif isinstance(value, dict | list):
+                    walk(value, (*path, key))
+
+        walk(document, ())
+        return CompiledPolicy(
+            policy=self.policy, document=document, slots=slots, variables=variables
+        )
+
+    def _build_document(self) -> dict:
+        """Build the policy document without resolving variable placeholders."""
         result = {}
 
         apps = self._build_applications()
@@ -69,10 +111,6 @@ class PolicySerializer:
 
         result["statusReportingSettings"] = self._build_status_reporting_settings()
 
-        # Resolve variable placeholders in all string values
-        merged_vars = self._merge_variables()
-        self._resolve_variables(result, merged_vars)
-
         return result
 
     def _build_applications(self) -> list[dict]:
@@ -94,14 +132,8 @@ class PolicySerializer:
         ):
             odk_app["defaultPermissionPolicy"] = pinned_app.default_permission_policy
         # Inject managed configuration from device's app user QR code at push time
-        if self.device:
-            qr_code_string = self.device.get_odk_collect_qr_code_string()
-            if qr_code_string:
-                device_id_template = self.policy.odk_collect_device_id_template
-                managed_config = {"settings_json": qr_code_string}
-                if device_id_template:
-                    managed_config["device_id"] = device_id_template
-                odk_app["managedConfiguration"] = managed_config
+        if self.device and (managed_config := odk_collect_managed_config(self.policy, self.device)):
+            odk_app["managedConfiguration"] = managed_config
         apps.append(odk_app)
 
         for app in self.applications:
@@ -227,14 +259,7 @@ class PolicySerializer:
 
         # Built-in system variables from device (accessible as {{ imei }}, {{ serial_number }}, etc.)
         if self.device:
-            merged["app_user_name"] = self.device.app_user_name or ""
-            merged["device_id"] = self.device.device_id or ""
-            try:
-                hardware_info = (self.device.raw_mdm_device or {}).get("hardwareInfo", {})
-                merged["imei"] = hardware_info.get("imei", "")
-            except (AttributeError, TypeError):
-                pass
-            merged["serial_number"] = self.device.serial_number or ""
+            merged.update(device_variables(self.device))
 
         return merged
 
@@ -255,3 +280,61 @@ class PolicySerializer:
 
     def _substitute(self, value: str, variables: dict[str, str]) -> str:
         return Template(value).safe_substitute(variables)
+
+
+def device_variables(device: Device) -> dict[str, str]:
+    """Built-in variables for a device. Their names are in DEVICE_VARIABLES."""
+    variables = {
+        "app_user_name": device.app_user_name or "",
+        "device_id": device.device_id or "",
+    }
+    try:
+        hardware_info = (device.raw_mdm_device or {}).get("hardwareInfo", {})
+        variables["imei"] = hardware_info.get("imei", "")
+    except (AttributeError, TypeError):
+        pass
+    variables["serial_number"] = device.serial_number or ""
+    return variables
+
+
+def odk_collect_managed_config(policy: Policy, device: Device) -> dict | None:
+    """The ODK Collect managed configuration for a device, from its app user's QR code."""
+    qr_code_string = device.get_odk_collect_qr_code_string()
+    if not qr_code_string:
+        return None
+    managed_config = {"settings_json": qr_code_string}
+    if device_id_template := policy.odk_collect_device_id_template:
+        managed_config["device_id"] = device_id_template
+    return managed_config
+
+
+@dataclass
+class CompiledPolicy:
+    """A policy document built by PolicySerializer.compile(), with the strings
+    that depend on a device recorded in ``slots`` as (path, unresolved string).
+    """
+
+    policy: Policy
+    document: dict
+    slots: list[tuple[tuple, str]]
+    variables: dict[str, str]
+
+    def render(self, device: Device | None = None) -> dict:
+        """Return the policy document for ``device``, the same as
+        PolicySerializer(..., device=device).to_dict() would.
+        """
+        document = copy.deepcopy(self.document)
+        variables = self.variables
+        if device:
+            variables = {**variables, **device_variables(device)}
+        for (*path, key), value in self.slots:
+            obj = document
+            for part in path:
+                obj = obj[part]
+            obj[key] = Template(value).safe_substitute(variables)
+        if device and (managed_config := odk_collect_managed_config(self.policy, device)):
+            for key, value in managed_config.items():
+                managed_config[key] = Template(value).safe_substitute(variables)
+            # ODK Collect is always the first application
+            document["applications"][0]["managedConfiguration"] = managed_config
+        return document
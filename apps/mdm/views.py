@@ -6,7 +6,6 @@ import structlog
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.core.files.base import ContentFile
 from django.db.models import Count, F, Max, Q
 from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
@@ -16,9 +15,8 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django_tables2.config import RequestConfig
 
-from apps.publish_mdm.models import AndroidEnterpriseAccount
 from apps.publish_mdm.nav import Breadcrumbs
-from apps.publish_mdm.utils import create_qr_code
+from apps.publish_mdm.qrcodes import qr_code_cache
 from config.dagster import trigger_dagster_job
 
 from .forms import (
@@ -30,7 +28,7 @@ from .forms import (
     PolicyTinyMDMForm,
     PolicyVariableFormSet,
 )
-from .mdms import get_active_mdm_instance
+from .mdms import enterprise_mdm_registry, get_active_mdm_instance
 from .models import (
     Device,
     EnrollmentToken,
@@ -123,17 +121,12 @@ def amapi_notifications_view(request):
     )
     device_name = device_data.get("name", "")
     enterprise_name = "/".join(device_name.split("/")[:2])
-    account = AndroidEnterpriseAccount.objects.filter(enterprise_name=enterprise_name).first()
-    if account:
-        mdm = get_active_mdm_instance(organization=account.organization)
-    else:
-        mdm = None
+    mdm = enterprise_mdm_registry.get(enterprise_name)
 
     if not (mdm and mdm.name == "Android Enterprise"):
         logger.warning(
             "Unknown enterprise or active MDM is not Android Enterprise. Ignoring",
             enterprise_name=enterprise_name,
-            enterprise_account=account,
             mdm=mdm,
             notification_type=notification_type,
         )
@@ -222,8 +215,10 @@ def _push_policy_to_mdm(policy, request):
 @login_required
 def policy_list(request, organization_slug):
     """List all policies for the current organization."""
-    policies = Policy.objects.filter(organization=request.organization).annotate(
-        fleet_count=Count("fleets")
+    policies = (
+        Policy.objects.filter(organization=request.organization)
+        .select_related("organization")
+        .annotate(fleet_count=Count("fleets"))
     )
     exclude = ("policy_id",) if request.organization.mdm == "Android Enterprise" else ()
     table = PolicyTable(data=policies, exclude=exclude)
@@ -518,12 +513,7 @@ def enrollment_token_create(request, organization_slug):
             token.token_resource_name = token_data.get("name", "")
             token.created_by = request.user
             if qr_code_str := token_data.get("qrCode"):
-                qr_image = create_qr_code(qr_code_str)
-                token.qr_code.save(
-                    f"token_{token.fleet.pk}_{get_random_string(12)}.png",
-                    ContentFile(qr_image.getvalue()),
-                    save=False,
-                )
+                token.qr_code = qr_code_cache.get_or_create(qr_code_str)
             token.save()
             messages.success(request, f"Enrollment token '{token}' created successfully.")
             return redirect("mdm:enrollment-token-detail", organization_slug, token.pk)
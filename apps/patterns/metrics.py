@@ -0,0 +1,167 @@
+import os
+import socket
+import threading
+from dataclasses import dataclass, field, replace
+
+import structlog
+from django.core.cache import cache
+
+logger = structlog.getLogger(__name__)
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+@dataclass
+class CallStats:
+    """Counters and a latency histogram for calls with the same labels."""
+
+    count: int = 0
+    errors: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+    # Cumulative counts, like Prometheus histograms: buckets[i] is the number
+    # of calls that took at most LATENCY_BUCKETS[i] seconds
+    buckets: list[int] = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS))
+
+    def observe(self, seconds: float, error: bool = False, retries: int = 0):
+        self.count += 1
+        self.errors += error
+        self.retries += retries
+        self.seconds += seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+    def add(self, other: "CallStats"):
+        self.count += other.count
+        self.errors += other.errors
+        self.retries += other.retries
+        self.seconds += other.seconds
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets, strict=True)]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+class CallMetrics:
+    """Process-wide API call counters and latency histograms, keyed by a tuple of
+    label values, that can be rendered in the Prometheus text exposition format.
+
+    Each process shares its counters through the Django cache with share() (at the
+    end of requests and Dagster operations), so render() includes the calls made by
+    all the web and Dagster processes. A process's counters expire from the cache
+    ``cache_timeout`` seconds after it last shared them.
+    """
+
+    cache_timeout = 24 * 60 * 60
+
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...]):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._stats: dict[tuple, CallStats] = {}
+        self._changed = False
+        self._lock = threading.Lock()
+
+    @property
+    def _processes_cache_key(self) -> str:
+        return f"call-metrics:{self.name}:processes"
+
+    def _process_cache_key(self) -> str:
+        # Not computed once, since worker processes are forked after the import
+        return f"call-metrics:{self.name}:{socket.gethostname()}:{os.getpid()}"
+
+    def observe(self, labels: tuple, seconds: float, error: bool = False, retries: int = 0):
+        with self._lock:
+            self._stats.setdefault(labels, CallStats()).observe(seconds, error, retries)
+            self._changed = True
+
+    def share(self):
+        """Save this process's counters in the cache, if they changed since the last time."""
+        with self._lock:
+            if not self._changed:
+                return
+            self._changed = False
+        key = self._process_cache_key()
+        try:
+            cache.set(key, self.snapshot(), timeout=self.cache_timeout)
+            # Concurrent registrations may overwrite each other, so each process
+            # checks that it is still listed every time
+            processes = cache.get(self._processes_cache_key, [])
+            if key not in processes:
+                cache.set(self._processes_cache_key, [*processes, key], timeout=None)
+        except Exception:
+            logger.warning("Could not share API call metrics", name=self.name, exc_info=True)
+            with self._lock:
+                self._changed = True
+
+    def shared_snapshot(self) -> dict[tuple, CallStats]:
+        """The counters of all the processes that shared them, including this one."""
+        self.share()
+        try:
+            processes = cache.get(self._processes_cache_key, [])
+            snapshots = cache.get_many(processes)
+        except Exception:
+            logger.warning("Could not get shared API call metrics", name=self.name, exc_info=True)
+            return self.snapshot()
+        if len(snapshots) < len(processes):
+            # Forget the processes whose counters expired
+            cache.set(self._processes_cache_key, list(snapshots), timeout=None)
+        totals: dict[tuple, CallStats] = {}
+        for snapshot in snapshots.values():
+            for labels, stats in snapshot.items():
+                totals.setdefault(labels, CallStats()).add(stats)
+        return totals
+
+    def snapshot(self) -> dict[tuple, CallStats]:
+        """A copy of the stats for each set of labels."""
+        with self._lock:
+            return {
+                labels: replace(stats, buckets=list(stats.buckets))
+                for labels, stats in self._stats.items()
+            }
+
+    def reset(self):
+        """Clear this process's counters, including the ones it shared."""
+        with self._lock:
+            self._stats.clear()
+            self._changed = False
+        cache.delete(self._process_cache_key())
+
+    def _labels(self, labels: tuple, **extra) -> str:
+        pairs = [*zip(self.label_names, labels, strict=True), *extra.items()]
+        return ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+    def render(self) -> str:
+        """The metrics of all the processes in the Prometheus text exposition format."""
+        stats = sorted(self.shared_snapshot().items())
+        lines = []
+        for suffix, attr, kind in (
+            ("requests_total", "count", "requests"),
+            ("errors_total", "errors", "failed requests"),
+            ("retries_total", "retries", "retried requests"),
+        ):
+            metric = f"{self.name}_{suffix}"
+            lines += [
+                f"# HELP {metric} The number of {self.description} {kind}.",
+                f"# TYPE {metric} counter",
+            ]
+            lines += [
+                f"{metric}{{{self._labels(labels)}}} {getattr(s, attr)}" for labels, s in stats
+            ]
+        metric = f"{self.name}_request_duration_seconds"
+        lines += [
+            f"# HELP {metric} The latency of {self.description} requests.",
+            f"# TYPE {metric} histogram",
+        ]
+        for labels, s in stats:
+            for bound, count in zip(LATENCY_BUCKETS, s.buckets, strict=True):
+                lines.append(f"{metric}_bucket{{{self._labels(labels, le=bound)}}} {count}")
+            lines += [
+                f"{metric}_bucket{{{self._labels(labels, le='+Inf')}}} {s.count}",
+                f"{metric}_sum{{{self._labels(labels)}}} {s.seconds:.6f}",
+                f"{metric}_count{{{self._labels(labels)}}} {s.count}",
+            ]
+        return "\n".join(lines) + "\n"
@@ -14,6 +14,7 @@ from apps.mdm.mdms import AndroidEnterprise
 
 from .etl.load import generate_and_save_app_user_collect_qrcodes
 from .forms import CentralServerForm
+from .memberships import membership_cache
 from .models import (
     AndroidEnterpriseAccount,
     AppUser,
@@ -27,6 +28,7 @@ from .models import (
     Project,
     ProjectAttachment,
     ProjectTemplateVariable,
+    PublishRun,
     TemplateVariable,
 )
 
@@ -191,6 +193,25 @@ class AppUserFormVersionAdmin(admin.ModelAdmin):
     ordering = ("-form_template_version__version",)
 
 
+@admin.register(PublishRun)
+class PublishRunAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "form_template",
+        "user",
+        "status",
+        "app_users",
+        "forms_published",
+        "forms_skipped",
+        "duration",
+        "created_at",
+    )
+    list_filter = ("status", "created_at")
+    list_select_related = ("form_template", "user")
+    raw_id_fields = ("form_template", "user", "template_version")
+    ordering = ("-created_at",)
+
+
 @admin.register(Organization)
 class OrganizationAdmin(admin.ModelAdmin):
     list_display = (
@@ -232,11 +253,13 @@ class OrganizationAdmin(admin.ModelAdmin):
     @admin.action(description="Soft-delete selected organizations")
     def soft_delete_organizations(self, request, queryset):
         count = queryset.filter(deleted_at__isnull=True).soft_delete()
+        membership_cache.invalidate_all()
         self.message_user(request, f"{count} organization(s) soft-deleted.")
 
     @admin.action(description="Restore selected organizations")
     def restore_organizations(self, request, queryset):
         count = queryset.filter(deleted_at__isnull=False).restore()
+        membership_cache.invalidate_all()
         self.message_user(request, f"{count} organization(s) restored.")
 
     def save_model(self, request, obj, form, change):
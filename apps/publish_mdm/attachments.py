@@ -0,0 +1,144 @@
+import hashlib
+import os
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import structlog
+from django.conf import settings
+from django.db.models.fields.files import FieldFile
+
+logger = structlog.getLogger(__name__)
+
+
+class AttachmentCache:
+    """A local disk cache for project attachments kept in an external storage
+    (like S3), so they are only downloaded once for all publishes and app users.
+
+    Each attachment is saved as ``<ATTACHMENT_CACHE_DIR>/<key>/<attachment name>``,
+    where the key is a hash of the storage name and the object's ETag, so a
+    changed file gets a new entry. Entries are downloaded in chunks, in parallel
+    when several are missing, and the least recently used ones are deleted once
+    the cache grows past ATTACHMENT_CACHE_MAX_SIZE bytes.
+    """
+
+    max_workers = 4
+
+    @property
+    def location(self) -> Path:
+        return Path(settings.ATTACHMENT_CACHE_DIR)
+
+    @staticmethod
+    def key(storage_name: str, version: str) -> str:
+        return hashlib.sha256(f"{storage_name}\0{version}".encode()).hexdigest()
+
+    def get_paths(
+        self, attachments: dict[str, FieldFile], directory: Path | None = None
+    ) -> list[Path]:
+        """Return the cached path of each attachment, downloading the missing ones.
+
+        With ``directory``, the attachments are linked into it (see get_path()) and
+        the linked paths are returned.
+        """
+        if not attachments:
+            return []
+        items = list(attachments.items())
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+            results = list(executor.map(lambda item: self._get(*item, directory), items))
+        self.evict(keep={cached_path.parent.name for cached_path, _ in results})
+        return [path for _, path in results]
+
+    def get_path(self, name: str, file: FieldFile, directory: Path | None = None) -> Path:
+        """Return the cached path of an attachment, downloading it if needed.
+
+        With ``directory``, the attachment is hard linked into it as soon as it is
+        found or downloaded, and the linked path is returned. The link can still be
+        read after another process evicts the entry. If the entry is evicted before
+        it can be linked, it is downloaded again.
+        """
+        return self._get(name, file, directory)[1]
+
+    def _get(self, name: str, file: FieldFile, directory: Path | None) -> tuple[Path, Path]:
+        """Return the cached path of an attachment and the path to read it from."""
+        with file.storage.open(file.name) as remote:
+            # S3File loads the object's metadata when opened. Other storages
+            # don't have an ETag, so fall back to the file size
+            obj = getattr(remote, "obj", None)
+            version = obj.e_tag if obj is not None else str(remote.size)
+            path = self.location / self.key(file.name, version) / name
+            if path.exists():
+                try:
+                    # Mark the entry as recently used
+                    os.utime(path.parent)
+                    linked_path = self.link(path, directory) if directory else path
+                except FileNotFoundError:
+                    logger.debug("Attachment evicted from cache", name=file.name, path=path)
+                else:
+                    logger.debug("Attachment found in cache", name=file.name, path=path)
+                    return path, linked_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            partial_path = path.with_name(f".{name}.{uuid.uuid4().hex}")
+            try:
+                with partial_path.open("wb") as local:
+                    if obj is not None:
+                        obj.download_fileobj(local)
+                    else:
+                        for chunk in remote.chunks():
+                            local.write(chunk)
+                # Link the download before it can be evicted
+                linked_path = self.link(partial_path, directory, name) if directory else path
+            except BaseException:
+                partial_path.unlink(missing_ok=True)
+                raise
+        try:
+            partial_path.replace(path)
+        except FileNotFoundError:
+            if directory is None:
+                raise
+            # The entry was evicted during the download, but the link is still readable
+        logger.info(
+            "Downloaded attachment to cache",
+            name=file.name,
+            path=path,
+            size=linked_path.stat().st_size,
+        )
+        return path, linked_path
+
+    def evict(self, keep: set[str] = frozenset()):
+        """Delete the least recently used entries, except the ones in ``keep``,
+        until the cache is no larger than ATTACHMENT_CACHE_MAX_SIZE.
+        """
+        entries = []
+        total = 0
+        for entry in self.location.iterdir():
+            try:
+                size = sum(path.stat().st_size for path in entry.iterdir())
+                entries.append((entry.stat().st_mtime, size, entry))
+            except FileNotFoundError:
+                # Evicted by another process
+                continue
+            total += size
+        for _, size, entry in sorted(entries):
+            if total <= settings.ATTACHMENT_CACHE_MAX_SIZE:
+                break
+            if entry.name in keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            logger.debug("Evicted attachment from cache", path=entry, size=size)
+
+    def link(self, path: Path, directory: Path, name: str | None = None) -> Path:
+        """Hard link a cached attachment into ``directory`` (as ``name``, if given) so
+        it can still be read if another process evicts it. Copies it if it can't be
+        linked.
+        """
+        target = directory / (name or path.name)
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copyfile(path, target)
+        return target
+
+
+attachment_cache = AttachmentCache()
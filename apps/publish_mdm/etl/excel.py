@@ -1,5 +1,6 @@
+import bisect
 import re
-from collections.abc import Generator
+from collections.abc import Callable, Generator
 
 import structlog
 from openpyxl.cell.cell import Cell
@@ -56,3 +57,119 @@ def find_cells_containing_value(sheet: Worksheet, value: str) -> Generator[Cell,
         for cell in row:
             if cell.value is not None and value in str(cell.value):
                 yield cell
+
+
+class SheetIndex:
+    """An index of a worksheet's cells, built in a single pass over the sheet, for
+    transformations that look up many values in the same sheet.
+
+    Maps header names (in the first row) to their cells and each (column, value)
+    pair below the header row to the first cell with that value. For substring and
+    regular expression searches, the cell values are also joined into a single
+    string per column (and one for the whole sheet) that is searched in one go.
+
+    The index reflects the cell values at the time it was built. Searches check
+    the current value of each matching cell, so cells changed since then are not
+    returned if they no longer match, but cells that only match after a change are
+    not found. Build a new index if that matters.
+    """
+
+    # Separates the cell values in the joined strings
+    separator = "\0"
+
+    def __init__(self, sheet: Worksheet):
+        self.sheet = sheet
+        self.headers: dict[str, Cell] = {}
+        self.cells_by_value: dict[tuple[int, object], Cell] = {}
+        # Non-empty cells below the header row, in row-major order
+        self._cells: list[Cell] = []
+        for row in sheet.iter_rows():
+            for cell in row:
+                if cell.value is None:
+                    continue
+                if cell.row == 1:
+                    self.headers.setdefault(cell.value, cell)
+                else:
+                    self.cells_by_value.setdefault((cell.column, cell.value), cell)
+                    self._cells.append(cell)
+        self._texts: dict[int | None, tuple[str, list[int], list[Cell]]] = {}
+
+    @classmethod
+    def of(cls, sheet: "Worksheet | SheetIndex") -> "SheetIndex":
+        """Return ``sheet`` if it is already an index, or index it."""
+        return sheet if isinstance(sheet, SheetIndex) else cls(sheet)
+
+    def header(self, column_name: str) -> Cell | None:
+        """Find the column header cell by name, like get_header()."""
+        header_cell = self.headers.get(column_name)
+        if not header_cell:
+            logger.debug("Could not find column header", column_name=column_name)
+        return header_cell
+
+    def column_cell(self, column_header: Cell, value) -> Cell | None:
+        """Find the first cell in the column with the value, like get_column_cell_by_value()."""
+        target_cell = self.cells_by_value.get((column_header.column, value))
+        if not target_cell:
+            logger.debug(
+                "Could not find value in column", column_name=column_header.value, value=value
+            )
+        return target_cell
+
+    def _text(self, column: int | None) -> tuple[str, list[int], list[Cell]]:
+        """The joined string of the cell values in the column (or the whole sheet),
+        with each value preceded by the separator, the offset of each value's
+        separator and the cells.
+        """
+        if column not in self._texts:
+            cells = [cell for cell in self._cells if column is None or cell.column == column]
+            offsets = []
+            parts = []
+            position = 0
+            for cell in cells:
+                offsets.append(position)
+                part = f"{self.separator}{cell.value}"
+                parts.append(part)
+                position += len(part)
+            self._texts[column] = ("".join(parts), offsets, cells)
+        return self._texts[column]
+
+    def _search(
+        self, pattern: re.Pattern, is_match: Callable[[str], bool], column: int | None
+    ) -> Generator[Cell, None, None]:
+        """Yield each cell in which ``pattern`` finds a match in the joined string and
+        ``is_match`` accepts its current value.
+        """
+        text, offsets, cells = self._text(column)
+        position = 0
+        while match := pattern.search(text, position):
+            index = bisect.bisect_right(offsets, match.start()) - 1
+            cell = cells[index]
+            if cell.value is not None and is_match(str(cell.value)):
+                yield cell
+                # Continue from the next cell
+                if index + 1 == len(offsets):
+                    return
+                position = offsets[index + 1]
+            else:
+                # Either the cell was changed, or the match spans several cells
+                position = match.start() + 1
+
+    def find_containing(self, value: str, column: int | None = None) -> Generator[Cell, None, None]:
+        """Find every cell below the header row (in the column, if given) that contains
+        the value, like find_cells_containing_value().
+        """
+        yield from self._search(re.compile(re.escape(value)), lambda text: value in text, column)
+
+    def search(
+        self, pattern: str, column: int | None = None, anchored: bool = False
+    ) -> Generator[Cell, None, None]:
+        """Find every cell below the header row (in the column, if given) in which the
+        regular expression matches. With ``anchored``, the match must be at the start
+        of the value, as with re.match().
+        """
+        compiled = re.compile(pattern)
+        if anchored:
+            joined = re.compile(f"{re.escape(self.separator)}(?:{pattern})", compiled.flags)
+            yield from self._search(joined, lambda text: bool(compiled.match(text)), column)
+        else:
+            yield from self._search(compiled, lambda text: bool(compiled.search(text)), column)
@@ -1,12 +1,37 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+
 import structlog
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from google.oauth2.credentials import Credentials
 from gspread import Client, HTTPClient
-from gspread.utils import ExportFormat
+from gspread.urls import DRIVE_FILES_API_V3_URL
+from gspread.utils import ExportFormat, extract_id_from_url
+
+from .tracing import span
 
 logger = structlog.getLogger(__name__)
 
+# Authorized clients, keyed by the user's refresh token (or access token if the
+# user has no refresh token), so each user's session and its refreshed access
+# token are reused across downloads.
+GSPREAD_CLIENTS_MAX_SIZE = 128
+_gspread_clients: OrderedDict[str, Client] = OrderedDict()
+_gspread_clients_lock = threading.Lock()
+
+
+class GoogleSheetFile(SimpleUploadedFile):
+    """An Excel export of a Google Sheet, along with the Drive revision it was
+    exported from.
+    """
+
+    def __init__(self, name, content, revision: str = "", reused: bool = False):
+        super().__init__(name=name, content=content, content_type=ExportFormat.EXCEL)
+        self.revision = revision
+        self.reused = reused
+
 
 def gspread_client(token: str, token_secret: str) -> Client:
     """Manually create a Google Sheets client using the provided user's token and
@@ -22,23 +47,78 @@ def gspread_client(token: str, token_secret: str) -> Client:
     return Client(auth=credentials, http_client=HTTPClient)
 
 
+def get_gspread_client(token: str, token_secret: str) -> Client:
+    """Return the authorized Google Sheets client for a user, creating it on first use."""
+    key = token_secret or token
+    with _gspread_clients_lock:
+        if key in _gspread_clients:
+            _gspread_clients.move_to_end(key)
+            return _gspread_clients[key]
+    gc = gspread_client(token=token, token_secret=token_secret)
+    with _gspread_clients_lock:
+        _gspread_clients[key] = gc
+        while len(_gspread_clients) > GSPREAD_CLIENTS_MAX_SIZE:
+            _gspread_clients.popitem(last=False)
+    return gc
+
+
+def clear_gspread_clients():
+    """Forget all cached Google Sheets clients."""
+    with _gspread_clients_lock:
+        _gspread_clients.clear()
+
+
 def export_sheet_by_url(gc: Client, sheet_url: str) -> bytes:
     """Export a Google Sheet by URL to an Excel file byte string."""
-    sheet = gc.open_by_url(url=sheet_url)
-    return sheet.export(format=ExportFormat.EXCEL)
+    return gc.export(extract_id_from_url(sheet_url), format=ExportFormat.EXCEL)
+
+
+def get_sheet_revision(gc: Client, sheet_url: str) -> str:
+    """Return a string identifying the current revision of a Google Sheet.
+
+    It combines the file ID with the Drive ``version`` (which increases on every
+    change to the file) and ``modifiedTime``, so it only matches a previous value
+    if the sheet has not changed since. An empty string is returned if the
+    metadata can't be fetched, which callers should treat as "unknown".
+    """
+    file_id = extract_id_from_url(sheet_url)
+    try:
+        response = gc.http_client.request(
+            "get",
+            f"{DRIVE_FILES_API_V3_URL}/{file_id}",
+            params={"supportsAllDrives": True, "fields": "version,modifiedTime"},
+        )
+        metadata = response.json()
+    except Exception as e:
+        logger.warning("Could not get Google Sheet revision", file_id=file_id, error=str(e))
+        return ""
+    if not isinstance(metadata, dict) or not metadata.get("version"):
+        return ""
+    return f"{file_id}:{metadata['version']}:{metadata.get('modifiedTime', '')}"
 
 
 def download_user_google_sheet(
-    token: str, token_secret: str, sheet_url: str, name: str
-) -> SimpleUploadedFile:
+    token: str,
+    token_secret: str,
+    sheet_url: str,
+    name: str,
+    cached_content: Callable[[str], bytes | None] | None = None,
+) -> GoogleSheetFile:
     """Download a Google Sheet by URL and return a Django SimpleUploadedFile to use in
     a Django model FileField.
+
+    If ``cached_content`` is given, it is called with the sheet's current revision
+    and may return the Excel content previously exported from that revision, in
+    which case the (slow) export is skipped.
     """
-    logger.info("Downloading Google Sheet", name=name)
-    gc = gspread_client(token=token, token_secret=token_secret)
-    content = export_sheet_by_url(gc=gc, sheet_url=sheet_url)
-    return SimpleUploadedFile(
-        name=name,
-        content=content,
-        content_type=ExportFormat.EXCEL,
-    )
+    gc = get_gspread_client(token=token, token_secret=token_secret)
+    with span("google.sheet_revision"):
+        revision = get_sheet_revision(gc=gc, sheet_url=sheet_url)
+    if revision and cached_content and (content := cached_content(revision)) is not None:
+        logger.info("Reusing unchanged Google Sheet", name=name, revision=revision)
+        return GoogleSheetFile(name=name, content=content, revision=revision, reused=True)
+    logger.info("Downloading Google Sheet", name=name, revision=revision)
+    with span("google.export") as data:
+        content = export_sheet_by_url(gc=gc, sheet_url=sheet_url)
+        data["bytes"] = len(content)
+    return GoogleSheetFile(name=name, content=content, revision=revision)
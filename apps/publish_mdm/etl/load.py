@@ -1,30 +1,47 @@
 import contextlib
 import tempfile
 from collections.abc import Callable, Sequence
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
 from pathlib import Path
 
 import structlog
 from django.conf import settings
 from django.core.files.storage import storages
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.db import transaction
+from django.db import models, transaction
+from django.utils import timezone
 from pydantic import BaseModel, field_validator
 from storages.base import BaseStorage
 
 from apps.users.models import User
 
+from ..attachments import attachment_cache
+from ..form_files import form_file_store
 from ..models import (
     AppUser,
+    AppUserFormTemplate,
     CentralServer,
     FormTemplate,
     FormTemplateVersion,
     Project,
+    PublishRun,
 )
+from ..qrcodes import qr_code_cache
 from .odk.client import PublishMDMClient
-from .odk.qrcode import create_app_user_qrcode
+from .odk.metrics import track_central_calls
+from .odk.qrcode import build_collect_settings, collect_settings_hash, create_app_user_qrcode
+from .tracing import publish_transaction, span
 
 logger = structlog.getLogger(__name__)
 
+# Below this many QR codes, rendering in-process is faster than starting a process pool
+QR_CODE_POOL_MIN_SIZE = 20
+# Cache key holding {"done": ..., "total": ...} while QR codes are generated in the background
+QR_CODE_PROGRESS_CACHE_KEY = "app-user-qr-codes-progress:{project_pk}"
+# Cache key holding {"done": ..., "total": ...} while a project is synced in the background
+PROJECT_SYNC_PROGRESS_CACHE_KEY = "central-project-sync-progress:{server_pk}:{project_id}"
+
 
 class PublishTemplateEvent(BaseModel):
     """Model to parse and validate the publish WebSocket message payload."""
@@ -49,10 +66,43 @@ def publish_form_template(event: PublishTemplateEvent, user: User, send_message:
     * Create the next version of the form template and app user versions
     * Get or create app users in ODK Central
     * Publish each app user version to ODK Central
+
+    Each publish is recorded in a PublishRun, along with the time spent in each
+    step, which is also sent as a summary before the final message.
     """
     send_message(f"New {event!r}")
     # Get the form template
     form_template = FormTemplate.objects.select_related().get(id=event.form_template)
+    run = PublishRun.objects.create(form_template=form_template, user=user)
+    with (
+        publish_transaction("publish_form_template") as trace,
+        track_central_calls("publish_form_template") as central_calls,
+    ):
+        try:
+            _publish_form_template(
+                event=event,
+                form_template=form_template,
+                user=user,
+                run=run,
+                send_message=send_message,
+            )
+        except BaseException:
+            # The template version was rolled back with the rest of the publish
+            run.template_version = None
+            run.finish(PublishRun.Status.FAILED, trace=trace)
+            raise
+        run.finish(PublishRun.Status.SUCCEEDED, trace=trace)
+    send_message(f"Timings: {trace.summary()}; {central_calls.count} Central API call(s)")
+    send_message(f"Successfully published {run.template_version.version}", complete=True)
+
+
+def _publish_form_template(
+    event: PublishTemplateEvent,
+    form_template: FormTemplate,
+    user: User,
+    run: PublishRun,
+    send_message: Callable,
+):
     send_message(f"Publishing next version of {form_template!r}")
     # Get the next version by querying ODK Central
     form_template.project.central_server.decrypt()
@@ -69,18 +119,29 @@ def publish_form_template(event: PublishTemplateEvent, user: User, send_message:
     file = form_template.download_user_google_sheet(
         user=user, name=f"{form_template.form_id_base}-{version}.xlsx"
     )
-    send_message(f"Downloaded template: {file}")
+    if file.reused:
+        send_message(f"Template unchanged since the last version, reusing it: {file}")
+    else:
+        send_message(f"Downloaded template: {file}")
     with transaction.atomic():
         # Create the next version locally
-        template_version = FormTemplateVersion.objects.create(
-            form_template=form_template, user=user, file=file, version=version
+        with span("storage.save_template") as data:
+            template_file = form_file_store.store(file)
+            data["bytes"] = file.size
+        run.template_version = FormTemplateVersion.objects.create(
+            form_template=form_template,
+            user=user,
+            file=template_file,
+            version=version,
+            sheet_revision=file.revision,
         )
         # Create a version for each app user locally
         app_users = form_template.get_app_users(names=event.app_users)
         attachments = {i.name: i.file for i in form_template.project.attachments.all()}
-        app_user_versions = template_version.create_app_user_versions(
+        app_user_versions = run.template_version.create_app_user_versions(
             app_users=app_users, send_message=send_message, attachments=attachments
         )
+        run.app_users = len(app_user_versions)
         # Get or create app users in ODK Central
         central_app_user_assignments = client.publish_mdm.get_or_create_app_users(
             display_names=[app_user.name for app_user in app_users]
@@ -94,13 +155,25 @@ def publish_form_template(event: PublishTemplateEvent, user: User, send_message:
         # At this point `attachments` will contain only the attachments detected
         # in the form. Get local absolute paths for them
         with attachment_paths_for_upload(attachments) as attachment_paths:
-            # Publish each app user form version to ODK Central
+            # Publish each app user form version to ODK Central, except the ones
+            # that did not change since the version that is still in Central
+            central_forms = {}
+            if any(version.unchanged_versions for version in app_user_versions):
+                central_forms = client.publish_mdm.get_forms()
             for app_user_version in app_user_versions:
+                if app_user_version.is_unchanged_in(central_forms):
+                    run.forms_skipped += 1
+                    send_message(
+                        f"Form unchanged, skipped publishing: {app_user_version.xml_form_id}"
+                    )
+                    continue
+                app_user_version.store_rendered_file()
                 form = client.publish_mdm.create_or_update_form(
                     xml_form_id=app_user_version.app_user_form_template.xml_form_id,
                     definition=app_user_version.file.read(),
                     attachments=attachment_paths,
                 )
+                run.forms_published += 1
                 send_message(f"Published form: {form.xmlFormId}")
         # Create or update the form assignments on the server
         for assignment in central_app_user_assignments.values():
@@ -110,39 +183,61 @@ def publish_form_template(event: PublishTemplateEvent, user: User, send_message:
         update_app_users_central_id(
             project=form_template.project, app_users=central_app_user_assignments
         )
-    send_message(f"Successfully published {version}", complete=True)
 
 
 @transaction.atomic
-def update_app_users_central_id(project: Project, app_users):
+def update_app_users_central_id(project: Project, app_users) -> int:
     """Update AppUser.central_id for any user related to `project` that has a
     null central_id, using the data in `app_users`. `app_users` should be a dict
     mapping user names to ProjectAppUserAssignment objects, like the dict returned
     by PublishService.get_or_create_app_users().
+
+    The matched users are updated with a single bulk UPDATE. Returns the number
+    of updated users.
     """
-    for app_user in project.app_users.filter(name__in=app_users, central_id__isnull=True):
+    now = timezone.now()
+    updated = list(
+        project.app_users.filter(name__in=app_users, central_id__isnull=True).only(
+            "id", "project", "name"
+        )
+    )
+    for app_user in updated:
         app_user.central_id = app_users[app_user.name].id
-        app_user.save()
+        app_user.modified_at = now
+    AppUser.objects.bulk_update(updated, fields=["central_id", "modified_at"])
+    if updated:
         logger.info(
             "Updated AppUser.central_id",
-            id=app_user.id,
-            name=app_user.name,
-            central_id=app_user.central_id,
+            project_id=project.id,
+            count=len(updated),
+            central_ids={app_user.name: app_user.central_id for app_user in updated},
         )
+    return len(updated)
 
 
+@track_central_calls("generate_and_save_app_user_collect_qrcodes")
 def generate_and_save_app_user_collect_qrcodes(
     project: Project,
     app_users: Sequence[AppUser] | None = None,
-):
+    progress: Callable[[int, int], None] | None = None,
+    parallel: bool = False,
+    max_workers: int | None = None,
+) -> dict[str, int]:
     """Generate and save QR codes for app users in the project.
 
     If app_users is provided, only generate QR codes for those users.
     Otherwise, generate QR codes for all app users in the project.
+
+    App users that already have a QR code built from the same Collect settings
+    are skipped. The others are rendered one by one, or if ``parallel`` is true
+    (only in background jobs, never in a web request), in a process pool for
+    large batches, and saved as they complete. If given, ``progress`` is called
+    with the number of processed app users and the total after each one.
     """
     if app_users is None:
         app_users = project.app_users.all()
-    logger.info("Generating QR codes", project=project.name, app_users=len(app_users))
+    total = len(app_users)
+    logger.info("Generating QR codes", project=project.name, app_users=total)
     project.central_server.decrypt()
     with PublishMDMClient(
         central_server=project.central_server, project_id=project.central_id
@@ -151,24 +246,103 @@ def generate_and_save_app_user_collect_qrcodes(
             display_names=[app_user.name for app_user in app_users],
         )
         logger.info("Got central app users", central_app_users=len(central_app_users))
+        qrcode_kwargs = {
+            "admin_pw": project.get_admin_pw(),
+            "base_url": client.session.base_url,
+            "project_id": project.central_id,
+            "project_name_prefix": project.name,
+            "language": project.app_language or settings.DEFAULT_APP_LANGUAGE,
+        }
+        done = 0
+        pending = []
         for app_user in app_users:
-            logger.info("Generating QR code", app_user=app_user.name)
-            image, app_user.qr_code_data = create_app_user_qrcode(
-                app_user=central_app_users[app_user.name],
-                admin_pw=project.get_admin_pw(),
-                base_url=client.session.base_url,
-                project_id=project.central_id,
-                project_name_prefix=project.name,
-                language=project.app_language or settings.DEFAULT_APP_LANGUAGE,
-            )
-            app_user.qr_code.save(
-                f"{app_user.name}.png",
-                SimpleUploadedFile("qrcode.png", image.getvalue(), content_type="image/png"),
-            )
+            central_app_user = central_app_users[app_user.name]
+            if app_user.qr_code and app_user.qr_code_data:
+                collect_settings = build_collect_settings(
+                    app_user=central_app_user, **qrcode_kwargs
+                )
+                if collect_settings_hash(collect_settings) == collect_settings_hash(
+                    app_user.qr_code_data
+                ):
+                    logger.debug("QR code unchanged", app_user=app_user.name)
+                    done += 1
+                    continue
+            pending.append((app_user, central_app_user))
+        skipped = done
+        if progress and done:
+            progress(done, total)
 
+        def save(app_user, image, qr_code_data):
+            nonlocal done
+            app_user.qr_code_data = qr_code_data
+            app_user.qr_code = qr_code_cache.store(image.getvalue())
+            app_user.save()
+            done += 1
+            if progress:
+                progress(done, total)
 
-def sync_central_project(server: CentralServer, project_id: int) -> Project:
-    """Sync a project from ODK Central to the local database."""
+        if not parallel or len(pending) < QR_CODE_POOL_MIN_SIZE:
+            for app_user, central_app_user in pending:
+                logger.info("Generating QR code", app_user=app_user.name)
+                save(app_user, *create_app_user_qrcode(app_user=central_app_user, **qrcode_kwargs))
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(
+                        create_app_user_qrcode, app_user=central_app_user, **qrcode_kwargs
+                    ): app_user
+                    for app_user, central_app_user in pending
+                }
+                for future in as_completed(futures):
+                    save(futures[future], *future.result())
+    logger.info("Generated QR codes", project=project.name, generated=len(pending), skipped=skipped)
+    return {"generated": len(pending), "skipped": skipped}
+
+
+# Number of steps reported by sync_central_project() to its progress callback
+PROJECT_SYNC_STEPS = 4
+
+
+@dataclass
+class ProjectSync:
+    """The result of sync_central_project(): the local Project and the number of
+    rows that were created or updated to match ODK Central.
+    """
+
+    project: Project
+    project_created: bool = False
+    app_users_created: int = 0
+    app_users_linked: int = 0
+    app_users_skipped: int = 0
+    form_templates_created: int = 0
+    app_user_forms_created: int = 0
+
+    def summary(self) -> dict[str, int]:
+        return {
+            "project_created": int(self.project_created),
+            "app_users_created": self.app_users_created,
+            "app_users_linked": self.app_users_linked,
+            "app_users_skipped": self.app_users_skipped,
+            "form_templates_created": self.form_templates_created,
+            "app_user_forms_created": self.app_user_forms_created,
+        }
+
+
+@track_central_calls("sync_central_project")
+def sync_central_project(
+    server: CentralServer,
+    project_id: int,
+    progress: Callable[[int, int], None] | None = None,
+) -> ProjectSync:
+    """Sync a project from ODK Central to the local database.
+
+    The project's app users and forms are fetched from Central first, then
+    compared with the local rows loaded in a few queries, and only the missing
+    rows are inserted in bulk. Local app users without a central_id are linked
+    to the Central app user with the same name. If given, ``progress`` is called
+    with the number of completed steps and PROJECT_SYNC_STEPS.
+    """
+    progress = progress or (lambda done, total: None)
     with PublishMDMClient(central_server=server, project_id=project_id) as client:
         logger.debug(
             "Syncing Project",
@@ -176,83 +350,146 @@ def sync_central_project(server: CentralServer, project_id: int) -> Project:
             base_url=server.base_url,
             organization=server.organization,
         )
-        # Project
         central_project = client.projects.get()
+        central_app_users = client.publish_mdm.get_app_users()
+        progress(1, PROJECT_SYNC_STEPS)
+        central_forms = client.publish_mdm.get_forms()
+        central_form_templates = client.publish_mdm.find_form_templates(
+            app_users=central_app_users, forms=central_forms
+        )
+        progress(2, PROJECT_SYNC_STEPS)
+
+    with transaction.atomic():
         project, created = Project.objects.get_or_create(
             central_id=central_project.id,
             central_server=server,
             organization=server.organization,
             defaults={"name": central_project.name},
         )
-        logger.info(
-            f"{'Created' if created else 'Retrieved'} Project",
-            id=project.id,
-            central_id=project.central_id,
-            project_name=project.name,
-            organization=server.organization,
-        )
-        # AppUser
-        central_app_users = client.publish_mdm.get_app_users()
-        for central_app_user in central_app_users.values():
-            if not central_app_user.deletedAt:
-                app_user, created = project.app_users.get_or_create(
+        result = ProjectSync(project=project, project_created=created)
+        app_user_pks = _sync_app_users(result, central_app_users.values())
+        progress(3, PROJECT_SYNC_STEPS)
+        _sync_form_templates(result, central_form_templates, app_user_pks)
+        progress(4, PROJECT_SYNC_STEPS)
+
+    logger.info(
+        "Synced Project",
+        id=project.id,
+        central_id=project.central_id,
+        project_name=project.name,
+        organization=server.organization,
+        **result.summary(),
+    )
+    return result
+
+
+def _sync_app_users(result: ProjectSync, central_app_users) -> dict[int, int]:
+    """Create the project's missing app users and return a mapping of Central app
+    user IDs to AppUser primary keys.
+    """
+    project = result.project
+    existing = list(project.app_users.only("id", "project", "name", "central_id"))
+    by_central_id = {app_user.central_id: app_user for app_user in existing}
+    by_name = {app_user.name: app_user for app_user in existing}
+    to_create, to_link = [], []
+    for central_app_user in central_app_users:
+        if central_app_user.deletedAt or central_app_user.id in by_central_id:
+            continue
+        app_user = by_name.get(central_app_user.displayName)
+        if app_user is None:
+            to_create.append(
+                AppUser(
+                    project=project,
+                    name=central_app_user.displayName,
                     central_id=central_app_user.id,
-                    defaults={"name": central_app_user.displayName},
-                )
-                logger.info(
-                    f"{'Created' if created else 'Retrieved'} AppUser",
-                    id=app_user.id,
-                    central_id=app_user.central_id,
-                    app_user_name=app_user.name,
                 )
-        # FormTemplate
-        central_forms = client.publish_mdm.get_forms()
-        central_form_templates = client.publish_mdm.find_form_templates(
-            app_users=central_app_users, forms=central_forms
-        )
-        for form_id_base, app_users in central_form_templates.items():
-            form_name = app_users[0].forms[0].name.split("[")[0].strip()
-            form_template, created = project.form_templates.get_or_create(
-                form_id_base=form_id_base,
-                defaults={"title_base": form_name},
             )
-            logger.info(
-                f"{'Created' if created else 'Retrieved'} FormTemplate",
-                id=form_template.id,
-                form_id_base=form_template.form_id_base,
-                form_title_base=form_template.title_base,
+        elif app_user.central_id is None:
+            app_user.central_id = central_app_user.id
+            to_link.append(app_user)
+        else:
+            # The name is already used by an app user linked to another Central app user
+            result.app_users_skipped += 1
+            logger.warning(
+                "Skipped AppUser with a duplicate name",
+                project_id=project.id,
+                central_id=central_app_user.id,
+                app_user_name=central_app_user.displayName,
             )
-            for app_user in app_users:
-                app_user_form, created = form_template.app_user_forms.get_or_create(
-                    app_user=project.app_users.get(central_id=app_user.id),
-                )
-                logger.info(
-                    f"{'Created' if created else 'Retrieved'} AppUserFormTemplate",
-                    id=app_user_form.id,
-                )
+    AppUser.objects.bulk_update(to_link, fields=["central_id"])
+    result.app_users_linked = len(to_link)
+    result.app_users_created = _insert_missing(project.app_users.all(), to_create)
+    return dict(project.app_users.filter(central_id__isnull=False).values_list("central_id", "pk"))
+
+
+def _sync_form_templates(result: ProjectSync, central_form_templates, app_user_pks):
+    """Create the project's missing form templates and app user assignments."""
+    project = result.project
+    form_templates = {}
+    for form_template in project.form_templates.only("id", "project", "form_id_base").order_by(
+        "pk"
+    ):
+        form_templates.setdefault(form_template.form_id_base, form_template)
+    to_create = [
+        FormTemplate(
+            project=project,
+            form_id_base=form_id_base,
+            title_base=app_users[0].forms[0].name.split("[")[0].strip(),
+        )
+        for form_id_base, app_users in central_form_templates.items()
+        if form_id_base not in form_templates
+    ]
+    for form_template in FormTemplate.objects.bulk_create(to_create):
+        form_templates[form_template.form_id_base] = form_template
+    result.form_templates_created = len(to_create)
 
-    return project
+    existing = set(
+        AppUserFormTemplate.objects.filter(form_template__project=project).values_list(
+            "app_user_id", "form_template_id"
+        )
+    )
+    pairs = {
+        (app_user_pks[app_user.id], form_templates[form_id_base].pk)
+        for form_id_base, app_users in central_form_templates.items()
+        for app_user in app_users
+        if app_user.id in app_user_pks
+    }
+    to_create = [
+        AppUserFormTemplate(app_user_id=app_user_pk, form_template_id=form_template_pk)
+        for app_user_pk, form_template_pk in sorted(pairs - existing)
+    ]
+    result.app_user_forms_created = _insert_missing(
+        AppUserFormTemplate.objects.filter(form_template__project=project), to_create
+    )
+
+
+def _insert_missing(queryset: models.QuerySet, objs: list) -> int:
+    """Bulk create the objects, skipping any that conflict with rows created since
+    they were checked (e.g. by another sync of the project), and return how many
+    rows were inserted into ``queryset``.
+    """
+    if not objs:
+        return 0
+    count = queryset.count()
+    queryset.model.objects.bulk_create(objs, ignore_conflicts=True)
+    return queryset.count() - count
 
 
 @contextlib.contextmanager
 def attachment_paths_for_upload(attachments: dict[str, SimpleUploadedFile]):
     """Get local filesystem paths for the attachments provided. The attachments
     should be the values from the `ProjectAttachment.file` field. If an external
-    storage is being used (like S3), the attachments will be downloaded and saved
-    in temp files.
+    storage is being used (like S3), the attachments are downloaded to a local
+    disk cache (see AttachmentCache) and linked into a temp directory.
     """
     if not isinstance(storages["default"], BaseStorage):
         # Just return the paths if the default storage is a local filesystem
         yield [file.path for file in attachments.values()]
     else:
         with tempfile.TemporaryDirectory() as tmpdirname:
-            temp_dir = Path(tmpdirname)
-            paths = []
-            for name, file in attachments.items():
-                path = temp_dir / name
-                logger.debug("Temporarily saving attachment for upload", path=path)
-                path.write_bytes(file.read())
-                paths.append(path)
+            with span("storage.attachments") as data:
+                paths = attachment_cache.get_paths(attachments, directory=Path(tmpdirname))
+                data["bytes"] = sum(path.stat().st_size for path in paths)
             yield paths
 
 
@@ -1,3 +1,4 @@
+import time
 from pathlib import Path
 
 import structlog
@@ -5,7 +6,9 @@ from pyodk._endpoints.auth import AuthService
 from pyodk._utils import config
 from pyodk.client import Client, Session
 from pyodk.errors import PyODKError
+from requests import RequestException
 
+from .metrics import record_central_call
 from .publish import PublishService
 
 logger = structlog.getLogger(__name__)
@@ -50,6 +53,32 @@ class PublishMDMAuthService(AuthService):
             raise err
 
 
+class PublishMDMSession(Session):
+    """pyODK session that records the method, endpoint, latency and retries of
+    every request it sends (see apps.publish_mdm.etl.odk.metrics).
+    """
+
+    def send(self, request, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except RequestException:
+            record_central_call(
+                request.method, request.url, time.perf_counter() - start, error=True
+            )
+            raise
+        # urllib3 keeps the retries made for the request on the raw response
+        retry = getattr(response.raw, "retries", None)
+        record_central_call(
+            request.method,
+            request.url,
+            time.perf_counter() - start,
+            error=response.status_code >= 400,
+            retries=len(getattr(retry, "history", ())),
+        )
+        return response
+
+
 class PublishMDMClient(Client):
     """Extended pyODK Client for interacting with ODK Central."""
 
@@ -67,7 +96,7 @@ class PublishMDMClient(Client):
             cache_path.write_text('token = ""')
         # Create a session with the given authentication details and supply the
         # session to the super class, so it doesn't try and create one itself
-        session = Session(
+        session = PublishMDMSession(
             base_url=central_server.base_url,
             api_version="v1",
             username=central_server.username,
@@ -0,0 +1,125 @@
+import contextlib
+import contextvars
+import re
+from collections import Counter
+from urllib.parse import urlparse
+
+import structlog
+from django.conf import settings
+from django.core.signals import request_finished
+from django.dispatch import receiver
+
+from apps.patterns.metrics import CallMetrics
+
+logger = structlog.getLogger(__name__)
+
+central_api_metrics = CallMetrics(
+    name="publish_mdm_central_api",
+    description="ODK Central API",
+    label_names=("method", "endpoint"),
+)
+
+# Placeholders for the path segments that follow these segments in Central API URLs
+NAMED_SEGMENTS = {
+    "forms": "{xmlFormId}",
+    "versions": "{version}",
+    "attachments": "{filename}",
+    "submissions": "{instanceId}",
+    "datasets": "{name}",
+    "entities": "{uuid}",
+}
+
+_active_trackers: contextvars.ContextVar[tuple["CentralCallTracker", ...]] = contextvars.ContextVar(
+    "central_call_trackers", default=()
+)
+
+
+def endpoint_template(url: str) -> str:
+    """Return the Central API endpoint for a request URL, with IDs and names replaced
+    by placeholders, like ``projects/{id}/forms/{xmlFormId}/draft``.
+    """
+    path = urlparse(url).path
+    _, _, path = path.partition("/v1/")
+    segments = [segment for segment in path.split("/") if segment]
+    for i, segment in enumerate(segments):
+        if i and segments[i - 1] in NAMED_SEGMENTS:
+            segments[i] = NAMED_SEGMENTS[segments[i - 1]]
+        elif re.fullmatch(r"\d+", segment):
+            segments[i] = "{id}"
+    return "/".join(segments)
+
+
+class CentralCallTracker:
+    """The Central API calls made during one operation (see track_central_calls())."""
+
+    def __init__(self, operation: str, budget: int):
+        self.operation = operation
+        self.budget = budget
+        self.calls: Counter[tuple[str, str]] = Counter()
+        self.seconds = 0.0
+        self.errors = 0
+        self.retries = 0
+
+    @property
+    def count(self) -> int:
+        return self.calls.total()
+
+    @property
+    def over_budget(self) -> bool:
+        return self.count > self.budget
+
+    def record(self, method: str, endpoint: str, seconds: float, error: bool, retries: int):
+        self.calls[method, endpoint] += 1
+        self.seconds += seconds
+        self.errors += error
+        self.retries += retries
+
+    def summary(self) -> str:
+        return ", ".join(
+            f"{method} {endpoint} x{count}"
+            for (method, endpoint), count in self.calls.most_common()
+        )
+
+
+@contextlib.contextmanager
+def track_central_calls(operation: str, budget: int | None = None):
+    """Count the Central API calls made within the block, by endpoint, and log them.
+    A warning is logged if there are more than ``budget`` calls (by default
+    CENTRAL_API_CALL_BUDGET), which usually means an endpoint is called in a loop.
+    """
+    if budget is None:
+        budget = settings.CENTRAL_API_CALL_BUDGET
+    tracker = CentralCallTracker(operation, budget)
+    token = _active_trackers.set((*_active_trackers.get(), tracker))
+    try:
+        yield tracker
+    finally:
+        _active_trackers.reset(token)
+        # Share the calls with the other processes, for operations run by Dagster
+        central_api_metrics.share()
+        log = logger.warning if tracker.over_budget else logger.info
+        log(
+            "Central API call budget exceeded" if tracker.over_budget else "Central API calls",
+            operation=operation,
+            calls=tracker.count,
+            budget=budget,
+            seconds=round(tracker.seconds, 3),
+            errors=tracker.errors,
+            retries=tracker.retries,
+            endpoints=tracker.summary(),
+        )
+
+
+def record_central_call(
+    method: str, url: str, seconds: float, error: bool = False, retries: int = 0
+):
+    """Add a Central API call to the process-wide metrics and the active trackers."""
+    endpoint = endpoint_template(url)
+    central_api_metrics.observe((method, endpoint), seconds, error=error, retries=retries)
+    for tracker in _active_trackers.get():
+        tracker.record(method, endpoint, seconds, error=error, retries=retries)
+
+
+@receiver(request_finished)
+def share_central_api_metrics(sender, **kwargs):
+    central_api_metrics.share()
@@ -10,6 +10,7 @@ from pyodk._endpoints.form_assignments import FormAssignmentService
 from pyodk._endpoints.forms import Form
 from pyodk._endpoints.project_app_users import ProjectAppUser, ProjectAppUserService
 
+from ..tracing import span
 from .constants import APP_USER_ROLE_ID
 
 if TYPE_CHECKING:
@@ -62,6 +63,7 @@ class PublishService(bases.Service):
             app_users = {name: user for name, user in app_users.items() if name in display_names}
         return app_users
 
+    @span("central.app_users")
     def get_or_create_app_users(
         self, display_names: list[str], project_id: int | None = None
     ) -> dict[str, ProjectAppUserAssignment]:
@@ -98,12 +100,13 @@ class PublishService(bases.Service):
             except ValueError:
                 continue
             if app_user := app_users.get(maybe_app_user):
-                user = app_user.model_copy(deep=True)
-                user.forms.append(form)
+                # A shallow copy is enough, only the forms list differs
+                user = app_user.model_copy(update={"forms": [*app_user.forms, form]})
                 form_templates[xml_form_id_base].append(user)
         logger.info("Found form templates", form_templates=list(form_templates.keys()))
         return form_templates
 
+    @span("central.version")
     def get_unique_version_by_form_id(
         self, xml_form_id_base: str, project_id: int | None = None, form_template=None
     ):
@@ -143,6 +146,23 @@ class PublishService(bases.Service):
         project_id: int | None = None,
     ) -> Form:
         """Return forms for the given form IDs, creating them if they don't exist."""
+        with span("central.publish_form") as data:
+            if isinstance(definition, bytes):
+                data["bytes"] = len(definition)
+            return self._create_or_update_form(
+                xml_form_id=xml_form_id,
+                definition=definition,
+                attachments=attachments,
+                project_id=project_id,
+            )
+
+    def _create_or_update_form(
+        self,
+        xml_form_id: str,
+        definition: PathLike | bytes,
+        attachments: list[PathLike | bytes] | None,
+        project_id: int | None,
+    ) -> Form:
         central_forms = self.get_forms(project_id=project_id)
         # Updated an existing form if it exists
         if xml_form_id in central_forms:
@@ -201,6 +221,7 @@ class PublishService(bases.Service):
             return {i["id"] for i in response.json()}
         return set()
 
+    @span("central.assign_forms")
     def assign_app_users_forms(
         self, app_users: list[ProjectAppUserAssignment], project_id: int | None = None
     ) -> None:
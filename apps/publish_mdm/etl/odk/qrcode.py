@@ -1,13 +1,15 @@
 import base64
+import copy
+import functools
+import hashlib
 import io
 import json
 import zlib
 from pathlib import Path
 
+import segno
 import structlog
-from PIL import Image, ImageDraw, ImageFont, ImageOps
-
-from apps.publish_mdm.utils import create_qr_code
+from PIL import Image, ImageDraw, ImageFont
 
 from .constants import DEFAULT_COLLECT_SETTINGS
 from .publish import ProjectAppUserAssignment
@@ -24,7 +26,8 @@ def build_collect_settings(
     admin_pw: str = "",
 ):
     """Build Collect settings for the given app user."""
-    collect_settings = DEFAULT_COLLECT_SETTINGS.copy()
+    # Deep copy so settings built for one app user never leak into another's
+    collect_settings = copy.deepcopy(DEFAULT_COLLECT_SETTINGS)
 
     if admin_pw:
         collect_settings["admin"]["admin_pw"] = admin_pw
@@ -40,6 +43,40 @@ def build_collect_settings(
     return collect_settings
 
 
+def collect_settings_hash(collect_settings: dict) -> str:
+    """Return a stable hash of Collect settings, used to detect unchanged QR codes."""
+    payload = json.dumps(collect_settings, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@functools.cache
+def get_label_font() -> ImageFont.FreeTypeFont:
+    """Load the QR code label font once per process."""
+    return ImageFont.truetype(Path(__file__).parent / "Roboto-Regular.ttf", 24)
+
+
+def render_labeled_qrcode(qr_data: bytes, label: str, scale: int = 4, border: int = 4) -> bytes:
+    """Render ``qr_data`` as a PNG QR code with ``label`` written below it.
+
+    The QR modules are drawn straight into a PIL image (instead of encoding a PNG
+    with segno and decoding it again) and the label font is cached, so this is
+    cheap enough to call for thousands of app users. It only takes picklable
+    arguments so it can run in a process pool.
+    """
+    code = segno.make(qr_data, micro=False)
+    width, height = code.symbol_size(scale=scale, border=border)
+    pixels = bytes(
+        0 if dark else 255 for row in code.matrix_iter(scale=scale, border=border) for dark in row
+    )
+    png = Image.new("RGB", (width, height + 30), (255, 255, 255))
+    png.paste(Image.frombytes("L", (width, height), pixels))
+    draw = ImageDraw.Draw(png)
+    draw.text((20, height - 10), label, font=get_label_font(), fill=(0, 0, 0))
+    png_buffer = io.BytesIO()
+    png.save(png_buffer, format="PNG")
+    return png_buffer.getvalue()
+
+
 def create_app_user_qrcode(
     app_user: ProjectAppUserAssignment,
     admin_pw: str,
@@ -60,20 +97,8 @@ def create_app_user_qrcode(
         language=language,
     )
 
-    # Generate QR code with segno
     qr_data = base64.b64encode(zlib.compress(json.dumps(collect_settings).encode("utf-8")))
-    code_buffer = create_qr_code(qr_data)
-
-    # Add text to QR code with PIL
-    png = Image.open(code_buffer)
-    png = png.convert("RGB")
-    text_anchor = png.height
-    png = ImageOps.expand(png, border=(0, 0, 0, 30), fill=(255, 255, 255))
-    draw = ImageDraw.Draw(png)
-    font = ImageFont.truetype(Path(__file__).parent / "Roboto-Regular.ttf", 24)
     label = f"{app_user.displayName}-{language}"
-    draw.text((20, text_anchor - 10), label, font=font, fill=(0, 0, 0))
-    png_buffer = io.BytesIO()
-    png.save(png_buffer, format="PNG")
+    png_buffer = io.BytesIO(render_labeled_qrcode(qr_data, label))
     logger.info("Generated QR code", app_user=app_user.displayName, qr_code=label)
     return png_buffer, collect_settings
@@ -1,13 +1,15 @@
 import hashlib
 import re
+from collections.abc import Callable, Iterable
 from enum import StrEnum
 
 import structlog
 from openpyxl import Workbook
+from openpyxl.cell.cell import Cell
 from openpyxl.worksheet.worksheet import Worksheet
 from pydantic import BaseModel, computed_field
 
-from .excel import find_cells_containing_value, get_column_cell_by_value, get_header
+from .excel import SheetIndex
 
 logger = structlog.getLogger(__name__)
 
@@ -45,19 +47,23 @@ class TemplateVariable(BaseModel):
         return f'"{value}"'
 
 
-def set_survey_template_variables(sheet: Worksheet, variables: list[TemplateVariable]):
+def set_survey_template_variables(
+    sheet: Worksheet | SheetIndex, variables: list[TemplateVariable]
+) -> list[Cell]:
     """Fill in the template variables on the survey sheet.
 
     Variables are just `calculate` rows in the survey sheet, so we need to find
     the variable in the `name` column and then offset to the `calculation`
-    column to fill in the value.
+    column to fill in the value. Returns the cells that were filled in.
     """
-    name_header = get_header(sheet=sheet, column_name="name")
-    calculation_column = get_header(sheet=sheet, column_name="calculation").column
+    index = SheetIndex.of(sheet)
+    name_header = index.header("name")
+    calculation_column = index.header("calculation").column
     # Calculate the number of columns over to the calculation column
     offset = calculation_column - name_header.column
+    calculation_cells = []
     for variable in variables:
-        variable_cell = get_column_cell_by_value(column_header=name_header, value=variable.name)
+        variable_cell = index.column_cell(column_header=name_header, value=variable.name)
         if not variable_cell:
             raise LookupError(
                 f"'{variable.name}' is not a valid variable in the XLSForm template. "
@@ -72,9 +78,11 @@ def set_survey_template_variables(sheet: Worksheet, variables: list[TemplateVari
             cell=calculation_cell.coordinate,
         )
         calculation_cell.value = value
+        calculation_cells.append(calculation_cell)
+    return calculation_cells
 
 
-def set_survey_attachments(sheet: Worksheet, attachments: dict | None = None):
+def set_survey_attachments(sheet: Worksheet | SheetIndex, attachments: dict | None = None):
     """Detect static attachments on the survey sheet.
 
     Media attachment columns are either "media::image", "media::audio", or "media::video".
@@ -89,22 +97,30 @@ def set_survey_attachments(sheet: Worksheet, attachments: dict | None = None):
     """
     if not attachments:
         return
+    index = SheetIndex.of(sheet)
     # Get all the "media::" columns in the sheet
     media_headers = []
     for media_type in ("image", "audio", "video"):
-        header = get_header(sheet=sheet, column_name=f"media::{media_type}")
+        header = index.header(f"media::{media_type}")
         if header:
             media_headers.append(header)
     # Get CSV attachments from pulldata functions in the calculation column
-    calculation_header = get_header(sheet=sheet, column_name="calculation")
+    calculation_header = index.header("calculation")
     csv_attachments = set()
     for name in attachments:
         name_parts = name.rsplit(".", 1)
         # For a CSV file named "test.csv", search for `pulldata('test'` or `pulldata("test"`
         # in the calculation column
         if len(name_parts) == 2 and name_parts[1].lower() == "csv":
-            if attachment_cell := get_column_cell_by_value(
-                calculation_header, rf"pulldata\((['\"]){name_parts[0]}\1", is_regex=True
+            if calculation_header and (
+                attachment_cell := next(
+                    index.search(
+                        rf"pulldata\((['\"]){name_parts[0]}\1",
+                        column=calculation_header.column,
+                        anchored=True,
+                    ),
+                    None,
+                )
             ):
                 logger.debug(
                     "Found CSV attachment reference",
@@ -121,7 +137,7 @@ def set_survey_attachments(sheet: Worksheet, attachments: dict | None = None):
         found_attachment_name = name in csv_attachments
         if not found_attachment_name:
             for media_header in media_headers:
-                attachment_cell = get_column_cell_by_value(column_header=media_header, value=name)
+                attachment_cell = index.column_cell(column_header=media_header, value=name)
                 if attachment_cell:
                     found_attachment_name = True
                     logger.debug(
@@ -141,112 +157,261 @@ def set_survey_attachments(sheet: Worksheet, attachments: dict | None = None):
 
 
 def update_setting_variables(
-    sheet: Worksheet, title_base: str, form_id_base: str, app_user: str, version: str
+    sheet: Worksheet | SheetIndex, title_base: str, form_id_base: str, app_user: str, version: str
 ):
     """Update the settings sheet to be specific to the app user.
 
     Available settings: https://docs.getodk.org/xlsform/#the-settings-sheet
     """
+    index = SheetIndex.of(sheet)
     # Append [<app_user>] to the form_title
     # The values are in the 2nd row of the sheet, so we offset by 1 for each settting
-    form_title_cell = get_header(sheet=sheet, column_name="form_title").offset(row=1)
+    form_title_cell = index.header("form_title").offset(row=1)
     form_title_cell.value = f"{title_base} [{app_user}]"
     logger.debug("Set form_title", cell=form_title_cell.coordinate, value=form_title_cell.value)
     # Append _<app_user> to the form_id
-    form_id_cell = get_header(sheet=sheet, column_name="form_id").offset(row=1)
+    form_id_cell = index.header("form_id").offset(row=1)
     form_id_cell.value = f"{form_id_base}_{app_user}"
     logger.debug("Set form_id", cell=form_id_cell.coordinate, value=form_id_cell.value)
     # Update the version, with the current date in YYYY-MM-DD format
-    version_cell = get_header(sheet=sheet, column_name="version").offset(row=1)
+    version_cell = index.header("version").offset(row=1)
     version_cell.value = version
     logger.debug("Set version", cell=version_cell.coordinate, value=version_cell.value)
 
 
-def discover_entity_lists(workbook: Workbook) -> list[str]:
-    """Discover the entity lists in the survey sheet."""
-    patterns = (
-        # instance('fruits')/root/...
-        re.compile(r"instance\('([\w_]+)'"),
-        # pulldata('fruits', '')...
-        re.compile(r"pulldata\('([\w_]+)'"),
-        # select_one_from_file fruits.csv
-        re.compile(r"([\w_]+).csv$"),
-    )
+APP_USER_SUFFIX = "_APP_USER"
+
+# References to entity lists in the survey sheet, combined so each cell is searched once:
+# instance('fruits')/root/..., pulldata('fruits', ...) and select_one_from_file fruits.csv
+ENTITY_LIST_PATTERN = re.compile(
+    r"instance\('(?P<instance>[\w_]+)'|pulldata\('(?P<pulldata>[\w_]+)'|(?P<file>[\w_]+).csv$"
+)
+
+
+def entity_list_substitute(entity_list: str, app_user: str) -> str:
+    """The app user's name for an entity list, e.g. `cats_APP_USER` -> `cats_11030`."""
+    return f"{entity_list.rsplit(APP_USER_SUFFIX, 1)[0]}_{app_user}"
+
+
+class EntityReferenceCell(BaseModel):
+    """A cell with references to app user entity lists."""
+
+    sheet: str
+    coordinate: str
+    # The cell value when the template was analyzed
+    value: str
+    # The (start, end) offsets of each app user entity list name in the value
+    spans: list[tuple[int, int]]
+
+    def render(self, app_user: str) -> str:
+        """The cell value with the app user's entity list names."""
+        return _substitute_spans(
+            self.value, self.spans, lambda name: entity_list_substitute(name, app_user)
+        )
+
+
+class EntityReferencePlan(BaseModel):
+    """The entity lists referenced in a form template and the cells to update to
+    point at an app user's own entity lists (the ones ending in `_APP_USER`).
+
+    A template only needs to be analyzed once with `analyze_entity_references()`.
+    The plan is then applied to each app user's copy of the workbook without
+    searching it again, and can be stored as JSON (see
+    `FormTemplateVersion.entity_references`).
+    """
+
+    entity_lists: list[str]
+    cells: list[EntityReferenceCell]
+
+    @property
+    def app_user_entity_lists(self) -> list[str]:
+        return [name for name in self.entity_lists if name.endswith(APP_USER_SUFFIX)]
+
+    def mapping(self, app_user: str) -> dict[str, str]:
+        """Map each app user entity list to the app user's entity list name."""
+        return {name: entity_list_substitute(name, app_user) for name in self.app_user_entity_lists}
+
+    def patches(self, app_user: str) -> dict[tuple[str, str], str]:
+        """The new value for each (sheet, coordinate) to update for the app user."""
+        return {(cell.sheet, cell.coordinate): cell.render(app_user) for cell in self.cells}
+
+    def apply(self, workbook: Workbook, app_user: str, changed: Iterable[Cell] = ()):
+        """Update the references to app user entity lists in the workbook.
+
+        Cells are expected to still have the value they had when the template was
+        analyzed. If one was changed since then, its current value is searched instead,
+        as is the value of each of the ``changed`` cells (like the filled in template
+        variables), which may only reference an entity list since the change.
+        """
+        mapping = self.mapping(app_user)
+        pattern = None
+        planned = set()
+        for cell in self.cells:
+            planned.add((cell.sheet, cell.coordinate))
+            target = workbook[cell.sheet][cell.coordinate]
+            if target.value == cell.value:
+                target.value = cell.render(app_user)
+            elif isinstance(target.value, str):
+                if pattern is None:
+                    pattern = _reference_pattern(self.app_user_entity_lists)
+                target.value = _replace_references(pattern, target.value, mapping)
+            logger.debug(
+                "Updated entity list reference",
+                cell=cell.coordinate,
+                value=target.value,
+                sheet=cell.sheet,
+            )
+        for target in changed:
+            if (target.parent.title, target.coordinate) in planned or not isinstance(
+                target.value, str
+            ):
+                continue
+            if pattern is None:
+                pattern = _reference_pattern(self.app_user_entity_lists)
+            value = _replace_references(pattern, target.value, mapping)
+            if value != target.value:
+                target.value = value
+                logger.debug(
+                    "Updated entity list reference",
+                    cell=target.coordinate,
+                    value=target.value,
+                    sheet=target.parent.title,
+                )
+
+
+def _reference_pattern(entity_lists: list[str]) -> re.Pattern | None:
+    """Match references to any of the entity lists in the survey sheet, either as
+    `fruits.csv` or in single quotes as in `pulldata('fruits', ...)`. The entity list
+    name is in the `name` group.
+    """
+    if not entity_lists:
+        return None
+    # Longest first, so a name that ends with another name is matched in full
+    names = "|".join(re.escape(name) for name in sorted(entity_lists, key=len, reverse=True))
+    return re.compile(rf"(?P<name>{names})\.csv|'(?P<quoted>{names})'")
+
+
+def _reference_spans(pattern: re.Pattern | None, value: str) -> list[tuple[int, int]]:
+    if pattern is None:
+        return []
+    return [
+        match.span("name") if match.group("name") else match.span("quoted")
+        for match in pattern.finditer(value)
+    ]
+
+
+def _substitute_spans(
+    value: str, spans: list[tuple[int, int]], substitute: Callable[[str], str]
+) -> str:
+    """Replace each (start, end) span of the value with ``substitute(name)``."""
+    parts = []
+    position = 0
+    for start, end in spans:
+        parts += [value[position:start], substitute(value[start:end])]
+        position = end
+    parts.append(value[position:])
+    return "".join(parts)
+
+
+def _replace_references(pattern: re.Pattern | None, value: str, mapping: dict[str, str]) -> str:
+    """Replace the entity list references that ``pattern`` finds in the value."""
+    return _substitute_spans(value, _reference_spans(pattern, value), mapping.__getitem__)
+
+
+def analyze_entity_references(workbook: Workbook) -> EntityReferencePlan:
+    """Find the entity lists referenced in the survey and entities sheets and the
+    cells that reference app user entity lists, reading each sheet once.
+    """
     entity_lists = set()
-    # Find entity lists in the `survey` sheet
+    # Values of the non-empty cells in the `survey` sheet (without the header row)
+    survey_values = []
     for row in workbook["survey"].iter_rows(min_row=2):
         for cell in row:
             if cell.value:
-                for pattern in patterns:
-                    match = pattern.search(str(cell.value))
-                    if match:
-                        entity_lists.add(match.group(1))
-                        logger.debug(
-                            "Discovered entity list",
-                            entity_list=match.group(1),
-                            cell=cell.coordinate,
-                            sheet="survey",
-                        )
-    # Find entity lists in the `entities` sheet
+                value = str(cell.value)
+                # Like the separate instance(), pulldata() and file patterns this
+                # replaced, only the first reference of each kind in a cell is used
+                kinds = set()
+                for match in ENTITY_LIST_PATTERN.finditer(value):
+                    if match.lastgroup not in kinds:
+                        kinds.add(match.lastgroup)
+                        entity_lists.add(match.group(match.lastgroup))
+                if isinstance(cell.value, str):
+                    survey_values.append((cell.coordinate, cell.value))
+    # Entity list names in the first column of the `entities` sheet, and all of its
+    # cells with an app user entity list name
+    entities_values = []
     if "entities" in workbook:
-        for row in workbook["entities"].iter_rows(min_row=2, min_col=1, max_col=1):
+        for row in workbook["entities"].iter_rows(min_row=2):
             for cell in row:
-                if cell.value:
+                if cell.value and cell.column == 1:
                     entity_lists.add(str(cell.value))
-                    logger.debug(
-                        "Discovered entity list",
-                        entity_list=cell.value,
-                        cell=cell.coordinate,
-                        sheet="entities",
-                    )
-    logger.debug("Discovered entity lists", entity_lists=entity_lists)
-    return entity_lists
+                if isinstance(cell.value, str) and cell.value.endswith(APP_USER_SUFFIX):
+                    entities_values.append((cell.coordinate, cell.value))
+
+    app_user_entity_lists = {name for name in entity_lists if name.endswith(APP_USER_SUFFIX)}
+    pattern = _reference_pattern(app_user_entity_lists)
+    cells = []
+    for coordinate, value in survey_values:
+        if spans := _reference_spans(pattern, value):
+            cells.append(
+                EntityReferenceCell(sheet="survey", coordinate=coordinate, value=value, spans=spans)
+            )
+    for coordinate, value in entities_values:
+        if value in app_user_entity_lists:
+            cells.append(
+                EntityReferenceCell(
+                    sheet="entities", coordinate=coordinate, value=value, spans=[(0, len(value))]
+                )
+            )
+    plan = EntityReferencePlan(entity_lists=sorted(entity_lists), cells=cells)
+    logger.debug(
+        "Analyzed entity references",
+        entity_lists=plan.entity_lists,
+        cells=[cell.coordinate for cell in cells],
+    )
+    return plan
+
+
+def discover_entity_lists(workbook: Workbook) -> set[str]:
+    """Discover the entity lists in the survey and entities sheets."""
+    return set(analyze_entity_references(workbook).entity_lists)
 
 
 def build_entity_list_mapping(workbook: Workbook, app_user: str) -> dict[str, str]:
     """Build a mapping of app user entity lists to new entity list names."""
-    entity_lists = discover_entity_lists(workbook=workbook)
-    substitutes = {}
-    for entity_list in entity_lists:
-        if entity_list.endswith("_APP_USER"):
-            name_substitute = f"{entity_list.rsplit('_APP_USER', 1)[0]}_{app_user}"
-            substitutes[entity_list] = name_substitute
-    return substitutes
+    return analyze_entity_references(workbook).mapping(app_user)
 
 
-def update_entity_references(workbook: Workbook, entity_list_mapping: dict[str, str] | None = None):
+def update_entity_references(
+    workbook: Workbook,
+    entity_list_mapping: dict[str, str] | None = None,
+    survey: SheetIndex | None = None,
+):
     """Update references to entity lists in the workbook, based on the mapping.
 
     For example: `filename_APP_USER.csv` -> `filename_11030.csv`
+
+    ``survey`` is an index of the survey sheet to reuse, if one is already built.
+    To render a template for many app users, use an EntityReferencePlan instead,
+    which only searches the template once.
     """
     if not entity_list_mapping:
-        entity_list_mapping = {}
-
-    # Update references to entity lists in the `survey`` sheet
-    for entity_list_orig, entity_list_new in entity_list_mapping.items():
-        # Replace references to "filename_APP_USER.csv"
-        for cell in find_cells_containing_value(
-            sheet=workbook["survey"], value=f"{entity_list_orig}.csv"
-        ):
-            cell.value = cell.value.replace(f"{entity_list_orig}.csv", f"{entity_list_new}.csv")
-            logger.debug(
-                "Updated entity list reference",
-                cell=cell.coordinate,
-                value=cell.value,
-                sheet="survey",
-            )
-        # Replace references to the fill in pulldata() and instance()
-        # (in single quotes, e.g., "'filename_APP_USER'")
-        for cell in find_cells_containing_value(
-            sheet=workbook["survey"], value=f"'{entity_list_orig}'"
-        ):
-            cell.value = cell.value.replace(f"'{entity_list_orig}'", f"'{entity_list_new}'")
-            logger.debug(
-                "Updated entity list pulldata reference",
-                cell=cell.coordinate,
-                value=cell.value,
-                sheet="survey",
-            )
+        return
+    pattern = _reference_pattern(list(entity_list_mapping))
+    if survey is None:
+        survey = SheetIndex(workbook["survey"])
+
+    # Update references to entity lists in the `survey` sheet, like "filename_APP_USER.csv"
+    # or in single quotes in pulldata() and instance(), e.g., "'filename_APP_USER'"
+    for cell in list(survey.search(pattern.pattern)):
+        cell.value = _replace_references(pattern, cell.value, entity_list_mapping)
+        logger.debug(
+            "Updated entity list reference",
+            cell=cell.coordinate,
+            value=cell.value,
+            sheet="survey",
+        )
 
     # Update references to entity lists in the `entities` sheet
     if "entities" in workbook:
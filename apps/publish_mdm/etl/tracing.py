@@ -0,0 +1,102 @@
+import contextlib
+import contextvars
+import time
+from dataclasses import asdict, dataclass
+
+import newrelic.agent
+import sentry_sdk
+import structlog
+from django.template.defaultfilters import filesizeformat
+
+logger = structlog.getLogger(__name__)
+
+_current_trace: contextvars.ContextVar["PublishTrace | None"] = contextvars.ContextVar(
+    "publish_trace", default=None
+)
+
+
+@dataclass
+class StageTiming:
+    """The total time spent in a publish stage, over ``count`` spans."""
+
+    count: int = 0
+    seconds: float = 0.0
+    bytes: int = 0
+
+
+class PublishTrace:
+    """The per-stage timings of one publish.
+
+    While a trace is active (see publish_transaction()), each span() in the
+    publish pipeline adds its duration and bytes transferred to the stage with
+    the same name, in the order the stages were first entered.
+    """
+
+    def __init__(self):
+        self.stages: dict[str, StageTiming] = {}
+
+    def add(self, stage: str, seconds: float, bytes: int = 0):
+        timing = self.stages.setdefault(stage, StageTiming())
+        timing.count += 1
+        timing.seconds += seconds
+        timing.bytes += bytes
+
+    def as_dict(self) -> dict[str, dict]:
+        return {
+            stage: asdict(timing) | {"seconds": round(timing.seconds, 3)}
+            for stage, timing in self.stages.items()
+        }
+
+    def summary(self) -> str:
+        """A one-line summary of the stage timings, for the publish messages."""
+        parts = []
+        for stage, timing in self.stages.items():
+            part = f"{stage} {timing.seconds:.2f}s"
+            if timing.count > 1:
+                part += f" ({timing.count}x)"
+            if timing.bytes:
+                part += f", {filesizeformat(timing.bytes)}"
+            parts.append(part)
+        return "; ".join(parts)
+
+
+@contextlib.contextmanager
+def publish_transaction(name: str):
+    """Start a Sentry transaction and a New Relic background task for a publish,
+    and activate a new PublishTrace for its spans.
+    """
+    trace = PublishTrace()
+    token = _current_trace.set(trace)
+    try:
+        with (
+            sentry_sdk.start_transaction(op="publish", name=name),
+            newrelic.agent.BackgroundTask(newrelic.agent.application(), name=name, group="Publish"),
+        ):
+            yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextlib.contextmanager
+def span(stage: str, **data):
+    """Time a stage of the publish pipeline, as a Sentry span and a New Relic
+    function trace, and add it to the active PublishTrace, if any.
+
+    Yields a dict of span data. Set its ``bytes`` key to record the number of
+    bytes transferred.
+    """
+    data.setdefault("bytes", 0)
+    start = time.perf_counter()
+    try:
+        with (
+            sentry_sdk.start_span(op="publish", name=stage) as sentry_span,
+            newrelic.agent.FunctionTrace(name=stage, group="Publish"),
+        ):
+            yield data
+            for key, value in data.items():
+                sentry_span.set_data(key, value)
+    finally:
+        seconds = time.perf_counter() - start
+        if (trace := _current_trace.get()) is not None:
+            trace.add(stage, seconds, data["bytes"])
+        logger.debug("Publish span", stage=stage, seconds=round(seconds, 3), **data)
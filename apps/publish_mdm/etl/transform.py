@@ -1,3 +1,4 @@
+import hashlib
 import io
 
 import openpyxl
@@ -5,57 +6,98 @@ import structlog
 from django.core.files.uploadedfile import SimpleUploadedFile
 from gspread.utils import ExportFormat
 
+from apps.publish_mdm.etl.excel import SheetIndex
 from apps.publish_mdm.etl.template import (
-    build_entity_list_mapping,
     set_survey_attachments,
     set_survey_template_variables,
-    update_entity_references,
     update_setting_variables,
 )
 
 from ..models import AppUser, FormTemplateVersion
+from .tracing import span
 
 logger = structlog.getLogger(__name__)
 
 
+class RenderedFormFile(SimpleUploadedFile):
+    """An app user's rendered form, along with a digest of its content that does
+    not depend on the version (see form_content_digest()).
+    """
+
+    def __init__(self, name, content, digest: str):
+        super().__init__(name=name, content=content, content_type=ExportFormat.EXCEL)
+        self.digest = digest
+
+
+def form_content_digest(
+    workbook: openpyxl.Workbook, attachments: dict | None = None, exclude=()
+) -> str:
+    """Hash the cell values of all the sheets in ``workbook``, except the ``exclude``
+    cells, and the storage names of the ``attachments``. Two renders with the same
+    digest only differ in the excluded cells (like the version), so the same
+    form and attachments are published.
+    """
+    digest = hashlib.sha256()
+    for sheet in workbook.worksheets:
+        digest.update(f"\0sheet:{sheet.title}\0".encode())
+        for row in sheet.iter_rows():
+            for cell in row:
+                if cell.value is not None and cell not in exclude:
+                    digest.update(f"{cell.coordinate}={cell.value!r}\0".encode())
+    for name, file in sorted((attachments or {}).items()):
+        digest.update(f"\0attachment:{name}={file.name}\0".encode())
+    return digest.hexdigest()
+
+
+@span("transform.render")
 def render_template_for_app_user(
     app_user: AppUser,
     template_version: FormTemplateVersion,
     attachments: dict | None = None,
-) -> SimpleUploadedFile:
+) -> RenderedFormFile:
     """Create the next version of the app user's form."""
     workbook = openpyxl.load_workbook(filename=template_version.file)
+    # Where the entity lists are referenced only depends on the template, so it is
+    # analyzed once per version (see FormTemplateVersion.create_app_user_versions())
+    entity_references = template_version.get_entity_reference_plan(workbook)
 
     # Fill in the survey template variables
     variables = app_user.get_template_variables()
 
     # FILTER OUT system variables like 'admin_pw'
     form_variables = [var for var in variables if var.name not in {"admin_pw"}]
-    set_survey_template_variables(sheet=workbook["survey"], variables=form_variables)
+    variable_cells = set_survey_template_variables(
+        sheet=workbook["survey"], variables=form_variables
+    )
 
+    # Index the filled in survey sheet once for the attachment lookups
+    survey = SheetIndex(workbook["survey"])
     # Detect static attachments in the survey sheet
-    set_survey_attachments(sheet=workbook["survey"], attachments=attachments)
+    set_survey_attachments(sheet=survey, attachments=attachments)
     logger.debug("App user variables", variables=variables)
 
     # Update ODK entity references on both the survey and entities sheets
-    entity_list_mapping = build_entity_list_mapping(workbook=workbook, app_user=app_user.name)
-    update_entity_references(workbook=workbook, entity_list_mapping=entity_list_mapping)
+    entity_references.apply(workbook, app_user=app_user.name, changed=variable_cells)
 
     # Update the form settings
     form_id_base = template_version.form_template.form_id_base
+    settings = SheetIndex(workbook["settings"])
     update_setting_variables(
-        sheet=workbook["settings"],
+        sheet=settings,
         title_base=template_version.form_template.title_base,
         form_id_base=form_id_base,
         app_user=app_user.name,
         version=template_version.version,
     )
+    digest = form_content_digest(
+        workbook, attachments=attachments, exclude=[settings.header("version").offset(row=1)]
+    )
     # Save the updated workbook to a new file
     buffer = io.BytesIO()
     workbook.save(buffer)
     buffer.seek(0)
-    return SimpleUploadedFile(
+    return RenderedFormFile(
         name=f"{form_id_base}_{app_user.name}-{template_version.version}.xlsx",
         content=buffer.read(),
-        content_type=ExportFormat.EXCEL,
+        digest=digest,
     )
@@ -1,27 +1,51 @@
-from django.db.models import Count
+from collections.abc import Sequence
+from typing import ClassVar
+
 from django.utils.functional import cached_property
 from django_filters import FilterSet, MultipleChoiceFilter
 
-from apps.mdm.models import Device, Fleet
+from apps.mdm.facets import device_facet_cache
+from apps.mdm.models import Device
 from apps.patterns.widgets import CheckboxSelectMultiple
 
 
-class FleetMultipleChoiceFilter(MultipleChoiceFilter):
-    """Like django-filter's built-in AllValuesMultipleFilter, but shows the
-    Fleet name and number of devices as the choice label instead of an ID.
+class FacetMultipleChoiceFilter(MultipleChoiceFilter):
+    """Like django-filter's built-in AllValuesMultipleFilter, but the choice labels
+    include the number of devices with each value. The counts are cached per
+    organization (see apps.mdm.facets), so the parent FilterSet must be created
+    with the request.
     """
 
+    # The fields to count the devices by: the choice value, followed by any fields
+    # used in the label. Defaults to the filter's field_name.
+    facet_fields: ClassVar[Sequence[str]] = ()
+
+    def get_label(self, value, *label_values, count: int) -> str:
+        return f"{value} ({count})"
+
     @cached_property
     def field(self):
-        qs = (
-            Fleet.objects.filter(devices__in=self.parent.queryset)
-            .annotate(device_count=Count("devices"))
-            .values_list("id", "name", "device_count")
+        rows = device_facet_cache.get(
+            self.parent.request.organization.id,
+            self.parent.queryset,
+            self.facet_fields or (self.field_name,),
         )
-        self.extra["choices"] = [(id, f"{name} ({count})") for id, name, count in qs]
+        choices = [
+            (value, self.get_label(value, *rest, count=count)) for value, *rest, count in rows
+        ]
+        self.extra["choices"] = sorted(choices, key=lambda choice: choice[1])
         return super().field
 
 
+class FleetMultipleChoiceFilter(FacetMultipleChoiceFilter):
+    """Shows the Fleet name and number of devices as the choice label instead of an ID."""
+
+    facet_fields = ("fleet", "fleet__name")
+
+    def get_label(self, value, name, *, count):
+        return f"{name} ({count})"
+
+
 class DeviceFilter(FilterSet):
     fleet = FleetMultipleChoiceFilter(widget=CheckboxSelectMultiple)
 
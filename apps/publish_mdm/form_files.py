@@ -0,0 +1,96 @@
+import datetime as dt
+import hashlib
+from collections import Counter
+from pathlib import PurePosixPath
+
+import structlog
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+logger = structlog.getLogger(__name__)
+
+
+class FormFileStore:
+    """A content-addressed store for form template and app user form version files.
+
+    Files are saved in the default storage under a name derived from a hash of
+    their content, so identical files (like an unchanged Google Sheet export, or
+    an app user's form that did not change since the previous version) are only
+    stored once and shared by all the versions that reference them. Stored files
+    that are no longer referenced by any version are deleted by compact(), which
+    is run by the ``compact_form_files`` management command.
+    """
+
+    location = "form-templates/blobs"
+
+    def name(self, content: bytes, filename: str = "") -> str:
+        """The storage name for a file with the given content."""
+        digest = hashlib.sha256(content).hexdigest()
+        suffix = PurePosixPath(filename).suffix
+        return f"{self.location}/{digest[:2]}/{digest}{suffix}"
+
+    def store(self, file: File) -> str:
+        """Save ``file`` unless a file with the same content is already stored,
+        and return its storage name.
+        """
+        file.seek(0)
+        content = file.read()
+        name = self.name(content, file.name or "")
+        if default_storage.exists(name):
+            logger.debug("Form file found in store", name=name)
+            return name
+        saved_name = default_storage.save(name, ContentFile(content))
+        logger.info("Saved form file", name=saved_name, size=len(content))
+        return saved_name
+
+    def references(self) -> Counter:
+        """The number of versions that reference each stored file."""
+        from .models import AppUserFormVersion, FormTemplateVersion  # noqa: PLC0415
+
+        counts = Counter()
+        for model in (FormTemplateVersion, AppUserFormVersion):
+            counts.update(
+                model.objects.filter(file__startswith=f"{self.location}/").values_list(
+                    "file", flat=True
+                )
+            )
+        return counts
+
+    def stored_names(self) -> list[str]:
+        """The names of all the files in the store."""
+        try:
+            directories, _ = default_storage.listdir(self.location)
+        except FileNotFoundError:
+            return []
+        return [
+            f"{self.location}/{directory}/{filename}"
+            for directory in directories
+            for filename in default_storage.listdir(f"{self.location}/{directory}")[1]
+        ]
+
+    def compact(self, min_age: dt.timedelta = dt.timedelta(days=1), dry_run=False) -> list[str]:
+        """Delete the stored files that are not referenced by any version and
+        return their names. Files modified within ``min_age`` are kept, since
+        a publish may have stored them before creating its versions.
+        """
+        references = self.references()
+        cutoff = timezone.now() - min_age
+        orphans = [
+            name
+            for name in self.stored_names()
+            if not references[name] and default_storage.get_modified_time(name) < cutoff
+        ]
+        if not dry_run:
+            for name in orphans:
+                default_storage.delete(name)
+        logger.info(
+            "Compacted form files",
+            deleted=len(orphans),
+            referenced=len(references),
+            dry_run=dry_run,
+        )
+        return orphans
+
+
+form_file_store = FormFileStore()
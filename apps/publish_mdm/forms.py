@@ -258,6 +258,12 @@ class ConfirmImportForm(import_export_forms.ConfirmImportForm):
         return self.cleaned_data
 
 
+class DeviceImportConfirmForm(PlatformFormMixin, forms.Form):
+    """Form for confirming a device import previewed in the background."""
+
+    import_id = forms.CharField(widget=forms.HiddenInput)
+
+
 class FormTemplateForm(PlatformFormMixin, forms.ModelForm):
     app_users = forms.ModelMultipleChoiceField(
         # The queryset will be set to the current project's app users in __init__()
@@ -860,9 +866,14 @@ class DeviceAppUserForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.instance.fleet.project:
+            # Sort in Python so a prefetched app_users list (e.g. in the devices list
+            # table) is reused instead of querying again for every device
+            app_users = sorted(
+                self.instance.fleet.project.app_users.all(), key=lambda i: i.name.casefold()
+            )
             self.fields["app_user_name"].choices = [
                 ("", "---"),
-                *((i.name, i.name) for i in self.instance.fleet.project.app_users.order_by("name")),
+                *((i.name, i.name) for i in app_users),
             ]
         self.fields["app_user_name"].widget.attrs["hx-post"] = reverse_lazy(
             "publish_mdm:device-update-app-user",
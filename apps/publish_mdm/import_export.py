@@ -1,17 +1,27 @@
+from collections import defaultdict
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
 from decimal import InvalidOperation
 from functools import partial
+from typing import ClassVar
 
 import structlog
 import tablib
-from django.core.exceptions import ValidationError
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import connection, models
 from django.db.models import Prefetch
+from django.utils import timezone
 from import_export import fields, resources, widgets
-from import_export.results import Result
+from import_export.instance_loaders import ModelInstanceLoader
+from import_export.results import InvalidRow, Result
+from import_export.tmp_storages import MediaStorage
 
 from apps.mdm.models import Device
 from config.dagster import trigger_dagster_job
 
-from .models import AppUser, AppUserFormTemplate, AppUserTemplateVariable
+from .models import AppUser, AppUserFormTemplate, AppUserTemplateVariable, Organization
 
 logger = structlog.getLogger(__name__)
 
@@ -30,17 +40,32 @@ class AppUserTemplateVariableWidget(widgets.ForeignKeyWidget):
         return {"template_variable": self.template_variable, "app_user_id": row["id"] or None}
 
     def clean(self, value, row=None, **kwargs):
-        """Validate the AppUserTemplateVariable during import."""
-        try:
-            template_variable = super().clean(value, row, **kwargs)
-        except AppUserTemplateVariable.DoesNotExist:
+        """Validate the AppUserTemplateVariable during import.
+
+        If ``app_user_template_variables`` (the current user's variables, keyed by
+        TemplateVariable ID) is passed in, the existing variable is looked up there
+        instead of querying the database.
+        """
+        existing = kwargs.get("app_user_template_variables")
+        if existing is None:
+            try:
+                template_variable = super().clean(value, row, **kwargs)
+            except AppUserTemplateVariable.DoesNotExist:
+                template_variable = None
+        elif value:
+            template_variable = existing.get(self.template_variable.pk)
+        else:
+            return None
+        if template_variable is None and value:
             template_variable = AppUserTemplateVariable(
                 value=value, **self.get_lookup_kwargs(value, row, **kwargs)
             )
         if template_variable is not None:
             template_variable.value = value
             try:
-                template_variable.full_clean(exclude=["app_user"])
+                # The TemplateVariable is one of the project's, so there's no need
+                # to query the database to validate it
+                template_variable.full_clean(exclude=["app_user", "template_variable"])
             except ValidationError as e:
                 raise ValueError(e.messages[0]) from e
         return template_variable
@@ -59,7 +84,7 @@ class AppUserTemplateVariableField(fields.Field):
         """Queue up saving or deleting the AppUserTemplateVariable during import.
         At this point the related AppUser may not exist yet (if "id" column is blank)
         and/or may not be fully validated so we'll save or delete the
-        AppUserTemplateVariable later in `AppUserResource.do_instance_save()`.
+        AppUserTemplateVariable later in `AppUserResource.save_instance()`.
         """
         # Get the validated AppUserTemplateVariable. It will be None if the value
         # is blank in the import file, in which case we need to delete the variable.
@@ -127,18 +152,78 @@ class FormTemplatesField(fields.Field):
     def save(self, instance, row, is_m2m=False, **kwargs):
         """Updates the `_new_form_templates` variable with a set of validated
         FormTemplate.form_id_base values during import. We'll create and/or delete
-        the AppUserFormTemplates later in `AppUserResource.do_instance_save()`.
+        the AppUserFormTemplates later in `AppUserResource.save_instance()`.
         """
         instance._new_form_templates = self.clean(row, **kwargs)
 
     def get_value(self, instance):
         # `instance._new_form_templates` will be set in save() above during import.
-        # `instance.form_templates` will be the original templates before import.
-        return getattr(instance, "_new_form_templates", instance.form_templates)
+        # `instance._original_form_templates` (set in AppUserResource.after_init_instance()
+        # during import) and `instance.form_templates` will be the original templates.
+        for attr in ("_new_form_templates", "_original_form_templates"):
+            if hasattr(instance, attr):
+                return getattr(instance, attr)
+        return instance.form_templates
+
+
+class StreamingExportMixin:
+    """Adds ``export_rows()`` to a ModelResource, for streaming an export to a file
+    or response one row at a time instead of building a ``tablib.Dataset``.
+    """
+
+    def iter_queryset(self, queryset):
+        """Iterate over the queryset in chunks. Django applies the queryset's
+        prefetch_related() lookups to each chunk.
+        """
+        if not queryset.query.order_by:
+            queryset = queryset.order_by("pk")
+        yield from queryset.iterator(chunk_size=self.get_chunk_size())
+
+    def export_rows(self, queryset=None) -> Iterator[list]:
+        """Yield the exported values for each row, without headers."""
+        if queryset is None:
+            queryset = self.get_queryset()
+        self.before_export(queryset)
+        queryset = self.filter_export(queryset)
+        export_fields = self.get_export_fields()
+        for obj in self.iter_queryset(queryset):
+            yield [self.export_field(field, obj) for field in export_fields]
+
+
+class AppUserInstanceLoader(ModelInstanceLoader):
+    """Loads all the AppUsers referenced in the import file up front, with their
+    template variables and form templates prefetched, instead of querying for
+    each row.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pk_field = self.resource.fields["id"]
+        ids = set()
+        for row in self.dataset.dict:
+            try:
+                ids.add(self.pk_field.clean(row))
+            except (KeyError, ValueError):
+                # Invalid IDs are reported for their row in get_instance()
+                continue
+        ids.discard(None)
+        self.all_instances = {}
+        if ids:
+            self.all_instances = {
+                instance.pk: instance for instance in self.get_queryset().filter(pk__in=ids)
+            }
+
+    def get_instance(self, row):
+        return self.all_instances.get(self.pk_field.clean(row))
+
 
+class AppUserResource(StreamingExportMixin, resources.ModelResource):
+    """Custom ModelResource for importing/exporting AppUsers.
 
-class AppUserResource(resources.ModelResource):
-    """Custom ModelResource for importing/exporting AppUsers."""
+    During import, everything needed to validate the rows is loaded up front
+    and validation happens in memory. Changes are then written in bulk, in
+    batches of ``Meta.batch_size`` rows.
+    """
 
     central_id = fields.Field(
         attribute="central_id", column_name="central_id", widget=PositiveIntegerWidget()
@@ -152,6 +237,9 @@ class AppUserResource(resources.ModelResource):
         fields = ("id", "name", "central_id", "form_templates")
         clean_model_instances = True
         skip_unchanged = True
+        use_bulk = True
+        batch_size = 1000
+        instance_loader_class = AppUserInstanceLoader
 
     def __init__(self, project):
         # The project for which we are importing/exporting AppUsers
@@ -206,83 +294,267 @@ class AppUserResource(resources.ModelResource):
         """
         return app_user.app_user_template_variables_dict.get(variable_name)
 
+    def after_init_instance(self, instance, new, row, **kwargs):
+        """Read the user's prefetched related objects before `import_row()` makes a
+        deep copy of the instance for the diff, since copying drops prefetched results.
+        """
+        if new:
+            instance._original_template_variables = []
+            instance._original_forms = []
+        else:
+            instance._original_template_variables = list(instance.app_user_template_variables.all())
+            instance._original_forms = list(instance.app_user_forms.all())
+        instance._original_form_templates = {
+            i.form_template.form_id_base for i in instance._original_forms
+        }
+        # Populate the cached property so it's copied too
+        instance.app_user_template_variables_dict  # noqa: B018
+        super().after_init_instance(instance, new, row, **kwargs)
+
     def import_instance(self, instance, row, **kwargs):
         """Called for each AppUser during import."""
         instance.project = self.project
         # We'll use these lists to queue up AppUserTemplateVariables for saving
-        # or deleting together in the do_instance_save() method below.
+        # or deleting together in the save_instance() method below.
         instance._template_variables_to_save = []
         instance._template_variables_to_delete = []
+        if instance.pk is None:
+            # A new user has no form templates unless set by the "form_templates" column
+            instance._new_form_templates = set()
         # Dict of the project's FormTemplates to be used for validation in
         # FormTemplatesWidget.clean()
         kwargs["project_form_templates"] = self.form_templates
+        # The user's current (prefetched) template variables, to be used in
+        # AppUserTemplateVariableWidget.clean()
+        kwargs["app_user_template_variables"] = {
+            i.template_variable_id: i for i in instance._original_template_variables
+        }
         super().import_instance(instance, row, **kwargs)
 
-    def do_instance_save(self, instance, is_create):
-        """Save the AppUser and save/delete AppUserTemplateVariables and AppUserFormTemplates."""
-        logger.info(
-            "Updating AppUser via file import",
-            new=is_create,
-            id=instance.id,
-            project_id=self.project.id,
-        )
-        instance.save()
-        for template_variable in instance._template_variables_to_save:
-            template_variable.app_user = instance
-            logger.info(
-                "Updating AppUserTemplateVariable via file import",
-                new=not template_variable.pk,
-                id=template_variable.id,
-                variable_name=template_variable.template_variable.name,
-                app_user_id=instance.id,
-                project_id=self.project.id,
+    def validate_instance(self, instance, import_validation_errors=None, validate_unique=True):
+        """Validate the AppUser in memory. The project is set by the resource and
+        the unique name check uses the names loaded in before_import(), updated as
+        rows are saved, so no queries are needed.
+        """
+        errors = dict(import_validation_errors or {})
+        try:
+            instance.full_clean(
+                exclude=[*errors, "project"], validate_unique=False, validate_constraints=False
             )
-            template_variable.save()
-        if not is_create:
-            for name in instance._template_variables_to_delete:
-                logger.info(
-                    "Deleting AppUserTemplateVariable via file import",
-                    variable_name=name,
-                    app_user_id=instance.id,
-                    project_id=self.project.id,
-                )
-                instance.app_user_template_variables.filter(template_variable__name=name).delete()
-        if is_create:
-            existing_form_templates = set()
+        except ValidationError as e:
+            errors = e.update_error_dict(errors)
+        if "name" not in errors and instance.name:
+            owner = self.app_user_names.get(instance.name.casefold())
+            if owner is not None and owner != instance.pk:
+                errors = ValidationError(
+                    {
+                        NON_FIELD_ERRORS: [
+                            instance.unique_error_message(AppUser, ("project", "name"))
+                        ]
+                    }
+                ).update_error_dict(errors)
+        if errors:
+            raise ValidationError(errors)
+
+    def save_instance(self, instance, is_create, row, **kwargs):
+        """Queue the AppUser and its AppUserTemplateVariable and AppUserFormTemplate
+        changes to be written in bulk.
+        """
+        if is_create and self._is_dry_run(kwargs):
+            # Don't take IDs from the sequence for a preview. The user's template
+            # variables and form templates get its ID when it's created in bulk_save().
+            # Record the name with a placeholder, so other rows can't reuse it
+            owner = object()
+        elif is_create:
+            instance.pk = owner = self.reserve_app_user_pk()
         else:
-            existing_form_templates = instance.form_templates
+            instance.modified_at = timezone.now()
+            self.app_user_names.pop(self.app_user_name_keys.get(instance.pk), None)
+            owner = instance.pk
+        key = instance.name.casefold()
+        self.app_user_names[key] = owner
+        self.app_user_name_keys[owner] = key
+        super().save_instance(instance, is_create, row, **kwargs)
+
+        existing_variables = {
+            i.template_variable.name: i for i in instance._original_template_variables
+        }
+        for template_variable in instance._template_variables_to_save:
+            template_variable.app_user = instance
+            if template_variable.pk:
+                template_variable.modified_at = instance.modified_at
+                self.template_variables_to_update.append(template_variable)
+            else:
+                self.template_variables_to_create.append(template_variable)
+        for name in instance._template_variables_to_delete:
+            if name in existing_variables:
+                self.template_variable_pks_to_delete.append(existing_variables[name].pk)
+
+        existing_forms = {i.form_template.form_id_base: i for i in instance._original_forms}
         # If the current instance has no `_new_form_templates` variable it means
         # the import file did not have a "form_templates" column, so the user's
         # form templates should be left unchanged
-        new_form_templates = getattr(instance, "_new_form_templates", existing_form_templates)
-        for form_id_base in new_form_templates - existing_form_templates:
-            logger.info(
-                "Adding a AppUserFormTemplate via file import",
-                app_user_id=instance.id,
-                project_id=self.project.id,
-                form_id_base=form_id_base,
-                template_id=self.form_templates[form_id_base],
+        new_form_templates = getattr(instance, "_new_form_templates", set(existing_forms))
+        for form_id_base in sorted(new_form_templates - set(existing_forms)):
+            self.app_user_forms_to_create.append(
+                AppUserFormTemplate(
+                    app_user=instance, form_template_id=self.form_templates[form_id_base]
+                )
             )
-            instance.app_user_forms.create(form_template_id=self.form_templates[form_id_base])
-        to_delete = existing_form_templates - new_form_templates
-        if to_delete:
+        for form_id_base in set(existing_forms) - new_form_templates:
+            self.app_user_form_pks_to_delete.append(existing_forms[form_id_base].pk)
+
+    def bulk_create(self, using_transactions, dry_run, raise_errors, batch_size=None, result=None):
+        self.bulk_save(using_transactions, dry_run, raise_errors, batch_size, result)
+
+    def bulk_update(self, using_transactions, dry_run, raise_errors, batch_size=None, result=None):
+        self.bulk_save(using_transactions, dry_run, raise_errors, batch_size, result)
+
+    def bulk_save(self, using_transactions, dry_run, raise_errors, batch_size=None, result=None):
+        """Write all queued AppUser, AppUserTemplateVariable and AppUserFormTemplate
+        changes, with a few queries per batch rather than several per row.
+        """
+        if not (self.create_instances or self.update_instances):
+            return
+        if using_transactions or not dry_run:
             logger.info(
-                "Deleting AppUserFormTemplates via file import",
-                app_user_id=instance.id,
+                "Saving AppUsers via file import",
                 project_id=self.project.id,
-                form_id_base_set=to_delete,
+                created=len(self.create_instances),
+                updated=len(self.update_instances),
+                template_variables_saved=(
+                    len(self.template_variables_to_create) + len(self.template_variables_to_update)
+                ),
+                template_variables_deleted=len(self.template_variable_pks_to_delete),
+                form_templates_added=len(self.app_user_forms_to_create),
+                form_templates_deleted=len(self.app_user_form_pks_to_delete),
             )
-            instance.app_user_forms.filter(form_template__form_id_base__in=to_delete).delete()
+            try:
+                AppUser.objects.bulk_create(self.create_instances, batch_size=batch_size)
+                AppUser.objects.bulk_update(
+                    self.update_instances,
+                    ["name", "central_id", "modified_at"],
+                    batch_size=batch_size,
+                )
+                AppUserTemplateVariable.objects.filter(
+                    pk__in=self.template_variable_pks_to_delete
+                ).delete()
+                AppUserTemplateVariable.objects.bulk_create(
+                    self.template_variables_to_create, batch_size=batch_size
+                )
+                AppUserTemplateVariable.objects.bulk_update(
+                    self.template_variables_to_update,
+                    ["value", "modified_at"],
+                    batch_size=batch_size,
+                )
+                AppUserFormTemplate.objects.filter(pk__in=self.app_user_form_pks_to_delete).delete()
+                AppUserFormTemplate.objects.bulk_create(
+                    self.app_user_forms_to_create, batch_size=batch_size
+                )
+            except Exception as e:
+                self.handle_import_error(result, e, raise_errors)
+        self.create_instances.clear()
+        self.update_instances.clear()
+        self.template_variables_to_create.clear()
+        self.template_variables_to_update.clear()
+        self.template_variable_pks_to_delete.clear()
+        self.app_user_forms_to_create.clear()
+        self.app_user_form_pks_to_delete.clear()
+
+    def reserve_app_user_pk(self) -> int:
+        """Return a primary key for a new AppUser, so the user's template variables
+        and form templates can be queued for creation before the user is saved.
+        Keys are taken from the AppUser ID sequence in one query, as many as there
+        are rows without an ID in the import file. Only used when not in a dry run.
+        """
+        if not self.reserved_app_user_pks:
+            count = max(self.unreserved_app_user_pks, 1)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                    [AppUser._meta.db_table, count],
+                )
+                self.reserved_app_user_pks = [pk for (pk,) in reversed(cursor.fetchall())]
+            self.unreserved_app_user_pks -= count
+        return self.reserved_app_user_pks.pop()
 
     def before_import(self, dataset, **kwargs):
         # A dict of the project's form templates that will be used for validation
         # of the "form_templates" column during import and for getting a FormTemplate ID
         # when creating a new AppUserFormTemplate
         self.form_templates = dict(self.project.form_templates.values_list("form_id_base", "id"))
+        # The names of the project's app users, case-folded to match the database
+        # collation, used for the unique name check in validate_instance()
+        self.app_user_name_keys = {
+            pk: name.casefold() for pk, name in self.project.app_users.values_list("id", "name")
+        }
+        self.app_user_names = {key: pk for pk, key in self.app_user_name_keys.items()}
+        self.reserved_app_user_pks = []
+        # The number of new app users (rows without an ID) in the file
+        self.unreserved_app_user_pks = (
+            sum(1 for pk in dataset["id"] if not pk) if "id" in dataset.headers else len(dataset)
+        )
+        self.template_variables_to_create = []
+        self.template_variables_to_update = []
+        self.template_variable_pks_to_delete = []
+        self.app_user_forms_to_create = []
+        self.app_user_form_pks_to_delete = []
+
+
+class DeviceInstanceLoader(ModelInstanceLoader):
+    """Looks up the Devices referenced in the import file with one
+    ``device_id IN (...)`` query per chunk of rows, instead of one query per row.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.device_id_field = self.resource.fields["device_id"]
+        self.chunk_size = self.resource.get_chunk_size()
+        # The distinct device IDs in file order, and the position of each in that list
+        self.device_ids = []
+        self.positions = {}
+        for row in self.dataset.dict:
+            try:
+                device_id = self.device_id_field.clean(row)
+            except (KeyError, ValueError):
+                # Errors are reported for their row in get_instance()
+                continue
+            if device_id and device_id not in self.positions:
+                self.positions[device_id] = len(self.device_ids)
+                self.device_ids.append(device_id)
+        self.loaded = set()
+        self.all_instances = {}
 
-
-class DeviceResource(resources.ModelResource):
-    """Custom ModelResource for importing/exporting Devices."""
+    def get_queryset(self):
+        # The fleet and its default app user are used by Device.set_default_app_user_name()
+        return super().get_queryset().select_related("fleet__default_app_user")
+
+    def load_chunk(self, position: int):
+        """Look up the chunk of device IDs starting at ``position``."""
+        device_ids = [
+            device_id
+            for device_id in self.device_ids[position : position + self.chunk_size]
+            if device_id not in self.loaded
+        ]
+        self.loaded.update(device_ids)
+        for instance in self.get_queryset().filter(device_id__in=device_ids):
+            self.all_instances[instance.device_id] = instance
+
+    def get_instance(self, row):
+        device_id = self.device_id_field.clean(row)
+        if not device_id:
+            return None
+        if device_id not in self.loaded:
+            self.load_chunk(self.positions[device_id])
+        return self.all_instances.get(device_id)
+
+
+class DeviceResource(StreamingExportMixin, resources.ModelResource):
+    """Custom ModelResource for importing/exporting Devices.
+
+    During import, devices are looked up a chunk of rows at a time and their
+    app_user_name changes are written in bulk, in batches of ``Meta.batch_size``.
+    """
 
     serial_number_readonly = fields.Field(
         attribute="serial_number", column_name="serial_number", readonly=True
@@ -304,9 +576,15 @@ class DeviceResource(resources.ModelResource):
         import_id_fields = ("device_id",)
         clean_model_instances = True
         skip_unchanged = True
+        use_bulk = True
+        batch_size = 1000
+        instance_loader_class = DeviceInstanceLoader
 
-    def __init__(self, organization):
+    def __init__(self, organization, progress: Callable[[int, int], None] | None = None):
         self.organization = organization
+        # Called with the number of rows processed and the total number of rows
+        # after each chunk of rows during import
+        self.progress = progress
         super().__init__()
 
     def get_queryset(self):
@@ -327,9 +605,44 @@ class DeviceResource(resources.ModelResource):
             )
         return instance
 
+    def get_bulk_update_fields(self):
+        return ["app_user_name"]
+
+    def validate_instance(self, instance, import_validation_errors=None, validate_unique=True):
+        # Only app_user_name can be changed by an import, and the device was looked up
+        # by its unique device_id, so only app_user_name is validated. Validating the
+        # other fields would query the database for each row (e.g. for the fleet FK).
+        exclude = [field.name for field in Device._meta.fields if field.name != "app_user_name"]
+        errors = dict(import_validation_errors or {})
+        try:
+            instance.full_clean(exclude=[*exclude, *errors], validate_unique=False)
+        except ValidationError as e:
+            errors = e.update_error_dict(errors)
+        if errors:
+            raise ValidationError(errors)
+
+    def save_instance(self, instance, is_create, row, **kwargs):
+        # Device.save() is not called in bulk mode, so apply its default app user here
+        instance.set_default_app_user_name()
+        super().save_instance(instance, is_create, row, **kwargs)
+
+    def before_import(self, dataset, **kwargs):
+        super().before_import(dataset, **kwargs)
+        self.rows_total = len(dataset)
+        self.rows_done = 0
+
+    def import_row(self, row, instance_loader, **kwargs):
+        row_result = super().import_row(row, instance_loader, **kwargs)
+        self.rows_done += 1
+        if self.progress and (
+            self.rows_done % self.get_chunk_size() == 0 or self.rows_done == self.rows_total
+        ):
+            self.progress(self.rows_done, self.rows_total)
+        return row_result
+
     def after_import(self, dataset: tablib.Dataset, result: Result, dry_run: bool = True, **kwargs):
         """After a confirmed import, push updated device policies to the MDM.
-        The push is done asynchronously via Dagster.
+        The push is done asynchronously via Dagster, in one mdm_job run per fleet.
 
         Only runs on the real import (not the dry-run preview), and only for
         rows that were actually new or updated.  Errors are logged but never
@@ -341,12 +654,218 @@ class DeviceResource(resources.ModelResource):
         device_pks = [row.object_id for row in result if row.is_new() or row.is_update()]
         if not device_pks:
             return
-        run_config = {"ops": {"push_mdm_device_config": {"config": {"device_pks": device_pks}}}}
+        device_pks_by_fleet = defaultdict(list)
+        for pk, fleet_id in Device.objects.filter(pk__in=device_pks).values_list("pk", "fleet_id"):
+            device_pks_by_fleet[fleet_id].append(pk)
+        for fleet_id, fleet_device_pks in device_pks_by_fleet.items():
+            run_config = {
+                "ops": {"push_mdm_device_config": {"config": {"device_pks": fleet_device_pks}}}
+            }
+            try:
+                trigger_dagster_job(job_name="mdm_job", run_config=run_config)
+            except Exception:
+                logger.error(
+                    "Failed to trigger Dagster job after CSV import",
+                    fleet_id=fleet_id,
+                    device_pks=fleet_device_pks,
+                    exc_info=True,
+                )
+
+
+@dataclass
+class PreviewError:
+    """An error from an import ``Result``, with the exception rendered as text."""
+
+    error: str
+    traceback: str
+    row: dict | None = None
+
+
+@dataclass
+class PreviewRow:
+    """A valid row from an import ``Result``."""
+
+    import_type: str
+    diff: list | None
+
+
+class ImportPreview:
+    """A summary of an import ``Result`` that can be stored in the cache. It has
+    the parts of the ``Result`` interface used by the ``publish_mdm/import.html``
+    template.
+    """
+
+    def __init__(self, result: Result):
+        self.totals = dict(result.totals)
+        self.diff_headers = list(result.diff_headers)
+        self.base_errors = [
+            PreviewError(error=str(error.error), traceback=error.traceback, row=error.row)
+            for error in result.base_errors
+        ]
+        self._row_errors = [
+            (
+                number,
+                [
+                    PreviewError(error=str(error.error), traceback=error.traceback, row=error.row)
+                    for error in errors
+                ],
+            )
+            for number, errors in result.row_errors()
+        ]
+        self.invalid_rows = [
+            InvalidRow(
+                number=row.number,
+                validation_error=ValidationError(
+                    {
+                        field: [str(message) for message in messages]
+                        for field, messages in row.error_dict.items()
+                    }
+                ),
+                values=row.values,
+            )
+            for row in result.invalid_rows
+        ]
+        self._valid_rows = [
+            PreviewRow(import_type=row.import_type, diff=row.diff) for row in result.valid_rows()
+        ]
+
+    def valid_rows(self) -> list[PreviewRow]:
+        return self._valid_rows
+
+    def row_errors(self) -> list[tuple[int, list[PreviewError]]]:
+        return self._row_errors
+
+    def has_errors(self) -> bool:
+        return bool(self.base_errors or self._row_errors)
+
+    def has_validation_errors(self) -> bool:
+        return bool(self.invalid_rows)
+
+
+# Cache key holding the DeviceImport for a device import running in the background
+DEVICE_IMPORT_CACHE_KEY = "device-import:{import_id}"
+# Cache key added when a stage ("validate" or "import") of a device import starts
+DEVICE_IMPORT_LOCK_CACHE_KEY = "device-import-lock:{import_id}:{stage}"
+
+
+@dataclass
+class DeviceImport:
+    """A device import that runs in the background, in a Dagster job or in the
+    request if Dagster is not enabled.
+
+    The uploaded file is kept in ``MediaStorage`` and the import's state in the
+    Django cache, so the progress and preview can be shown to the user between
+    the upload and confirm requests.
+    """
+
+    class Status(models.TextChoices):
+        VALIDATING = "validating"
+        PREVIEW = "preview"
+        INVALID = "invalid"
+        IMPORTING = "importing"
+        DONE = "done"
+        FAILED = "failed"
+
+    # The name of the uploaded file in MediaStorage
+    import_id: str
+    organization_id: int
+    # The index of the file format in settings.IMPORT_EXPORT_FORMATS
+    format: int
+    original_file_name: str
+    status: str = Status.VALIDATING
+    done: int = 0
+    total: int = 0
+    preview: ImportPreview | None = None
+
+    cache_timeout: ClassVar[int] = 60 * 60
+
+    @classmethod
+    def get(cls, import_id: str) -> "DeviceImport | None":
+        return cache.get(DEVICE_IMPORT_CACHE_KEY.format(import_id=import_id))
+
+    def save(self):
+        cache.set(
+            DEVICE_IMPORT_CACHE_KEY.format(import_id=self.import_id), self, self.cache_timeout
+        )
+
+    def delete(self):
+        cache.delete(DEVICE_IMPORT_CACHE_KEY.format(import_id=self.import_id))
+
+    @property
+    def in_progress(self) -> bool:
+        return self.status in (self.Status.VALIDATING, self.Status.IMPORTING)
+
+    def report_progress(self, done: int, total: int):
+        self.done = done
+        self.total = total
+        self.save()
+
+    def lock(self, dry_run: bool) -> bool:
+        """Mark the validate (if ``dry_run`` is True) or import stage as started.
+        Returns False if it was already started, e.g. by a second confirm request.
+        """
+        key = DEVICE_IMPORT_LOCK_CACHE_KEY.format(
+            import_id=self.import_id, stage="validate" if dry_run else "import"
+        )
+        return cache.add(key, True, self.cache_timeout)
+
+    def run(self, dry_run: bool) -> ImportPreview | None:
+        """Import the uploaded file, or only validate it if ``dry_run`` is True.
+
+        Each stage only runs once per import: if it was already started, nothing
+        is done. The file is deleted from MediaStorage unless a valid preview is
+        waiting for confirmation. Errors are logged and set the status to FAILED.
+        """
+        if not self.lock(dry_run):
+            logger.warning(
+                "Device import already started", import_id=self.import_id, dry_run=dry_run
+            )
+            return self.preview
+        self.status = self.Status.VALIDATING if dry_run else self.Status.IMPORTING
+        self.done = self.total = 0
+        self.preview = None
+        self.save()
+        import_format = settings.IMPORT_EXPORT_FORMATS[self.format]()
+        if not import_format.is_binary():
+            import_format.encoding = "utf-8-sig"
+        tmp_storage = MediaStorage(
+            name=self.import_id,
+            encoding=import_format.encoding,
+            read_mode=import_format.get_read_mode(),
+        )
         try:
-            trigger_dagster_job(job_name="mdm_job", run_config=run_config)
+            organization = Organization.objects.get(pk=self.organization_id)
+            dataset = import_format.create_dataset(tmp_storage.read())
+            self.total = len(dataset)
+            resource = DeviceResource(organization, progress=self.report_progress)
+            result = resource.import_data(
+                dataset,
+                use_transactions=True,
+                rollback_on_validation_errors=True,
+                dry_run=dry_run,
+            )
         except Exception:
-            logger.error(
-                "Failed to trigger Dagster job after CSV import",
-                device_pks=device_pks,
-                exc_info=True,
+            logger.exception("Device import failed", import_id=self.import_id, dry_run=dry_run)
+            self.status = self.Status.FAILED
+        else:
+            self.preview = ImportPreview(result)
+            if result.has_errors() or result.has_validation_errors():
+                self.status = self.Status.INVALID
+            else:
+                self.status = self.Status.PREVIEW if dry_run else self.Status.DONE
+            logger.info(
+                "Device import finished",
+                import_id=self.import_id,
+                dry_run=dry_run,
+                status=self.status,
+                totals=self.preview.totals,
             )
+        if self.status != self.Status.PREVIEW:
+            try:
+                tmp_storage.remove()
+            except Exception:
+                logger.warning(
+                    "Could not delete device import file", import_id=self.import_id, exc_info=True
+                )
+        self.save()
+        return self.preview
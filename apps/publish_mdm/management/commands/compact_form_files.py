@@ -0,0 +1,34 @@
+import datetime as dt
+
+from django.core.management.base import BaseCommand
+
+from apps.publish_mdm.form_files import form_file_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the files in the content-addressed form file store that are no "
+        "longer referenced by any form template or app user form version."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age-hours",
+            type=int,
+            default=24,
+            help="Keep files modified within this many hours (default: 24).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="List the files that would be deleted without deleting them.",
+        )
+
+    def handle(self, *args, **options):
+        orphans = form_file_store.compact(
+            min_age=dt.timedelta(hours=options["min_age_hours"]), dry_run=options["dry_run"]
+        )
+        for name in orphans:
+            self.stdout.write(name)
+        action = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{action} {len(orphans)} unreferenced form file(s)."))
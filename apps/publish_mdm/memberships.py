@@ -0,0 +1,80 @@
+import uuid
+
+import structlog
+from django.core.cache import cache
+from django.db.models import QuerySet
+
+logger = structlog.getLogger(__name__)
+
+
+def prefilled(queryset: QuerySet, objects: list) -> QuerySet:
+    """Return ``queryset`` with its results set to ``objects``, so iterating,
+    counting or slicing it does not query the database. Chained methods like
+    ``filter()`` still build a new query.
+    """
+    queryset._result_cache = objects
+    queryset._prefetch_done = True
+    return queryset
+
+
+class MembershipCache:
+    """The organizations a user can access and the projects in each organization,
+    used by OrganizationMiddleware and ODKProjectMiddleware on every request.
+
+    Entries are cached in the Django cache under revision tokens: one per user,
+    replaced when the user is added to or removed from an organization, and a
+    global one, replaced when an organization, project or ODK Central server is
+    saved or deleted (see the signal receivers in apps.publish_mdm.models).
+    """
+
+    revision_cache_key = "publish_mdm:memberships-revision"
+    user_revision_cache_key = "publish_mdm:memberships-revision:{user_id}"
+    timeout = 60 * 60
+
+    def revisions(self, user_id: int | None = None) -> str:
+        keys = [self.revision_cache_key]
+        if user_id is not None:
+            keys.append(self.user_revision_cache_key.format(user_id=user_id))
+        revisions = cache.get_many(keys)
+        if missing := {key: uuid.uuid4().hex for key in keys if key not in revisions}:
+            # Keep any revision set by another process in the meantime
+            for key, revision in missing.items():
+                cache.add(key, revision, timeout=None)
+            revisions |= cache.get_many(missing)
+        return ":".join(revisions.get(key, "") for key in keys)
+
+    def _get(self, key: str, queryset: QuerySet) -> QuerySet:
+        objects = cache.get(key)
+        if objects is None:
+            objects = list(queryset)
+            cache.set(key, objects, timeout=self.timeout)
+        return prefilled(queryset, objects)
+
+    def organizations(self, user) -> QuerySet:
+        """The user's organizations, as returned by User.get_organizations()."""
+        key = f"publish_mdm:memberships:{user.pk}:{self.revisions(user.pk)}"
+        return self._get(key, user.get_organizations())
+
+    def projects(self, organization) -> QuerySet:
+        """The organization's projects, with their related objects selected."""
+        key = f"publish_mdm:organization-projects:{organization.pk}:{self.revisions()}"
+        return self._get(key, organization.projects.select_related())
+
+    def invalidate(self, *user_ids: int):
+        """Drop the cached organizations of the given users."""
+        cache.set_many(
+            {
+                self.user_revision_cache_key.format(user_id=user_id): uuid.uuid4().hex
+                for user_id in user_ids
+            },
+            timeout=None,
+        )
+        logger.debug("Invalidated user memberships", user_ids=user_ids)
+
+    def invalidate_all(self):
+        """Drop the cached organizations and projects of all users."""
+        cache.set(self.revision_cache_key, uuid.uuid4().hex, timeout=None)
+        logger.debug("Invalidated all memberships")
+
+
+membership_cache = MembershipCache()
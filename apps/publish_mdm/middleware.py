@@ -1,8 +1,9 @@
 import structlog
-from django.http import HttpRequest, HttpResponseForbidden
+from django.http import Http404, HttpRequest, HttpResponseForbidden
 from django.shortcuts import get_object_or_404
 from django.urls import ResolverMatch
 
+from .memberships import membership_cache
 from .models import Organization
 from .nav import Breadcrumbs
 
@@ -17,6 +18,7 @@ class ODKProjectMiddleware:
 
     This must come after OrganizationMiddleware in the MIDDLEWARE setting to ensure
     `request.organization` is set correctly if an organization slug is in the URL.
+    The organization's projects are cached, see MembershipCache.
     """
 
     def __init__(self, get_response):
@@ -32,11 +34,14 @@ class ODKProjectMiddleware:
         request.odk_projects = None
         if not getattr(request, "organization", None):
             if request.user.is_authenticated:
-                request.organization = request.user.get_organizations().first()
+                organizations = getattr(request, "organizations", None)
+                if organizations is None:
+                    organizations = membership_cache.organizations(request.user)
+                request.organization = organizations.first()
             else:
                 request.organization = None
         if request.organization:
-            request.odk_projects = request.organization.projects.select_related()
+            request.odk_projects = membership_cache.projects(request.organization)
         # Automatically lookup the current project
         resolver_match: ResolverMatch = request.resolver_match
         if (
@@ -45,7 +50,12 @@ class ODKProjectMiddleware:
             and request.organization
         ):
             odk_project_pk = resolver_match.captured_kwargs["odk_project_pk"]
-            project = get_object_or_404(request.odk_projects, pk=odk_project_pk)
+            project = next(
+                (project for project in request.odk_projects if project.pk == odk_project_pk),
+                None,
+            )
+            if project is None:
+                raise Http404("No Project matches the given query.")
             logger.debug(
                 "odk_project_pk detected",
                 odk_project_pk=odk_project_pk,
@@ -66,6 +76,7 @@ class OrganizationMiddleware:
     """Middleware to look up the current organization based on the URL.
 
     The `organization` and `organizations` attributes are added to the request object.
+    The user's organizations are cached, see MembershipCache.
     """
 
     def __init__(self, get_response):
@@ -76,7 +87,7 @@ class OrganizationMiddleware:
 
     def process_view(self, request: HttpRequest, view_func, view_args, view_kwargs):
         if request.user.is_authenticated:
-            request.organizations = request.user.get_organizations()
+            request.organizations = membership_cache.organizations(request.user)
         else:
             request.organizations = None
         request.organization = None
@@ -91,7 +102,14 @@ class OrganizationMiddleware:
             organizations = request.organizations
         if "organization_slug" in resolver_match.captured_kwargs and organizations is not None:
             organization_slug = resolver_match.captured_kwargs["organization_slug"]
-            organization = get_object_or_404(organizations, slug=organization_slug)
+            if is_public_signup_request:
+                organization = get_object_or_404(organizations, slug=organization_slug)
+            else:
+                organization = next(
+                    (org for org in organizations if org.slug == organization_slug), None
+                )
+                if organization is None:
+                    raise Http404("No Organization matches the given query.")
             logger.debug(
                 "organization_slug detected",
                 organization_slug=organization_slug,
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.13 on 2026-10-19 08:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("publish_mdm", "0018_alter_organization_mdm"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="formtemplateversion",
+            name="sheet_revision",
+            field=models.CharField(
+                blank=True,
+                help_text="The Google Sheet revision the file was downloaded from.",
+                max_length=255,
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.13 on 2026-10-19 09:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("publish_mdm", "0019_formtemplateversion_sheet_revision"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="formtemplateversion",
+            name="entity_references",
+            field=models.JSONField(
+                blank=True,
+                help_text="The entity lists referenced in the file and the cells that are updated for each app user.",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.13 on 2026-10-19 10:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("publish_mdm", "0020_formtemplateversion_entity_references"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="appuserformversion",
+            name="content_digest",
+            field=models.CharField(
+                blank=True,
+                help_text="A hash of the rendered form's content, excluding its version.",
+                max_length=64,
+            ),
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.13 on 2026-10-19 10:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("publish_mdm", "0021_appuserformversion_content_digest"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PublishRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("modified_at", models.DateTimeField(auto_now=True, db_index=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("running", "Running"),
+                            ("succeeded", "Succeeded"),
+                            ("failed", "Failed"),
+                        ],
+                        default="running",
+                        max_length=20,
+                    ),
+                ),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "app_users",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="The number of app users the form template was published for.",
+                    ),
+                ),
+                ("forms_published", models.PositiveIntegerField(default=0)),
+                (
+                    "forms_skipped",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="The number of unchanged forms that were not published again.",
+                    ),
+                ),
+                (
+                    "timings",
+                    models.JSONField(
+                        blank=True,
+                        default=dict,
+                        help_text="The count, total seconds and bytes transferred for each publish stage.",
+                    ),
+                ),
+                (
+                    "form_template",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="publish_runs",
+                        to="publish_mdm.formtemplate",
+                    ),
+                ),
+                (
+                    "template_version",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="publish_runs",
+                        to="publish_mdm.formtemplateversion",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="publish_runs",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
@@ -4,6 +4,7 @@ from functools import cached_property
 from typing import ClassVar
 from urllib.parse import urlparse
 
+import openpyxl
 import structlog
 from django.conf import settings
 from django.contrib.sites.shortcuts import get_current_site
@@ -12,6 +13,8 @@ from django.core.validators import RegexValidator
 from django.db import models, transaction
 from django.db.models import F, Value
 from django.db.models.functions import NullIf
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.crypto import get_random_string
@@ -24,13 +27,16 @@ from invitations.signals import invite_url_sent
 from apps.infisical.api import kms_api
 from apps.infisical.fields import EncryptedCharField, EncryptedEmailField, EncryptedMixin
 from apps.infisical.managers import EncryptedManager
-from apps.mdm.mdms import get_active_mdm_instance
+from apps.mdm.mdms import enterprise_mdm_registry, get_active_mdm_instance
 from apps.mdm.models import Fleet, Policy, PolicyApplication
 from apps.patterns.soft_delete import SoftDeleteModel
 from apps.users.models import User
 
 from .etl import template
-from .etl.google import download_user_google_sheet
+from .etl.google import GoogleSheetFile, download_user_google_sheet
+from .etl.tracing import span
+from .form_files import form_file_store
+from .memberships import membership_cache
 
 logger = structlog.getLogger(__name__)
 
@@ -387,8 +393,10 @@ class FormTemplate(AbstractBaseModel):
             q &= models.Q(app_user_forms__app_user__name__in=names)
         return AppUser.objects.filter(q)
 
-    def download_user_google_sheet(self, user: User, name: str) -> SimpleUploadedFile:
-        """Download the Google Sheet Excel file for this form template."""
+    def download_user_google_sheet(self, user: User, name: str) -> GoogleSheetFile:
+        """Download the Google Sheet Excel file for this form template, reusing the
+        file of a previous version if the sheet has not changed since.
+        """
         social_token = user.get_google_social_token()
         if social_token is None:
             raise ValueError("User does not have a Google social token.")
@@ -397,8 +405,28 @@ class FormTemplate(AbstractBaseModel):
             token_secret=social_token.token_secret,
             sheet_url=self.template_url,
             name=name,
+            cached_content=self.get_template_content,
         )
 
+    def get_template_content(self, revision: str) -> bytes | None:
+        """Return the Excel content of the latest version downloaded from the given
+        Google Sheet revision, or None if there is no such version.
+        """
+        previous = (
+            self.versions.filter(sheet_revision=revision)
+            .exclude(file="")
+            .order_by("-created_at")
+            .first()
+        )
+        if previous is None:
+            return None
+        try:
+            with previous.file.open("rb") as f:
+                return f.read()
+        except OSError:
+            logger.warning("Could not read previous template version", version=previous)
+            return None
+
 
 class FormTemplateVersion(AbstractBaseModel):
     """A version (like v5) of a form template."""
@@ -409,6 +437,17 @@ class FormTemplateVersion(AbstractBaseModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="form_template_versions")
     file = models.FileField(upload_to="form-templates/")
     version = models.CharField(max_length=255)
+    sheet_revision = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text="The Google Sheet revision the file was downloaded from.",
+    )
+    entity_references = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="The entity lists referenced in the file and the cells that are "
+        "updated for each app user.",
+    )
 
     class Meta:
         constraints = (
@@ -420,6 +459,25 @@ class FormTemplateVersion(AbstractBaseModel):
     def __str__(self):
         return self.file.name
 
+    def get_entity_reference_plan(
+        self, workbook: openpyxl.Workbook | None = None
+    ) -> template.EntityReferencePlan:
+        """Return the entity reference plan for the file. The first time, the file is
+        analyzed and the plan is kept on the instance, so rendering the version for
+        each app user doesn't search the file again. create_app_user_versions()
+        saves it.
+
+        ``workbook`` is the file's workbook, if it is already loaded and not modified.
+        """
+        if self.entity_references is not None:
+            return template.EntityReferencePlan.model_validate(self.entity_references)
+        if workbook is None:
+            with self.file.open("rb") as f:
+                workbook = openpyxl.load_workbook(f)
+        plan = template.analyze_entity_references(workbook)
+        self.entity_references = plan.model_dump(mode="json")
+        return plan
+
     def create_app_user_versions(
         self,
         app_users: models.QuerySet["AppUser"] | None = None,
@@ -427,6 +485,7 @@ class FormTemplateVersion(AbstractBaseModel):
         attachments: dict | None = None,
     ) -> list["AppUserFormVersion"]:
         """Create the next version of this form template for each app user."""
+        analyzed = self.entity_references is not None
         app_user_versions = []
         q = models.Q(form_template=self.form_template)
         # Optionally limit to specific app users (partial publish)
@@ -443,6 +502,9 @@ class FormTemplateVersion(AbstractBaseModel):
             if send_message:
                 send_message(f"Created FormTemplateVersion({xml_form_id=}, {version=})")
             app_user_versions.append(app_user_version)
+        if not analyzed and self.entity_references is not None:
+            # Store the entity reference plan from the first render for later publishes
+            self.save(update_fields=["entity_references"])
         return app_user_versions
 
 
@@ -473,7 +535,7 @@ class AppUser(AbstractBaseModel):
 
     # While ODK Central does not limit the characters that can be used in an
     # app user's name, we have to limit the characters so that we can use the name
-    # in `build_entity_list_mapping()` to generate valid entity list names.
+    # in `entity_list_substitute()` to generate valid entity list names.
     # An entity list name must be a valid XML identifier and cannot include a period.
     # (See https://docs.getodk.org/central-api-dataset-management/#creating-datasets and
     # https://getodk.github.io/xforms-spec/entities.html#declaring-that-a-form-creates-entities)
@@ -601,17 +663,43 @@ class AppUserFormTemplate(AbstractBaseModel):
     def create_next_version(
         self, form_template_version: FormTemplateVersion, attachments: dict | None = None
     ):
-        """Create the next version of this app user form template."""
+        """Create the next version of this app user form template.
+
+        If the rendered form has the same content as earlier versions apart from the
+        version number, the latest one's file is reused and the new version records
+        their versions (see AppUserFormVersion.is_unchanged_in()). Otherwise the file
+        is saved in the content-addressed form file store.
+        """
         from .etl.transform import render_template_for_app_user  # noqa: PLC0415
 
         version_file = render_template_for_app_user(
             app_user=self.app_user, template_version=form_template_version, attachments=attachments
         )
-        return AppUserFormVersion.objects.create(
+        digest = getattr(version_file, "digest", "")
+        unchanged = []
+        if digest:
+            unchanged = list(
+                self.app_user_form_template_versions.filter(content_digest=digest)
+                .order_by("-created_at")
+                .values_list("file", "form_template_version__version")
+            )
+        if unchanged:
+            file = unchanged[0][0]
+            logger.info("Rendered form unchanged, reusing file", file=file)
+        else:
+            with span("storage.save_form") as data:
+                file = form_file_store.store(version_file)
+                data["bytes"] = version_file.size
+        app_user_version = AppUserFormVersion.objects.create(
             app_user_form_template=self,
             form_template_version=form_template_version,
-            file=version_file,
+            file=file,
+            content_digest=digest,
         )
+        if unchanged:
+            app_user_version.unchanged_versions = frozenset(version for _, version in unchanged)
+            app_user_version.rendered_file = version_file
+        return app_user_version
 
 
 class AppUserFormVersion(AbstractBaseModel):
@@ -626,6 +714,17 @@ class AppUserFormVersion(AbstractBaseModel):
         FormTemplateVersion, on_delete=models.CASCADE, related_name="app_user_form_templates"
     )
     file = models.FileField(upload_to="form-templates/")
+    content_digest = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="A hash of the rendered form's content, excluding its version.",
+    )
+    # If the rendered form did not change since earlier versions, their version
+    # numbers, and this version's own render in case it has to be uploaded after
+    # all (the reused file has an earlier version number). Set by
+    # AppUserFormTemplate.create_next_version()
+    unchanged_versions: frozenset[str] = frozenset()
+    rendered_file: SimpleUploadedFile | None = None
 
     class Meta:
         constraints = (
@@ -648,6 +747,82 @@ class AppUserFormVersion(AbstractBaseModel):
         """The app user for this version."""
         return self.app_user_form_template.app_user
 
+    def is_unchanged_in(self, central_forms: dict) -> bool:
+        """Whether ODK Central has an earlier version of this app user's form with the
+        same rendered form, so this version doesn't need to be published.
+        ``central_forms`` maps xmlFormIds to forms, like PublishService.get_forms().
+        """
+        central_form = central_forms.get(self.xml_form_id)
+        return central_form is not None and central_form.version in self.unchanged_versions
+
+    def store_rendered_file(self):
+        """Save this version's own render in place of the reused file, so it can be
+        uploaded. ODK Central would reject the earlier version number in the reused file.
+        """
+        if self.rendered_file is None:
+            return
+        with span("storage.save_form") as data:
+            self.file = form_file_store.store(self.rendered_file)
+            data["bytes"] = self.rendered_file.size
+        self.save(update_fields=["file", "modified_at"])
+        self.rendered_file = None
+
+
+class PublishRun(AbstractBaseModel):
+    """A record of one publish of a form template to ODK Central, with the time
+    spent in each stage of the publish pipeline (see apps.publish_mdm.etl.tracing).
+    """
+
+    class Status(models.TextChoices):
+        RUNNING = "running", "Running"
+        SUCCEEDED = "succeeded", "Succeeded"
+        FAILED = "failed", "Failed"
+
+    form_template = models.ForeignKey(
+        FormTemplate, on_delete=models.CASCADE, related_name="publish_runs"
+    )
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name="publish_runs"
+    )
+    template_version = models.ForeignKey(
+        FormTemplateVersion,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="publish_runs",
+    )
+    status = models.CharField(max_length=20, choices=Status, default=Status.RUNNING)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    app_users = models.PositiveIntegerField(
+        default=0, help_text="The number of app users the form template was published for."
+    )
+    forms_published = models.PositiveIntegerField(default=0)
+    forms_skipped = models.PositiveIntegerField(
+        default=0, help_text="The number of unchanged forms that were not published again."
+    )
+    timings = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="The count, total seconds and bytes transferred for each publish stage.",
+    )
+
+    def __str__(self):
+        return f"{self.form_template} ({self.get_status_display()}, {self.created_at})"
+
+    @property
+    def duration(self) -> datetime.timedelta | None:
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.created_at
+
+    def finish(self, status: Status, trace=None):
+        """Save the run's final status and, if given, the PublishTrace's timings."""
+        self.status = status
+        self.finished_at = timezone.now()
+        if trace is not None:
+            self.timings = trace.as_dict()
+        self.save()
+
 
 def project_directory_path(instance: "ProjectAttachment", filename: str):
     return f"project/{instance.project.id}/attachment/{filename}"
@@ -775,3 +950,48 @@ class AndroidEnterpriseAccount(AbstractBaseModel):
     @property
     def is_enrolled(self):
         return bool(self.enterprise_name)
+
+
+@receiver([post_save, post_delete], sender=Organization)
+@receiver([post_save, post_delete], sender=AndroidEnterpriseAccount)
+def invalidate_enterprise_mdm_registry(sender, **kwargs):
+    """Drop cached enterprise MDM instances when an organization or its
+    enterprise account changes, since either can change the resolved MDM.
+    """
+    enterprise_mdm_registry.invalidate()
+    # Invalidate again after the commit, in case another process rebuilt an entry
+    # from the previous state in the meantime
+    transaction.on_commit(enterprise_mdm_registry.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Organization)
+@receiver([post_save, post_delete], sender=Project)
+@receiver([post_save, post_delete], sender=CentralServer)
+def invalidate_all_memberships(sender, **kwargs):
+    """Drop the cached organizations and projects used by the middleware when an
+    organization, project or ODK Central server (shown in the project menu) changes.
+    """
+    membership_cache.invalidate_all()
+    # Invalidate again after the commit, in case another process cached the
+    # previous state in the meantime
+    transaction.on_commit(membership_cache.invalidate_all)
+
+
+@receiver(m2m_changed, sender=Organization.users.through)
+def invalidate_user_memberships(sender, instance, action, reverse, pk_set, **kwargs):
+    """Drop the cached organizations of users added to or removed from an organization."""
+    if action == "post_clear":
+        invalidate_all_memberships(sender)
+    elif action in ("post_add", "post_remove"):
+        user_ids = [instance.pk] if reverse else list(pk_set)
+        membership_cache.invalidate(*user_ids)
+        transaction.on_commit(lambda: membership_cache.invalidate(*user_ids))
+
+
+@receiver(post_save, sender=User)
+def invalidate_superuser_memberships(sender, instance, update_fields=None, **kwargs):
+    """Drop the user's cached organizations when they may have become or stopped
+    being a superuser, who can access all organizations.
+    """
+    if update_fields is None or "is_superuser" in update_fields:
+        membership_cache.invalidate(instance.pk)
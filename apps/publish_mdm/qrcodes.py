@@ -0,0 +1,107 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+
+import structlog
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .utils import create_qr_code
+
+logger = structlog.getLogger(__name__)
+
+
+class QRCodeCache:
+    """A content-addressed store for rendered QR code images.
+
+    Images are saved in the default storage under a name derived from a hash of
+    the QR code payload and the options used to render it, so the same QR code
+    is only rendered and uploaded once, no matter how many AppUsers, Fleets or
+    EnrollmentTokens point at it. Names known to exist in storage are kept in a
+    small LRU index so repeat lookups don't hit the storage backend (an S3 HEAD
+    request in deployed environments).
+    """
+
+    location = "qr-codes/cache"
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._index: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(payload: bytes | str, **options) -> str:
+        """Hash a QR code payload and its render options."""
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        digest = hashlib.sha256(payload)
+        digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def name(self, key: str) -> str:
+        """The storage name for the image with the given key."""
+        return f"{self.location}/{key[:2]}/{key}.png"
+
+    def exists(self, name: str) -> bool:
+        """Check whether an image is saved in storage, using the LRU index first."""
+        with self._lock:
+            if name in self._index:
+                self._index.move_to_end(name)
+                return True
+        if not default_storage.exists(name):
+            return False
+        self._remember(name, default_storage.size(name))
+        return True
+
+    def get_or_create(
+        self,
+        payload: bytes | str,
+        render: Callable[[], bytes] | None = None,
+        **options,
+    ) -> str:
+        """Return the storage name of the QR code image for ``payload``, rendering
+        and saving it only if it is not already stored.
+
+        ``render`` returns the PNG bytes and defaults to a plain QR code of the payload.
+        ``options`` should include anything ``render`` uses besides the payload.
+        """
+        name = self.name(self.key(payload, **options))
+        if self.exists(name):
+            logger.debug("QR code image found in cache", name=name)
+            return name
+        content = render() if render else create_qr_code(payload).getvalue()
+        return self._save(name, content)
+
+    def store(self, content: bytes, payload: bytes | str | None = None, **options) -> str:
+        """Save an already rendered QR code image unless an image for the same
+        payload and options (or, without a payload, the same content) is already
+        stored, and return its name.
+        """
+        name = self.name(self.key(content if payload is None else payload, **options))
+        if self.exists(name):
+            logger.debug("QR code image found in cache", name=name)
+            return name
+        return self._save(name, content)
+
+    def clear(self):
+        """Forget the names in the LRU index. Stored images are not deleted."""
+        with self._lock:
+            self._index.clear()
+
+    def _save(self, name: str, content: bytes) -> str:
+        saved_name = default_storage.save(name, ContentFile(content))
+        logger.info("Saved QR code image", name=saved_name, size=len(content))
+        self._remember(saved_name, len(content))
+        return saved_name
+
+    def _remember(self, name: str, size: int):
+        with self._lock:
+            self._index[name] = size
+            self._index.move_to_end(name)
+            while len(self._index) > self.max_entries:
+                self._index.popitem(last=False)
+
+
+qr_code_cache = QRCodeCache()
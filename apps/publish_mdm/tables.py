@@ -1,14 +1,213 @@
+import base64
+import binascii
+import json
+import operator
+from collections.abc import Sequence
+from functools import reduce
 from typing import ClassVar
 
 import django_tables2 as tables
 from allauth.account.adapter import render_to_string
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, Q, QuerySet
+from django.utils.functional import cached_property
 from django.utils.html import format_html
+from django_tables2.rows import BoundRows
+from django_tables2.utils import OrderBy
 
 from apps.mdm.models import Device, Fleet
 from apps.publish_mdm.forms import DeviceAppUserForm
 
 from .models import CentralServer, FormTemplate, FormTemplateVersion
 
+# Above this many rows, KeysetPaginator.count is the query planner's estimate
+APPROXIMATE_COUNT_THRESHOLD = 10_000
+
+
+def approximate_count(queryset: QuerySet, threshold: int = APPROXIMATE_COUNT_THRESHOLD):
+    """Count the rows in ``queryset``, counting at most ``threshold + 1`` rows. If
+    there are more, the PostgreSQL query planner's estimate is returned instead.
+
+    Returns a ``(count, is_approximate)`` tuple.
+    """
+    queryset = queryset.order_by().values("pk")
+    count = queryset[: threshold + 1].count()
+    if count <= threshold:
+        return count, False
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return max(int(plan[0]["Plan"]["Plan Rows"]), count), True
+
+
+class KeysetPage:
+    """A page of results from a KeysetPaginator."""
+
+    def __init__(self, object_list, cursor: str | None, next_cursor: str | None, paginator):
+        self.object_list = object_list
+        # The cursor used to get this page (None for the first page)
+        self.cursor = cursor
+        # The cursor for the next page (None for the last page)
+        self.next_cursor = next_cursor
+        self.paginator = paginator
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+
+class KeysetPaginator:
+    """Keyset ("seek") pagination for a QuerySet.
+
+    Instead of skipping rows with an OFFSET, each page after the first is selected
+    with a WHERE clause on the ordering values of the previous page's last row,
+    which are passed around in an opaque cursor. Fetching a page costs the same
+    however deep into the results it is, as long as the ordering can use an index.
+    The primary key is appended to the ordering so that it is total and stable.
+    """
+
+    def __init__(self, queryset: QuerySet, ordering: Sequence[str], per_page: int = 25):
+        ordering = [i for i in ordering if i.lstrip("-") != "pk"] + [
+            next((i for i in ordering if i.lstrip("-") == "pk"), "pk")
+        ]
+        self.per_page = per_page
+        # (annotation name, descending) for each ordering field
+        self.keys = [(f"keyset_{n}", field.startswith("-")) for n, field in enumerate(ordering)]
+        self.queryset = queryset.annotate(
+            **{
+                key: F(field.lstrip("-"))
+                for (key, _), field in zip(self.keys, ordering, strict=True)
+            }
+        ).order_by(*(F(key).desc() if desc else F(key).asc() for key, desc in self.keys))
+        self.unpaginated_queryset = queryset
+
+    @cached_property
+    def _count(self) -> tuple[int, bool]:
+        return approximate_count(self.unpaginated_queryset)
+
+    @property
+    def count(self) -> int:
+        """The total number of results, estimated for very large querysets."""
+        return self._count[0]
+
+    @property
+    def count_is_approximate(self) -> bool:
+        return self._count[1]
+
+    @staticmethod
+    def encode_cursor(values: list) -> str:
+        data = json.dumps(values, cls=DjangoJSONEncoder, separators=(",", ":"))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor: str) -> list | None:
+        """Decode a cursor, returning None if it is not valid for this paginator."""
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        except (binascii.Error, ValueError):
+            return None
+        if not isinstance(values, list) or len(values) != len(self.keys):
+            return None
+        return values
+
+    def seek(self, values: list) -> Q:
+        """Build a filter for the rows after the row with the given ordering values.
+
+        PostgreSQL sorts NULLs last in ascending order and first in descending order,
+        and the comparisons below follow that so the ordering can use an index.
+        """
+        conditions = []
+        equal = Q()
+        for (key, desc), value in zip(self.keys, values, strict=True):
+            if value is None:
+                after = Q(**{f"{key}__isnull": False}) if desc else None
+                same = Q(**{f"{key}__isnull": True})
+            else:
+                after = (
+                    Q(**{f"{key}__lt": value})
+                    if desc
+                    else Q(**{f"{key}__gt": value}) | Q(**{f"{key}__isnull": True})
+                )
+                same = Q(**{key: value})
+            if after is not None:
+                conditions.append(equal & after)
+            equal &= same
+        return reduce(operator.or_, conditions)
+
+    def page(self, cursor: str | None = None) -> KeysetPage:
+        """Return the page after ``cursor``, or the first page. An invalid cursor
+        also returns the first page.
+        """
+        queryset = self.queryset
+        values = self.decode_cursor(cursor) if cursor else None
+        if values is None:
+            cursor = None
+        else:
+            queryset = queryset.filter(self.seek(values))
+        object_list = list(queryset[: self.per_page + 1])
+        next_cursor = None
+        if len(object_list) > self.per_page:
+            object_list = object_list[: self.per_page]
+            last = object_list[-1]
+            next_cursor = self.encode_cursor([getattr(last, key) for key, _ in self.keys])
+        elif cursor is None:
+            # Everything fits on the first page, so there is no need to count
+            self.__dict__.setdefault("_count", (len(object_list), False))
+        return KeysetPage(object_list, cursor, next_cursor, self)
+
+
+class KeysetTable(tables.Table):
+    """A Table paginated with a KeysetPaginator instead of page numbers. It is
+    rendered with infinite scroll: the last row loads the next page with HTMX when
+    it is scrolled into view. Requests for the next page have a cursor query
+    parameter and should be rendered with the ``patterns/tables/keyset-rows.html``
+    template.
+    """
+
+    class Meta:
+        template_name = "patterns/tables/keyset-table.html"
+
+    @property
+    def prefixed_cursor_field(self) -> str:
+        return f"{self.prefix}cursor"
+
+    def get_keyset_ordering(self) -> list[str]:
+        """The queryset ordering for the table's current order_by."""
+        ordering = []
+        for alias in self.order_by or ():
+            bound_column = self.columns[OrderBy(alias).bare]
+            # As in TableQuerysetData.order_by(), bound_column.order_by reflects the
+            # current ordering of the column
+            if alias[0] != bound_column.order_by_alias[0]:
+                order_by = bound_column.order_by.opposite
+            else:
+                order_by = bound_column.order_by
+            ordering += [i.for_queryset() for i in order_by]
+        return ordering
+
+    def paginate(self, per_page=None, **kwargs):
+        """Paginate the table using the cursor in the request (``RequestConfig``
+        sets ``self.request``). Page numbers are ignored.
+        """
+        if not isinstance(self.data.data, QuerySet):
+            return super().paginate(per_page=per_page, **kwargs)
+        request = getattr(self, "request", None)
+        cursor = request.GET.get(self.prefixed_cursor_field) if request else None
+        self.paginator = KeysetPaginator(
+            self.data.data, self.get_keyset_ordering(), per_page or self._meta.per_page
+        )
+        self.page = self.paginator.page(cursor)
+        self.page.object_list = BoundRows(data=self.page.object_list, table=self)
+        return self
+
 
 class FormTemplateTable(tables.Table):
     app_users = tables.Column(
@@ -104,7 +303,7 @@ class AppUserNameColumn(tables.TemplateColumn):
         return render_to_string(self.template_name, {"form": form})
 
 
-class DeviceTable(tables.Table):
+class DeviceTable(KeysetTable):
     """A table for listing MDM Devices."""
 
     device_id = tables.LinkColumn(
@@ -162,22 +361,28 @@ class DeviceTable(tables.Table):
             "last_seen_mdm",
             "last_seen_vpn",
         )
-        template_name = "patterns/tables/table.html"
+        order_by = ("device_id",)
+        per_page = 50
+        template_name = "patterns/tables/keyset-table.html"
         attrs: ClassVar = {
             "class": "table-device",
             "th": {"scope": "col", "class": "px-4 py-3 whitespace-nowrap"},
         }
 
 
-class FleetTable(tables.Table):
+class FleetTable(KeysetTable):
     name = tables.LinkColumn(
         "publish_mdm:edit-fleet",
         args=[tables.A("organization__slug"), tables.A("pk")],
         attrs={"a": {"class": "text-primary-600 hover:underline"}},
     )
+    project = tables.Column(order_by=("project__name",))
+    default_app_user = tables.Column(order_by=("default_app_user__name",))
 
     class Meta:
         model = Fleet
         fields = ("name", "mdm_group_id", "project", "default_app_user")
-        template_name = "patterns/tables/table.html"
+        order_by = ("name",)
+        per_page = 50
+        template_name = "patterns/tables/keyset-table.html"
         attrs: ClassVar = {"th": {"scope": "col", "class": "px-4 py-3 whitespace-nowrap"}}
@@ -92,6 +92,7 @@ urlpatterns = [
         name="edit-app-user",
     ),
     path("create-organization/", views.create_organization, name="create-organization"),
+    path("metrics/", views.api_metrics, name="api-metrics"),
     path(
         "o/<slug:organization_slug>/send-invite/",
         views.SendOrganizationInvite.as_view(),
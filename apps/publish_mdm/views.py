@@ -1,25 +1,37 @@
 import contextlib
 import json
+from collections.abc import AsyncIterator, Iterator
+from itertools import islice
 from urllib.parse import urlencode
 
 import structlog
 from allauth.socialaccount.views import ConnectionsView
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
 from django.db import models, transaction
 from django.db.models import OuterRef, Q, Subquery, Value
 from django.db.models.functions import Collate, Lower, NullIf
-from django.http import Http404, HttpRequest, HttpResponse
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpRequest,
+    HttpResponse,
+    HttpResponseBase,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils.html import format_html, mark_safe
 from django.utils.http import url_has_allowed_host_and_scheme
 from django.utils.timezone import localdate
 from django.views.decorators.http import require_POST
-from django_tables2.config import RequestConfig
 from googleapiclient.errors import Error as GoogleAPIClientError
 from import_export.results import RowResult
 from import_export.tmp_storages import MediaStorage
@@ -39,15 +51,20 @@ from pyodk.errors import PyODKError
 from requests.exceptions import RequestException
 
 from apps.mdm.mdms import AndroidEnterprise, get_active_mdm_instance
+from apps.mdm.metering import mdm_api_metrics
 from apps.mdm.models import Device, FirmwareSnapshot, Fleet, Policy
 from apps.tailscale.models import Device as TailscaleDevice
-from config.dagster import trigger_dagster_job
+from config.dagster import DagsterNotEnabledError, trigger_dagster_job
 
 from .etl.load import (
+    PROJECT_SYNC_PROGRESS_CACHE_KEY,
+    PROJECT_SYNC_STEPS,
+    QR_CODE_PROGRESS_CACHE_KEY,
     create_project,
     generate_and_save_app_user_collect_qrcodes,
     sync_central_project,
 )
+from .etl.odk.metrics import central_api_metrics
 from .filters import DeviceFilter
 from .forms import (
     AppUserForm,
@@ -57,6 +74,7 @@ from .forms import (
     ConfirmImportForm,
     DeviceAppUserForm,
     DeviceEnrollmentQRCodeForm,
+    DeviceImportConfirmForm,
     ExportForm,
     FleetAddForm,
     FleetEditForm,
@@ -71,7 +89,7 @@ from .forms import (
     SearchForm,
     TemplateVariableFormSet,
 )
-from .import_export import AppUserResource, DeviceResource
+from .import_export import AppUserResource, DeviceImport, DeviceResource
 from .models import (
     AndroidEnterpriseAccount,
     AppUser,
@@ -82,12 +100,14 @@ from .models import (
     Project,
 )
 from .nav import Breadcrumbs
+from .qrcodes import qr_code_cache
 from .tables import (
     CentralServerTable,
     DeviceTable,
     FleetTable,
     FormTemplateTable,
     FormTemplateVersionTable,
+    KeysetPaginator,
 )
 from .utils import get_login_url
 
@@ -99,16 +119,72 @@ InviteForm = get_invite_form()
 @login_required
 @transaction.atomic
 def server_sync(request: HttpRequest, organization_slug):
+    """Sync a project from ODK Central in a background Dagster job, or in this
+    request if Dagster is not enabled.
+    """
     form = ProjectSyncForm(request=request, data=request.POST or None)
     if request.method == "POST" and form.is_valid():
-        project = sync_central_project(
-            server=form.cleaned_data["server"],
-            project_id=form.cleaned_data["project"],
+        server = form.cleaned_data["server"]
+        project_id = form.cleaned_data["project"]
+        run_config = {
+            "ops": {
+                "sync_central_project_data": {
+                    "config": {"central_server_pk": server.pk, "project_id": int(project_id)}
+                }
+            }
+        }
+        progress_cache_key = PROJECT_SYNC_PROGRESS_CACHE_KEY.format(
+            server_pk=server.pk, project_id=project_id
+        )
+        # Show the job as started until it reports its first progress. This is set
+        # before triggering the job, so it can't overwrite the job's own progress
+        cache.set(progress_cache_key, {"done": 0, "total": PROJECT_SYNC_STEPS}, timeout=60 * 60)
+        try:
+            trigger_dagster_job(job_name="central_project_sync_job", run_config=run_config)
+        except DagsterNotEnabledError:
+            cache.delete(progress_cache_key)
+            result = sync_central_project(server=server, project_id=project_id)
+            summary = result.summary()
+            messages.add_message(
+                request,
+                messages.SUCCESS,
+                f"Project synced. Added {summary['app_users_created']} app user(s) and "
+                f"{summary['form_templates_created']} form template(s).",
+            )
+            return redirect("publish_mdm:form-template-list", organization_slug, result.project.id)
+        except Exception:
+            cache.delete(progress_cache_key)
+            logger.error(
+                "Failed to trigger Dagster central_project_sync_job",
+                server=server,
+                project_id=project_id,
+                exc_info=True,
+            )
+            messages.error(
+                request,
+                "We encountered an issue syncing the project. "
+                "Please try again, or contact support if the problem continues.",
+            )
+        else:
+            messages.success(request, "The project is being synced in the background.")
+            # Show the progress of this project's sync on the page
+            sync_url = reverse("publish_mdm:server-sync", args=[organization_slug])
+            return redirect(f"{sync_url}?{urlencode({'server': server.pk, 'project': project_id})}")
+        return redirect("publish_mdm:server-sync", organization_slug)
+    sync_progress = None
+    server_pk = request.GET.get("server", "")
+    project_id = request.GET.get("project", "")
+    if (
+        server_pk.isdigit()
+        and project_id.isdigit()
+        and request.organization.central_servers.filter(pk=server_pk).exists()
+    ):
+        sync_progress = cache.get(
+            PROJECT_SYNC_PROGRESS_CACHE_KEY.format(server_pk=server_pk, project_id=project_id)
         )
-        messages.add_message(request, messages.SUCCESS, "Project synced.")
-        return redirect("publish_mdm:form-template-list", organization_slug, project.id)
     context = {
         "form": form,
+        "sync_progress": sync_progress,
         "breadcrumbs": Breadcrumbs.from_items(
             request=request,
             items=[("Sync Project", "sync-project")],
@@ -126,19 +202,52 @@ def server_sync_projects(request: HttpRequest, organization_slug):
 @login_required
 def app_user_list(request: HttpRequest, organization_slug, odk_project_pk):
     app_users = request.odk_project.app_users.prefetch_related("app_user_forms__form_template")
+    paginator = KeysetPaginator(app_users, ordering=["name"], per_page=48)
+    page = paginator.page(request.GET.get("cursor"))
+    if request.htmx and "cursor" in request.GET:
+        # Infinite scroll: the next page of app users
+        return render(request, "publish_mdm/app_user_list.html#app-user-cards", {"app_users": page})
     context = {
-        "app_users": app_users,
+        "app_users": page,
         "breadcrumbs": Breadcrumbs.from_items(
             request=request,
             items=[("App Users", "app-user-list")],
         ),
+        "qr_code_progress": cache.get(
+            QR_CODE_PROGRESS_CACHE_KEY.format(project_pk=request.odk_project.pk)
+        ),
     }
     return render(request, "publish_mdm/app_user_list.html", context)
 
 
 @login_required
 def app_user_generate_qr_codes(request: HttpRequest, organization_slug, odk_project_pk):
-    generate_and_save_app_user_collect_qrcodes(project=request.odk_project)
+    """Regenerate the project's app user QR codes in a background Dagster job, or
+    in this request if Dagster is not enabled.
+    """
+    project = request.odk_project
+    run_config = {"ops": {"generate_app_user_qr_codes": {"config": {"project_pk": project.pk}}}}
+    progress_cache_key = QR_CODE_PROGRESS_CACHE_KEY.format(project_pk=project.pk)
+    # Show the job as started until it reports its first progress. This is set
+    # before triggering the job, so the job's final delete can't be overwritten
+    cache.set(progress_cache_key, {"done": 0, "total": project.app_users.count()}, timeout=60 * 60)
+    try:
+        trigger_dagster_job(job_name="app_user_qr_codes_job", run_config=run_config)
+    except DagsterNotEnabledError:
+        cache.delete(progress_cache_key)
+        generate_and_save_app_user_collect_qrcodes(project=project)
+    except Exception:
+        cache.delete(progress_cache_key)
+        logger.error(
+            "Failed to trigger Dagster app_user_qr_codes_job", project=project, exc_info=True
+        )
+        messages.error(
+            request,
+            "We encountered an issue regenerating the QR codes. "
+            "Please try again, or contact support if the problem continues.",
+        )
+    else:
+        messages.success(request, "QR codes are being regenerated in the background.")
     return redirect("publish_mdm:app-user-list", organization_slug, odk_project_pk)
 
 
@@ -149,7 +258,7 @@ def form_template_list(request: HttpRequest, organization_slug, odk_project_pk):
     ).prefetch_related(
         models.Prefetch(
             "versions",
-            queryset=FormTemplateVersion.objects.order_by("-modified_at"),
+            queryset=FormTemplateVersion.objects.select_related("user").order_by("-modified_at"),
             to_attr="latest_version",
         )
     )
@@ -264,6 +373,48 @@ def form_template_publish(
     return response
 
 
+async def iterate_in_thread(iterator: Iterator, chunk_size: int = 100) -> AsyncIterator:
+    """Consume a synchronous iterator (e.g. one that queries the database) in a
+    thread, ``chunk_size`` items at a time, and yield its items asynchronously.
+    """
+    next_chunk = sync_to_async(lambda: list(islice(iterator, chunk_size)))
+    while chunk := await next_chunk():
+        for item in chunk:
+            yield item
+
+
+def export_response(
+    request: HttpRequest, resource, export_format, filename: str
+) -> HttpResponseBase:
+    """Return a response that sends the resource's export file to the client without
+    building the whole file in memory. Text formats are streamed row by row, while
+    binary formats are written to a temporary file that is then streamed.
+
+    Under ASGI, Django buffers the whole content of a streaming response that has a
+    synchronous iterator, so the content is given as an asynchronous iterator then.
+    """
+    content = export_format.export_stream(resource.get_export_headers(), resource.export_rows())
+    is_asgi = isinstance(request, ASGIRequest)
+    if export_format.is_binary():
+        response = FileResponse(
+            content,
+            as_attachment=True,
+            filename=filename,
+            content_type=export_format.get_content_type(),
+        )
+        if is_asgi:
+            # FileResponse has already set the headers from the file and will close it
+            response.streaming_content = iterate_in_thread(
+                iter(lambda: content.read(response.block_size), b"")
+            )
+        return response
+    return StreamingHttpResponse(
+        iterate_in_thread(content) if is_asgi else content,
+        content_type=export_format.get_content_type(),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @login_required
 def app_user_export(request, organization_slug, odk_project_pk):
     """Exports AppUsers to a CSV or Excel file.
@@ -276,14 +427,8 @@ def app_user_export(request, organization_slug, odk_project_pk):
     form = ExportForm([resource], data=request.POST or None)
     if request.method == "POST" and form.is_valid():
         export_format = form.cleaned_data["format"]
-        dataset = resource.export()
-        data = export_format.export_data(dataset)
         filename = f"app_users_{odk_project_pk}_{localdate()}.{export_format.get_extension()}"
-        return HttpResponse(
-            data,
-            content_type=export_format.get_content_type(),
-            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
-        )
+        return export_response(request, resource, export_format, filename)
 
     context = {
         "breadcrumbs": Breadcrumbs.from_items(
@@ -392,6 +537,17 @@ def app_user_import(request, organization_slug, odk_project_pk):
     )
 
 
+@staff_member_required
+def api_metrics(request):
+    """The ODK Central and MDM API call counts and latency histograms of the web and
+    Dagster processes, in the Prometheus text exposition format.
+    """
+    return HttpResponse(
+        central_api_metrics.render() + mdm_api_metrics.render(),
+        content_type="text/plain; version=0.0.4",
+    )
+
+
 def websockets_server_health(request):
     """When using separate ASGI and WSGI deployments, this can be used for health checks
     for the ASGI (Websockets) server.
@@ -943,8 +1099,11 @@ def devices_list(request: HttpRequest, organization_slug):
             q |= Q(**{f"{field}__icontains": search_term})
         devices = devices.filter(q)
 
-    filter_ = DeviceFilter(request.GET, queryset=devices)
+    filter_ = DeviceFilter(request.GET, queryset=devices, request=request)
     table = DeviceTable(data=filter_.qs, request=request, show_footer=False)
+    if request.htmx and table.prefixed_cursor_field in request.GET:
+        # Infinite scroll: the next page of rows
+        return render(request, "patterns/tables/keyset-rows.html", {"table": table})
     context = {
         "table": table,
         "breadcrumbs": Breadcrumbs.from_items(
@@ -1063,14 +1222,8 @@ def device_export(request, organization_slug):
     form = ExportForm([resource], data=request.POST or None)
     if request.method == "POST" and form.is_valid():
         export_format = form.cleaned_data["format"]
-        dataset = resource.export()
-        data = export_format.export_data(dataset)
         filename = f"devices_{organization_slug}_{localdate()}.{export_format.get_extension()}"
-        return HttpResponse(
-            data,
-            content_type=export_format.get_content_type(),
-            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
-        )
+        return export_response(request, resource, export_format, filename)
 
     context = {
         "breadcrumbs": Breadcrumbs.from_items(
@@ -1085,6 +1238,29 @@ def device_export(request, organization_slug):
     return render(request, "publish_mdm/export.html", context)
 
 
+def start_device_import(device_import: DeviceImport, dry_run: bool):
+    """Run a device import in a background Dagster job, or in this request if
+    Dagster is not enabled.
+    """
+    run_config = {
+        "ops": {
+            "import_devices": {"config": {"import_id": device_import.import_id, "dry_run": dry_run}}
+        }
+    }
+    try:
+        trigger_dagster_job(job_name="device_import_job", run_config=run_config)
+    except DagsterNotEnabledError:
+        device_import.run(dry_run=dry_run)
+    except Exception:
+        logger.error(
+            "Failed to trigger Dagster device_import_job",
+            import_id=device_import.import_id,
+            exc_info=True,
+        )
+        device_import.status = DeviceImport.Status.FAILED
+        device_import.save()
+
+
 @login_required
 def device_import(request, organization_slug):
     """Imports Devices from a CSV or Excel file.
@@ -1093,23 +1269,81 @@ def device_import(request, organization_slug):
     device_export view above. If a device with the given device_id exists, its
     app_user_name will be updated. The import is done in 2 stages: first the user
     uploads a file, then they will be shown a preview of the import and asked to
-    confirm. Once the user confirms, the database will be updated.
+    confirm. Once the user confirms, the database will be updated. Both stages
+    run in the background (see start_device_import()), and this page shows their
+    progress until they are done, using the ``import_id`` query parameter.
     """
+    import_url = reverse("publish_mdm:devices-import", args=[organization_slug])
+    success_url = reverse("publish_mdm:devices-list", args=[organization_slug])
     resource = DeviceResource(request.organization)
-    return handle_import(
-        request,
-        resource,
-        success_url=reverse("publish_mdm:devices-list", args=[organization_slug]),
-        success_noun="devices",
-        extra_context={
-            "breadcrumbs": Breadcrumbs.from_items(
-                request=request,
-                items=[("Devices", "devices-list"), ("Import", "devices-import")],
-            ),
-            "description": "Import Devices using a file previously exported from this organization.",
-            "submit_label": "Import devices",
-        },
-    )
+    form = ImportForm([resource], data=request.POST or None, files=request.FILES or None)
+    device_import = None
+    if import_id := request.POST.get("import_id") or request.GET.get("import_id"):
+        device_import = DeviceImport.get(import_id)
+        if device_import is None or device_import.organization_id != request.organization.pk:
+            messages.error(request, "We could not find your import. Please try importing again.")
+            return redirect(import_url)
+    if request.method == "POST":
+        if device_import is not None:
+            # Confirm stage
+            if device_import.status == DeviceImport.Status.PREVIEW:
+                # Show the import as in progress right away, so the page doesn't show
+                # the confirm form again until the background job starts
+                device_import.status = DeviceImport.Status.IMPORTING
+                device_import.save()
+                start_device_import(device_import, dry_run=False)
+            return redirect(f"{import_url}?{urlencode({'import_id': device_import.import_id})}")
+        if form.is_valid():
+            # Initial import stage. Save the file so the background job can read it
+            import_format = form.cleaned_data["format"]
+            tmp_storage = MediaStorage(
+                encoding=import_format.encoding,
+                read_mode=import_format.get_read_mode(),
+            )
+            tmp_storage.save(form.file_data)
+            device_import = DeviceImport(
+                import_id=tmp_storage.name,
+                organization_id=request.organization.pk,
+                format=int(form.data["format"]),
+                original_file_name=form.cleaned_data["import_file"].name,
+            )
+            device_import.save()
+            start_device_import(device_import, dry_run=True)
+            return redirect(f"{import_url}?{urlencode({'import_id': device_import.import_id})}")
+    result = None
+    if device_import is not None and not device_import.in_progress:
+        if device_import.status == DeviceImport.Status.DONE:
+            device_import.delete()
+            totals = device_import.preview.totals
+            messages.success(
+                request,
+                f"Import finished successfully, with {totals[RowResult.IMPORT_TYPE_NEW]} "
+                f"new and {totals[RowResult.IMPORT_TYPE_UPDATE]} updated devices.",
+            )
+            return redirect(success_url)
+        result = device_import.preview
+        if device_import.status == DeviceImport.Status.PREVIEW:
+            form = DeviceImportConfirmForm(initial={"import_id": device_import.import_id})
+        else:
+            device_import.delete()
+            if device_import.status == DeviceImport.Status.FAILED:
+                messages.error(
+                    request, "We could not complete your import. Please try importing again."
+                )
+    context = {
+        "form": form,
+        "result": result,
+        "confirm": isinstance(form, DeviceImportConfirmForm),
+        "import_progress": device_import if device_import and device_import.in_progress else None,
+        "cancel_url": success_url,
+        "breadcrumbs": Breadcrumbs.from_items(
+            request=request,
+            items=[("Devices", "devices-list"), ("Import", "devices-import")],
+        ),
+        "description": "Import Devices using a file previously exported from this organization.",
+        "submit_label": "Import devices",
+    }
+    return render(request, "publish_mdm/import.html", context)
 
 
 @require_POST
@@ -1148,8 +1382,10 @@ def device_update_app_user(request: HttpRequest, organization_slug, device_pk):
 @login_required
 def fleets_list(request: HttpRequest, organization_slug):
     fleets = request.organization.fleets.select_related("project", "default_app_user")
-    table = FleetTable(data=fleets, show_footer=False)
-    RequestConfig(request, paginate=False).configure(table)
+    table = FleetTable(data=fleets, request=request, show_footer=False)
+    if request.htmx and table.prefixed_cursor_field in request.GET:
+        # Infinite scroll: the next page of rows
+        return render(request, "patterns/tables/keyset-rows.html", {"table": table})
     context = {
         "table": table,
         "breadcrumbs": Breadcrumbs.from_items(
@@ -1328,7 +1564,11 @@ def fleet_qr_code(request: HttpRequest, organization_slug):
     error = None
     if form.is_valid():
         fleet = form.cleaned_data["fleet"]
-        if fleet and (not fleet.enroll_qr_code or fleet.enroll_token_expired):
+        if fleet and (
+            not fleet.enroll_qr_code
+            or fleet.enroll_token_expired
+            or not qr_code_cache.exists(fleet.enroll_qr_code.name)
+        ):
             if active_mdm := get_active_mdm_instance(organization=request.organization):
                 # The QR code is not saved. Get it from the MDM and save it
                 try:
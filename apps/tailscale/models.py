@@ -1,6 +1,9 @@
+import datetime as dt
+
 from django.contrib import postgres
 from django.db import models, transaction
-from django.db.models import OuterRef, Subquery
+from django.db.models import F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
 
 class Device(models.Model):
@@ -34,45 +37,83 @@ class Device(models.Model):
 
 class DeviceSnapshotManager(models.Manager):
     @transaction.atomic()
-    def assign_devices(self) -> tuple[int, int]:
-        """Assign devices to snapshots that don't have one."""
-        # Get all snapshots that don't have a device
-        qs = self.get_queryset().filter(device_id=None).select_for_update()
-        # Get the device ID for each snapshot's node ID
-        qs = qs.annotate(
-            existing_device_id=Subquery(
-                Device.objects.filter(node_id=OuterRef("node_id")).values("id")[:1]
+    def assign_devices(self, since: dt.datetime | None = None) -> tuple[int, int]:
+        """Assign devices to snapshots that don't have one.
+
+        This runs a fixed number of set-based queries regardless of the size of
+        the tailnet:
+
+        1. Upsert (``INSERT ... ON CONFLICT (node_id) DO UPDATE``) a device for
+           every node ID that has unassigned snapshots.
+        2. Link all unassigned snapshots to their device in a single UPDATE.
+        3. Point each device touched by the current sync batch (snapshots synced
+           at or after ``since``) to its most recent snapshot, keeping the
+           device's ``name`` and ``last_seen`` in sync with it. A snapshot
+           without a ``last_seen`` leaves the device's ``last_seen`` unchanged.
+
+        ``Device.last_seen`` can't be null, so a new device whose snapshot has no
+        ``last_seen`` gets the snapshot's ``synced_at`` instead.
+
+        If ``since`` is not given, the batch is every snapshot at least as recent
+        as the newest snapshot already linked to a device.
+
+        Returns the number of snapshots assigned to existing devices and the number
+        of new devices.
+        """
+        if since is None:
+            since = (
+                self.get_queryset()
+                .filter(latest_for_device__isnull=False)
+                .aggregate(since=Max("synced_at"))["since"]
             )
+        # Get all snapshots that don't have a device
+        unassigned = self.get_queryset().filter(device_id=None)
+        # The most recent unassigned snapshot for each node ID
+        latest_unassigned = list(
+            unassigned.order_by("node_id", "-synced_at", "-id")
+            .distinct("node_id")
+            .only("node_id", "name", "last_seen", "tailnet", "synced_at")
         )
-        # Update the device_id field with the existing device ID
-        num_updated = qs.filter(existing_device_id__isnull=False).update(
-            device_id=models.F("existing_device_id")
+        node_ids = [snapshot.node_id for snapshot in latest_unassigned]
+        existing_node_ids = set(
+            Device.objects.filter(node_id__in=node_ids).values_list("node_id", flat=True)
         )
-        # Create new devices for any snapshots that don't have one
-        new_devices = []
-        for snapshot in qs.filter(existing_device_id=None):
-            device, _ = Device.objects.get_or_create(
-                node_id=snapshot.node_id,
-                defaults={
-                    "name": snapshot.name,
-                    "last_seen": snapshot.last_seen,
-                    "tailnet": snapshot.tailnet,
-                    "latest_snapshot": snapshot,
-                },
-            )
-            # Update the snapshot with the new device too
-            snapshot.device = device
-            snapshot.save()
-            new_devices.append(device)
-        # Update the latest_snapshot_id field for all devices
-        Device.objects.annotate(
-            new_snapshot_id=Subquery(
-                DeviceSnapshot.objects.filter(device_id=OuterRef("id"))
-                .order_by("-synced_at")
-                .values("id")[:1]
-            )
-        ).update(latest_snapshot_id=models.F("new_snapshot_id"))
-        return num_updated, len(new_devices)
+        Device.objects.bulk_create(
+            [
+                Device(
+                    node_id=snapshot.node_id,
+                    name=snapshot.name,
+                    last_seen=snapshot.last_seen or snapshot.synced_at,
+                    tailnet=snapshot.tailnet,
+                    latest_snapshot=snapshot,
+                )
+                for snapshot in latest_unassigned
+            ],
+            update_conflicts=True,
+            unique_fields=["node_id"],
+            # last_seen is updated with the latest snapshot below
+            update_fields=["name", "tailnet"],
+            batch_size=1000,
+        )
+        num_updated = unassigned.filter(node_id__in=existing_node_ids).count()
+        # Link the snapshots to their devices
+        unassigned.update(
+            device_id=Subquery(Device.objects.filter(node_id=OuterRef("node_id")).values("id")[:1])
+        )
+        # Update the latest snapshot (and the fields copied from it) only for the
+        # devices in the current sync batch
+        batch = self.get_queryset().filter(device_id__isnull=False)
+        if since is not None:
+            batch = batch.filter(synced_at__gte=since)
+        latest_snapshot = (
+            self.get_queryset().filter(device_id=OuterRef("id")).order_by("-synced_at", "-id")[:1]
+        )
+        Device.objects.filter(id__in=batch.values("device_id")).update(
+            latest_snapshot_id=Subquery(latest_snapshot.values("id")),
+            name=Subquery(latest_snapshot.values("name")),
+            last_seen=Coalesce(Subquery(latest_snapshot.values("last_seen")), F("last_seen")),
+        )
+        return num_updated, len(node_ids) - len(existing_node_ids)
 
 
 class DeviceSnapshot(models.Model):
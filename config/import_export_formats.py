@@ -1,8 +1,60 @@
+import csv
+import tempfile
+from collections.abc import Iterable, Iterator
+from typing import IO
+
 import tablib
 from import_export.formats import base_formats
 
 
+class _Echo:
+    """A file-like object whose write() returns the value written, so a csv.writer
+    can produce one line at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+class CSV(base_formats.CSV):
+    def export_stream(self, headers: list[str], rows: Iterable[list]) -> Iterator[str]:
+        """Yield the CSV file for the headers and rows one line at a time, instead of
+        building the whole file in memory like ``export_data()``.
+        """
+        writer = csv.writer(_Echo())
+        yield writer.writerow(headers)
+        for row in rows:
+            yield writer.writerow(row)
+
+
 class XLSX(base_formats.XLSX):
+    def export_stream(self, headers: list[str], rows: Iterable[list]) -> IO[bytes]:
+        """Write the headers and rows to a temporary XLSX file and return it, open
+        and positioned at the start. openpyxl's write-only mode is used, so rows are
+        not kept in memory after they're written.
+        """
+        from openpyxl import Workbook  # noqa: PLC0415
+        from openpyxl.cell import WriteOnlyCell  # noqa: PLC0415
+        from openpyxl.styles import Font  # noqa: PLC0415
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("Tablib Dataset")
+        sheet.freeze_panes = "A2"
+        bold = Font(bold=True)
+        header_cells = []
+        for header in headers:
+            cell = WriteOnlyCell(sheet, value=header)
+            cell.font = bold
+            header_cells.append(cell)
+        sheet.append(header_cells)
+        for row in rows:
+            sheet.append(row)
+        # The caller is responsible for closing the file
+        file = tempfile.TemporaryFile()  # noqa: SIM115
+        workbook.save(file)
+        file.seek(0)
+        return file
+
     def create_dataset(self, in_stream):
         """
         Create dataset from first sheet.
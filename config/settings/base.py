@@ -12,14 +12,14 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 import logging
 import os
+import tempfile
 from pathlib import Path
 
 import dj_database_url
 import structlog
 from dotenv import dotenv_values
-from import_export.formats import base_formats
 
-from ..import_export_formats import XLSX
+from ..import_export_formats import CSV, XLSX
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -276,6 +276,15 @@ AWS_QUERYSTRING_AUTH = os.getenv("AWS_QUERYSTRING_AUTH", "True") == "True"
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 
+# Local disk cache for project attachments downloaded from S3 when publishing forms
+ATTACHMENT_CACHE_DIR = os.getenv(
+    "ATTACHMENT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "publish-mdm-attachments")
+)
+ATTACHMENT_CACHE_MAX_SIZE = int(os.getenv("ATTACHMENT_CACHE_MAX_SIZE", str(1024**3)))
+
+# Operations that make more ODK Central API calls than this are logged with a warning
+CENTRAL_API_CALL_BUDGET = int(os.getenv("CENTRAL_API_CALL_BUDGET", "100"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -420,7 +429,7 @@ ODK_CENTRAL_USERNAME = os.getenv("ODK_CENTRAL_USERNAME")
 ODK_CENTRAL_PASSWORD = os.getenv("ODK_CENTRAL_PASSWORD")
 
 # django-import-export
-IMPORT_EXPORT_FORMATS = [base_formats.CSV, XLSX]
+IMPORT_EXPORT_FORMATS = [CSV, XLSX]
 
 # The default language for generating App User QR codes. Can be overriden for
 # a Project using the app_language field.
@@ -450,6 +459,13 @@ MDM_REGISTRY = {
     "TinyMDM": "apps.mdm.mdms.TinyMDM",
 }
 
+# Hourly MDM API call quota of each organization, used to show how much of it was
+# used in the MDM API usage admin. 0 means the quota is unknown
+MDM_API_HOURLY_QUOTAS = {
+    "Android Enterprise": int(os.getenv("ANDROID_ENTERPRISE_API_HOURLY_QUOTA", "0")),
+    "TinyMDM": int(os.getenv("TINYMDM_API_HOURLY_QUOTA", "0")),
+}
+
 # Shared secret token for the AMAPI Pub/Sub push endpoint.  When set, all push
 # notification requests must include ``?token=<value>`` in the URL; requests
 # without a matching token are rejected with HTTP 403.  Must be set for the
@@ -0,0 +1,45 @@
+import dagster as dg
+import django
+from django.core.cache import cache
+from pydantic import Field
+
+django.setup()
+
+
+from apps.publish_mdm.etl.load import (  # noqa: E402
+    QR_CODE_PROGRESS_CACHE_KEY,
+    generate_and_save_app_user_collect_qrcodes,
+)
+from apps.publish_mdm.models import Project  # noqa: E402
+
+
+class AppUserQRCodesConfig(dg.Config):
+    project_pk: int
+    # Only regenerate QR codes for these app users. All app users in the project if empty.
+    app_user_pks: list[int] = Field(default_factory=list)
+
+
+@dg.asset(description="Generate ODK Collect QR codes for a project's app users")
+def generate_app_user_qr_codes(context: dg.AssetExecutionContext, config: AppUserQRCodesConfig):
+    """Generate and save QR codes for a project's app users, reporting progress
+    in the Django cache so the app users page can display it.
+    """
+    project = Project.objects.select_related("central_server").get(pk=config.project_pk)
+    app_users = project.app_users.all()
+    if config.app_user_pks:
+        app_users = app_users.filter(pk__in=config.app_user_pks)
+    cache_key = QR_CODE_PROGRESS_CACHE_KEY.format(project_pk=project.pk)
+
+    def progress(done: int, total: int):
+        cache.set(cache_key, {"done": done, "total": total}, timeout=60 * 60)
+        if done == total or done % 100 == 0:
+            context.log.info(f"Processed {done}/{total} QR codes for {project}")
+
+    try:
+        summary = generate_and_save_app_user_collect_qrcodes(
+            project=project, app_users=list(app_users), progress=progress, parallel=True
+        )
+    finally:
+        cache.delete(cache_key)
+    context.add_output_metadata(summary)
+    return summary
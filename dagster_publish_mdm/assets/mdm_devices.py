@@ -7,7 +7,9 @@ django.setup()
 
 
 from apps.mdm.mdms import get_active_mdm_instance  # noqa: E402
+from apps.mdm.metering import APIUsage, mdm_api_usage  # noqa: E402
 from apps.mdm.models import Device  # noqa: E402
+from apps.publish_mdm.import_export import DeviceImport  # noqa: E402
 from apps.publish_mdm.models import Organization  # noqa: E402
 
 
@@ -25,12 +27,18 @@ def sync_and_push_mdm_devices(context: dg.AssetExecutionContext, config: SyncFle
     if not active_mdm:
         context.log.warning(f"MDM not configured for organization {organization}")
         return
-    active_mdm.sync_fleets(push_config=True)
+    try:
+        active_mdm.sync_fleets(push_config=True)
+    finally:
+        mdm_api_usage.flush()
     context.log.info(f"Synced all fleets in {organization}")
+    context.add_output_metadata(active_mdm.api_usage.as_metadata())
 
 
 @dg.asset(description="Get a list of devices from the MDM", group_name="mdm_assets")
 def mdm_device_snapshot(context: dg.AssetExecutionContext):
+    api_usage = APIUsage()
+    calls_by_organization = {}
     for org in Organization.objects.all():
         if active_mdm := get_active_mdm_instance(org):
             try:
@@ -39,8 +47,17 @@ def mdm_device_snapshot(context: dg.AssetExecutionContext):
                 context.log.error(f"Failed to sync devices for {org} ({org.slug=} {e=!s})")
             else:
                 context.log.info(f"Synced all fleets in {org}")
+            api_usage.add(active_mdm.api_usage)
+            calls_by_organization[org.slug] = active_mdm.api_usage.calls
         else:
             context.log.warning(f"MDM not configured for organization {org}")
+    mdm_api_usage.flush()
+    context.add_output_metadata(
+        {
+            **api_usage.as_metadata(),
+            "api_calls_by_organization": dg.MetadataValue.json(calls_by_organization),
+        }
+    )
 
 
 class DeviceConfig(dg.Config):
@@ -63,6 +80,9 @@ def push_mdm_device_config(context: dg.AssetExecutionContext, config: DeviceConf
     for device in devices:
         org = device.fleet.organization
         devices_by_org.setdefault(org, []).append(device)
+    # Load the app users' QR code data for all devices at once
+    Device.load_odk_collect_qr_code_strings(devices)
+    api_usage = APIUsage()
     for org, org_devices in devices_by_org.items():
         active_mdm = get_active_mdm_instance(organization=org)
         if not active_mdm:
@@ -82,5 +102,33 @@ def push_mdm_device_config(context: dg.AssetExecutionContext, config: DeviceConf
                     f"{error_data=})"
                 )
                 failed_pks.append(device.pk)
+        api_usage.add(active_mdm.api_usage)
+    mdm_api_usage.flush()
+    context.add_output_metadata(api_usage.as_metadata())
     if failed_pks:
         raise ValueError(f"Failed to push configuration for devices: {failed_pks}")
+
+
+class DeviceImportConfig(dg.Config):
+    # The DeviceImport.import_id of an uploaded file
+    import_id: str
+    # Only validate the file and save a preview if True, otherwise import it
+    dry_run: bool = True
+
+
+@dg.asset(description="Import devices from an uploaded file")
+def import_devices(context: dg.AssetExecutionContext, config: DeviceImportConfig):
+    """Validate or import an uploaded device import file, reporting progress and
+    the preview in the Django cache so the device import page can display them.
+    """
+    device_import = DeviceImport.get(config.import_id)
+    if device_import is None:
+        raise ValueError(f"Device import {config.import_id} not found or expired.")
+    context.log.info(
+        f"{'Validating' if config.dry_run else 'Importing'} {device_import.original_file_name}"
+    )
+    preview = device_import.run(dry_run=config.dry_run)
+    if device_import.status == DeviceImport.Status.FAILED:
+        raise dg.Failure(f"Device import {config.import_id} failed.")
+    context.add_output_metadata({"status": device_import.status, **preview.totals})
+    return preview.totals
@@ -0,0 +1,43 @@
+import dagster as dg
+import django
+from django.core.cache import cache
+
+django.setup()
+
+
+from apps.publish_mdm.etl.load import (  # noqa: E402
+    PROJECT_SYNC_PROGRESS_CACHE_KEY,
+    sync_central_project,
+)
+from apps.publish_mdm.models import CentralServer  # noqa: E402
+
+
+class CentralProjectSyncConfig(dg.Config):
+    central_server_pk: int
+    # The project ID in ODK Central
+    project_id: int
+
+
+@dg.asset(description="Sync a project's app users and form templates from ODK Central")
+def sync_central_project_data(context: dg.AssetExecutionContext, config: CentralProjectSyncConfig):
+    """Sync a project from ODK Central, reporting progress in the Django cache so
+    the project sync page can display it.
+    """
+    server = CentralServer.objects.select_related("organization").get(pk=config.central_server_pk)
+    cache_key = PROJECT_SYNC_PROGRESS_CACHE_KEY.format(
+        server_pk=server.pk, project_id=config.project_id
+    )
+
+    def progress(done: int, total: int):
+        cache.set(cache_key, {"done": done, "total": total}, timeout=60 * 60)
+        context.log.info(f"Completed {done}/{total} steps syncing project {config.project_id}")
+
+    try:
+        result = sync_central_project(
+            server=server, project_id=config.project_id, progress=progress
+        )
+    finally:
+        cache.delete(cache_key)
+    summary = result.summary()
+    context.add_output_metadata({"project_pk": result.project.pk, **summary})
+    return summary
@@ -1,8 +1,12 @@
 import datetime as dt
 import os
+from itertools import batched
+from typing import Annotated
 
 import dagster as dg
 import django
+from django.db import transaction
+from pydantic import BaseModel, Field, StringConstraints, field_validator
 
 from dagster_publish_mdm.resources.tailscale import TailscaleResource
 
@@ -10,6 +14,9 @@ django.setup()
 
 from apps.tailscale.models import Device, DeviceSnapshot  # noqa: E402
 
+# Number of device snapshots validated and inserted at a time
+SNAPSHOT_CHUNK_SIZE = 500
+
 
 @dg.asset(
     description="Get a list of tailnet devices from Tailscale",
@@ -30,53 +37,95 @@ def tailscale_device_snapshot(
     return devices
 
 
+ShortStr = Annotated[str, StringConstraints(max_length=32)]
+LongStr = Annotated[str, StringConstraints(max_length=255)]
+
+
+class TailscaleDevice(BaseModel):
+    """Lightweight schema to validate a device from the Tailscale devices API
+    before inserting it into the DeviceSnapshot table, with the same constraints
+    as the model fields.
+    """
+
+    addresses: list[ShortStr]
+    client_version: ShortStr = Field(default="", alias="clientVersion")
+    created: dt.datetime
+    expires: dt.datetime | None = None
+    hostname: LongStr
+    last_seen: dt.datetime | None = Field(default=None, alias="lastSeen")
+    name: LongStr
+    node_id: Annotated[str, StringConstraints(min_length=1, max_length=128)] = Field(alias="nodeId")
+    os: ShortStr
+    tags: list[ShortStr] | None = None
+    update_available: bool = Field(alias="updateAvailable")
+    user: Annotated[str, StringConstraints(max_length=64)]
+
+    @field_validator("expires")
+    @classmethod
+    def no_expiration(cls, value):
+        """Tailscale uses 0001-01-01T00:00:00Z to indicate no expiration."""
+        if value is not None and value.year == 1:
+            return None
+        return value
+
+
 @dg.asset(description="A table of Tailscale devices over time", group_name="tailscale_assets")
 def tailscale_append_device_snapshot_table(
     context: dg.AssetExecutionContext, tailscale_device_snapshot: dict
-) -> list[DeviceSnapshot]:
-    """Convert the Tailscale device list to a table and store in PostgreSQL."""
+) -> dict:
+    """Convert the Tailscale device list to a table and store in PostgreSQL.
+
+    Devices are validated and inserted in chunks of ``SNAPSHOT_CHUNK_SIZE``, so
+    only one chunk of DeviceSnapshot instances is held in memory at a time. A
+    small summary of the inserted rows is returned instead of the instances.
+    """
     device_map = dict(Device.objects.values_list("node_id", "id"))
-    snapshots: list[DeviceSnapshot] = []
-    for device in tailscale_device_snapshot["devices"]:
-        existing_device_id = device_map.get(device["nodeId"])
-        expires = dt.datetime.fromisoformat(device["expires"])
-        if expires.year == 1:
-            # Tailscale uses 0001-01-01T00:00:00Z to indicate no expiration
-            expires = None
-        snapshot = DeviceSnapshot(
-            addresses=device["addresses"],
-            client_version=device["clientVersion"],
-            created=device["created"],
-            expires=expires,
-            hostname=device["hostname"],
-            last_seen=device.get("lastSeen"),
-            name=device["name"],
-            node_id=device["nodeId"],
-            os=device["os"],
-            tags=device.get("tags", None),
-            update_available=device["updateAvailable"],
-            user=device["user"],
-            # Non-API fields
-            device_id=existing_device_id,
-            tailnet=tailscale_device_snapshot["tailnet"],
-            raw_data=device,
-            synced_at=dt.datetime.now(tz=dt.UTC),
-        )
-        snapshot.full_clean()
-        snapshots.append(snapshot)
-    DeviceSnapshot.objects.bulk_create(snapshots)
-    context.log.info(f"Inserted {len(snapshots)} devices into tailscale_devicesnapshot")
-    return snapshots
+    tailnet = tailscale_device_snapshot["tailnet"]
+    synced_at = dt.datetime.now(tz=dt.UTC)
+    count = 0
+    first_id = last_id = None
+    with transaction.atomic():
+        for chunk in batched(tailscale_device_snapshot["devices"], SNAPSHOT_CHUNK_SIZE):
+            snapshots = []
+            for device in chunk:
+                data = TailscaleDevice.model_validate(device)
+                snapshots.append(
+                    DeviceSnapshot(
+                        **data.model_dump(),
+                        # Non-API fields
+                        device_id=device_map.get(data.node_id),
+                        tailnet=tailnet,
+                        raw_data=device,
+                        synced_at=synced_at,
+                    )
+                )
+            DeviceSnapshot.objects.bulk_create(snapshots)
+            count += len(snapshots)
+            first_id = first_id or snapshots[0].id
+            last_id = snapshots[-1].id
+    context.log.info(f"Inserted {count} devices into tailscale_devicesnapshot")
+    summary = {
+        "count": count,
+        "first_id": first_id,
+        "last_id": last_id,
+        "synced_at": synced_at.isoformat(),
+    }
+    context.add_output_metadata(summary)
+    return summary
 
 
 @dg.asset(
     group_name="tailscale_assets",
-    deps=["tailscale_append_device_snapshot_table"],
     description="Updates consolidated list of Tailscale devices",
 )
-def tailscale_insert_and_update_devices(context: dg.AssetExecutionContext) -> tuple[int, int]:
-    """Maintain a consolidated list of Tailscale devices"""
-    updated_devices, new_devices = DeviceSnapshot.objects.assign_devices()
+def tailscale_insert_and_update_devices(
+    context: dg.AssetExecutionContext, tailscale_append_device_snapshot_table: dict
+) -> tuple[int, int]:
+    """Maintain a consolidated list of Tailscale devices. Only the devices in the
+    snapshots inserted by the last sync are updated.
+    """
+    since = dt.datetime.fromisoformat(tailscale_append_device_snapshot_table["synced_at"])
+    updated_devices, new_devices = DeviceSnapshot.objects.assign_devices(since=since)
     context.log.info(
         f"Updated {updated_devices} and inserted {new_devices} devices into tailscale_device"
     )
@@ -133,26 +182,44 @@ def stale_tailscale_devices(
 )
 def pruned_stale_tailscale_devices(
     context: dg.AssetExecutionContext, stale_tailscale_devices: list, tailscale: TailscaleResource
-) -> None:
+) -> list[dict]:
     """Prunes old tailscale devices"""
 
     if not stale_tailscale_devices:
         context.log.info("No stale devices to prune.")
-        return
+        return []
 
     context.log.info(f"Pruning {len(stale_tailscale_devices)} devices")
 
-    for device in stale_tailscale_devices:
+    devices_by_path = {f"device/{device.get('id')}": device for device in stale_tailscale_devices}
+    responses = tailscale.delete_many(list(devices_by_path))
+    results = []
+    for path, device in devices_by_path.items():
         device_id = device.get("id")
         hostname = device.get("hostname")
         user = device.get("user")
-        try:
-            response = tailscale.delete(path=f"device/{device_id}")
-            if response.status_code == 200:
-                context.log.info(f"Deleted device: {hostname} (ID: {device_id}) for user: {user}")
-            else:
-                context.log.warning(
-                    f"Failed to delete {hostname}: (ID: {device_id}) {response.status_code} - {response.text}"
-                )
-        except Exception as e:
-            context.log.error(f"Error deleting device {hostname}: (ID: {device_id}) {e}")
+        response = responses[path]
+        result = {"id": device_id, "hostname": hostname, "user": user, "deleted": False}
+        if isinstance(response, Exception):
+            result["error"] = str(response)
+            context.log.error(f"Error deleting device {hostname}: (ID: {device_id}) {response}")
+        elif response.status_code == 200:
+            result["deleted"] = True
+            result["status_code"] = response.status_code
+            context.log.info(f"Deleted device: {hostname} (ID: {device_id}) for user: {user}")
+        else:
+            result["status_code"] = response.status_code
+            context.log.warning(
+                f"Failed to delete {hostname}: (ID: {device_id}) {response.status_code} - {response.text}"
+            )
+        results.append(result)
+
+    failed = [result for result in results if not result["deleted"]]
+    context.add_output_metadata(
+        {
+            "Deleted devices": len(results) - len(failed),
+            "Failed deletions": len(failed),
+            "Failed deletions preview": failed[:10],
+        }
+    )
+    return results
@@ -1,10 +1,10 @@
 import dagster as dg
 
-from dagster_publish_mdm.assets import mdm_devices
+from dagster_publish_mdm.assets import app_users, mdm_devices, projects
 from dagster_publish_mdm.assets.tailscale import tailscale_devices
 from dagster_publish_mdm.resources.tailscale import TailscaleResource
 
-all_assets = dg.load_assets_from_modules([tailscale_devices, mdm_devices])
+all_assets = dg.load_assets_from_modules([tailscale_devices, mdm_devices, app_users, projects])
 tailscale_schedule = dg.ScheduleDefinition(
     name="tailscale_schedule",
     target=dg.AssetSelection.groups("tailscale_assets"),
@@ -19,6 +19,13 @@ mdm_schedule = dg.ScheduleDefinition(
 )
 mdm_job = dg.define_asset_job(name="mdm_job", selection="push_mdm_device_config")
 sync_fleets_job = dg.define_asset_job(name="sync_fleets_job", selection="sync_and_push_mdm_devices")
+app_user_qr_codes_job = dg.define_asset_job(
+    name="app_user_qr_codes_job", selection="generate_app_user_qr_codes"
+)
+device_import_job = dg.define_asset_job(name="device_import_job", selection="import_devices")
+central_project_sync_job = dg.define_asset_job(
+    name="central_project_sync_job", selection="sync_central_project_data"
+)
 
 tailscale_device_deletion_schedule = dg.ScheduleDefinition(
     name="tailscale_device_deletion_schedule",
@@ -38,5 +45,11 @@ defs = dg.Definitions(
         ),
     },
     schedules=[tailscale_schedule, mdm_schedule, tailscale_device_deletion_schedule],
-    jobs=[mdm_job, sync_fleets_job],
+    jobs=[
+        mdm_job,
+        sync_fleets_job,
+        app_user_qr_codes_job,
+        device_import_job,
+        central_project_sync_job,
+    ],
 )
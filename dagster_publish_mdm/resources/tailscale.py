@@ -1,10 +1,12 @@
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urljoin
 
 import dagster as dg
 import requests
 from oauthlib.oauth2 import BackendApplicationClient
+from pydantic import PrivateAttr
 from requests.adapters import HTTPAdapter, Retry
 from requests_oauthlib import OAuth2Session
 
@@ -24,7 +26,9 @@ class ClientCredentialsAutoTokenSession(OAuth2Session):
     2. https://requests-oauthlib.readthedocs.io/en/latest/oauth2_workflow.html#refreshing-tokens
     """
 
-    def __init__(self, client_secret: str, token_url: str, **kwargs) -> None:
+    def __init__(
+        self, client_secret: str, token_url: str, pool_maxsize: int = 10, **kwargs
+    ) -> None:
         # The client secret is used to fetch a new token, so save it here
         # for fetch_token() to use
         self.client_secret = client_secret
@@ -51,7 +55,7 @@ class ClientCredentialsAutoTokenSession(OAuth2Session):
             status_forcelist=[500, 502, 503, 504],
             allowed_methods=frozenset(["GET"]),
         )
-        self.mount("https://", HTTPAdapter(max_retries=retries))
+        self.mount("https://", HTTPAdapter(max_retries=retries, pool_maxsize=pool_maxsize))
 
     def fetch_token(self, **kwargs) -> None:
         """Fetch a new token using saved client credentials"""
@@ -75,36 +79,85 @@ class ClientCredentialsAutoTokenSession(OAuth2Session):
         logger.debug(f"Token expired? {expired}")
         return expired
 
+    def ensure_token(self) -> None:
+        """Fetch a new access token now if the current one has expired. Call this
+        before sharing the session between threads, so they don't all race to
+        fetch a token on their first request.
+        """
+        if self.is_token_expired():
+            self.fetch_token()
+
 
 class TailscaleResource(dg.ConfigurableResource):
-    """A Dagster resource for interacting with the Tailscale API."""
+    """A Dagster resource for interacting with the Tailscale API.
+
+    A single session (and its OAuth access token, until it expires) is reused for
+    all the requests made by the resource during a run.
+    """
 
     base_url: str = "https://api.tailscale.com/api/v2/"
     # OAuth2 client ID and secret for Tailscale API
     client_id: str
     client_secret: str
     tailnet: str
+    # Maximum number of concurrent requests made by delete_many()
+    max_workers: int = 8
+
+    _session: ClientCredentialsAutoTokenSession | None = PrivateAttr(default=None)
 
-    def client(self) -> requests.Session:
-        """Return a requests session configured with the Tailscale API key."""
+    def teardown_after_execution(self, context: dg.InitResourceContext) -> None:
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def client(self) -> ClientCredentialsAutoTokenSession:
+        """Return a new requests session configured with the Tailscale API key."""
         return ClientCredentialsAutoTokenSession(
             client_id=self.client_id,
             client_secret=self.client_secret,
             token_url=self.url("oauth/token"),
+            pool_maxsize=self.max_workers,
         )
 
+    @property
+    def session(self) -> ClientCredentialsAutoTokenSession:
+        """The session shared by all the requests made by this resource."""
+        if self._session is None:
+            self._session = self.client()
+        return self._session
+
     def url(self, path: str) -> str:
         """Return a full URL for the Tailscale API."""
         return urljoin(self.base_url, path.lstrip("/"))
 
     def get(self, path: str, *args, **kwargs) -> dict:
         """Make a GET request to the Tailscale API."""
-        response = self.client().get(*args, url=self.url(path), **kwargs)
+        response = self.session.get(*args, url=self.url(path), **kwargs)
         response.raise_for_status()
         return response.json()
 
-    def delete(self, path: str, *args, **kwargs) -> dict:
+    def delete(self, path: str, *args, **kwargs) -> requests.Response:
         """Make a DELETE request to the Tailscale API."""
-        response = self.client().delete(*args, url=self.url(path), **kwargs)
+        response = self.session.delete(*args, url=self.url(path), **kwargs)
         response.raise_for_status()
         return response
+
+    def delete_many(self, paths: list[str]) -> dict[str, requests.Response | Exception]:
+        """Make DELETE requests to the Tailscale API for multiple paths concurrently,
+        using at most ``max_workers`` threads.
+
+        Returns a dict mapping each path to its response, or to the exception raised
+        for it (e.g. an HTTPError for an error response).
+        """
+        if not paths:
+            return {}
+        self.session.ensure_token()
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.delete, path): path for path in paths}
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    results[futures[future]] = e
+        return results
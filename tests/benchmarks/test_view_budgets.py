@@ -0,0 +1,131 @@
+"""Query-count budgets for the most used pages.
+
+Each view is requested with fixtures seeded at several scales. The test fails if
+the number of queries grows with the amount of data (an N+1 regression) or if it
+goes over the budget stored in ``budgets.json``. Wall-clock time is not asserted,
+as it depends on the machine running the tests. When a change legitimately adds
+a query to a page, update its ``max_queries`` in ``budgets.json`` in the same
+commit.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from tests.mdm import TestAllMDMsNoAutouse
+from tests.mdm.factories import (
+    DeviceFactory,
+    DeviceSnapshotAppFactory,
+    DeviceSnapshotFactory,
+    FirmwareSnapshotFactory,
+    FleetFactory,
+    PolicyApplicationFactory,
+    PolicyFactory,
+)
+from tests.publish_mdm.factories import (
+    AppUserFactory,
+    AppUserFormTemplateFactory,
+    AppUserTemplateVariableFactory,
+    CentralServerFactory,
+    FormTemplateFactory,
+    FormTemplateVersionFactory,
+    OrganizationFactory,
+    ProjectFactory,
+    TemplateVariableFactory,
+)
+from tests.tailscale.factories import DeviceFactory as TailscaleDeviceFactory
+from tests.users.factories import UserFactory
+
+BUDGETS = json.loads((Path(__file__).parent / "budgets.json").read_text())
+SCALES = (1, 4, 8)
+
+
+def seed(organization, project, scale):
+    """Create ``scale`` of each object displayed by the views, for ``organization``
+    and for another organization (which should not affect the views).
+    """
+    for org in [organization, OrganizationFactory()]:
+        if org != organization:
+            project = ProjectFactory(organization=org, central_server__organization=org)
+        template_variable = TemplateVariableFactory(organization=org)
+        form_templates = FormTemplateFactory.create_batch(scale, project=project)
+        for form_template in form_templates:
+            FormTemplateVersionFactory(form_template=form_template)
+        for app_user in AppUserFactory.create_batch(scale, project=project):
+            AppUserTemplateVariableFactory(app_user=app_user, template_variable=template_variable)
+            for form_template in form_templates[:2]:
+                AppUserFormTemplateFactory(app_user=app_user, form_template=form_template)
+        for _ in range(scale):
+            policy = PolicyFactory(organization=org)
+            PolicyApplicationFactory.create_batch(2, policy=policy)
+            fleet = FleetFactory(organization=org, project=project, policy=policy)
+            for device in DeviceFactory.create_batch(2, fleet=fleet):
+                snapshot = DeviceSnapshotFactory(mdm_device=device)
+                DeviceSnapshotAppFactory.create_batch(2, device_snapshot=snapshot)
+                device.latest_snapshot = snapshot
+                device.save(push_to_mdm=False)
+                FirmwareSnapshotFactory(device=device)
+                TailscaleDeviceFactory(name=f"{device.serial_number.lower()}.tailnet.ts.net")
+
+
+@pytest.mark.django_db
+class TestViewBudgets(TestAllMDMsNoAutouse):
+    @pytest.fixture
+    def user(self, client, organization):
+        user = UserFactory()
+        user.save()
+        organization.users.add(user)
+        client.force_login(user=user)
+        return user
+
+    @pytest.fixture
+    def project(self, organization):
+        return ProjectFactory(
+            organization=organization,
+            central_server=CentralServerFactory(organization=organization),
+        )
+
+    def get_url(self, view, organization, project):
+        if view == "devices_list":
+            return reverse("publish_mdm:devices-list", args=[organization.slug])
+        if view == "device_detail":
+            device = DeviceFactory._meta.model.objects.filter(
+                fleet__organization=organization
+            ).first()
+            return reverse("publish_mdm:device-detail", args=[organization.slug, device.pk])
+        if view == "app_user_list":
+            return reverse("publish_mdm:app-user-list", args=[organization.slug, project.pk])
+        if view == "form_template_list":
+            return reverse("publish_mdm:form-template-list", args=[organization.slug, project.pk])
+        if view == "fleets_list":
+            return reverse("publish_mdm:fleets-list", args=[organization.slug])
+        if view == "policy_list":
+            return reverse("mdm:policy-list", args=[organization.slug])
+        raise ValueError(view)
+
+    @pytest.mark.parametrize("view", sorted(BUDGETS))
+    def test_view_budget(self, client, user, organization, project, view, all_mdms):
+        budget = BUDGETS[view]
+        query_counts = {}
+        seeded = 0
+        for scale in SCALES:
+            seed(organization, project, scale - seeded)
+            seeded = scale
+            url = self.get_url(view, organization, project)
+            # Warm up per-process caches (e.g. content types) before measuring
+            client.get(url)
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url)
+            assert response.status_code == 200
+            query_counts[scale] = len(queries)
+            assert len(queries) <= budget["max_queries"], (
+                f"{view} ran {len(queries)} queries at scale {scale}, "
+                f"over the budget of {budget['max_queries']}"
+            )
+        assert len(set(query_counts.values())) == 1, (
+            f"{view} query count grows with the amount of data: {query_counts}"
+        )
@@ -4,6 +4,9 @@ from requests.exceptions import HTTPError
 
 from apps.publish_mdm.models import AndroidEnterpriseAccount
 from tests.mdm import ANDROID_ENTERPRISE_SERVICE_ACCOUNT_FILE, _configure_mdm
+from tests.mdm import factories as mdm_factories
+from tests.publish_mdm import factories as publish_mdm_factories
+from tests.users import factories as users_factories
 
 
 @pytest.fixture
@@ -60,3 +63,12 @@ def force_tinymdm(organization):
 @pytest.fixture
 def force_android_enterprise(organization, set_amapi_service_account_file):
     _configure_mdm("Android Enterprise", organization)
+
+
+@pytest.fixture(autouse=True)
+def reset_unique_fakers():
+    # Forget the unique values used by each test (its rows are rolled back) so
+    # the suite doesn't run out of unique words as it grows.
+    yield
+    for module in (mdm_factories, publish_mdm_factories, users_factories):
+        module.fake.unique.clear()
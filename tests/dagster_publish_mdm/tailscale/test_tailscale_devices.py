@@ -2,11 +2,13 @@ import datetime as dt
 
 import dagster as dg
 import pytest
+import requests
+from pydantic import ValidationError
 
 from apps.tailscale.models import DeviceSnapshot
 from dagster_publish_mdm.assets.tailscale import tailscale_devices as assets
 from dagster_publish_mdm.resources.tailscale import TailscaleResource
-from tests.tailscale.factories import DeviceSnapshotFactory
+from tests.tailscale.factories import DeviceFactory, DeviceSnapshotFactory
 
 TAILSCALE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 
@@ -84,6 +86,50 @@ def test_tailscale_append_device_snapshot_table(devices):
     assert device.synced_at is not None
 
 
+@pytest.mark.django_db
+def test_tailscale_append_device_snapshot_table_in_chunks(devices, monkeypatch):
+    """Snapshots are inserted in chunks and a summary of the inserted rows is returned."""
+    monkeypatch.setattr(assets, "SNAPSHOT_CHUNK_SIZE", 2)
+    device = devices["devices"][0]
+    devices["devices"] = [{**device, "nodeId": f"node{i}"} for i in range(5)]
+    result = assets.tailscale_append_device_snapshot_table(
+        context=dg.build_asset_context(), tailscale_device_snapshot=devices
+    )
+    snapshots = DeviceSnapshot.objects.order_by("id")
+    assert [i.node_id for i in snapshots] == [f"node{i}" for i in range(5)]
+    assert result == {
+        "count": 5,
+        "first_id": snapshots[0].id,
+        "last_id": snapshots[4].id,
+        "synced_at": snapshots[0].synced_at.isoformat(),
+    }
+    # All the snapshots from a sync share the same sync time
+    assert len({i.synced_at for i in snapshots}) == 1
+
+
+@pytest.mark.django_db
+def test_tailscale_append_device_snapshot_table_links_existing_devices(devices):
+    """Snapshots for known node IDs are linked to the existing device."""
+    device = DeviceFactory(node_id=devices["devices"][0]["nodeId"])
+    assets.tailscale_append_device_snapshot_table(
+        context=dg.build_asset_context(), tailscale_device_snapshot=devices
+    )
+    assert DeviceSnapshot.objects.get(node_id=device.node_id).device == device
+
+
+@pytest.mark.django_db
+def test_tailscale_append_device_snapshot_table_invalid_device(devices, monkeypatch):
+    """An invalid device fails the asset without inserting any snapshots."""
+    monkeypatch.setattr(assets, "SNAPSHOT_CHUNK_SIZE", 1)
+    device = devices["devices"][0]
+    devices["devices"] = [device, {**device, "os": "x" * 33}]
+    with pytest.raises(ValidationError):
+        assets.tailscale_append_device_snapshot_table(
+            context=dg.build_asset_context(), tailscale_device_snapshot=devices
+        )
+    assert not DeviceSnapshot.objects.exists()
+
+
 @pytest.mark.django_db
 def test_device_no_expiration(devices):
     """Test asset handles devices with no expiration date."""
@@ -107,14 +153,20 @@ def test_device_with_no_last_seen(devices):
 
 
 @pytest.mark.django_db
-def test_tailscale_insert_and_update_devices(devices):
+def test_tailscale_insert_and_update_devices(devices, mocker):
     """Test asset inserts and updates devices."""
-    DeviceSnapshotFactory(device=None)
+    snapshot = DeviceSnapshotFactory(device=None)
+    mock_assign = mocker.patch.object(
+        DeviceSnapshot.objects, "assign_devices", wraps=DeviceSnapshot.objects.assign_devices
+    )
     updated_devices, new_devices = assets.tailscale_insert_and_update_devices(
-        context=dg.build_asset_context()
+        context=dg.build_asset_context(),
+        tailscale_append_device_snapshot_table={"synced_at": snapshot.synced_at.isoformat()},
     )
     assert updated_devices == 0
     assert new_devices == 1
+    # Only the snapshots inserted by the last sync are used to update devices
+    mock_assign.assert_called_once_with(since=snapshot.synced_at)
 
 
 def test_dev_stale_tailscale_devices(monkeypatch):
@@ -225,3 +277,67 @@ def test_stale_tailscale_devices_with_no_last_seen(monkeypatch):
         dg.build_asset_context(), tailscale_device_snapshot=snapshot
     )
     assert len(result) == 1
+
+
+@pytest.fixture
+def tailscale(requests_mock):
+    requests_mock.post(
+        "https://api.tailscale.com/api/v2/oauth/token",
+        json={"access_token": "dummy", "expires_in": 3600, "token_type": "Bearer"},
+    )
+    return TailscaleResource(client_id="key", client_secret="secret", tailnet="tailnet")
+
+
+def test_tailscale_resource_reuses_session_and_token(requests_mock, tailscale, devices):
+    """The resource fetches a single access token and reuses its session across calls."""
+    requests_mock.get(
+        f"https://api.tailscale.com/api/v2/tailnet/{tailscale.tailnet}/devices",
+        json=devices,
+    )
+    requests_mock.delete("https://api.tailscale.com/api/v2/device/1111")
+    session = tailscale.session
+    tailscale.get(path=f"tailnet/{tailscale.tailnet}/devices")
+    tailscale.get(path=f"tailnet/{tailscale.tailnet}/devices")
+    tailscale.delete(path="device/1111")
+    assert tailscale.session is session
+    token_requests = [r for r in requests_mock.request_history if r.path.endswith("oauth/token")]
+    assert len(token_requests) == 1
+
+
+def test_tailscale_resource_delete_many(requests_mock, tailscale):
+    """delete_many returns the response or the exception for each path."""
+    requests_mock.delete("https://api.tailscale.com/api/v2/device/1", status_code=200)
+    requests_mock.delete("https://api.tailscale.com/api/v2/device/2", status_code=404)
+    results = tailscale.delete_many(["device/1", "device/2"])
+    assert results["device/1"].status_code == 200
+    assert isinstance(results["device/2"], requests.HTTPError)
+    token_requests = [r for r in requests_mock.request_history if r.path.endswith("oauth/token")]
+    assert len(token_requests) == 1
+
+
+def test_pruned_stale_tailscale_devices(requests_mock, tailscale):
+    """Stale devices are deleted and a result is returned for each device."""
+    requests_mock.delete("https://api.tailscale.com/api/v2/device/1", status_code=200)
+    requests_mock.delete("https://api.tailscale.com/api/v2/device/2", status_code=500)
+    stale_devices = [
+        {"id": "1", "hostname": "device-1", "user": "user1"},
+        {"id": "2", "hostname": "device-2", "user": "user2"},
+    ]
+    context = dg.build_asset_context()
+    results = assets.pruned_stale_tailscale_devices(
+        context, stale_tailscale_devices=stale_devices, tailscale=tailscale
+    )
+    assert [(result["id"], result["deleted"]) for result in results] == [
+        ("1", True),
+        ("2", False),
+    ]
+    assert results[0]["status_code"] == 200
+    assert "500" in results[1]["error"]
+
+
+def test_pruned_stale_tailscale_devices_no_devices(tailscale):
+    """Nothing is deleted when there are no stale devices."""
+    results = assets.pruned_stale_tailscale_devices(
+        dg.build_asset_context(), stale_tailscale_devices=[], tailscale=tailscale
+    )
+    assert results == []
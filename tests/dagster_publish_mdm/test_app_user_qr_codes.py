@@ -0,0 +1,60 @@
+import dagster as dg
+import pytest
+from django.core.cache import cache
+
+from apps.publish_mdm.etl.load import QR_CODE_PROGRESS_CACHE_KEY
+from dagster_publish_mdm.assets.app_users import AppUserQRCodesConfig, generate_app_user_qr_codes
+from tests.publish_mdm.factories import AppUserFactory, ProjectFactory
+
+
+@pytest.mark.django_db
+class TestGenerateAppUserQRCodes:
+    @pytest.fixture
+    def project(self):
+        return ProjectFactory()
+
+    def test_generate_all(self, mocker, project):
+        """QR codes are generated for all the project's app users, progress is
+        reported in the cache and cleared at the end.
+        """
+        app_users = AppUserFactory.create_batch(2, project=project)
+        AppUserFactory()  # Another project's app user
+        cache_key = QR_CODE_PROGRESS_CACHE_KEY.format(project_pk=project.pk)
+        reported = []
+
+        def generate(project, app_users, progress, parallel):
+            assert parallel
+            for i in range(len(app_users)):
+                progress(i + 1, len(app_users))
+                reported.append(cache.get(cache_key))
+            return {"generated": len(app_users), "skipped": 0}
+
+        mock_generate = mocker.patch(
+            "dagster_publish_mdm.assets.app_users.generate_and_save_app_user_collect_qrcodes",
+            side_effect=generate,
+        )
+
+        result = generate_app_user_qr_codes(
+            context=dg.build_asset_context(),
+            config=AppUserQRCodesConfig(project_pk=project.pk),
+        )
+
+        assert result == {"generated": 2, "skipped": 0}
+        assert set(mock_generate.call_args.kwargs["app_users"]) == set(app_users)
+        assert reported == [{"done": 1, "total": 2}, {"done": 2, "total": 2}]
+        assert cache.get(cache_key) is None
+
+    def test_generate_selected(self, mocker, project):
+        """Only the selected app users are passed on when app_user_pks is set."""
+        app_user, _ = AppUserFactory.create_batch(2, project=project)
+        mock_generate = mocker.patch(
+            "dagster_publish_mdm.assets.app_users.generate_and_save_app_user_collect_qrcodes",
+            return_value={"generated": 1, "skipped": 0},
+        )
+
+        generate_app_user_qr_codes(
+            context=dg.build_asset_context(),
+            config=AppUserQRCodesConfig(project_pk=project.pk, app_user_pks=[app_user.pk]),
+        )
+
+        assert mock_generate.call_args.kwargs["app_users"] == [app_user]
@@ -0,0 +1,58 @@
+import dagster as dg
+import pytest
+
+from apps.publish_mdm.import_export import DeviceImport
+from dagster_publish_mdm.assets.mdm_devices import DeviceImportConfig, import_devices
+from tests.publish_mdm.factories import OrganizationFactory
+
+
+@pytest.mark.django_db
+class TestImportDevices:
+    @pytest.fixture
+    def device_import(self):
+        device_import = DeviceImport(
+            import_id="abc123",
+            organization_id=OrganizationFactory().pk,
+            format=0,
+            original_file_name="devices.csv",
+        )
+        device_import.save()
+        return device_import
+
+    def test_import(self, mocker, device_import):
+        """The stored DeviceImport is run and its totals are returned."""
+
+        def run(self, dry_run):
+            self.status = DeviceImport.Status.DONE
+            return mocker.Mock(totals={"new": 0, "update": 2})
+
+        mock_run = mocker.patch.object(DeviceImport, "run", autospec=True, side_effect=run)
+
+        result = import_devices(
+            context=dg.build_asset_context(),
+            config=DeviceImportConfig(import_id=device_import.import_id, dry_run=False),
+        )
+
+        assert result == {"new": 0, "update": 2}
+        assert mock_run.call_args.kwargs == {"dry_run": False}
+
+    def test_failed_import(self, mocker, device_import):
+        """The run fails if the import fails."""
+
+        def run(self, dry_run):
+            self.status = DeviceImport.Status.FAILED
+
+        mocker.patch.object(DeviceImport, "run", autospec=True, side_effect=run)
+
+        with pytest.raises(dg.Failure):
+            import_devices(
+                context=dg.build_asset_context(),
+                config=DeviceImportConfig(import_id=device_import.import_id),
+            )
+
+    def test_missing_import(self):
+        """The run fails if the import has expired from the cache."""
+        with pytest.raises(ValueError, match="not found"):
+            import_devices(
+                context=dg.build_asset_context(), config=DeviceImportConfig(import_id="missing")
+            )
@@ -52,3 +52,26 @@ class TestSyncAndPushMDMDevices(TestAllMDMs):
         )
 
         mock_sync.assert_not_called()
+
+    def test_api_usage_metadata(self, mocker, organization):
+        """The MDM API calls made during the sync are added to the output metadata."""
+        MDM = get_active_mdm_class(organization)
+
+        def sync_fleets(self, push_config):
+            self.api_usage.observe(0.5, error=False)
+            self.api_usage.observe(1.5, error=True, rate_limited=1)
+
+        mocker.patch.object(MDM, "sync_fleets", sync_fleets)
+        context = dg.build_asset_context()
+
+        sync_and_push_mdm_devices(
+            context=context, config=SyncFleetsConfig(organization_pk=organization.pk)
+        )
+
+        assert context.get_output_metadata("result") == {
+            "api_calls": 2,
+            "api_errors": 1,
+            "api_rate_limited": 1,
+            "api_backoffs": 0,
+            "api_seconds": 2.0,
+        }
@@ -0,0 +1,40 @@
+import dagster as dg
+import pytest
+from django.core.cache import cache
+
+from apps.publish_mdm.etl.load import PROJECT_SYNC_PROGRESS_CACHE_KEY, ProjectSync
+from dagster_publish_mdm.assets.projects import (
+    CentralProjectSyncConfig,
+    sync_central_project_data,
+)
+from tests.publish_mdm.factories import CentralServerFactory, ProjectFactory
+
+
+@pytest.mark.django_db
+def test_sync_central_project_data(mocker):
+    """The project is synced, progress is reported in the cache and cleared at the end."""
+    server = CentralServerFactory()
+    project = ProjectFactory(central_server=server, organization=server.organization)
+    cache_key = PROJECT_SYNC_PROGRESS_CACHE_KEY.format(server_pk=server.pk, project_id=7)
+    reported = []
+
+    def sync(server, project_id, progress):
+        for step in range(1, 3):
+            progress(step, 2)
+            reported.append(cache.get(cache_key))
+        return ProjectSync(project=project, form_templates_created=3)
+
+    mock_sync = mocker.patch(
+        "dagster_publish_mdm.assets.projects.sync_central_project", side_effect=sync
+    )
+
+    result = sync_central_project_data(
+        context=dg.build_asset_context(),
+        config=CentralProjectSyncConfig(central_server_pk=server.pk, project_id=7),
+    )
+
+    assert result["form_templates_created"] == 3
+    assert mock_sync.call_args.kwargs["server"] == server
+    assert mock_sync.call_args.kwargs["project_id"] == 7
+    assert reported == [{"done": 1, "total": 2}, {"done": 2, "total": 2}]
+    assert cache.get(cache_key) is None
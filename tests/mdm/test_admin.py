@@ -2,13 +2,14 @@ import pytest
 from django.conf import settings
 from django.contrib.auth.models import Permission
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import linebreaks
 from import_export.tmp_storages import TempFolderStorage
 from pytest_django.asserts import assertContains, assertNotContains, assertRedirects
 
 from apps.mdm.import_export import DeviceResource
 from apps.mdm.mdms import get_active_mdm_class
-from apps.mdm.models import Device, Fleet
+from apps.mdm.models import Device, Fleet, MDMAPIUsage
 from tests.mdm import TestAllMDMs
 from tests.users.factories import UserFactory
 
@@ -892,3 +893,53 @@ class TestDeviceAdminWipeAndSoftDelete(TestAdmin):
         device.refresh_from_db()
         assert device.is_deleted is False
         assertContains(response, "1 device(s) could not be wiped and deleted.")
+
+
+class TestMDMAPIUsageAdmin(TestAdmin):
+    def test_changelist(self, client, user, organization, settings):
+        """The changelist shows the share of the hourly quota used by all calls
+        made for the organization in the same hour.
+        """
+        settings.MDM_API_HOURLY_QUOTAS = {"TinyMDM": 200}
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+        for endpoint, calls in (("devices", 30), ("users/{id}", 20)):
+            MDMAPIUsage.objects.create(
+                organization=organization,
+                mdm="TinyMDM",
+                hour=hour,
+                method="GET",
+                endpoint=endpoint,
+                calls=calls,
+                seconds=calls / 2,
+            )
+        response = client.get(reverse("admin:mdm_mdmapiusage_changelist"))
+        assert response.status_code == 200
+        assertContains(response, "users/{id}")
+        assertContains(response, "25%")
+        assertContains(response, "0.5")
+        assertNotContains(response, reverse("admin:mdm_mdmapiusage_add"))
+
+    def test_filtered_changelist(self, client, user, organization, settings):
+        """The share of the hourly quota includes the calls excluded by the filters."""
+        settings.MDM_API_HOURLY_QUOTAS = {"TinyMDM": 200}
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+        for method, calls in (("GET", 30), ("PUT", 20)):
+            MDMAPIUsage.objects.create(
+                organization=organization,
+                mdm="TinyMDM",
+                hour=hour,
+                method=method,
+                endpoint="devices",
+                calls=calls,
+            )
+        response = client.get(reverse("admin:mdm_mdmapiusage_changelist"), {"method": "PUT"})
+        assert response.status_code == 200
+        assert [row.method for row in response.context["cl"].result_list] == ["PUT"]
+        assertContains(response, "25%")
+
+    def test_non_staff(self, client):
+        user = UserFactory()
+        user.save()
+        client.force_login(user=user)
+        response = client.get(reverse("admin:mdm_mdmapiusage_changelist"))
+        assert response.status_code == 302
@@ -7,6 +7,7 @@ import pytest
 from django.contrib.sites.models import Site
 from googleapiclient.errors import HttpError
 
+from apps.mdm.facets import device_facet_cache
 from apps.mdm.mdms import AndroidEnterprise, MDMAPIError
 from apps.mdm.mdms.android_enterprise import (
     ALL_SCOPES,
@@ -215,6 +216,7 @@ class TestAndroidEnterprise(TestAndroidEnterpriseOnly):
         monkeypatch,
         with_default_app_user,
         caplog,
+        mocker,
     ):
         """Ensures calling pull_devices() updates and creates Devices as expected."""
         if with_default_app_user:
@@ -258,8 +260,12 @@ class TestAndroidEnterprise(TestAndroidEnterpriseOnly):
         soft_deleted_device = DeviceFactory(fleet=fleet)
         soft_deleted_device.soft_delete()
 
+        mock_invalidate = mocker.spy(device_facet_cache, "invalidate")
         active_mdm.pull_devices(fleet)
 
+        # The bulk updates invalidate the cached device counts
+        mock_invalidate.assert_any_call(fleet.organization_id)
+
         assert fleet.devices.count() == 10
         # 4 devices are new
         new_devices = fleet.devices.exclude(id__in=[i.id for i in devices])
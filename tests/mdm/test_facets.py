@@ -0,0 +1,112 @@
+import pytest
+
+from apps.mdm.facets import device_facet_cache
+from apps.mdm.models import Device, Fleet
+from tests.publish_mdm.factories import OrganizationFactory
+
+from .factories import DeviceFactory, FleetFactory
+
+
+@pytest.mark.django_db
+class TestDeviceFacetCache:
+    @pytest.fixture
+    def organization(self):
+        return OrganizationFactory()
+
+    @pytest.fixture
+    def fleets(self, organization):
+        fleets = FleetFactory.create_batch(2, organization=organization)
+        DeviceFactory.create_batch(3, fleet=fleets[0])
+        DeviceFactory.create_batch(1, fleet=fleets[1])
+        # Devices in another organization are not counted
+        DeviceFactory.create_batch(2)
+        return fleets
+
+    def get_counts(self, organization, queryset=None):
+        if queryset is None:
+            queryset = Device.objects.filter(fleet__organization=organization)
+        rows = device_facet_cache.get(organization.id, queryset, ["fleet"])
+        return dict(rows)
+
+    def test_counts_are_cached(self, organization, fleets, django_assert_num_queries):
+        """The counts are only queried once until they are invalidated."""
+        expected = {fleets[0].id: 3, fleets[1].id: 1}
+        with django_assert_num_queries(1):
+            assert self.get_counts(organization) == expected
+        with django_assert_num_queries(0):
+            assert self.get_counts(organization) == expected
+
+    def test_filtered_queryset(self, organization, fleets):
+        """A filtered queryset gets its own cached counts."""
+        self.get_counts(organization)
+        queryset = Device.objects.filter(fleet__organization=organization, fleet=fleets[1])
+        assert self.get_counts(organization, queryset) == {fleets[1].id: 1}
+
+    def test_invalidated_on_create(self, organization, fleets):
+        self.get_counts(organization)
+        DeviceFactory(fleet=fleets[1])
+        assert self.get_counts(organization) == {fleets[0].id: 3, fleets[1].id: 2}
+
+    def test_invalidated_on_soft_delete(self, organization, fleets):
+        self.get_counts(organization)
+        fleets[1].devices.get().soft_delete()
+        assert self.get_counts(organization) == {fleets[0].id: 3}
+
+    def test_invalidated_on_delete(self, organization, fleets):
+        self.get_counts(organization)
+        fleets[1].devices.get().delete()
+        assert self.get_counts(organization) == {fleets[0].id: 3}
+
+    def test_invalidated_on_fleet_change(self, organization, fleets):
+        self.get_counts(organization)
+        device = fleets[0].devices.first()
+        device.fleet = fleets[1]
+        device.save(update_fields=["fleet"])
+        assert self.get_counts(organization) == {fleets[0].id: 2, fleets[1].id: 2}
+
+    def test_not_invalidated_on_other_updates(self, organization, fleets, mocker):
+        """Saving only other fields of a device keeps the cached counts."""
+        self.get_counts(organization)
+        mock_invalidate = mocker.patch.object(device_facet_cache, "invalidate")
+        device = fleets[0].devices.first()
+        device.app_user_name = "someone"
+        device.save(update_fields=["app_user_name"])
+        mock_invalidate.assert_not_called()
+
+    def test_not_invalidated_on_unchanged_full_save(self, organization, fleets, mocker):
+        """A full save of a loaded device that keeps its fleet skips the invalidation
+        and the Fleet query it needs.
+        """
+        self.get_counts(organization)
+        mock_invalidate = mocker.patch.object(device_facet_cache, "invalidate")
+        device = Device.objects.get(pk=fleets[1].devices.get().pk)
+        device.app_user_name = "someone"
+        mock_filter = mocker.spy(Fleet.objects, "filter")
+        device.save()
+        mock_invalidate.assert_not_called()
+        mock_filter.assert_not_called()
+
+    def test_invalidated_on_full_save_with_fleet_change(self, organization, fleets):
+        self.get_counts(organization)
+        device = Device.objects.get(pk=fleets[1].devices.get().pk)
+        device.save()
+        device.fleet = fleets[0]
+        device.save()
+        assert self.get_counts(organization) == {fleets[0].id: 4}
+
+    def test_invalidate(self, organization, fleets):
+        """Invalidating one organization keeps the other organizations' counts."""
+        other_device = Device.objects.exclude(fleet__organization=organization).first()
+        other_organization = other_device.fleet.organization
+        self.get_counts(organization)
+        self.get_counts(other_organization)
+        # Add devices without sending signals
+        Device.objects.bulk_create(
+            [
+                DeviceFactory.build(fleet=fleets[1]),
+                DeviceFactory.build(fleet=other_device.fleet),
+            ]
+        )
+        device_facet_cache.invalidate(organization.id)
+        assert self.get_counts(organization) == {fleets[0].id: 3, fleets[1].id: 2}
+        assert self.get_counts(other_organization) == {other_device.fleet_id: 1}
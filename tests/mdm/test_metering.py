@@ -0,0 +1,215 @@
+from unittest.mock import Mock
+
+import pytest
+import requests
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+
+from apps.mdm.mdms import AndroidEnterprise, TinyMDM
+from apps.mdm.metering import (
+    APIUsage,
+    amapi_endpoint,
+    mdm_api_metrics,
+    mdm_api_usage,
+    tinymdm_endpoint,
+)
+from apps.mdm.models import MDMAPIUsage
+from tests.mdm import TestAndroidEnterpriseOnly, TestTinyMDMOnly
+from tests.publish_mdm.factories import OrganizationFactory
+
+
+@pytest.fixture(autouse=True)
+def reset_metering():
+    mdm_api_usage._usage.clear()
+    mdm_api_usage._pending = 0
+    mdm_api_metrics.reset()
+    yield
+    mdm_api_usage._usage.clear()
+    mdm_api_usage._pending = 0
+    mdm_api_metrics.reset()
+
+
+@pytest.mark.parametrize(
+    ("url", "expected"),
+    [
+        ("https://www.tinymdm.net/api/v1/devices", "devices"),
+        ("https://www.tinymdm.net/api/v1/devices/abc123", "devices/{id}"),
+        ("https://www.tinymdm.net/api/v1/groups/abc/devices", "groups/{id}/devices"),
+        ("https://www.tinymdm.net/api/v1/users/42/", "users/{id}"),
+        ("https://www.tinymdm.net/api/v1/policies/p1/members", "policies/{id}/members"),
+    ],
+)
+def test_tinymdm_endpoint(url, expected):
+    assert tinymdm_endpoint(url) == expected
+
+
+def test_amapi_endpoint():
+    resource_method = Mock(method="GET", methodId="androidmanagement.enterprises.devices.list")
+    assert amapi_endpoint(resource_method) == ("GET", "androidmanagement.enterprises.devices.list")
+    # Missing or non-string attributes result in blank labels
+    assert amapi_endpoint(Mock()) == ("", "")
+
+
+def test_api_usage():
+    usage = APIUsage()
+    usage.observe(0.5, error=False)
+    usage.observe(1.25, error=True, rate_limited=1, backoffs=2)
+    other = APIUsage(calls=1, seconds=0.25)
+    usage.add(other)
+    assert usage.as_metadata() == {
+        "api_calls": 3,
+        "api_errors": 1,
+        "api_rate_limited": 1,
+        "api_backoffs": 2,
+        "api_seconds": 2.0,
+    }
+
+
+@pytest.mark.django_db
+class TestAPIUsageBuffer:
+    @pytest.fixture
+    def mdm(self):
+        return Mock(spec=["name", "organization", "api_usage"], name="mdm", api_usage=APIUsage())
+
+    def test_record_and_flush(self, mdm):
+        """Calls are buffered, then added to the hourly MDMAPIUsage rows when flushed."""
+        mdm.name = "TinyMDM"
+        mdm.organization = OrganizationFactory()
+        mdm_api_usage.record(mdm, "GET", "devices", 0.5, status_code=200)
+        mdm_api_usage.record(mdm, "GET", "devices", 1.5, status_code=429, rate_limited=1)
+        mdm_api_usage.record(mdm, "PUT", "users/{id}", 0.25, status_code=None)
+        assert not MDMAPIUsage.objects.exists()
+        assert mdm.api_usage == APIUsage(calls=3, errors=2, rate_limited=1, seconds=2.25)
+
+        mdm_api_usage.flush()
+        usage = {
+            (row.method, row.endpoint): (row.calls, row.errors, row.rate_limited, row.seconds)
+            for row in MDMAPIUsage.objects.filter(organization=mdm.organization, mdm="TinyMDM")
+        }
+        assert usage == {("GET", "devices"): (2, 1, 1, 2.0), ("PUT", "users/{id}"): (1, 1, 0, 0.25)}
+
+        # A later flush adds to the existing rows
+        mdm_api_usage.record(mdm, "GET", "devices", 0.5, status_code=200, backoffs=1)
+        mdm_api_usage.flush()
+        row = MDMAPIUsage.objects.get(method="GET", endpoint="devices")
+        assert (row.calls, row.errors, row.backoffs, row.seconds) == (3, 1, 1, 2.5)
+
+    def test_flush_concurrent_row(self, mdm):
+        """Rows created by another process after the calls were recorded are added to."""
+        mdm.name = "TinyMDM"
+        mdm.organization = OrganizationFactory()
+        mdm_api_usage.record(mdm, "GET", "devices", 0.5, status_code=200)
+        mdm_api_usage.record(mdm, "PUT", "devices", 0.5, status_code=200)
+        MDMAPIUsage.objects.create(
+            organization=mdm.organization,
+            mdm="TinyMDM",
+            hour=timezone.now().replace(minute=0, second=0, microsecond=0),
+            method="GET",
+            endpoint="devices",
+            calls=2,
+            errors=1,
+            seconds=1,
+        )
+        mdm_api_usage.flush()
+        assert set(MDMAPIUsage.objects.values_list("method", "calls", "errors", "seconds")) == {
+            ("GET", 3, 1, 1.5),
+            ("PUT", 1, 0, 0.5),
+        }
+
+    def test_flush_size(self, mdm, monkeypatch):
+        monkeypatch.setattr(mdm_api_usage, "flush_size", 2)
+        mdm.name = "TinyMDM"
+        mdm.organization = OrganizationFactory()
+        mdm_api_usage.record(mdm, "GET", "devices", 0.1, status_code=200)
+        assert not MDMAPIUsage.objects.exists()
+        mdm_api_usage.record(mdm, "GET", "devices", 0.1, status_code=200)
+        assert MDMAPIUsage.objects.get().calls == 2
+
+    def test_deleted_organization(self, mdm):
+        """Calls for organizations deleted before the flush are not saved."""
+        mdm.name = "TinyMDM"
+        mdm.organization = OrganizationFactory()
+        other = Mock(spec=["name", "organization", "api_usage"], api_usage=APIUsage())
+        other.name = "TinyMDM"
+        other.organization = OrganizationFactory()
+        mdm_api_usage.record(mdm, "GET", "devices", 0.1, status_code=200)
+        mdm_api_usage.record(other, "GET", "devices", 0.1, status_code=200)
+        other.organization.delete()
+        mdm_api_usage.flush()
+        assert list(MDMAPIUsage.objects.values_list("organization", flat=True)) == [
+            mdm.organization.pk
+        ]
+
+    def test_no_organization(self, mdm):
+        """Calls made without an organization are only counted in the metrics."""
+        mdm.name = "Android Enterprise"
+        mdm.organization = None
+        mdm_api_usage.record(mdm, "POST", "androidmanagement.signupUrls.create", 0.1, 200)
+        mdm_api_usage.flush()
+        assert not MDMAPIUsage.objects.exists()
+        assert mdm.api_usage.calls == 1
+        assert (
+            mdm_api_metrics.snapshot()[
+                ("Android Enterprise", "POST", "androidmanagement.signupUrls.create")
+            ].count
+            == 1
+        )
+
+
+@pytest.mark.django_db
+class TestTinyMDMMetering(TestTinyMDMOnly):
+    def test_request(self, organization, requests_mock):
+        active_mdm = TinyMDM(organization=organization)
+        requests_mock.get("https://www.tinymdm.net/api/v1/devices/abc", json={})
+        requests_mock.put("https://www.tinymdm.net/api/v1/users/abc", status_code=429)
+        active_mdm.request("GET", "https://www.tinymdm.net/api/v1/devices/abc")
+        active_mdm.request(
+            "PUT", "https://www.tinymdm.net/api/v1/users/abc", raise_for_status=False
+        )
+        assert active_mdm.api_usage.calls == 2
+        assert active_mdm.api_usage.errors == 1
+        assert active_mdm.api_usage.rate_limited == 1
+
+        mdm_api_usage.flush()
+        assert set(
+            MDMAPIUsage.objects.filter(organization=organization, mdm="TinyMDM").values_list(
+                "method", "endpoint", "calls", "rate_limited"
+            )
+        ) == {("GET", "devices/{id}", 1, 0), ("PUT", "users/{id}", 1, 1)}
+
+    def test_request_connection_error(self, organization, requests_mock):
+        active_mdm = TinyMDM(organization=organization)
+        requests_mock.get(
+            "https://www.tinymdm.net/api/v1/devices", exc=requests.exceptions.ConnectionError
+        )
+        with pytest.raises(requests.exceptions.ConnectionError):
+            active_mdm.request("GET", "https://www.tinymdm.net/api/v1/devices")
+        assert active_mdm.api_usage == APIUsage(
+            calls=1, errors=1, seconds=active_mdm.api_usage.seconds
+        )
+
+
+@pytest.mark.django_db
+class TestAndroidEnterpriseMetering(TestAndroidEnterpriseOnly):
+    def test_execute(self, organization):
+        active_mdm = AndroidEnterprise(organization=organization)
+        resource_method = Mock(method="GET", methodId="androidmanagement.enterprises.devices.list")
+        resource_method.execute.return_value = {}
+        active_mdm.execute(resource_method)
+        resource_method.execute.side_effect = HttpError(
+            Mock(status=429, reason="Too Many Requests"), b"{}"
+        )
+        active_mdm.execute(resource_method, raise_exception=False)
+        assert active_mdm.api_usage.calls == 2
+        assert active_mdm.api_usage.errors == 1
+        assert active_mdm.api_usage.rate_limited == 1
+
+        mdm_api_usage.flush()
+        row = MDMAPIUsage.objects.get(organization=organization, mdm="Android Enterprise")
+        assert (row.method, row.endpoint, row.calls, row.errors, row.rate_limited) == (
+            "GET",
+            "androidmanagement.enterprises.devices.list",
+            2,
+            1,
+            1,
+        )
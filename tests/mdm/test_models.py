@@ -10,6 +10,7 @@ from apps.mdm.mdms import get_active_mdm_class
 from apps.mdm.models import (
     EMM_DPC_PACKAGE,
     AllowPersonalUsage,
+    Device,
     DeviceSnapshotApp,
     EnrollmentToken,
     PolicyApplication,
@@ -388,6 +389,37 @@ class TestModels(TestAllMDMs):
         inner = json.loads(result)
         assert inner == ""  # empty since no AppUser
 
+    def test_load_odk_collect_qr_code_strings(self, fleet, django_assert_num_queries):
+        """QR code strings for a batch of devices are loaded in one query and match
+        what get_odk_collect_qr_code_string() would return for each device.
+        """
+        other_fleet = FleetFactory(organization=fleet.organization)
+        AppUserFactory(name="user1", project=fleet.project, qr_code_data={"a": 1})
+        AppUserFactory(name="user2", project=fleet.project, qr_code_data=None)
+        # Same name in another project
+        AppUserFactory(name="user1", project=other_fleet.project, qr_code_data={"b": 2})
+        devices = [
+            DeviceFactory(fleet=fleet, app_user_name="user1"),
+            # App user names are case-insensitive
+            DeviceFactory(fleet=fleet, app_user_name="USER1"),
+            DeviceFactory(fleet=fleet, app_user_name="user2"),
+            DeviceFactory(fleet=fleet, app_user_name="missing"),
+            DeviceFactory(fleet=fleet, app_user_name=""),
+            DeviceFactory(fleet=other_fleet, app_user_name="user1"),
+        ]
+        expected = [device.get_odk_collect_qr_code_string() for device in devices]
+        assert expected[0] == '{"a":1}'
+        assert expected[2:] == ["null", "", "", '{"b":2}']
+
+        with django_assert_num_queries(1):
+            Device.load_odk_collect_qr_code_strings(devices)
+        with django_assert_num_queries(0):
+            assert [device.get_odk_collect_qr_code_string() for device in devices] == expected
+
+        # A changed app user name is looked up again
+        devices[0].app_user_name = "user2"
+        assert devices[0].get_odk_collect_qr_code_string() == "null"
+
     def test_device_snapshot_str(self):
         """DeviceSnapshot.__str__ returns name (device_id) format."""
         snapshot = DeviceSnapshotFactory(name="My Device", device_id="abc123")
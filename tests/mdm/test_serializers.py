@@ -1,4 +1,6 @@
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from apps.mdm.models import (
     ConfigureWifi,
@@ -12,6 +14,7 @@ from apps.mdm.models import (
     UsbDataAccess,
     WifiDirectSettings,
 )
+from apps.mdm.policy_cache import policy_render_cache
 from apps.mdm.serializers import PolicySerializer
 from apps.publish_mdm.etl.odk.constants import DEFAULT_COLLECT_SETTINGS
 from tests.mdm import TestAllMDMs
@@ -539,3 +542,124 @@ class TestPolicySerializer(TestAllMDMs):
         assert srs["hardwareStatusEnabled"] is True
         assert srs["systemPropertiesEnabled"] is True
         assert srs["commonCriteriaModeEnabled"] is True
+
+
+@pytest.mark.django_db
+class TestPolicyRenderCache(TestAllMDMs):
+    @pytest.fixture
+    def fleet(self, organization):
+        fleet = FleetFactory(organization=organization, policy__organization=organization)
+        policy = fleet.policy
+        PolicyVariable.objects.create(key="auth_key", value="secret", scope="policy", policy=policy)
+        PolicyVariable.objects.create(key="region", value="north", scope="fleet", fleet=fleet)
+        PolicyApplication.objects.create(
+            policy=policy,
+            package_name="com.example.app",
+            install_type="FORCE_INSTALLED",
+            managed_configuration={
+                "auth": "$auth_key",
+                "region": "$region",
+                "names": ["$serial_number", "$app_user_name-$region"],
+                "device": "${device_id}/$imei",
+            },
+            order=1,
+        )
+        return fleet
+
+    @pytest.fixture
+    def devices(self, fleet):
+        devices = []
+        for i in range(2):
+            AppUserFactory(
+                name=f"user{i}", project=fleet.project, qr_code_data={"n": f"$region{i}"}
+            )
+            devices.append(
+                DeviceFactory(
+                    fleet=fleet,
+                    app_user_name=f"user{i}",
+                    serial_number=f"SERIAL{i}",
+                    raw_mdm_device={"hardwareInfo": {"imei": f"IMEI{i}"}},
+                )
+            )
+        return devices
+
+    def test_render_matches_serializer(self, fleet, devices):
+        """Rendering a compiled policy gives the same document as the serializer."""
+        policy = fleet.policy
+        compiled = policy.get_serializer().compile()
+        for device in devices:
+            serializer = policy.get_serializer()
+            serializer.device = device
+            expected = serializer.to_dict()
+            assert compiled.render(device) == expected
+            assert policy.get_policy_data(device=device) == expected
+        assert compiled.render() == policy.get_policy_data()
+        config = compiled.render(devices[1])["applications"][1]["managedConfiguration"]
+        assert config == {
+            "auth": "secret",
+            "region": "north",
+            "names": ["SERIAL1", "user1-north"],
+            "device": f"{devices[1].device_id}/IMEI1",
+        }
+
+    def test_compiled_once_per_revision(self, fleet, devices):
+        """The policy's applications and variables are only queried for the first device."""
+        policy = fleet.policy
+        policy_render_cache.invalidate(policy.organization_id)
+        with CaptureQueriesContext(connection) as first_queries:
+            policy.get_policy_data(device=devices[0])
+        with CaptureQueriesContext(connection) as second_queries:
+            policy.get_policy_data(device=devices[1])
+
+        # Only the app user QR code lookup is left for the second device
+        assert len(second_queries) == 1
+        assert len(first_queries) > len(second_queries)
+
+    @pytest.mark.parametrize("change", ["policy", "application", "variable", "fleet"])
+    def test_invalidation(self, fleet, devices, change):
+        """Changes to anything the document is built from are picked up."""
+        policy = fleet.policy
+        device = devices[0]
+        policy.get_policy_data(device=device)
+        if change == "policy":
+            policy.vpn_package_name = "com.example.vpn"
+            policy.save()
+        elif change == "application":
+            PolicyApplication.objects.create(
+                policy=policy, package_name="com.example.new", install_type="FORCE_INSTALLED"
+            )
+        elif change == "variable":
+            variable = PolicyVariable.objects.get(key="region")
+            variable.value = "south"
+            variable.save()
+        else:
+            # Moving a fleet to the policy brings its fleet-scoped variables
+            other_fleet = FleetFactory(organization=fleet.organization)
+            PolicyVariable.objects.create(
+                key="auth_key", value="fleet-secret", scope="fleet", fleet=other_fleet
+            )
+            policy.get_policy_data(device=device)
+            other_fleet.policy = policy
+            other_fleet.save()
+
+        serializer = PolicySerializer(
+            policy=policy,
+            applications=list(policy.applications.order_by("order", "pk")),
+            variables=list(PolicyVariable.objects.filter(policy=policy))
+            + list(PolicyVariable.objects.filter(fleet__policy=policy)),
+            device=device,
+        )
+        assert policy.get_policy_data(device=device) == serializer.to_dict()
+
+    def test_invalidation_scoped_to_organization(self, fleet, devices):
+        """Changes in another organization don't drop this organization's policies."""
+        policy = fleet.policy
+        policy.get_policy_data(device=devices[0])
+        revision = policy_render_cache.revision(policy.organization_id)
+        other_fleet = FleetFactory()
+        other_fleet.save()
+        assert other_fleet.organization_id != policy.organization_id
+        assert policy_render_cache.revision(policy.organization_id) == revision
+        with CaptureQueriesContext(connection) as queries:
+            policy.get_policy_data(device=devices[1])
+        assert len(queries) == 1
@@ -6,6 +6,7 @@ from requests import Response
 from requests.exceptions import HTTPError
 from requests.sessions import Session
 
+from apps.mdm.facets import device_facet_cache
 from apps.mdm.mdms import MDMAPIError, TinyMDM
 from apps.mdm.models import Device
 from apps.publish_mdm.etl.odk.constants import DEFAULT_COLLECT_SETTINGS
@@ -141,6 +142,7 @@ class TestTinyMDM(TestTinyMDMOnly):
         device_in_different_fleet,
         with_default_app_user,
         caplog,
+        mocker,
     ):
         """Ensures calling pull_devices() updates and creates Devices as expected."""
         if with_default_app_user:
@@ -178,9 +180,13 @@ class TestTinyMDM(TestTinyMDMOnly):
                 },
             )
 
+        mock_invalidate = mocker.spy(device_facet_cache, "invalidate")
         active_mdm = TinyMDM(fleet.organization)
         active_mdm.pull_devices(fleet)
 
+        # The bulk updates invalidate the cached device counts
+        mock_invalidate.assert_any_call(fleet.organization_id)
+
         # There should be 9 or 10 devices in the fleet now
         if device_in_different_fleet:
             assert fleet.devices.count() == 9
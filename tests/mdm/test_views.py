@@ -3,12 +3,13 @@ import json
 
 import pytest
 from django.contrib.messages import ERROR, SUCCESS, WARNING, Message
+from django.core.cache import cache
 from django.urls import reverse, reverse_lazy
 from django.utils.timezone import now
 from pytest_django.asserts import assertContains, assertMessages, assertRedirects
 
 from apps.mdm.forms import EnrollmentTokenCreateForm
-from apps.mdm.mdms import AndroidEnterprise
+from apps.mdm.mdms import AndroidEnterprise, enterprise_mdm_registry, get_active_mdm_instance
 from apps.mdm.models import (
     Device,
     DeviceSnapshot,
@@ -971,6 +972,78 @@ class TestAmapiNotificationsView(TestAndroidEnterpriseOnly):
         assert response.status_code == 204
         assert DeviceSnapshot.objects.count() == before
 
+    def test_mdm_instance_reused_across_notifications(
+        self, client, mocker, mock_notification_handler
+    ):
+        """The MDM instance for an enterprise is built once and reused for later
+        notifications.
+        """
+        mock_get_mdm = mocker.patch(
+            "apps.mdm.mdms.get_active_mdm_instance", wraps=get_active_mdm_instance
+        )
+        body = self.build_pubsub_body({"name": "enterprises/test/devices/abc"})
+        for _ in range(3):
+            response = self.post(client, body)
+            assert response.status_code == 204
+        mock_get_mdm.assert_called_once()
+        assert mock_notification_handler.call_count == 3
+
+    def test_mdm_instance_rebuilt_when_account_changes(
+        self, client, organization, mock_notification_handler
+    ):
+        """Changing the enterprise account invalidates the cached MDM instance."""
+        body = self.build_pubsub_body({"name": "enterprises/test/devices/abc"})
+        self.post(client, body)
+        mock_notification_handler.assert_called_once()
+        account = organization.android_enterprise
+        account.enterprise_name = "enterprises/other"
+        account.save()
+        mock_notification_handler.reset_mock()
+        # The old enterprise name no longer resolves to the organization
+        self.post(client, body)
+        mock_notification_handler.assert_not_called()
+        body = self.build_pubsub_body({"name": "enterprises/other/devices/abc"})
+        self.post(client, body)
+        mock_notification_handler.assert_called_once()
+
+    def test_mdm_instance_rebuilt_when_organization_mdm_changes(
+        self, client, organization, mock_notification_handler
+    ):
+        """Switching the organization to another MDM stops notifications from being
+        handled with the cached Android Enterprise instance.
+        """
+        body = self.build_pubsub_body({"name": "enterprises/test/devices/abc"})
+        self.post(client, body)
+        mock_notification_handler.assert_called_once()
+        organization.mdm = "TinyMDM"
+        organization.save()
+        mock_notification_handler.reset_mock()
+        self.post(client, body)
+        mock_notification_handler.assert_not_called()
+
+    def test_mdm_registry_version_shared_through_cache(self, organization):
+        """Bumping the registry version in the cache (e.g. from another process)
+        drops the cached instances.
+        """
+        mdm = enterprise_mdm_registry.get("enterprises/test")
+        assert enterprise_mdm_registry.get("enterprises/test").api is mdm.api
+        cache.incr(enterprise_mdm_registry.version_cache_key)
+        assert enterprise_mdm_registry.get("enterprises/test").api is not mdm.api
+
+    def test_mdm_registry_per_call_state(self, organization):
+        """Each call gets its own api_errors and api_usage, so concurrent
+        notifications don't clear or add to each other's.
+        """
+        first = enterprise_mdm_registry.get("enterprises/test")
+        first.api_errors.append("error")
+        first.api_usage.calls += 1
+        second = enterprise_mdm_registry.get("enterprises/test")
+        assert second is not first
+        assert second.api is first.api
+        assert second.api_errors == []
+        assert second.api_usage.calls == 0
+        assert first.api_errors == ["error"]
+
 
 # ---------------------------------------------------------------------------
 # _push_policy_to_mdm — Dagster integration
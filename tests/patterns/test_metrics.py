@@ -0,0 +1,71 @@
+from apps.patterns.metrics import LATENCY_BUCKETS, CallMetrics, CallStats
+
+
+def test_histogram_buckets():
+    stats = CallStats()
+    stats.observe(0.2)
+    stats.observe(3, error=True, retries=2)
+    assert (stats.count, stats.errors, stats.retries) == (2, 1, 2)
+    assert stats.seconds == 3.2
+    assert dict(zip(LATENCY_BUCKETS, stats.buckets, strict=True)) == {
+        0.05: 0,
+        0.1: 0,
+        0.25: 1,
+        0.5: 1,
+        1.0: 1,
+        2.5: 1,
+        5.0: 2,
+        10.0: 2,
+        30.0: 2,
+    }
+
+
+def test_render():
+    metrics = CallMetrics("test_api", "Test API", ("endpoint",))
+    metrics.observe(('say "hi"',), 0.5)
+    lines = metrics.render().splitlines()
+    assert "# TYPE test_api_requests_total counter" in lines
+    assert 'test_api_requests_total{endpoint="say \\"hi\\""} 1' in lines
+    assert 'test_api_request_duration_seconds_bucket{endpoint="say \\"hi\\"",le="0.25"} 0' in lines
+    assert 'test_api_request_duration_seconds_bucket{endpoint="say \\"hi\\"",le="0.5"} 1' in lines
+    assert 'test_api_request_duration_seconds_sum{endpoint="say \\"hi\\""} 0.500000' in lines
+
+
+def test_snapshot_is_a_copy():
+    metrics = CallMetrics("test_api", "Test API", ("endpoint",))
+    metrics.observe(("a",), 0.5)
+    snapshot = metrics.snapshot()
+    metrics.observe(("a",), 0.5)
+    assert snapshot[("a",)].count == 1
+    assert snapshot[("a",)].buckets[-1] == 1
+
+
+def test_shared_between_processes(mocker):
+    """render() includes the counters shared by the other processes."""
+    metrics = CallMetrics("test_shared_api", "Test API", ("endpoint",))
+    metrics.observe(("a",), 0.5)
+    mocker.patch("apps.patterns.metrics.os.getpid", return_value=-1)
+    metrics.share()
+    mocker.stopall()
+    # This process's own counters
+    metrics.reset()
+    metrics.observe(("a",), 2, error=True)
+    metrics.observe(("b",), 0.1)
+
+    snapshot = metrics.shared_snapshot()
+
+    assert (snapshot[("a",)].count, snapshot[("a",)].errors) == (2, 1)
+    assert snapshot[("a",)].seconds == 2.5
+    assert snapshot[("b",)].count == 1
+    assert 'test_shared_api_requests_total{endpoint="a"} 2' in metrics.render().splitlines()
+
+
+def test_share_only_changes(mocker):
+    metrics = CallMetrics("test_changes_api", "Test API", ("endpoint",))
+    mock_set = mocker.patch("apps.patterns.metrics.cache.set")
+    metrics.share()
+    mock_set.assert_not_called()
+    metrics.observe(("a",), 0.5)
+    metrics.share()
+    metrics.share()
+    assert mock_set.call_count == 2
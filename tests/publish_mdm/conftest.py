@@ -1,6 +1,7 @@
 import pytest
 
 from apps.infisical.api import InfisicalKMS
+from apps.publish_mdm.etl.google import clear_gspread_clients
 
 
 @pytest.fixture(autouse=True)
@@ -9,6 +10,21 @@ def disable_client_auth(mocker):
     mocker.patch("pyodk._utils.session.Auth.login")
 
 
+@pytest.fixture(autouse=True)
+def attachment_cache_dir(settings, tmp_path):
+    # Don't share downloaded attachments between tests
+    settings.ATTACHMENT_CACHE_DIR = tmp_path / "attachment-cache"
+    return settings.ATTACHMENT_CACHE_DIR
+
+
+@pytest.fixture(autouse=True)
+def reset_gspread_clients():
+    # Don't reuse Google Sheets clients (or mocks of them) between tests
+    clear_gspread_clients()
+    yield
+    clear_gspread_clients()
+
+
 @pytest.fixture(autouse=True)
 def disable_infisical_encryption(mocker):
     # Never attempt to encrypt/decrypt with Infisical
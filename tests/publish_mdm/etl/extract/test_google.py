@@ -1,13 +1,19 @@
 import pytest
+from gspread.utils import ExportFormat
 
 from apps.publish_mdm.etl.google import (
     download_user_google_sheet,
     export_sheet_by_url,
+    get_gspread_client,
+    get_sheet_revision,
     gspread_client,
 )
-from tests.publish_mdm.factories import FormTemplateFactory
+from tests.publish_mdm.factories import FormTemplateFactory, FormTemplateVersionFactory
 from tests.users.factories import SocialTokenFactory, UserFactory
 
+SHEET_URL = "https://docs.google.com/spreadsheets/d/1/edit"
+DRIVE_FILE_URL = "https://www.googleapis.com/drive/v3/files/1"
+
 
 class TestDownloadUserGoogleSheet:
     """Test the download of user Google Sheets."""
@@ -18,41 +24,79 @@ class TestDownloadUserGoogleSheet:
         assert gc.http_client.auth.token == "token"
         assert gc.http_client.auth.refresh_token == "token_secret"
 
+    def test_get_gspread_client_reused_per_user(self):
+        """One authorized client is kept per user's refresh token."""
+        gc = get_gspread_client(token="token", token_secret="token_secret")
+        assert get_gspread_client(token="new-token", token_secret="token_secret") is gc
+        assert get_gspread_client(token="token", token_secret="other_secret") is not gc
+
     def test_export_sheet_by_url(self, mocker):
         """Test the export of a Google Sheet by URL."""
         gc = gspread_client(token="token", token_secret="token_secret")
-        mock_open_by_url = mocker.patch.object(gc, "open_by_url", return_value=mocker.MagicMock())
-        mock_open_by_url.return_value.export.return_value = b"file content"
-        content = export_sheet_by_url(
-            gc=gc, sheet_url="https://docs.google.com/spreadsheets/d/1/edit"
-        )
+        mock_export = mocker.patch.object(gc, "export", return_value=b"file content")
+        content = export_sheet_by_url(gc=gc, sheet_url=SHEET_URL)
         assert content == b"file content"
+        mock_export.assert_called_once_with("1", format=ExportFormat.EXCEL)
+
+    def test_get_sheet_revision(self, requests_mock):
+        """The revision combines the file ID, Drive version and modified time."""
+        requests_mock.get(
+            DRIVE_FILE_URL, json={"version": "42", "modifiedTime": "2026-01-01T00:00:00.000Z"}
+        )
+        gc = gspread_client(token="token", token_secret="token_secret")
+        assert get_sheet_revision(gc=gc, sheet_url=SHEET_URL) == "1:42:2026-01-01T00:00:00.000Z"
+
+    def test_get_sheet_revision_error(self, requests_mock):
+        """An unknown revision is returned if the Drive metadata can't be fetched."""
+        requests_mock.get(
+            DRIVE_FILE_URL, status_code=500, json={"error": {"code": 500, "message": "Error"}}
+        )
+        gc = gspread_client(token="token", token_secret="token_secret")
+        assert get_sheet_revision(gc=gc, sheet_url=SHEET_URL) == ""
 
     def test_download_user_google_sheet(self, mocker):
         """Test the download of a user Google Sheet."""
         mock_gspread_client = mocker.patch("apps.publish_mdm.etl.google.gspread_client")
-        mock_gspread_client.return_value.open_by_url.return_value.export.return_value = (
-            b"file content"
-        )
+        mock_gspread_client.return_value.export.return_value = b"file content"
         downloaded_file = download_user_google_sheet(
             token="token",
             token_secret="token_secret",
-            sheet_url="https://docs.google.com/spreadsheets/d/1/edit",
+            sheet_url=SHEET_URL,
             name="mysheet.xlsx",
         )
         assert downloaded_file.name == "mysheet.xlsx"
         assert downloaded_file.read() == b"file content"
+        assert not downloaded_file.reused
+
+    def test_download_user_google_sheet_cached_content(self, mocker):
+        """The export is skipped when content for the current revision is available."""
+        mocker.patch("apps.publish_mdm.etl.google.get_sheet_revision", return_value="1:42:modified")
+        mock_gspread_client = mocker.patch("apps.publish_mdm.etl.google.gspread_client")
+        cached_content = mocker.Mock(return_value=b"cached content")
+        downloaded_file = download_user_google_sheet(
+            token="token",
+            token_secret="token_secret",
+            sheet_url=SHEET_URL,
+            name="mysheet.xlsx",
+            cached_content=cached_content,
+        )
+        cached_content.assert_called_once_with("1:42:modified")
+        mock_gspread_client.return_value.export.assert_not_called()
+        assert downloaded_file.read() == b"cached content"
+        assert downloaded_file.revision == "1:42:modified"
+        assert downloaded_file.reused
 
     def test_form_template_download_user_google_sheet(self, mocker):
         """Test the download of a user Google Sheet from a FormTemplate."""
         user = UserFactory.build()
         token = SocialTokenFactory.build(token="token", token_secret="token_secret")
-        form_template = FormTemplateFactory.build(form_id_base="staff_registration")
+        form_template = FormTemplateFactory.build(
+            form_id_base="staff_registration", template_url=SHEET_URL
+        )
         mocker.patch.object(user, "get_google_social_token", return_value=token)
+        mocker.patch.object(form_template, "get_template_content", return_value=None)
         mock_gspread_client = mocker.patch("apps.publish_mdm.etl.google.gspread_client")
-        mock_gspread_client.return_value.open_by_url.return_value.export.return_value = (
-            b"file content"
-        )
+        mock_gspread_client.return_value.export.return_value = b"file content"
         downloaded_file = form_template.download_user_google_sheet(user=user, name="mysheet.xlsx")
         assert downloaded_file.name == "mysheet.xlsx"
         assert downloaded_file.read() == b"file content"
@@ -64,3 +108,32 @@ class TestDownloadUserGoogleSheet:
         mocker.patch.object(user, "get_google_social_token", return_value=None)
         with pytest.raises(ValueError):
             form_template.download_user_google_sheet(user=user, name="mysheet.xlsx")
+
+    @pytest.mark.django_db
+    def test_form_template_reuses_unchanged_sheet(self, mocker):
+        """The previous version's file is reused if the sheet revision is unchanged."""
+        user = UserFactory()
+        token = SocialTokenFactory.build(token="token", token_secret="token_secret")
+        mocker.patch.object(user, "get_google_social_token", return_value=token)
+        version = FormTemplateVersionFactory(
+            form_template__template_url=SHEET_URL, sheet_revision="1:42:modified"
+        )
+        form_template = version.form_template
+        mock_gspread_client = mocker.patch("apps.publish_mdm.etl.google.gspread_client")
+        mock_get_sheet_revision = mocker.patch("apps.publish_mdm.etl.google.get_sheet_revision")
+        # Unchanged: the stored file is reused
+        mock_get_sheet_revision.return_value = "1:42:modified"
+        with version.file.open("rb") as f:
+            expected = f.read()
+        downloaded_file = form_template.download_user_google_sheet(user=user, name="next.xlsx")
+        assert downloaded_file.reused
+        assert downloaded_file.read() == expected
+        mock_gspread_client.return_value.export.assert_not_called()
+        # Changed: the sheet is exported again
+        mock_get_sheet_revision.return_value = "1:43:modified"
+        mock_gspread_client.return_value.export.return_value = b"new content"
+        downloaded_file = form_template.download_user_google_sheet(user=user, name="next.xlsx")
+        assert not downloaded_file.reused
+        assert downloaded_file.read() == b"new content"
+        assert downloaded_file.revision == "1:43:modified"
+        mock_gspread_client.assert_called_once()
@@ -1,9 +1,14 @@
 import pytest
 from requests.exceptions import HTTPError
 
-from apps.publish_mdm.etl.load import create_project, sync_central_project
-from apps.publish_mdm.models import AppUserFormTemplate
-from tests.publish_mdm.factories import CentralServerFactory
+from apps.publish_mdm.etl.load import PROJECT_SYNC_STEPS, create_project, sync_central_project
+from apps.publish_mdm.models import AppUser, AppUserFormTemplate
+from tests.publish_mdm.factories import (
+    AppUserFactory,
+    CentralServerFactory,
+    FormTemplateFactory,
+    ProjectFactory,
+)
 
 
 @pytest.mark.django_db
@@ -29,8 +34,12 @@ class TestCreateProject:
 class TestProjectSync:
     """Test the sync_central_project() function."""
 
-    def test_sync(self, requests_mock):
-        server = CentralServerFactory()
+    @pytest.fixture
+    def server(self):
+        return CentralServerFactory()
+
+    @pytest.fixture
+    def project_json(self, server, requests_mock):
         # Mock the ODK Central API request for getting a project
         project_json = {
             "id": 1,
@@ -39,6 +48,10 @@ class TestProjectSync:
             "createdAt": "2025-04-18T23:19:14.802Z",
         }
         requests_mock.get(f"{server.base_url}/v1/projects/1", json=project_json)
+        return project_json
+
+    @pytest.fixture
+    def users_json(self, server, requests_mock):
         # Mock the ODK Central API request for getting app users
         users_json = [
             {
@@ -73,6 +86,10 @@ class TestProjectSync:
             },
         ]
         requests_mock.get(f"{server.base_url}/v1/projects/1/app-users", json=users_json)
+        return users_json
+
+    @pytest.fixture
+    def forms_json(self, server, requests_mock):
         # Mock the ODK Central API request for getting forms
         forms_json = [
             {
@@ -111,8 +128,13 @@ class TestProjectSync:
             },
         ]
         requests_mock.get(f"{server.base_url}/v1/projects/1/forms", json=forms_json)
+        return forms_json
 
-        sync_central_project(server=server, project_id=1)
+    def test_sync(self, server, project_json, users_json, forms_json):
+        progress = []
+        result = sync_central_project(
+            server=server, project_id=1, progress=lambda *args: progress.append(args)
+        )
 
         # Ensure the database has the expected data
         # Project
@@ -142,3 +164,84 @@ class TestProjectSync:
             AppUserFormTemplate.objects.filter(app_user__central_id=users_json[1]["id"]).count()
             == 0
         )
+        # Summary and progress
+        assert result.project == project
+        assert result.summary() == {
+            "project_created": 1,
+            "app_users_created": 2,
+            "app_users_linked": 0,
+            "app_users_skipped": 0,
+            "form_templates_created": 2,
+            "app_user_forms_created": 2,
+        }
+        assert progress == [(step, PROJECT_SYNC_STEPS) for step in range(1, 5)]
+
+    def test_resync(
+        self, server, project_json, users_json, forms_json, django_assert_max_num_queries
+    ):
+        """Syncing again does not create any rows, in a fixed number of queries."""
+        sync_central_project(server=server, project_id=1)
+        with django_assert_max_num_queries(8):
+            result = sync_central_project(server=server, project_id=1)
+        assert result.summary() == {
+            "project_created": 0,
+            "app_users_created": 0,
+            "app_users_linked": 0,
+            "app_users_skipped": 0,
+            "form_templates_created": 0,
+            "app_user_forms_created": 0,
+        }
+        assert result.project.app_users.count() == 2
+        assert result.project.form_templates.count() == 2
+        assert AppUserFormTemplate.objects.count() == 2
+
+    def test_concurrent_sync(self, server, project_json, users_json, forms_json, mocker):
+        """App users created by another sync after the existing ones were loaded are
+        not counted as created.
+        """
+        bulk_update = AppUser.objects.bulk_update
+
+        def concurrent_bulk_update(objs, **kwargs):
+            project = server.projects.get()
+            AppUserFactory(project=project, name="10000", central_id=users_json[0]["id"])
+            return bulk_update(objs, **kwargs)
+
+        mocker.patch.object(AppUser.objects, "bulk_update", side_effect=concurrent_bulk_update)
+
+        result = sync_central_project(server=server, project_id=1)
+
+        assert result.summary()["app_users_created"] == 1
+        assert result.project.app_users.count() == 2
+
+    def test_existing_rows(self, server, project_json, users_json, forms_json):
+        """Existing app users are linked by name and existing form templates are
+        reused. An app user whose name is linked to another Central app user is skipped.
+        """
+        project = ProjectFactory(
+            central_id=project_json["id"],
+            central_server=server,
+            organization=server.organization,
+        )
+        unlinked = AppUserFactory(project=project, name="10000", central_id=None)
+        AppUserFactory(project=project, name="20000", central_id=99)
+        form_template = FormTemplateFactory(project=project, form_id_base="myform")
+
+        result = sync_central_project(server=server, project_id=1)
+
+        assert result.summary() == {
+            "project_created": 0,
+            "app_users_created": 0,
+            "app_users_linked": 1,
+            "app_users_skipped": 1,
+            "form_templates_created": 1,
+            "app_user_forms_created": 2,
+        }
+        unlinked.refresh_from_db()
+        assert unlinked.central_id == users_json[0]["id"]
+        assert set(
+            unlinked.app_user_forms.values_list("form_template__form_id_base", flat=True)
+        ) == {
+            "myform",
+            "otherform",
+        }
+        assert project.form_templates.filter(form_id_base="myform").get() == form_template
@@ -1,4 +1,6 @@
 import datetime as dt
+import os
+import shutil
 import tempfile
 
 import boto3
@@ -7,14 +9,18 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from gspread.utils import ExportFormat
 from moto import mock_aws
 
+from apps.publish_mdm.attachments import attachment_cache
 from apps.publish_mdm.etl.load import (
     PublishTemplateEvent,
     attachment_paths_for_upload,
     publish_form_template,
 )
 from apps.publish_mdm.etl.odk.publish import ProjectAppUserAssignment
+from apps.publish_mdm.etl.transform import RenderedFormFile
+from apps.publish_mdm.models import PublishRun
 from tests.publish_mdm.factories import (
     AppUserFormTemplateFactory,
+    AppUserFormVersionFactory,
     FormTemplateFactory,
     ProjectAttachmentFactory,
     ProjectFactory,
@@ -67,7 +73,11 @@ class TestPublishFormTemplate:
         )
         project = ProjectFactory(central_server__base_url="https://central", central_id=2)
         user = UserFactory()
-        form_template = FormTemplateFactory(project=project, form_id_base="staff_registration")
+        form_template = FormTemplateFactory(
+            project=project,
+            form_id_base="staff_registration",
+            template_url="https://docs.google.com/spreadsheets/d/1/edit",
+        )
         # Create 2 app users
         user_form1 = AppUserFormTemplateFactory(form_template=form_template, app_user__name="user1")
         user_form2 = AppUserFormTemplateFactory(form_template=form_template, app_user__name="user2")
@@ -78,9 +88,7 @@ class TestPublishFormTemplate:
         attachments = ProjectAttachmentFactory.create_batch(2, project=project)
         # Mock Gspread download
         mock_gspread_client = mocker.patch("apps.publish_mdm.etl.google.gspread_client")
-        mock_gspread_client.return_value.open_by_url.return_value.export.return_value = (
-            b"file content"
-        )
+        mock_gspread_client.return_value.export.return_value = b"file content"
         # Mock rendering the template
         mock_file = SimpleUploadedFile(
             "myform.xlsx", b"file content", content_type=ExportFormat.EXCEL
@@ -159,3 +167,277 @@ class TestPublishFormTemplate:
         )
         # `attachment_paths_for_upload` should be called once even if there are 2 app users
         mock_attachment_paths_for_upload.assert_called_once()
+        # The publish is recorded with the time spent in each stage
+        run = form_template.publish_runs.get()
+        assert run.status == PublishRun.Status.SUCCEEDED
+        assert run.user == user
+        assert run.template_version.version == "2025-02-01-v1"
+        assert run.finished_at is not None
+        assert (run.app_users, run.forms_published, run.forms_skipped) == (1, 1, 0)
+        assert run.timings["google.export"]["count"] == 1
+        assert run.timings["google.export"]["bytes"] == len(b"file content")
+        assert "storage.save_template" in run.timings
+        assert ("storage.attachments" in run.timings) == using_s3_storage
+
+    def test_unchanged_form_not_published(self, mocker):
+        """A form that is unchanged since the version still in ODK Central is not
+        uploaded again, and its previous file is reused.
+        """
+        project = ProjectFactory(central_server__base_url="https://central", central_id=2)
+        form_template = FormTemplateFactory(
+            project=project,
+            form_id_base="staff_registration",
+            template_url="https://docs.google.com/spreadsheets/d/1/edit",
+        )
+        user_form = AppUserFormTemplateFactory(form_template=form_template, app_user__name="user1")
+        previous = AppUserFormVersionFactory(
+            app_user_form_template=user_form,
+            form_template_version__form_template=form_template,
+            form_template_version__version="2025-01-01-v1",
+            content_digest="digest",
+        )
+        mock_gspread_client = mocker.patch("apps.publish_mdm.etl.google.gspread_client")
+        mock_gspread_client.return_value.export.return_value = b"file content"
+        mocker.patch(
+            "apps.publish_mdm.etl.transform.render_template_for_app_user",
+            return_value=RenderedFormFile("myform.xlsx", b"new content", digest="digest"),
+        )
+        mocker.patch(
+            "apps.publish_mdm.etl.odk.publish.PublishService.get_unique_version_by_form_id",
+            return_value="2025-02-01-v1",
+        )
+        mocker.patch(
+            "apps.publish_mdm.etl.odk.publish.PublishService.get_or_create_app_users",
+            return_value={
+                "user1": ProjectAppUserAssignment(
+                    projectId=project.central_id,
+                    id=user_form.app_user.central_id,
+                    type="field_key",
+                    displayName="user1",
+                    createdAt=dt.datetime.now(),
+                    updatedAt=None,
+                    deletedAt=None,
+                    token="token1",
+                )
+            },
+        )
+        mocker.patch(
+            "apps.publish_mdm.etl.odk.publish.PublishService.get_forms",
+            return_value={"staff_registration_user1": mocker.Mock(version="2025-01-01-v1")},
+        )
+        mock_create_or_update_form = mocker.patch(
+            "apps.publish_mdm.etl.odk.publish.PublishService.create_or_update_form"
+        )
+        mock_assign_app_users_forms = mocker.patch(
+            "apps.publish_mdm.etl.odk.publish.PublishService.assign_app_users_forms"
+        )
+        messages = []
+
+        publish_form_template(
+            event=PublishTemplateEvent(form_template=form_template.id, app_users=["user1"]),
+            user=UserFactory(),
+            send_message=lambda message, complete=False: messages.append(message),
+        )
+
+        mock_create_or_update_form.assert_not_called()
+        mock_assign_app_users_forms.assert_called_once()
+        assert "Form unchanged, skipped publishing: staff_registration_user1" in messages
+        version = user_form.app_user_form_template_versions.latest("created_at")
+        assert version.form_template_version.version == "2025-02-01-v1"
+        assert version.file.name == previous.file.name
+        run = form_template.publish_runs.get()
+        assert (run.forms_published, run.forms_skipped) == (0, 1)
+        # The timings summary is sent before the final message
+        assert messages[-2].startswith("Timings: google.sheet_revision ")
+        assert messages[-1] == "Successfully published 2025-02-01-v1"
+
+    def test_unchanged_form_published_three_times(self, mocker):
+        """An unchanged form is only uploaded the first time. Once ODK Central has
+        another version, it is uploaded with the new version number, not the earlier
+        one in the reused file.
+        """
+        project = ProjectFactory(central_server__base_url="https://central", central_id=2)
+        form_template = FormTemplateFactory(
+            project=project,
+            form_id_base="staff_registration",
+            template_url="https://docs.google.com/spreadsheets/d/1/edit",
+        )
+        user_form = AppUserFormTemplateFactory(form_template=form_template, app_user__name="user1")
+        mock_gspread_client = mocker.patch("apps.publish_mdm.etl.google.gspread_client")
+        mock_gspread_client.return_value.export.return_value = b"file content"
+        mocker.patch(
+            "apps.publish_mdm.etl.transform.render_template_for_app_user",
+            side_effect=lambda app_user, template_version, attachments=None: RenderedFormFile(
+                "myform.xlsx", template_version.version.encode(), digest="digest"
+            ),
+        )
+        mocker.patch(
+            "apps.publish_mdm.etl.odk.publish.PublishService.get_unique_version_by_form_id",
+            side_effect=[f"2025-01-0{day}-v1" for day in range(1, 5)],
+        )
+        mocker.patch(
+            "apps.publish_mdm.etl.odk.publish.PublishService.get_or_create_app_users",
+            side_effect=lambda display_names: {
+                "user1": ProjectAppUserAssignment(
+                    projectId=project.central_id,
+                    id=user_form.app_user.central_id,
+                    type="field_key",
+                    displayName="user1",
+                    createdAt=dt.datetime.now(),
+                    updatedAt=None,
+                    deletedAt=None,
+                    token="token1",
+                )
+            },
+        )
+        # The forms in ODK Central, with the version in the uploaded file
+        central_forms = {}
+
+        def create_or_update_form(xml_form_id, definition, attachments):
+            central_forms[xml_form_id] = mocker.Mock(version=definition.decode())
+            return mocker.Mock(xmlFormId=xml_form_id)
+
+        mocker.patch(
+            "apps.publish_mdm.etl.odk.publish.PublishService.get_forms",
+            side_effect=lambda: dict(central_forms),
+        )
+        mocker.patch(
+            "apps.publish_mdm.etl.odk.publish.PublishService.create_or_update_form",
+            side_effect=create_or_update_form,
+        )
+        mocker.patch("apps.publish_mdm.etl.odk.publish.PublishService.assign_app_users_forms")
+
+        def publish():
+            publish_form_template(
+                event=PublishTemplateEvent(form_template=form_template.id, app_users=["user1"]),
+                user=UserFactory(),
+                send_message=self.send_message,
+            )
+            run = form_template.publish_runs.latest("created_at")
+            return run.forms_published, run.forms_skipped
+
+        assert [publish() for _ in range(3)] == [(1, 0), (0, 1), (0, 1)]
+        assert central_forms["staff_registration_user1"].version == "2025-01-01-v1"
+        # Another version was published to ODK Central in the meantime
+        central_forms["staff_registration_user1"].version = "other"
+        assert publish() == (1, 0)
+        assert central_forms["staff_registration_user1"].version == "2025-01-04-v1"
+        version = user_form.app_user_form_template_versions.latest("created_at")
+        assert version.file.read() == b"2025-01-04-v1"
+
+    def test_failed_run(self, mocker):
+        """A failed publish is recorded without its rolled back template version."""
+        form_template = FormTemplateFactory(
+            project__central_server__base_url="https://central",
+            template_url="https://docs.google.com/spreadsheets/d/1/edit",
+        )
+        AppUserFormTemplateFactory(form_template=form_template)
+        mock_gspread_client = mocker.patch("apps.publish_mdm.etl.google.gspread_client")
+        mock_gspread_client.return_value.export.return_value = b"file content"
+        mocker.patch(
+            "apps.publish_mdm.etl.transform.render_template_for_app_user",
+            return_value=RenderedFormFile("myform.xlsx", b"new content", digest="digest"),
+        )
+        mocker.patch(
+            "apps.publish_mdm.etl.odk.publish.PublishService.get_unique_version_by_form_id",
+            return_value="2025-02-01-v1",
+        )
+        mocker.patch(
+            "apps.publish_mdm.etl.odk.publish.PublishService.get_or_create_app_users",
+            side_effect=ValueError("Central is down"),
+        )
+
+        with pytest.raises(ValueError, match="Central is down"):
+            publish_form_template(
+                event=PublishTemplateEvent(form_template=form_template.id, app_users=[]),
+                user=UserFactory(),
+                send_message=self.send_message,
+            )
+
+        run = form_template.publish_runs.get()
+        assert run.status == PublishRun.Status.FAILED
+        assert run.template_version is None
+        assert run.finished_at is not None
+        assert run.app_users == 1
+        assert "google.export" in run.timings
+        assert not form_template.versions.exists()
+
+
+@pytest.mark.parametrize("s3_storage", [True], indirect=True)
+class TestAttachmentPathsForUpload:
+    """Test attachment_paths_for_upload() with S3 storage and the attachment cache."""
+
+    @pytest.fixture
+    def attachments(self, s3_storage):
+        project = ProjectFactory()
+        return {
+            name: ProjectAttachmentFactory(
+                project=project, name=name, file=SimpleUploadedFile(name, content)
+            ).file
+            for name, content in [("a.csv", b"a" * 10), ("b.csv", b"b" * 20)]
+        }
+
+    def test_paths(self, attachments, attachment_cache_dir):
+        """The attachments are cached and linked into a temp directory with their names."""
+        with attachment_paths_for_upload(attachments) as paths:
+            assert [path.name for path in paths] == ["a.csv", "b.csv"]
+            assert [path.read_bytes() for path in paths] == [b"a" * 10, b"b" * 20]
+            assert paths[0].is_relative_to(tempfile.gettempdir())
+            assert not paths[0].is_relative_to(attachment_cache_dir)
+            temp_dir = paths[0].parent
+        assert not temp_dir.exists()
+        assert len(list(attachment_cache_dir.iterdir())) == 2
+
+    def test_reused(self, attachments):
+        """Cached attachments are not downloaded again."""
+        with attachment_paths_for_upload(attachments):
+            pass
+        cached_path = attachment_cache.get_path("a.csv", attachments["a.csv"])
+        cached_path.write_bytes(b"cached")
+        with attachment_paths_for_upload(attachments) as paths:
+            assert paths[0].read_bytes() == b"cached"
+
+    def test_evicted_before_link(self, attachments, mocker):
+        """An entry evicted by another process before it is linked is downloaded again."""
+        cached_path = attachment_cache.get_path("a.csv", attachments["a.csv"])
+        link = attachment_cache.link
+        linked = []
+
+        def evicting_link(path, directory, name=None):
+            if not linked:
+                shutil.rmtree(path.parent)
+            linked.append(path)
+            return link(path, directory, name)
+
+        mocker.patch.object(attachment_cache, "link", side_effect=evicting_link)
+        with attachment_paths_for_upload({"a.csv": attachments["a.csv"]}) as paths:
+            assert paths[0].read_bytes() == b"a" * 10
+        assert len(linked) == 2
+        assert cached_path.read_bytes() == b"a" * 10
+
+    def test_changed_file(self, attachments):
+        """A file that was changed in storage gets a new cache entry."""
+        file = attachments["a.csv"]
+        old_path = attachment_cache.get_path("a.csv", file)
+        file.storage.delete(file.name)
+        file.storage.save(file.name, SimpleUploadedFile(file.name, b"changed"))
+        new_path = attachment_cache.get_path("a.csv", file)
+        assert new_path != old_path
+        assert new_path.read_bytes() == b"changed"
+
+    def test_eviction(self, attachments, settings, attachment_cache_dir):
+        """The least recently used entries are evicted past the maximum size,
+        except the ones being used.
+        """
+        settings.ATTACHMENT_CACHE_MAX_SIZE = 25
+        a_path = attachment_cache.get_path("a.csv", attachments["a.csv"])
+        os.utime(a_path.parent, (0, 0))
+        with attachment_paths_for_upload({"b.csv": attachments["b.csv"]}) as paths:
+            assert paths[0].read_bytes() == b"b" * 20
+        assert not a_path.exists()
+        assert len(list(attachment_cache_dir.iterdir())) == 1
+        # Entries in use are kept even if the cache is too large
+        settings.ATTACHMENT_CACHE_MAX_SIZE = 0
+        with attachment_paths_for_upload(attachments) as paths:
+            assert [path.read_bytes() for path in paths] == [b"a" * 10, b"b" * 20]
+        assert len(list(attachment_cache_dir.iterdir())) == 2
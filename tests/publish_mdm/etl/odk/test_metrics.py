@@ -0,0 +1,101 @@
+import pytest
+from requests.exceptions import ConnectionError
+
+from apps.publish_mdm.etl.odk.client import PublishMDMClient
+from apps.publish_mdm.etl.odk.metrics import (
+    central_api_metrics,
+    endpoint_template,
+    track_central_calls,
+)
+from tests.publish_mdm.factories import CentralServerFactory
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    central_api_metrics.reset()
+    yield
+    central_api_metrics.reset()
+
+
+@pytest.fixture
+def odk_client():
+    central_server = CentralServerFactory.build(id=1, base_url="https://central")
+    with PublishMDMClient(central_server=central_server, project_id=1) as client:
+        yield client
+
+
+@pytest.mark.parametrize(
+    ("url", "endpoint"),
+    [
+        ("https://central/v1/projects/1/app-users", "projects/{id}/app-users"),
+        ("https://central/v1/users/current", "users/current"),
+        (
+            "https://central/v1/projects/1/forms/survey_user1/draft/attachments/logo.png",
+            "projects/{id}/forms/{xmlFormId}/draft/attachments/{filename}",
+        ),
+        (
+            "https://central/v1/projects/12/forms/survey_user1/assignments/2?x=1",
+            "projects/{id}/forms/{xmlFormId}/assignments/{id}",
+        ),
+        ("https://central/v1/projects/1/forms?publish=true", "projects/{id}/forms"),
+    ],
+)
+def test_endpoint_template(url, endpoint):
+    assert endpoint_template(url) == endpoint
+
+
+class TestSessionMetrics:
+    def test_calls_recorded(self, requests_mock, odk_client):
+        requests_mock.get("https://central/v1/projects/1/forms", json=[])
+        requests_mock.get("https://central/v1/projects/2/forms", status_code=404)
+        with track_central_calls("test") as calls:
+            odk_client.get("projects/1/forms")
+            odk_client.get("projects/1/forms")
+            odk_client.get("projects/2/forms")
+        assert calls.count == 3
+        assert calls.calls == {("GET", "projects/{id}/forms"): 3}
+        assert calls.errors == 1
+        stats = central_api_metrics.snapshot()[("GET", "projects/{id}/forms")]
+        assert (stats.count, stats.errors, stats.retries) == (3, 1, 0)
+
+    def test_connection_error(self, requests_mock, odk_client):
+        requests_mock.get("https://central/v1/projects/1/forms", exc=ConnectionError)
+        with track_central_calls("test") as calls, pytest.raises(ConnectionError):
+            odk_client.get("projects/1/forms")
+        assert (calls.count, calls.errors) == (1, 1)
+
+    def test_nested_operations(self, requests_mock, odk_client):
+        requests_mock.get("https://central/v1/projects/1/forms", json=[])
+        with track_central_calls("outer") as outer:
+            odk_client.get("projects/1/forms")
+            with track_central_calls("inner") as inner:
+                odk_client.get("projects/1/forms")
+        assert (outer.count, inner.count) == (2, 1)
+
+    def test_budget(self, requests_mock, odk_client, settings, mocker):
+        settings.CENTRAL_API_CALL_BUDGET = 1
+        mock_logger = mocker.patch("apps.publish_mdm.etl.odk.metrics.logger")
+        requests_mock.get("https://central/v1/projects/1/forms", json=[])
+        with track_central_calls("test") as calls:
+            odk_client.get("projects/1/forms")
+        assert not calls.over_budget
+        mock_logger.warning.assert_not_called()
+        with track_central_calls("test") as calls:
+            odk_client.get("projects/1/forms")
+            odk_client.get("projects/1/forms")
+        assert calls.over_budget
+        mock_logger.warning.assert_called_once()
+        assert mock_logger.warning.call_args.kwargs["calls"] == 2
+
+    def test_render(self, requests_mock, odk_client):
+        requests_mock.get("https://central/v1/projects/1/forms", json=[])
+        odk_client.get("projects/1/forms")
+        text = central_api_metrics.render()
+        labels = 'method="GET",endpoint="projects/{id}/forms"'
+        assert f"publish_mdm_central_api_requests_total{{{labels}}} 1\n" in text
+        assert f"publish_mdm_central_api_errors_total{{{labels}}} 0\n" in text
+        assert (
+            f'publish_mdm_central_api_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1\n'
+            in text
+        )
+        assert f"publish_mdm_central_api_request_duration_seconds_count{{{labels}}} 1\n" in text
@@ -1,9 +1,19 @@
+import io
+
 import pytest
 from django.conf import settings
+from PIL import Image
 
+from apps.publish_mdm.etl import load
 from apps.publish_mdm.etl.load import generate_and_save_app_user_collect_qrcodes
 from apps.publish_mdm.etl.odk.publish import ProjectAppUserAssignment
-from apps.publish_mdm.etl.odk.qrcode import build_collect_settings, create_app_user_qrcode
+from apps.publish_mdm.etl.odk.qrcode import (
+    build_collect_settings,
+    collect_settings_hash,
+    create_app_user_qrcode,
+    get_label_font,
+    render_labeled_qrcode,
+)
 from tests.publish_mdm.factories import AppUserFactory, ProjectFactory
 
 
@@ -99,3 +109,118 @@ class TestCollectSettings:
         generate_and_save_app_user_collect_qrcodes(project, app_users=[db_app_user])
 
         mock_create_app_user_qrcode.assert_called_once()
+
+    def test_build_collect_settings_does_not_share_state(self, app_user):
+        """Settings built for one app user are not changed by building another's."""
+        kwargs = {"base_url": "https://central", "project_id": 1, "project_name_prefix": "P"}
+        first = build_collect_settings(app_user=app_user, admin_pw="pw1", **kwargs)
+        other_user = app_user.model_copy(update={"displayName": "20000", "token": "token2"})
+        build_collect_settings(app_user=other_user, admin_pw="pw2", **kwargs)
+
+        assert first["general"]["username"] == "10000"
+        assert first["admin"]["admin_pw"] == "pw1"
+
+    def test_collect_settings_hash(self):
+        """The hash does not depend on key order."""
+        assert collect_settings_hash({"a": 1, "b": {"c": 2, "d": 3}}) == collect_settings_hash(
+            {"b": {"d": 3, "c": 2}, "a": 1}
+        )
+        assert collect_settings_hash({"a": 1}) != collect_settings_hash({"a": 2})
+
+    def test_render_labeled_qrcode(self):
+        """The QR code is rendered with a 30px strip below it for the label, and the
+        label font is only loaded once.
+        """
+        get_label_font.cache_clear()
+        first = Image.open(io.BytesIO(render_labeled_qrcode(b"data", "user-en")))
+        render_labeled_qrcode(b"other data", "other-en")
+
+        assert first.format == "PNG"
+        assert first.mode == "RGB"
+        # Version 1 QR code: (21 modules + 2 * 4 border) * 4 scale
+        assert first.size == (116, 116 + 30)
+        assert get_label_font.cache_info().misses == 1
+
+    @pytest.fixture
+    def central_app_users(self, mocker):
+        """Mock the Central API to return an app user for every requested name."""
+
+        def get_or_create_app_users(display_names, **kwargs):
+            return {
+                name: ProjectAppUserAssignment(
+                    projectId=1,
+                    id=i,
+                    type=None,
+                    displayName=name,
+                    createdAt="2025-01-07T14:18:37.300Z",
+                    updatedAt=None,
+                    deletedAt=None,
+                    token=f"token-{name}",
+                )
+                for i, name in enumerate(display_names)
+            }
+
+        return mocker.patch(
+            "apps.publish_mdm.etl.odk.publish.PublishService.get_or_create_app_users",
+            side_effect=get_or_create_app_users,
+        )
+
+    @pytest.mark.django_db
+    def test_unchanged_qrcodes_are_skipped(self, central_app_users, mocker):
+        """App users whose QR code was built from the same settings are skipped."""
+        project = ProjectFactory(central_server__base_url="https://central")
+        AppUserFactory.create_batch(3, project=project)
+        generate_and_save_app_user_collect_qrcodes(project)
+        # Clear one app user's QR code data, so its settings no longer match
+        changed_app_user = project.app_users.first()
+        changed_app_user.qr_code_data = None
+        changed_app_user.save()
+        mock_create_app_user_qrcode = mocker.patch(
+            "apps.publish_mdm.etl.load.create_app_user_qrcode", wraps=create_app_user_qrcode
+        )
+        progress = mocker.Mock()
+
+        summary = generate_and_save_app_user_collect_qrcodes(project, progress=progress)
+
+        assert summary == {"generated": 1, "skipped": 2}
+        mock_create_app_user_qrcode.assert_called_once()
+        assert mock_create_app_user_qrcode.call_args.kwargs["app_user"].displayName == (
+            changed_app_user.name
+        )
+        assert progress.call_args_list == [mocker.call(2, 3), mocker.call(3, 3)]
+        changed_app_user.refresh_from_db()
+        assert changed_app_user.qr_code_data is not None
+
+    @pytest.mark.django_db
+    def test_process_pool(self, central_app_users, mocker, monkeypatch):
+        """Large batches are rendered in a process pool and all QR codes are saved."""
+        monkeypatch.setattr(load, "QR_CODE_POOL_MIN_SIZE", 2)
+        project = ProjectFactory(central_server__base_url="https://central")
+        app_users = AppUserFactory.create_batch(3, project=project)
+        progress = mocker.Mock()
+
+        summary = generate_and_save_app_user_collect_qrcodes(
+            project, progress=progress, parallel=True, max_workers=2
+        )
+
+        assert summary == {"generated": 3, "skipped": 0}
+        assert progress.call_count == 3
+        for app_user in app_users:
+            app_user.refresh_from_db()
+            assert app_user.qr_code.read()[:4] == b"\x89PNG"
+            assert app_user.qr_code_data["general"]["username"] == app_user.name
+
+    @pytest.mark.django_db
+    def test_no_process_pool_by_default(self, central_app_users, mocker, monkeypatch):
+        """Without parallel=True (e.g. in a web request), large batches are rendered
+        one by one in the current process.
+        """
+        monkeypatch.setattr(load, "QR_CODE_POOL_MIN_SIZE", 2)
+        mock_pool = mocker.patch.object(load, "ProcessPoolExecutor")
+        project = ProjectFactory(central_server__base_url="https://central")
+        AppUserFactory.create_batch(3, project=project)
+
+        summary = generate_and_save_app_user_collect_qrcodes(project)
+
+        assert summary == {"generated": 3, "skipped": 0}
+        mock_pool.assert_not_called()
@@ -0,0 +1,71 @@
+import pytest
+
+from apps.publish_mdm.etl.tracing import PublishTrace, publish_transaction, span
+
+
+class TestSpan:
+    def test_recorded_in_trace(self):
+        with publish_transaction("test") as trace:
+            with span("google.export") as data:
+                data["bytes"] = 100
+            for _ in range(2):
+                with span("transform.render"):
+                    pass
+        assert list(trace.stages) == ["google.export", "transform.render"]
+        assert trace.stages["google.export"].count == 1
+        assert trace.stages["google.export"].bytes == 100
+        assert trace.stages["transform.render"].count == 2
+        assert trace.stages["transform.render"].bytes == 0
+
+    def test_recorded_on_error(self):
+        with (
+            publish_transaction("test") as trace,
+            pytest.raises(ValueError),
+            span("central.app_users"),
+        ):
+            raise ValueError
+        assert trace.stages["central.app_users"].count == 1
+
+    def test_decorator(self):
+        @span("transform.render")
+        def render():
+            return "form"
+
+        with publish_transaction("test") as trace:
+            assert render() == "form"
+            assert render() == "form"
+        assert trace.stages["transform.render"].count == 2
+
+    def test_without_trace(self):
+        """Spans outside a publish are not recorded anywhere."""
+        with span("google.export") as data:
+            data["bytes"] = 100
+        with publish_transaction("test") as trace:
+            pass
+        assert trace.stages == {}
+
+    def test_nested_transactions(self):
+        with publish_transaction("outer") as outer:
+            with publish_transaction("inner") as inner, span("inner"):
+                pass
+            with span("outer"):
+                pass
+        assert list(outer.stages) == ["outer"]
+        assert list(inner.stages) == ["inner"]
+
+
+class TestPublishTrace:
+    def test_as_dict(self):
+        trace = PublishTrace()
+        trace.add("google.export", 1.23456, bytes=2048)
+        trace.add("google.export", 1, bytes=1024)
+        assert trace.as_dict() == {
+            "google.export": {"count": 2, "seconds": 2.235, "bytes": 3072},
+        }
+
+    def test_summary(self):
+        trace = PublishTrace()
+        trace.add("google.export", 1.5, bytes=2048)
+        trace.add("transform.render", 0.25)
+        trace.add("transform.render", 0.25)
+        assert trace.summary() == "google.export 1.50s, 2.0\xa0KB; transform.render 0.50s (2x)"
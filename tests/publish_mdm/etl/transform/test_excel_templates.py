@@ -1,4 +1,5 @@
 import hashlib
+import json
 import re
 from pathlib import Path
 
@@ -6,10 +7,17 @@ import pytest
 from openpyxl import Workbook, load_workbook
 from openpyxl.worksheet.worksheet import Worksheet
 
-from apps.publish_mdm.etl.excel import get_column_cell_by_value, get_header
+from apps.publish_mdm.etl.excel import (
+    SheetIndex,
+    find_cells_containing_value,
+    get_column_cell_by_value,
+    get_header,
+)
 from apps.publish_mdm.etl.template import (
+    EntityReferencePlan,
     TemplateVariable,
     VariableTransform,
+    analyze_entity_references,
     build_entity_list_mapping,
     discover_entity_lists,
     set_survey_attachments,
@@ -17,6 +25,7 @@ from apps.publish_mdm.etl.template import (
     update_entity_references,
     update_setting_variables,
 )
+from apps.publish_mdm.etl.transform import form_content_digest
 from tests.publish_mdm.factories import ProjectAttachmentFactory, ProjectFactory
 
 
@@ -60,6 +69,54 @@ class TestExcelHelpers:
         assert cell is None
 
 
+class TestSheetIndex:
+    @pytest.fixture
+    def sheet(self) -> Worksheet:
+        return load_workbook(Path(__file__).parent / "ODK XLSForm Template.xlsx")["survey"]
+
+    @pytest.mark.parametrize("column_name", ["type", "name", "calculation", "not a column"])
+    def test_header(self, sheet, column_name):
+        """Headers are the same as found by get_header()."""
+        index = SheetIndex(sheet)
+        assert index.header(column_name) == get_header(sheet=sheet, column_name=column_name)
+
+    @pytest.mark.parametrize("value", ["fruit", "color", "not a value"])
+    def test_column_cell(self, sheet, value):
+        """Cells are the same as found by get_column_cell_by_value()."""
+        index = SheetIndex(sheet)
+        name_header = index.header("name")
+        assert index.column_cell(name_header, value) == get_column_cell_by_value(
+            column_header=name_header, value=value
+        )
+
+    @pytest.mark.parametrize("value", ["fruit", "_APP_USER", "csv", "not a value"])
+    def test_find_containing(self, sheet, value):
+        """Cells are the same as found by find_cells_containing_value(), in order."""
+        index = SheetIndex(sheet)
+        assert list(index.find_containing(value)) == list(
+            find_cells_containing_value(sheet=sheet, value=value)
+        )
+
+    def test_search(self, sheet):
+        """Regular expressions are matched against each value, optionally only at the start."""
+        sheet["B2"] = "fruit_list"
+        sheet["B3"] = "my_fruit"
+        index = SheetIndex(sheet)
+        column = index.header("name").column
+        found = [cell.coordinate for cell in index.search(r"fruit\w*", column=column)]
+        assert found[:2] == ["B2", "B3"]
+        found = [cell.coordinate for cell in index.search("fruit", column=column, anchored=True)]
+        assert "B2" in found
+        assert "B3" not in found
+
+    def test_changed_cells(self, sheet):
+        """Cells that no longer match since the index was built are not returned."""
+        index = SheetIndex(sheet)
+        cells = list(index.find_containing("fruit"))
+        cells[0].value = "changed"
+        assert list(index.find_containing("fruit")) == cells[1:]
+
+
 class TestTemplate:
     def test_set_template_variable(self, survey_sheet):
         """Test setting a single template variable."""
@@ -172,3 +229,117 @@ class TestEntityReferences:
         assert (
             survey_sheet["K5"].value == "instance('fruits')/root/item[name=${fruits_entity}]/color"
         )
+
+
+class TestEntityReferencePlan:
+    @pytest.fixture
+    def workbook(self) -> Workbook:
+        return load_workbook(Path(__file__).parent / "ODK XLSForm Template.xlsx")
+
+    def test_analyze(self, workbook):
+        """Only cells that reference app user entity lists are in the plan."""
+        plan = analyze_entity_references(workbook)
+        coordinates = {(cell.sheet, cell.coordinate) for cell in plan.cells}
+        assert ("survey", "A8") in coordinates
+        assert ("survey", "K10") in coordinates
+        assert ("survey", "A4") not in coordinates
+        assert ("entities", "A2") not in coordinates
+        # Every cell in the plan has at least one reference
+        assert all(cell.spans for cell in plan.cells)
+
+    def test_patches(self, workbook):
+        """The patches only depend on the plan and the app user name."""
+        plan = analyze_entity_references(workbook)
+        patches = plan.patches(app_user="11030")
+        assert patches[("survey", "A8")] == "select_one_from_file cats_11030.csv"
+        assert all("_APP_USER" not in value for value in patches.values())
+
+    def test_apply(self, workbook):
+        plan = analyze_entity_references(workbook)
+        plan.apply(workbook, app_user="11030")
+        survey_sheet = workbook["survey"]
+        assert survey_sheet["A8"].value == "select_one_from_file cats_11030.csv"
+        assert (
+            survey_sheet["K10"].value
+            == "instance('cats_11030')/root/item[name=${cats_entity}]/color"
+        )
+        # Project-wide entity list names are unchanged
+        assert survey_sheet["A4"].value == "select_one_from_file fruits.csv"
+        assert workbook["entities"]["A2"].value == "fruits"
+
+    def test_stored_plan(self, workbook):
+        """The plan can be stored as JSON and applied without the original workbook."""
+        data = analyze_entity_references(workbook).model_dump(mode="json")
+        plan = EntityReferencePlan.model_validate(json.loads(json.dumps(data)))
+        plan.apply(workbook, app_user="11030")
+        assert workbook["survey"]["A8"].value == "select_one_from_file cats_11030.csv"
+
+    def test_changed_cell(self, workbook):
+        """A cell changed since the template was analyzed is searched again."""
+        plan = analyze_entity_references(workbook)
+        workbook["survey"]["A8"] = "select_one_from_file dogs_APP_USER.csv"
+        plan.apply(workbook, app_user="11030")
+        assert workbook["survey"]["A8"].value == "select_one_from_file dogs_11030.csv"
+
+    def test_changed_cells(self, workbook):
+        """Changed cells outside the plan, like filled in template variables, are searched."""
+        plan = analyze_entity_references(workbook)
+        cell = workbook["survey"]["K2"]
+        cell.value = "pulldata('pets_APP_USER', 'name', 'id', '1')"
+        plan.apply(workbook, app_user="11030", changed=[cell])
+        assert cell.value == "pulldata('pets_11030', 'name', 'id', '1')"
+
+    def test_first_reference_of_each_kind(self):
+        """Only the first reference of each kind in a cell is discovered."""
+        workbook = Workbook()
+        survey = workbook.active
+        survey.title = "survey"
+        survey.append(["calculation"])
+        survey.append(["instance('cats')/root/item + instance('dogs')/root/item"])
+        assert analyze_entity_references(workbook).entity_lists == ["cats"]
+
+    @pytest.mark.parametrize(
+        "value, expected",
+        [
+            ("pulldata('cats_APP_USER', 'name')", "pulldata('cats_11030', 'name')"),
+            ("big_cats_APP_USER.csv", "big_cats_11030.csv"),
+            ("cats_APP_USER.csv cats_APP_USER.csv", "cats_11030.csv cats_11030.csv"),
+            ("cats_APP_USER", "cats_APP_USER"),
+        ],
+    )
+    def test_cell_references(self, value, expected):
+        workbook = Workbook()
+        survey = workbook.active
+        survey.title = "survey"
+        survey.append(["type", "calculation"])
+        survey.append(["select_one_from_file big_cats_APP_USER.csv", value])
+        survey.append(["select_one_from_file cats_APP_USER.csv", ""])
+        plan = analyze_entity_references(workbook)
+        plan.apply(workbook, app_user="11030")
+        assert survey["B2"].value == expected
+
+
+class TestFormContentDigest:
+    @pytest.fixture
+    def workbook(self):
+        # A copy that can be modified
+        return load_workbook(Path(__file__).parent / "ODK XLSForm Template.xlsx")
+
+    def test_excluded_cells(self, workbook):
+        """The digest changes with the content, except in the excluded cells."""
+        version_cell = workbook["settings"]["C2"]
+        digest = form_content_digest(workbook, exclude=[version_cell])
+        version_cell.value = "2025-01-01-v2"
+        assert form_content_digest(workbook, exclude=[version_cell]) == digest
+        assert form_content_digest(workbook) != digest
+        workbook["survey"]["B2"].value = "changed"
+        assert form_content_digest(workbook, exclude=[version_cell]) != digest
+
+    def test_attachments(self, workbook, mocker):
+        """The digest changes when an attachment is replaced by a new file."""
+        file, new_file = mocker.Mock(), mocker.Mock()
+        file.name = "project/1/attachment/a.csv"
+        new_file.name = "project/1/attachment/a_1Xz9.csv"
+        digest = form_content_digest(workbook, {"a.csv": file})
+        assert form_content_digest(workbook, {"a.csv": file}) == digest
+        assert form_content_digest(workbook, {"a.csv": new_file}) != digest
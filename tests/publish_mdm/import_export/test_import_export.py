@@ -1,4 +1,8 @@
 import pytest
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from import_export.tmp_storages import MediaStorage
 from tablib import Dataset
 
 from apps.mdm.mdms import get_active_mdm_class
@@ -6,7 +10,7 @@ from apps.publish_mdm import import_export, models
 from apps.publish_mdm.etl.load import update_app_users_central_id
 from apps.publish_mdm.etl.odk.publish import ProjectAppUserAssignment
 from tests.mdm import TestAllMDMsNoAutouse
-from tests.mdm.factories import DeviceFactory
+from tests.mdm.factories import DeviceFactory, FleetFactory
 from tests.publish_mdm.factories import (
     AppUserFactory,
     CentralServerFactory,
@@ -122,6 +126,19 @@ class TestAppUserResource:
         for i in range(len(dataset)):
             assert dataset.get(i) in expected_export_values
 
+    def test_export_rows(self, project, app_user, settings, django_assert_num_queries):
+        """export_rows() yields the same rows as export(), applying the prefetches to
+        each chunk of the queryset.
+        """
+        settings.IMPORT_EXPORT_CHUNK_SIZE = 2
+        AppUserFactory.create_batch(4, project=project)
+        resource = import_export.AppUserResource(project)
+        expected = [list(row) for row in resource.export()]
+        # One query for the app users, read through a cursor, and 2 prefetch queries
+        # for each of the 3 chunks
+        with django_assert_num_queries(7):
+            assert list(resource.export_rows()) == expected
+
     def test_successful_import(self, app_user):
         project = app_user.project
         app_user2 = models.AppUser.objects.create(
@@ -344,6 +361,79 @@ class TestAppUserResource:
             assert result.invalid_rows[index].number == row_number
             assert result.invalid_rows[index].error_dict == row_errors
 
+    def test_import_query_count_constant(self, project, template_variables):
+        """The number of queries does not grow with the number of rows imported."""
+        headers = "id,name,central_id,form_templates," + ",".join(
+            i.name for i in template_variables
+        )
+
+        def import_users(prefix, count):
+            existing = AppUserFactory.create_batch(count, project=project)
+            for app_user in existing:
+                app_user.app_user_template_variables.create(
+                    template_variable=template_variables[0], value="old"
+                )
+                app_user.app_user_forms.create(form_template=project.form_templates.first())
+            rows = [f"{u.id},{prefix}{u.id},,template2,new,label,,pw" for u in existing]
+            rows += [f",{prefix}new{i},,template1,a,b,c,d" for i in range(count)]
+            dataset = Dataset().load("\n".join([headers, *rows]))
+            with CaptureQueriesContext(connection) as queries:
+                result = import_export.AppUserResource(project).import_data(
+                    dataset, use_transactions=True
+                )
+            assert not result.has_errors()
+            assert not result.has_validation_errors()
+            return len(queries)
+
+        assert import_users("a", 2) == import_users("b", 20)
+        assert project.app_users.count() == 44
+        app_user = project.app_users.get(name="bnew0")
+        assert app_user.form_templates == {"template1"}
+        assert dict(
+            app_user.app_user_template_variables.values_list("template_variable__name", "value")
+        ) == {"center_id": "a", "center_label": "b", "public_key": "c", "manager_password": "d"}
+
+    @pytest.mark.parametrize("dry_run", [True, False])
+    def test_new_app_user_ids(self, project, template_variables, mocker, dry_run):
+        """IDs for new app users are only reserved when not in a dry run, and only
+        as many as there are new rows.
+        """
+        headers = "id,name,central_id,form_templates," + ",".join(
+            i.name for i in template_variables
+        )
+        rows = [f",new{i},,template1,a,b,c,d" for i in range(2)]
+        dataset = Dataset().load("\n".join([headers, *rows]))
+        reserve = mocker.spy(import_export.AppUserResource, "reserve_app_user_pk")
+
+        result = import_export.AppUserResource(project).import_data(
+            dataset, use_transactions=True, dry_run=dry_run
+        )
+
+        assert not result.has_errors()
+        assert not result.has_validation_errors()
+        if dry_run:
+            reserve.assert_not_called()
+            assert not project.app_users.exists()
+        else:
+            assert reserve.call_count == 2
+            new_pks = sorted(project.app_users.values_list("pk", flat=True))
+            # No IDs were reserved beyond the new rows
+            assert AppUserFactory(project=project).pk == new_pks[-1] + 1
+            app_user = project.app_users.get(name="new1")
+            assert app_user.form_templates == {"template1"}
+            assert app_user.app_user_template_variables.count() == 4
+
+    def test_dry_run_duplicate_new_names(self, project):
+        """Two new rows with the same name are reported in a dry run too."""
+        dataset = Dataset().load("id,name\n,same\n,Same")
+
+        result = import_export.AppUserResource(project).import_data(
+            dataset, use_transactions=True, dry_run=True
+        )
+
+        assert result.has_validation_errors()
+        assert [row.number for row in result.invalid_rows] == [2]
+
     def test_appuser_central_id_updated(self, app_user):
         app_user.central_id = None
         app_user.save()
@@ -359,10 +449,38 @@ class TestAppUserResource:
                 "token": "token3",
             }
         )
-        update_app_users_central_id(app_user.project, {app_user.name: odk_central_user})
+        assert update_app_users_central_id(app_user.project, {app_user.name: odk_central_user}) == 1
         app_user.refresh_from_db()
         assert app_user.central_id == odk_central_user.id
 
+    def test_appuser_central_id_bulk_updated(self, django_assert_num_queries):
+        """All users with a null central_id are updated in one UPDATE query, and
+        users that already have a central_id are left as they are.
+        """
+        project = ProjectFactory()
+        unlinked = AppUserFactory.create_batch(3, project=project, central_id=None)
+        linked = AppUserFactory(project=project, central_id=99)
+        central_users = {
+            app_user.name: ProjectAppUserAssignment(
+                projectId=1,
+                id=index,
+                type="field_key",
+                displayName=app_user.name,
+                createdAt="2024-07-08T21:43:16.249Z",
+                updatedAt=None,
+                deletedAt=None,
+                token=f"token{index}",
+            )
+            for index, app_user in enumerate([*unlinked, linked], start=1)
+        }
+        # SAVEPOINT, SELECT, UPDATE and RELEASE SAVEPOINT
+        with django_assert_num_queries(4):
+            assert update_app_users_central_id(project, central_users) == 3
+        assert set(project.app_users.values_list("name", "central_id")) == {
+            *((app_user.name, index) for index, app_user in enumerate(unlinked, start=1)),
+            (linked.name, 99),
+        }
+
 
 @pytest.mark.django_db
 class TestDeviceResource(TestAllMDMsNoAutouse):
@@ -473,6 +591,52 @@ class TestDeviceResource(TestAllMDMsNoAutouse):
         for row in valid_rows:
             assert row.import_type == "skip"
 
+    def test_import_looks_up_devices_per_chunk(self, organization, settings):
+        """Devices are looked up with one query per chunk of rows, and progress is
+        reported after each chunk.
+        """
+        settings.IMPORT_EXPORT_CHUNK_SIZE = 2
+        devices = DeviceFactory.create_batch(5, fleet__organization=organization)
+        csv_data = "device_id,serial_number,app_user_name\n"
+        for i in devices:
+            csv_data += f"{i.device_id},{i.serial_number},{i.app_user_name}_edited\n"
+        progress = []
+        resource = import_export.DeviceResource(
+            organization, progress=lambda done, total: progress.append((done, total))
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            result = resource.import_data(
+                Dataset().load(csv_data), use_transactions=True, rollback_on_validation_errors=True
+            )
+
+        assert not result.has_validation_errors()
+        assert not result.has_errors()
+        lookups = [q["sql"] for q in queries if '"mdm_device"."device_id" IN' in q["sql"]]
+        assert len(lookups) == 3
+        updates = [q["sql"] for q in queries if q["sql"].startswith('UPDATE "mdm_device"')]
+        assert len(updates) == 1
+        assert progress == [(2, 5), (4, 5), (5, 5)]
+        for device in devices:
+            device.refresh_from_db()
+            assert device.app_user_name.endswith("_edited")
+
+    def test_blank_app_user_name_uses_fleet_default(self, organization):
+        """A blank app_user_name is replaced by the fleet's default app user, as
+        it would be when saving the device.
+        """
+        device = DeviceFactory(fleet__organization=organization)
+        default_app_user = AppUserFactory(project=device.fleet.project)
+        device.fleet.default_app_user = default_app_user
+        device.fleet.save()
+        csv_data = f"device_id,serial_number,app_user_name\n{device.device_id},serial,\n"
+
+        result = self.import_data(csv_data, organization)
+
+        assert not result.has_validation_errors()
+        device.refresh_from_db()
+        assert device.app_user_name == default_app_user.name
+
     @pytest.mark.parametrize("dry_run", [True, False])
     def test_valid_import_dry_run(self, organization, mocker, dry_run, all_mdms):
         """Ensure push_device_config is never called directly; Dagster handles MDM pushes."""
@@ -512,8 +676,12 @@ class TestDeviceResourceAfterImport:
         )
 
     def test_after_import_with_dagster_triggers_job(self, organization, mocker):
-        """after_import() triggers mdm_job for each updated device."""
-        devices = DeviceFactory.create_batch(2, fleet__organization=organization)
+        """after_import() triggers one mdm_job per fleet for the updated devices."""
+        fleet = FleetFactory(organization=organization)
+        devices = [
+            *DeviceFactory.create_batch(2, fleet=fleet),
+            DeviceFactory(fleet__organization=organization),
+        ]
         csv_data = "device_id,serial_number,app_user_name\n"
         for device in devices:
             csv_data += f"{device.device_id},{device.serial_number},{device.app_user_name}_edited\n"
@@ -525,11 +693,12 @@ class TestDeviceResourceAfterImport:
         self.import_data(csv_data, organization)
 
         mock_push_device_config.assert_not_called()
-        mock_trigger.assert_called_once()
-        device_pks = mock_trigger.call_args.kwargs["run_config"]["ops"]["push_mdm_device_config"][
-            "config"
-        ]["device_pks"]
-        assert set(device_pks) == {device.pk for device in devices}
+        assert mock_trigger.call_count == 2
+        batches = [
+            set(call.kwargs["run_config"]["ops"]["push_mdm_device_config"]["config"]["device_pks"])
+            for call in mock_trigger.call_args_list
+        ]
+        assert sorted(batches, key=len) == [{devices[2].pk}, {devices[0].pk, devices[1].pk}]
 
     def test_after_import_dry_run_skips_dagster(self, organization, mocker):
         """Dry-run imports do not trigger the Dagster job."""
@@ -543,3 +712,102 @@ class TestDeviceResourceAfterImport:
         self.import_data(csv_data, organization, dry_run=True)
 
         mock_trigger.assert_not_called()
+
+
+@pytest.mark.django_db
+class TestDeviceImport:
+    """Tests for DeviceImport, which runs device imports in the background."""
+
+    @pytest.fixture
+    def organization(self):
+        return OrganizationFactory()
+
+    @pytest.fixture
+    def devices(self, organization):
+        return DeviceFactory.create_batch(2, fleet__organization=organization)
+
+    def start_import(self, organization, rows) -> import_export.DeviceImport:
+        dataset = Dataset(*rows, headers=["device_id", "serial_number", "app_user_name"])
+        format_index = next(
+            i for i, f in enumerate(settings.IMPORT_EXPORT_FORMATS) if f().get_title() == "csv"
+        )
+        tmp_storage = MediaStorage()
+        tmp_storage.save(dataset.export("csv").encode())
+        device_import = import_export.DeviceImport(
+            import_id=tmp_storage.name,
+            organization_id=organization.pk,
+            format=format_index,
+            original_file_name="devices.csv",
+        )
+        device_import.save()
+        return device_import
+
+    def test_preview_and_import(self, organization, devices, mocker):
+        """A dry run stores a preview in the cache, keeping the file for the import."""
+        mocker.patch("apps.publish_mdm.import_export.trigger_dagster_job")
+        rows = [(d.device_id, d.serial_number, f"{d.app_user_name}_edited") for d in devices]
+        device_import = self.start_import(organization, rows)
+
+        device_import.run(dry_run=True)
+
+        stored = import_export.DeviceImport.get(device_import.import_id)
+        assert stored.status == import_export.DeviceImport.Status.PREVIEW
+        assert (stored.done, stored.total) == (2, 2)
+        assert [row.import_type for row in stored.preview.valid_rows()] == ["update", "update"]
+        assert not stored.preview.has_errors()
+        for device in devices:
+            device.refresh_from_db()
+            assert not device.app_user_name.endswith("_edited")
+
+        stored.run(dry_run=False)
+
+        stored = import_export.DeviceImport.get(device_import.import_id)
+        assert stored.status == import_export.DeviceImport.Status.DONE
+        assert stored.preview.totals["update"] == 2
+        with pytest.raises(FileNotFoundError):
+            MediaStorage(name=device_import.import_id).read()
+        for device in devices:
+            device.refresh_from_db()
+            assert device.app_user_name.endswith("_edited")
+
+    def test_run_once_per_stage(self, organization, devices, mocker):
+        """Each stage only runs once, even if its job is started twice."""
+        mocker.patch("apps.publish_mdm.import_export.trigger_dagster_job")
+        rows = [(d.device_id, d.serial_number, f"{d.app_user_name}_edited") for d in devices]
+        device_import = self.start_import(organization, rows)
+        device_import.run(dry_run=True)
+        import_data = mocker.spy(import_export.DeviceResource, "import_data")
+
+        import_export.DeviceImport.get(device_import.import_id).run(dry_run=False)
+        import_export.DeviceImport.get(device_import.import_id).run(dry_run=False)
+
+        assert import_data.call_count == 1
+        stored = import_export.DeviceImport.get(device_import.import_id)
+        assert stored.status == import_export.DeviceImport.Status.DONE
+
+    def test_invalid_rows(self, organization, devices):
+        """Validation errors are stored in the preview and the file is deleted."""
+        device_import = self.start_import(organization, [("unknown", "serial", "user")])
+
+        device_import.run(dry_run=True)
+
+        stored = import_export.DeviceImport.get(device_import.import_id)
+        assert stored.status == import_export.DeviceImport.Status.INVALID
+        assert stored.preview.has_validation_errors()
+        assert stored.preview.invalid_rows[0].field_specific_errors == {
+            "device_id": ["A device with ID 'unknown' does not exist in the current organization."]
+        }
+        with pytest.raises(FileNotFoundError):
+            MediaStorage(name=device_import.import_id).read()
+
+    def test_unreadable_file(self, organization):
+        """The import fails if its file can't be read."""
+        device_import = import_export.DeviceImport(
+            import_id="unreadable",
+            organization_id=organization.pk,
+            format=0,
+            original_file_name="devices.csv",
+        )
+
+        assert device_import.run(dry_run=True) is None
+        assert device_import.status == import_export.DeviceImport.Status.FAILED
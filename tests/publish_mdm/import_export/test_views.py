@@ -7,6 +7,7 @@ from pathlib import Path
 from typing import ClassVar
 
 import pytest
+from asgiref.sync import async_to_sync
 from django.conf import settings
 from django.contrib.messages import ERROR, Message
 from django.urls import reverse
@@ -17,9 +18,11 @@ from tablib import Dataset
 from apps.mdm.mdms import get_active_mdm_class
 from apps.publish_mdm.forms import (
     ConfirmImportForm,
+    DeviceImportConfirmForm,
     ExportForm,
     ImportForm,
 )
+from apps.publish_mdm.import_export import DeviceImport
 from apps.publish_mdm.models import AppUser
 from tests.mdm.factories import DeviceFactory, FleetFactory
 from tests.publish_mdm.factories import (
@@ -301,7 +304,9 @@ class TestAppUserImport(ImportTestBase):
 
 
 class TestDeviceImport(ImportTestBase):
-    """Test the Device import process."""
+    """Test the Device import process. Without Dagster, both stages run in the
+    request before redirecting to the import status page.
+    """
 
     @pytest.fixture
     def fleet(self, organization):
@@ -329,16 +334,39 @@ class TestDeviceImport(ImportTestBase):
             headers=["device_id", "serial_number", "app_user_name"],
         )
 
-    @pytest.mark.parametrize("format_name", ["csv", "xlsx"])
-    def test_valid_upload(self, client, url, user, devices, dataset, format_name):
-        """Ensure the review page is shown after a valid import file is uploaded."""
+    def upload(self, client, url, dataset, format_name, **kwargs):
         _, io_class, form_format = self.FORMATS[format_name]
         import_file_data = dataset.export(format_name)
         data = {"format": form_format, "import_file": io_class(import_file_data)}
-        response = client.post(url, data=data)
+        return client.post(url, data=data, **kwargs)
+
+    def previewed_import(self, organization, dataset, format_name):
+        """Save an import file and a DeviceImport with a preview, as if the file
+        had been uploaded and validated.
+        """
+        import_format, _, form_format = self.FORMATS[format_name]
+        tmp_storage = MediaStorage(
+            encoding=import_format.encoding,
+            read_mode=import_format.get_read_mode(),
+        )
+        tmp_storage.save(dataset.export(format_name))
+        device_import = DeviceImport(
+            import_id=tmp_storage.name,
+            organization_id=organization.pk,
+            format=form_format,
+            original_file_name=f"test.{format_name}",
+        )
+        device_import.run(dry_run=True)
+        return device_import
+
+    @pytest.mark.parametrize("format_name", ["csv", "xlsx"])
+    def test_valid_upload(self, client, url, user, devices, dataset, format_name):
+        """Ensure the review page is shown after a valid import file is uploaded."""
+        response = self.upload(client, url, dataset, format_name, follow=True)
 
         assert response.status_code == 200
-        assert isinstance(response.context["form"], ConfirmImportForm)
+        assert len(response.redirect_chain) == 1
+        assert isinstance(response.context["form"], DeviceImportConfirmForm)
         assert (
             "Below is a preview of data to be imported. If you are satisfied "
             "with the results, click 'Confirm import'."
@@ -353,24 +381,14 @@ class TestDeviceImport(ImportTestBase):
     @pytest.mark.parametrize("format_name", ["csv", "xlsx"])
     def test_import_confirmed(self, client, url, user, organization, devices, dataset, format_name):
         """Ensure confirming the import updates the devices' app_user_name."""
-        import_format, _, form_format = self.FORMATS[format_name]
-        import_file_data = dataset.export(format_name)
-        tmp_storage = MediaStorage(
-            encoding=import_format.encoding,
-            read_mode=import_format.get_read_mode(),
-        )
-        tmp_storage.save(import_file_data)
-        data = {
-            "import_file_name": tmp_storage.name,
-            "original_file_name": f"test.{format_name}",
-            "format": form_format,
-            "resource": "",
-        }
+        device_import = self.previewed_import(organization, dataset, format_name)
+        data = {"import_id": device_import.import_id}
         response = client.post(url, data=data, follow=True)
 
         assert response.status_code == 200
         assert response.redirect_chain == [
-            (reverse("publish_mdm:devices-list", args=[organization.slug]), 302)
+            (f"{url}?import_id={device_import.import_id}", 302),
+            (reverse("publish_mdm:devices-list", args=[organization.slug]), 302),
         ]
         assert (
             "Import finished successfully, with 0 new and 2 updated devices."
@@ -380,15 +398,28 @@ class TestDeviceImport(ImportTestBase):
         devices[1].refresh_from_db()
         assert devices[0].app_user_name == "new_user1"
         assert devices[1].app_user_name == "new_user2"
+        assert DeviceImport.get(device_import.import_id) is None
+
+    def test_confirm_twice(self, client, url, user, organization, devices, dataset, mocker):
+        """Confirming the import again before the background job starts (e.g. with a
+        double click) doesn't start a second import.
+        """
+        device_import = self.previewed_import(organization, dataset, "csv")
+        mock_trigger = mocker.patch("apps.publish_mdm.views.trigger_dagster_job")
+        data = {"import_id": device_import.import_id}
+
+        client.post(url, data=data)
+        response = client.post(url, data=data, follow=True)
+
+        mock_trigger.assert_called_once()
+        assert response.context["import_progress"].status == DeviceImport.Status.IMPORTING
+        assert not response.context["confirm"]
 
     @pytest.mark.parametrize("format_name", ["csv", "xlsx"])
     def test_invalid_upload(self, client, url, user, devices, dataset, format_name):
         """Ensure a validation error is shown when an unknown device_id is uploaded."""
         dataset.append(("unknown_device", "some_serial_no", "some_user"))
-        _, io_class, form_format = self.FORMATS[format_name]
-        import_file_data = dataset.export(format_name)
-        data = {"format": form_format, "import_file": io_class(import_file_data)}
-        response = client.post(url, data=data)
+        response = self.upload(client, url, dataset, format_name, follow=True)
 
         assert response.status_code == 200
         assert isinstance(response.context["form"], ImportForm)
@@ -404,6 +435,34 @@ class TestDeviceImport(ImportTestBase):
         assert devices[0].app_user_name == "user1"
         assert devices[1].app_user_name == "user2"
 
+    def test_upload_triggers_dagster_job(self, client, url, user, organization, dataset, mocker):
+        """With Dagster enabled, the file is validated in a device_import_job run and
+        the progress is shown until it is done.
+        """
+        mock_trigger = mocker.patch("apps.publish_mdm.views.trigger_dagster_job")
+        response = self.upload(client, url, dataset, "csv", follow=True)
+
+        import_id = response.context["import_progress"].import_id
+        mock_trigger.assert_called_once_with(
+            job_name="device_import_job",
+            run_config={
+                "ops": {"import_devices": {"config": {"import_id": import_id, "dry_run": True}}}
+            },
+        )
+        assert response.context["import_progress"].organization_id == organization.pk
+        assertContains(response, "0 of 0 rows done.")
+
+    def test_unknown_import(self, client, url, user, organization, dataset):
+        """An import from another organization, or one that expired, can't be viewed."""
+        other_import = self.previewed_import(OrganizationFactory(), dataset, "csv")
+        response = client.get(f"{url}?import_id={other_import.import_id}", follow=True)
+
+        assert response.redirect_chain == [(url, 302)]
+        assertMessages(
+            response,
+            [Message(ERROR, "We could not find your import. Please try importing again.")],
+        )
+
     def test_push_device_config_called_after_confirm(
         self, client, url, user, organization, devices, dataset, mocker
     ):
@@ -413,20 +472,8 @@ class TestDeviceImport(ImportTestBase):
         mock_trigger = mocker.patch("apps.publish_mdm.import_export.trigger_dagster_job")
         mock_push = mocker.patch.object(get_active_mdm_class(organization), "push_device_config")
 
-        import_format_cls, _, form_format = self.FORMATS["csv"]
-        import_file_data = dataset.export("csv")
-        tmp_storage = MediaStorage(
-            encoding=import_format_cls.encoding,
-            read_mode=import_format_cls.get_read_mode(),
-        )
-        tmp_storage.save(import_file_data)
-        data = {
-            "import_file_name": tmp_storage.name,
-            "original_file_name": "test.csv",
-            "format": form_format,
-            "resource": "",
-        }
-        client.post(url, data=data, follow=True)
+        device_import = self.previewed_import(organization, dataset, "csv")
+        client.post(url, data={"import_id": device_import.import_id}, follow=True)
 
         mock_trigger.assert_called_once()
         mock_push.assert_not_called()
@@ -444,10 +491,7 @@ class TestDeviceImport(ImportTestBase):
         mock_trigger = mocker.patch("apps.publish_mdm.import_export.trigger_dagster_job")
         mock_push = mocker.patch.object(get_active_mdm_class(organization), "push_device_config")
 
-        _, io_class, form_format = self.FORMATS["csv"]
-        import_file_data = dataset.export("csv")
-        data = {"format": form_format, "import_file": io_class(import_file_data)}
-        client.post(url, data=data)
+        self.upload(client, url, dataset, "csv", follow=True)
 
         mock_trigger.assert_not_called()
         mock_push.assert_not_called()
@@ -471,11 +515,11 @@ class ExportTestBase(ImportExportTestBase):
         assert re.match(
             rf'attachment; filename="{expected_file_name_pattern}"', content_disposition
         )
-        dataset = Dataset()
-        data = response.content
+        # The file is streamed. Read it the same way it would be read when imported
+        assert response.streaming
         if not export_format.is_binary():
-            data = data.decode()
-        dataset.load(data)
+            export_format.encoding = "utf-8"
+        dataset = export_format.create_dataset(b"".join(response.streaming_content))
         assert dataset.headers == expected_col_headers
         assert set(dataset) == expected_rows
 
@@ -604,3 +648,24 @@ class TestDeviceExport(ExportTestBase):
             ["device_id", "serial_number", "manufacturer", "model", "app_user_name"],
             expected_rows,
         )
+
+    @pytest.mark.parametrize("format_index,format_class", enumerate(settings.IMPORT_EXPORT_FORMATS))
+    def test_export_asgi(self, async_client, url, user, organization, format_index, format_class):
+        """Under ASGI, the file is streamed from an asynchronous iterator, so Django
+        doesn't buffer the whole file in memory before sending it.
+        """
+        devices = DeviceFactory.create_batch(3, fleet__organization=organization)
+        async_client.force_login(user)
+
+        async def export():
+            response = await async_client.post(url, {"format": format_index})
+            return response, [chunk async for chunk in response.streaming_content]
+
+        response, chunks = async_to_sync(export)()
+
+        assert response.is_async
+        format = format_class()
+        if not format.is_binary():
+            format.encoding = "utf-8"
+        dataset = format.create_dataset(b"".join(chunks))
+        assert {row[0] for row in dataset} == {device.device_id for device in devices}
@@ -0,0 +1,79 @@
+import datetime as dt
+import io
+import os
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+
+from apps.publish_mdm.form_files import FormFileStore
+
+from .factories import AppUserFormVersionFactory, FormTemplateVersionFactory
+
+
+@pytest.mark.django_db
+class TestFormFileStore:
+    @pytest.fixture
+    def store(self, settings, tmp_path):
+        settings.MEDIA_ROOT = tmp_path
+        return FormFileStore()
+
+    def age(self, name, days=2):
+        """Set the modified time of a stored file to ``days`` ago."""
+        timestamp = (dt.datetime.now() - dt.timedelta(days=days)).timestamp()
+        os.utime(default_storage.path(name), (timestamp, timestamp))
+
+    def test_store(self, store):
+        """Files with the same content are stored once, under a hash of the content."""
+        name = store.store(ContentFile(b"content", name="v1.xlsx"))
+        same_name = store.store(ContentFile(b"content", name="v2.xlsx"))
+        other_name = store.store(ContentFile(b"other", name="v1.xlsx"))
+
+        assert name == same_name != other_name
+        assert name.startswith("form-templates/blobs/") and name.endswith(".xlsx")
+        assert sorted(store.stored_names()) == sorted([name, other_name])
+        with default_storage.open(name) as f:
+            assert f.read() == b"content"
+
+    def test_references(self, store):
+        name = store.store(ContentFile(b"content", name="v1.xlsx"))
+        version = FormTemplateVersionFactory(file=name)
+        AppUserFormVersionFactory.create_batch(2, form_template_version=version, file=name)
+
+        assert store.references()[name] == 3
+
+    def test_compact(self, store):
+        """Only old files that are not referenced by any version are deleted."""
+        referenced = store.store(ContentFile(b"referenced", name="a.xlsx"))
+        AppUserFormVersionFactory(file=referenced)
+        orphan = store.store(ContentFile(b"orphan", name="b.xlsx"))
+        recent_orphan = store.store(ContentFile(b"recent", name="c.xlsx"))
+        for name in (referenced, orphan):
+            self.age(name)
+
+        assert store.compact(dry_run=True) == [orphan]
+        assert default_storage.exists(orphan)
+        assert store.compact() == [orphan]
+        assert not default_storage.exists(orphan)
+        assert default_storage.exists(referenced)
+        assert default_storage.exists(recent_orphan)
+
+    def test_compact_empty(self, store):
+        assert store.compact() == []
+
+    def test_command(self, store):
+        orphan = store.store(ContentFile(b"orphan", name="b.xlsx"))
+        self.age(orphan, days=0.75)
+        stdout = io.StringIO()
+
+        call_command("compact_form_files", "--min-age-hours=12", "--dry-run", stdout=stdout)
+        assert stdout.getvalue().splitlines() == [
+            orphan,
+            "Would delete 1 unreferenced form file(s).",
+        ]
+
+        call_command("compact_form_files", stdout=io.StringIO())
+        assert default_storage.exists(orphan)
+        call_command("compact_form_files", "--min-age-hours=12", stdout=io.StringIO())
+        assert not default_storage.exists(orphan)
@@ -196,3 +196,70 @@ class TestCustomMiddleware:
 
         assert organizations[0] not in request.organizations
         assert len(list(request.organizations)) == len(organizations) - 1
+
+    def process(self, rf, middleware, url, user):
+        request = self.get_request(rf, url, user)
+        view_func, view_args, view_kwargs = request.resolver_match
+        for m in middleware:
+            m.process_view(request, view_func, view_args, view_kwargs)
+        return request
+
+    def test_cached_lookups(
+        self, organizations, projects, rf, middleware, user, django_assert_num_queries
+    ):
+        """Repeated requests resolve the organization and project without any queries."""
+        project = projects[0]
+        url = reverse("publish_mdm:app-user-list", args=[project.organization.slug, project.pk])
+        expected_projects = set(project.organization.projects.all())
+        self.process(rf, middleware, url, user)
+
+        with django_assert_num_queries(0):
+            request = self.process(rf, middleware, url, user)
+            assert request.organization == project.organization
+            assert request.odk_project == project
+            assert set(request.odk_projects) == expected_projects
+            assert request.organizations.count() == len(organizations)
+            assert str(request.odk_projects[0].central_server)
+
+    def test_membership_changes(self, organizations, projects, rf, middleware, user):
+        """The cached organizations are dropped when the user's memberships change."""
+        organization = organizations[0]
+        url = reverse("publish_mdm:server-sync", args=[organization.slug])
+        self.process(rf, middleware, url, user)
+
+        organization.users.remove(user)
+        with pytest.raises(Http404):
+            self.process(rf, middleware, url, user)
+
+        user.organizations.add(organization)
+        request = self.process(rf, middleware, url, user)
+        assert request.organization == organization
+
+    def test_project_changes(self, organizations, projects, rf, middleware, user):
+        """The cached projects are dropped when a project is added or renamed."""
+        organization = organizations[0]
+        url = reverse("publish_mdm:server-sync", args=[organization.slug])
+        self.process(rf, middleware, url, user)
+
+        new_project = ProjectFactory(
+            central_server=projects[0].central_server, organization=organization
+        )
+        projects[0].name = "Renamed"
+        projects[0].save()
+
+        request = self.process(rf, middleware, url, user)
+        assert new_project in request.odk_projects
+        assert {project.name for project in request.odk_projects} >= {"Renamed"}
+
+    def test_superuser_change(self, organizations, rf, middleware, user):
+        """A user that becomes a superuser can access all organizations."""
+        other_organization = OrganizationFactory()
+        url = reverse("publish_mdm:server-sync", args=[other_organization.slug])
+        with pytest.raises(Http404):
+            self.process(rf, middleware, url, user)
+
+        user.is_superuser = True
+        user.save()
+
+        request = self.process(rf, middleware, url, user)
+        assert request.organization == other_organization
@@ -1,4 +1,5 @@
 import re
+from pathlib import Path
 
 import pytest
 from django.core.exceptions import ValidationError
@@ -10,6 +11,7 @@ from apps.infisical.fields import EncryptedMixin
 from apps.mdm.mdms import get_active_mdm_class
 from apps.mdm.models import Fleet, Policy, PolicyApplication
 from apps.publish_mdm.etl import template
+from apps.publish_mdm.etl.transform import RenderedFormFile
 from apps.publish_mdm.models import CentralServer
 from tests.mdm import TestAllMDMs, _configure_mdm
 
@@ -179,12 +181,95 @@ class TestAppUserFormTemplate:
         assert template.xml_form_id == "staff_registration_app_user_name"
         assert str(template) == "staff_registration_app_user_name"
 
+    @pytest.mark.django_db
+    def test_create_next_version_unchanged(self, mocker, settings, tmp_path):
+        """An unchanged render reuses the file of the latest version with the same
+        content, and is only skipped while ODK Central has one of those versions.
+        """
+        settings.MEDIA_ROOT = tmp_path
+        app_user_form = AppUserFormTemplateFactory()
+        versions = FormTemplateVersionFactory.create_batch(
+            4, form_template=app_user_form.form_template
+        )
+        renders = [
+            RenderedFormFile("v1.xlsx", b"first", digest="a"),
+            RenderedFormFile("v2.xlsx", b"second", digest="a"),
+            RenderedFormFile("v3.xlsx", b"third", digest="b"),
+            RenderedFormFile("v4.xlsx", b"fourth", digest="a"),
+        ]
+        mocker.patch(
+            "apps.publish_mdm.etl.transform.render_template_for_app_user", side_effect=renders
+        )
+
+        first, second, third, fourth = [app_user_form.create_next_version(v) for v in versions]
+
+        assert first.file.name.startswith("form-templates/blobs/")
+        assert not first.unchanged_versions
+        assert first.rendered_file is None
+        assert second.file.name == first.file.name
+        assert second.unchanged_versions == {versions[0].version}
+        assert second.rendered_file is renders[1]
+        assert third.file.name != first.file.name
+        assert not third.unchanged_versions
+        with third.file.open("rb") as f:
+            assert f.read() == b"third"
+        assert fourth.file.name == first.file.name
+        assert fourth.unchanged_versions == {versions[0].version, versions[1].version}
+        central_form = mocker.Mock(version=versions[0].version)
+        assert second.is_unchanged_in({first.xml_form_id: central_form})
+        assert fourth.is_unchanged_in({first.xml_form_id: central_form})
+        central_form.version = versions[2].version
+        assert not second.is_unchanged_in({first.xml_form_id: central_form})
+        assert not fourth.is_unchanged_in({first.xml_form_id: central_form})
+        assert not second.is_unchanged_in({})
+        assert not first.is_unchanged_in({first.xml_form_id: central_form})
+
+        # If it has to be uploaded after all, the version's own render is stored
+        fourth.store_rendered_file()
+        fourth.refresh_from_db()
+        assert fourth.file.name != first.file.name
+        with fourth.file.open("rb") as f:
+            assert f.read() == b"fourth"
+
 
 class TestFormTemplateVersion:
     def test_str(self):
         version = FormTemplateVersionFactory.build(version="v1")
         assert str(version) == version.file.name
 
+    @pytest.mark.django_db
+    def test_get_entity_reference_plan(self, mocker):
+        """The file is analyzed once and the plan is kept on the version, without
+        saving it.
+        """
+        path = Path(__file__).parent / "etl/transform/ODK XLSForm Template.xlsx"
+        version = FormTemplateVersionFactory(file__data=path.read_bytes())
+        mock_analyze = mocker.spy(template, "analyze_entity_references")
+
+        plan = version.get_entity_reference_plan()
+
+        assert "cats_APP_USER" in plan.entity_lists
+        assert version.entity_references == plan.model_dump(mode="json")
+        assert version.get_entity_reference_plan() == plan
+        mock_analyze.assert_called_once()
+        version.refresh_from_db()
+        assert version.entity_references is None
+
+    @pytest.mark.django_db
+    def test_create_app_user_versions_stores_plan(self, mocker):
+        """The template is analyzed once for all the app users and the plan is saved."""
+        path = Path(__file__).parent / "etl/transform/ODK XLSForm Template.xlsx"
+        version = FormTemplateVersionFactory(file__data=path.read_bytes())
+        AppUserFormTemplateFactory.create_batch(2, form_template=version.form_template)
+        mock_analyze = mocker.spy(template, "analyze_entity_references")
+
+        app_user_versions = version.create_app_user_versions()
+
+        assert len(app_user_versions) == 2
+        mock_analyze.assert_called_once()
+        version.refresh_from_db()
+        assert version.entity_references == mock_analyze.spy_return.model_dump(mode="json")
+
 
 @pytest.mark.django_db
 class TestAppUser:
@@ -0,0 +1,72 @@
+import pytest
+from django.core.files.storage import default_storage
+
+from apps.publish_mdm.qrcodes import QRCodeCache
+from apps.publish_mdm.utils import create_qr_code
+
+
+class TestQRCodeCache:
+    @pytest.fixture
+    def qr_code_cache(self, settings, tmp_path):
+        settings.MEDIA_ROOT = tmp_path
+        return QRCodeCache(max_entries=2)
+
+    def test_key(self):
+        """The key depends on the payload and the render options, not their types."""
+        key = QRCodeCache.key("data", label="a", scale=4)
+        assert key == QRCodeCache.key(b"data", scale=4, label="a")
+        assert key != QRCodeCache.key("data", label="b", scale=4)
+        assert key != QRCodeCache.key("other data", label="a", scale=4)
+
+    def test_get_or_create(self, qr_code_cache, mocker):
+        """A QR code is rendered and saved once, then the stored image is reused."""
+        mock_render = mocker.Mock(return_value=b"png")
+
+        name = qr_code_cache.get_or_create("data", render=mock_render, label="a")
+        same_name = qr_code_cache.get_or_create("data", render=mock_render, label="a")
+        other_name = qr_code_cache.get_or_create("data", render=mock_render, label="b")
+
+        assert name == same_name != other_name
+        assert name.startswith("qr-codes/cache/")
+        assert mock_render.call_count == 2
+        with default_storage.open(name) as f:
+            assert f.read() == b"png"
+
+    def test_get_or_create_default_render(self, qr_code_cache):
+        """Without a render function, a plain QR code of the payload is saved."""
+        name = qr_code_cache.get_or_create("data")
+
+        with default_storage.open(name) as f:
+            assert f.read() == create_qr_code("data").getvalue()
+
+    def test_store(self, qr_code_cache, mocker):
+        """Already rendered images are only uploaded if their content (or payload)
+        is not stored yet.
+        """
+        mock_save = mocker.spy(default_storage, "save")
+
+        name = qr_code_cache.store(b"png")
+        assert qr_code_cache.store(b"png") == name
+        assert qr_code_cache.store(b"other png", payload="data") != name
+        assert qr_code_cache.store(b"changed png", payload="data") == qr_code_cache.name(
+            QRCodeCache.key("data")
+        )
+
+        assert mock_save.call_count == 2
+
+    def test_index_is_lru(self, qr_code_cache, mocker):
+        """Names in the LRU index are not checked in storage, and the least recently
+        used names are evicted from the index when it is full.
+        """
+        names = [qr_code_cache.store(content) for content in (b"1", b"2", b"3")]
+        mock_exists = mocker.spy(default_storage, "exists")
+
+        assert qr_code_cache.exists(names[2])
+        assert qr_code_cache.exists(names[1])
+        mock_exists.assert_not_called()
+        # The first name was evicted, so it is checked in storage
+        assert qr_code_cache.exists(names[0])
+        mock_exists.assert_called_once_with(names[0])
+
+    def test_exists_missing_file(self, qr_code_cache):
+        assert not qr_code_cache.exists("qr-codes/cache/00/missing.png")
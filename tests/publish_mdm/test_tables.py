@@ -0,0 +1,107 @@
+from datetime import timedelta
+
+import pytest
+from django.test import RequestFactory
+from django.utils import timezone
+
+from apps.mdm.models import Fleet
+from apps.publish_mdm.tables import (
+    FleetTable,
+    KeysetPaginator,
+    approximate_count,
+)
+from tests.mdm.factories import FleetFactory
+from tests.publish_mdm.factories import AppUserFactory, OrganizationFactory
+
+
+@pytest.mark.django_db
+class TestKeysetPaginator:
+    @pytest.fixture
+    def fleets(self):
+        organization = OrganizationFactory()
+        fleets = FleetFactory.create_batch(7, organization=organization)
+        # Some fleets share a default app user name and some have none, so the
+        # ordering needs the pk tie-breaker and NULL handling
+        for fleet in fleets[:4]:
+            fleet.default_app_user = AppUserFactory(
+                project=fleet.project, name="same" if fleet.pk % 2 else f"user{fleet.pk}"
+            )
+            fleet.save()
+        return Fleet.objects.filter(organization=organization)
+
+    def all_pages(self, paginator):
+        """Follow the cursors from the first page to the last one."""
+        page = paginator.page()
+        rows = list(page)
+        while page.has_next():
+            page = paginator.page(page.next_cursor)
+            rows += list(page)
+        return rows
+
+    @pytest.mark.parametrize(
+        "ordering",
+        [
+            ["name"],
+            ["-name"],
+            ["default_app_user__name"],
+            ["-default_app_user__name"],
+            ["-default_app_user__name", "name"],
+        ],
+    )
+    def test_pages(self, fleets, ordering):
+        """Following the cursors returns every row once, in the queryset ordering."""
+        paginator = KeysetPaginator(fleets, ordering=ordering, per_page=2)
+        expected = list(fleets.order_by(*ordering, "pk"))
+        assert self.all_pages(paginator) == expected
+        assert paginator.count == 7
+        assert not paginator.count_is_approximate
+
+    @pytest.mark.parametrize(
+        "ordering", [["enroll_token_expires_at"], ["-enroll_token_expires_at"]]
+    )
+    def test_pages_microseconds(self, ordering):
+        """Datetimes in the same millisecond are paged over exactly once."""
+        organization = OrganizationFactory()
+        expires_at = timezone.now().replace(microsecond=123000)
+        for microseconds in (0, 1, 2, 3, 4):
+            FleetFactory(
+                organization=organization,
+                enroll_token_expires_at=expires_at + timedelta(microseconds=microseconds),
+            )
+        fleets = Fleet.objects.filter(organization=organization)
+        paginator = KeysetPaginator(fleets, ordering=ordering, per_page=2)
+        assert self.all_pages(paginator) == list(fleets.order_by(*ordering, "pk"))
+
+    def test_cursor_round_trip(self, fleets):
+        values = [timezone.now().replace(microsecond=123456), "name", 1]
+        paginator = KeysetPaginator(fleets, ordering=["enroll_token_expires_at", "name"])
+        assert paginator.decode_cursor(KeysetPaginator.encode_cursor(values)) == values
+
+    def test_invalid_cursor(self, fleets):
+        """An invalid cursor returns the first page."""
+        paginator = KeysetPaginator(fleets, ordering=["name"], per_page=2)
+        first_page = list(paginator.page())
+        for cursor in ["not-a-cursor", KeysetPaginator.encode_cursor(["a"]), "e30"]:
+            page = paginator.page(cursor)
+            assert page.cursor is None
+            assert list(page) == first_page
+
+    def test_approximate_count(self, fleets):
+        """Above the threshold, the planner's estimate is returned."""
+        assert approximate_count(fleets, threshold=7) == (7, False)
+        count, is_approximate = approximate_count(fleets, threshold=3)
+        assert is_approximate
+        assert count >= 4
+
+
+@pytest.mark.django_db
+class TestKeysetTable:
+    def test_order_by_column(self):
+        """The table's order_by is translated to the columns' queryset ordering."""
+        organization = OrganizationFactory()
+        FleetFactory.create_batch(3, organization=organization)
+        request = RequestFactory().get("/", {"sort": "-default_app_user"})
+        table = FleetTable(data=Fleet.objects.filter(organization=organization), request=request)
+        assert table.get_keyset_ordering() == ["-default_app_user__name"]
+        assert isinstance(table.paginator, KeysetPaginator)
+        assert len(table.page.object_list) == 3
@@ -8,12 +8,13 @@ import pytest
 from allauth.socialaccount.models import SocialToken
 from django.conf import settings
 from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.cache import cache
 from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.db.models import Count, Q
 from django.shortcuts import resolve_url
 from django.template.loader import render_to_string
-from django.urls import reverse
+from django.urls import reverse, reverse_lazy
 from django.utils.formats import date_format
 from django.utils.timezone import localtime, now
 from django_tables2 import Table
@@ -27,10 +28,17 @@ from pytest_django.asserts import (
     assertQuerySetEqual,
     assertRedirects,
     assertTemplateNotUsed,
+    assertTemplateUsed,
 )
 from requests.exceptions import HTTPError
 
 from apps.mdm.mdms import TinyMDM, get_active_mdm_class
+from apps.publish_mdm.etl.load import (
+    PROJECT_SYNC_PROGRESS_CACHE_KEY,
+    PROJECT_SYNC_STEPS,
+    QR_CODE_PROGRESS_CACHE_KEY,
+    ProjectSync,
+)
 from apps.publish_mdm.etl.odk.constants import DEFAULT_COLLECT_SETTINGS
 from apps.publish_mdm.etl.odk.publish import ProjectAppUserAssignment
 from apps.publish_mdm.etl.template import VariableTransform
@@ -62,6 +70,9 @@ from apps.publish_mdm.models import (
     OrganizationInvitation,
     Project,
 )
+from apps.publish_mdm.qrcodes import qr_code_cache
+from apps.publish_mdm.tables import KeysetPaginator
+from config.dagster import DagsterNotEnabledError
 from tests.mdm import TestAllMDMs, TestAllMDMsNoAutouse, TestAndroidEnterpriseOnly, TestTinyMDMOnly
 from tests.mdm.factories import (
     DeviceFactory,
@@ -259,6 +270,58 @@ class TestGenerateQRCodes(ViewTestBase):
         # All app users should have their qr_code and qr_code_data fields set now
         assert project.app_users.filter(Q(qr_code="") | Q(qr_code_data__isnull=True)).count() == 0
 
+    def test_background_job(self, client, url, user, project, app_users, mocker):
+        """When Dagster is enabled, QR codes are generated by app_user_qr_codes_job
+        and the app users page shows its progress.
+        """
+        mock_generate = mocker.patch(
+            "apps.publish_mdm.views.generate_and_save_app_user_collect_qrcodes"
+        )
+        mock_trigger = mocker.patch("apps.publish_mdm.views.trigger_dagster_job")
+
+        response = client.get(url, follow=True)
+
+        mock_generate.assert_not_called()
+        mock_trigger.assert_called_once_with(
+            job_name="app_user_qr_codes_job",
+            run_config={
+                "ops": {"generate_app_user_qr_codes": {"config": {"project_pk": project.pk}}}
+            },
+        )
+        assertContains(response, "QR codes are being regenerated in the background.")
+        assertContains(response, "Regenerating QR codes: 0 of 3 done.")
+
+    def test_background_job_finishes_first(self, client, url, user, project, app_users, mocker):
+        """If the job finishes (and deletes its progress) before the view returns,
+        the progress banner is not shown again.
+        """
+        progress_cache_key = QR_CODE_PROGRESS_CACHE_KEY.format(project_pk=project.pk)
+        mocker.patch(
+            "apps.publish_mdm.views.trigger_dagster_job",
+            side_effect=lambda **kwargs: cache.delete(progress_cache_key),
+        )
+
+        response = client.get(url, follow=True)
+
+        assertContains(response, "QR codes are being regenerated in the background.")
+        assertNotContains(response, "Regenerating QR codes:")
+
+    def test_background_job_error(self, client, url, user, project, mocker):
+        """When the Dagster job cannot be triggered, an error message is shown."""
+        mock_generate = mocker.patch(
+            "apps.publish_mdm.views.generate_and_save_app_user_collect_qrcodes"
+        )
+        mocker.patch(
+            "apps.publish_mdm.views.trigger_dagster_job",
+            side_effect=Exception("Dagster unreachable"),
+        )
+
+        response = client.get(url, follow=True)
+
+        mock_generate.assert_not_called()
+        assertContains(response, "We encountered an issue regenerating the QR codes.")
+        assertNotContains(response, "Regenerating QR codes:")
+
 
 @pytest.mark.django_db
 class TestNonExistentProjectID:
@@ -1918,14 +1981,9 @@ class TestProjectSync(ViewTestBase):
         assert response.status_code == 200
         assert isinstance(response.context.get("form"), ProjectSyncForm)
 
-    def test_valid_form(self, client, url, user, organization, project, mocker, requests_mock):
-        """Ensure submitting a valid form calls sync_central_project()."""
+    @pytest.fixture
+    def data(self, organization, requests_mock):
         server = CentralServerFactory(organization=organization)
-        # Valid form data
-        data = {
-            "server": server.id,
-            "project": 1,
-        }
         # Mock ODK API request to get projects, called in ProjectSyncForm.set_project_choices()
         json_response = [
             {
@@ -1936,19 +1994,94 @@ class TestProjectSync(ViewTestBase):
             },
         ]
         requests_mock.get(f"{server.base_url}/v1/projects", json=json_response)
+        # Valid form data
+        return {
+            "server": server.id,
+            "project": 1,
+        }
+
+    def test_valid_form(self, client, url, user, organization, project, data, mocker):
+        """Ensure submitting a valid form calls sync_central_project() when
+        Dagster is not enabled.
+        """
+        mocker.patch(
+            "apps.publish_mdm.views.trigger_dagster_job", side_effect=DagsterNotEnabledError
+        )
         # Mock sync_central_project()
         mock_sync = mocker.patch(
-            "apps.publish_mdm.views.sync_central_project", return_value=project
+            "apps.publish_mdm.views.sync_central_project",
+            return_value=ProjectSync(project=project, app_users_created=2),
         )
         response = client.post(url, data=data, follow=True)
 
         assert response.status_code == 200
         mock_sync.assert_called_once()
-        assert "Project synced." in response.content.decode()
+        assert "Project synced. Added 2 app user(s) and 0 form template(s)." in (
+            response.content.decode()
+        )
         assert response.redirect_chain == [
             (reverse("publish_mdm:form-template-list", args=[organization.slug, project.id]), 302)
         ]
 
+    def test_background_job(self, client, url, user, data, mocker):
+        """When Dagster is enabled, the project is synced by central_project_sync_job
+        and the sync page shows its progress.
+        """
+        mock_sync = mocker.patch("apps.publish_mdm.views.sync_central_project")
+        mock_trigger = mocker.patch("apps.publish_mdm.views.trigger_dagster_job")
+
+        response = client.post(url, data=data, follow=True)
+
+        mock_sync.assert_not_called()
+        mock_trigger.assert_called_once_with(
+            job_name="central_project_sync_job",
+            run_config={
+                "ops": {
+                    "sync_central_project_data": {
+                        "config": {"central_server_pk": data["server"], "project_id": 1}
+                    }
+                }
+            },
+        )
+        assert response.redirect_chain == [(f"{url}?server={data['server']}&project=1", 302)]
+        assertContains(response, "The project is being synced in the background.")
+        assertContains(response, f"Syncing project: 0 of {PROJECT_SYNC_STEPS} steps done.")
+        # The progress is only shown for the project being synced
+        response = client.get(url, {"server": data["server"], "project": 2})
+        assertNotContains(response, "Syncing project:")
+
+    def test_background_job_finishes_first(self, client, url, user, data, mocker):
+        """The job's progress is not overwritten if it reports progress, or
+        finishes, before the view returns.
+        """
+        cache_key = PROJECT_SYNC_PROGRESS_CACHE_KEY.format(server_pk=data["server"], project_id=1)
+
+        def trigger(**kwargs):
+            assert cache.get(cache_key) == {"done": 0, "total": PROJECT_SYNC_STEPS}
+            cache.delete(cache_key)
+
+        mocker.patch("apps.publish_mdm.views.trigger_dagster_job", side_effect=trigger)
+
+        response = client.post(url, data=data, follow=True)
+
+        assertContains(response, "The project is being synced in the background.")
+        assertNotContains(response, "Syncing project:")
+
+    def test_background_job_error(self, client, url, user, data, mocker):
+        """When the Dagster job cannot be triggered, an error message is shown."""
+        mock_sync = mocker.patch("apps.publish_mdm.views.sync_central_project")
+        mocker.patch(
+            "apps.publish_mdm.views.trigger_dagster_job",
+            side_effect=Exception("Dagster unreachable"),
+        )
+
+        response = client.post(url, data=data, follow=True)
+
+        mock_sync.assert_not_called()
+        assertContains(response, "We encountered an issue syncing the project.")
+        cache_key = PROJECT_SYNC_PROGRESS_CACHE_KEY.format(server_pk=data["server"], project_id=1)
+        assert cache.get(cache_key) is None
+
 
 class TestProjectSyncProjectsPartial(ViewTestBase):
     """Test the server_sync_projects view."""
@@ -2443,14 +2576,36 @@ class TestFleetsList(ViewTestBase):
         }
         # All columns are sortable
         assert table.orderable
-        # Not paginated
-        assert not hasattr(table, "paginator")
+        # Keyset paginated, all fleets fit on the first page
+        assert isinstance(table.paginator, KeysetPaginator)
+        assert not table.page.has_next()
         # Ensure the table is rendered in the page
         assert table.as_html(response.wsgi_request) in response.content.decode()
         # Ensure the correct template is used for htmx requests
         if htmx:
             assertTemplateNotUsed(response, "publish_mdm/fleets_list.html")
 
+    def test_next_page(self, client, url, user, organization):
+        """An htmx request with a cursor renders only the rows of the next page."""
+        fleets = FleetFactory.create_batch(60, organization=organization)
+        fleets.sort(key=lambda fleet: (fleet.name, fleet.pk))
+
+        response = client.get(url)
+        table = response.context["table"]
+        assert [row.record for row in table.page.object_list] == fleets[:50]
+        assert table.page.has_next()
+
+        response = client.get(
+            url, {"cursor": table.page.next_cursor}, headers={"HX-Request": "true"}
+        )
+
+        assert response.status_code == 200
+        assertTemplateUsed(response, "patterns/tables/keyset-rows.html")
+        assertTemplateNotUsed(response, "publish_mdm/fleets_list.html")
+        table = response.context["table"]
+        assert [row.record for row in table.page.object_list] == fleets[50:]
+        assert not table.page.has_next()
+
 
 class TestAddFleet(ViewTestBase, TestAllMDMsNoAutouse):
     """Test creating a new Fleet for the current organization."""
@@ -2881,6 +3036,38 @@ class TestFleetQRCode(ViewTestBase, TestAllMDMsNoAutouse):
         fleet.refresh_from_db()
         assertContains(response, f'<img src="{fleet.enroll_qr_code.url}"')
 
+    def test_saved_qr_code_not_regenerated(self, client, url, user, organization, mocker, all_mdms):
+        """The QR code is not fetched from the MDM again while its image is stored
+        and its enrollment token is still valid.
+        """
+        fleet = FleetFactory(organization=organization, enroll_token_expires_at=None)
+        mock_get_enrollment_qr_code = mocker.patch.object(
+            get_active_mdm_class(organization), "get_enrollment_qr_code"
+        )
+
+        for _ in range(2):
+            response = client.post(url, data={"fleet": fleet.id})
+            assertContains(response, f'<img src="{fleet.enroll_qr_code.url}"')
+
+        mock_get_enrollment_qr_code.assert_not_called()
+
+    def test_missing_qr_code_image(self, client, url, user, organization, mocker, all_mdms):
+        """The QR code is fetched from the MDM again if its image is missing from storage."""
+        fleet = FleetFactory(organization=organization, enroll_qr_code="missing/qr-code.png")
+
+        def side_effect(fleet):
+            fleet.enroll_qr_code = qr_code_cache.store(fake.image())
+
+        mocker.patch.object(
+            get_active_mdm_class(organization), "get_enrollment_qr_code", side_effect=side_effect
+        )
+
+        response = client.post(url, data={"fleet": fleet.id})
+
+        fleet.refresh_from_db()
+        assert fleet.enroll_qr_code.name.startswith("qr-codes/cache/")
+        assertContains(response, f'<img src="{fleet.enroll_qr_code.url}"')
+
     def test_no_fleet_selected(self, client, url, user):
         """Ensure a placeholder is shown if no fleet is selected."""
         data = {
@@ -3776,3 +3963,27 @@ class TestSocialAccountConnectionsView:
                 "publish_mdm:enterprise-setup", args=[enrolled_android_enterprise.organization.slug]
             ),
         )
+
+
+@pytest.mark.django_db
+class TestApiMetrics:
+    url = reverse_lazy("publish_mdm:api-metrics")
+
+    def login(self, client, is_staff):
+        user = UserFactory(is_staff=is_staff)
+        user.save()
+        client.force_login(user)
+
+    def test_staff_only(self, client):
+        self.login(client, is_staff=False)
+        response = client.get(self.url)
+        assert response.status_code == 302
+
+    def test_get(self, client, mocker):
+        self.login(client, is_staff=True)
+        mocker.patch("apps.publish_mdm.views.central_api_metrics.render", return_value="central\n")
+        mocker.patch("apps.publish_mdm.views.mdm_api_metrics.render", return_value="mdm\n")
+        response = client.get(self.url)
+        assert response.status_code == 200
+        assert response["Content-Type"] == "text/plain; version=0.0.4"
+        assert response.content == b"central\nmdm\n"
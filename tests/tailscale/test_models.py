@@ -24,6 +24,14 @@ class TestDeviceSnapshot:
 
 @pytest.mark.django_db
 class TestAssignDevices:
+    @staticmethod
+    def link_latest_snapshots():
+        """Link the snapshots created by DeviceFactory to their devices."""
+        for device in Device.objects.all():
+            DeviceSnapshot.objects.filter(latest_for_device=device).update(
+                device=device, node_id=device.node_id
+            )
+
     def test_device_created_for_new_node_id(self):
         """A snapshot without a device should create a new device"""
         snapshot = DeviceSnapshotFactory(device=None)
@@ -54,3 +62,100 @@ class TestAssignDevices:
         DeviceSnapshot.objects.assign_devices()
         device.refresh_from_db()
         assert device.latest_snapshot == snap1
+
+    def test_returns_counts(self):
+        """The number of snapshots linked to existing devices and the number of
+        new devices are returned.
+        """
+        device = DeviceFactory()
+        self.link_latest_snapshots()
+        DeviceSnapshotFactory.create_batch(2, node_id=device.node_id, device=None)
+        new_node_snapshots = DeviceSnapshotFactory.create_batch(3, device=None)
+        DeviceSnapshotFactory(node_id=new_node_snapshots[0].node_id, device=None)
+        assert DeviceSnapshot.objects.assign_devices() == (2, 3)
+        assert Device.objects.count() == 4
+        assert not DeviceSnapshot.objects.filter(device=None).exists()
+
+    def test_new_device_uses_most_recent_snapshot(self):
+        """A node with several unassigned snapshots gets a single device, created
+        from its most recent snapshot.
+        """
+        now = timezone.now()
+        older = DeviceSnapshotFactory(device=None, synced_at=now - dt.timedelta(hours=1))
+        newer = DeviceSnapshotFactory(
+            node_id=older.node_id, device=None, synced_at=now, name="new-name"
+        )
+        DeviceSnapshot.objects.assign_devices()
+        device = Device.objects.get(node_id=older.node_id)
+        assert device.latest_snapshot == newer
+        assert device.name == "new-name"
+        assert device.last_seen == newer.last_seen
+        assert set(device.snapshots.all()) == {older, newer}
+
+    def test_new_device_without_last_seen(self):
+        """A new device falls back to the sync time when the snapshot has no last_seen."""
+        snapshot = DeviceSnapshotFactory(device=None, last_seen=None)
+        DeviceSnapshot.objects.assign_devices()
+        assert Device.objects.get(node_id=snapshot.node_id).last_seen == snapshot.synced_at
+
+    def test_existing_device_keeps_last_seen(self):
+        """An existing device keeps its last_seen if its new snapshot has none."""
+        now = timezone.now()
+        device = DeviceFactory(
+            last_seen=now - dt.timedelta(hours=1),
+            latest_snapshot__synced_at=now - dt.timedelta(days=1),
+        )
+        DeviceSnapshotFactory(node_id=device.node_id, device=None, synced_at=now, last_seen=None)
+        DeviceSnapshot.objects.assign_devices(since=now)
+        device.refresh_from_db()
+        assert device.last_seen == now - dt.timedelta(hours=1)
+
+    def test_name_and_last_seen_synced_from_latest_snapshot(self):
+        """Devices in the sync batch get the name and last_seen of their latest snapshot."""
+        now = timezone.now()
+        device = DeviceFactory(
+            name="old-name", latest_snapshot__synced_at=now - dt.timedelta(days=1)
+        )
+        snapshot = DeviceSnapshotFactory(
+            node_id=device.node_id,
+            device=device,
+            synced_at=now,
+            name="new-name",
+            last_seen=now,
+        )
+        DeviceSnapshot.objects.assign_devices()
+        device.refresh_from_db()
+        assert device.latest_snapshot == snapshot
+        assert device.name == "new-name"
+        assert device.last_seen == now
+
+    def test_latest_snapshot_update_limited_to_sync_batch(self):
+        """Devices without snapshots in the current sync batch are left untouched."""
+        now = timezone.now()
+        batch_start = now - dt.timedelta(minutes=5)
+        device = DeviceFactory(latest_snapshot__synced_at=now - dt.timedelta(days=2))
+        # An older snapshot that is newer than the device's latest snapshot, but
+        # outside the batch
+        DeviceSnapshotFactory(
+            node_id=device.node_id, device=device, synced_at=now - dt.timedelta(days=1)
+        )
+        other_device = DeviceFactory(latest_snapshot__synced_at=now - dt.timedelta(days=2))
+        batch_snapshot = DeviceSnapshotFactory(
+            node_id=other_device.node_id, device=other_device, synced_at=now
+        )
+        DeviceSnapshot.objects.assign_devices(since=batch_start)
+        latest_snapshot_id = device.latest_snapshot_id
+        device.refresh_from_db()
+        other_device.refresh_from_db()
+        assert device.latest_snapshot_id == latest_snapshot_id
+        assert other_device.latest_snapshot == batch_snapshot
+
+    def test_query_count_independent_of_tailnet_size(self, django_assert_max_num_queries):
+        """The number of queries does not grow with the number of snapshots."""
+        devices = DeviceFactory.create_batch(5)
+        self.link_latest_snapshots()
+        for device in devices:
+            DeviceSnapshotFactory(node_id=device.node_id, device=None)
+        DeviceSnapshotFactory.create_batch(20, device=None)
+        with django_assert_max_num_queries(9):
+            assert DeviceSnapshot.objects.assign_devices() == (5, 20)